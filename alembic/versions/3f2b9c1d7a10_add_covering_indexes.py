@@ -0,0 +1,41 @@
+"""Add covering indexes for the hottest laundry, notification and stock queries
+
+Revision ID: 3f2b9c1d7a10
+Revises:
+Create Date: 2026-10-16 09:00:00
+
+Proposed by ``flask suggest-indexes`` from a recorded workload and reviewed
+by hand. Tables are created by ``db.create_all()``, so this is the first
+revision; ``app.schema_upgrades`` creates the same indexes on databases that
+are not managed by Alembic, hence ``if_not_exists``.
+"""
+from alembic import op
+
+revision = "3f2b9c1d7a10"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Dashboard and laundry list filters
+    op.create_index("ix_laundry_status", "laundry", ["status"], if_not_exists=True)
+    op.create_index("ix_laundry_date_received", "laundry", ["date_received"], if_not_exists=True)
+    # Customer order history / loyalty lookups
+    op.create_index("ix_laundry_customer_id", "laundry", ["customer_id"], if_not_exists=True)
+    # Unread badge and notification list
+    op.create_index(
+        "ix_notification_user_id_is_read", "notification", ["user_id", "is_read"], if_not_exists=True
+    )
+    # Stock movement history ordered by date
+    op.create_index(
+        "ix_stock_movement_created_at", "stock_movement", ["created_at"], if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index("ix_stock_movement_created_at", table_name="stock_movement", if_exists=True)
+    op.drop_index("ix_notification_user_id_is_read", table_name="notification", if_exists=True)
+    op.drop_index("ix_laundry_customer_id", table_name="laundry", if_exists=True)
+    op.drop_index("ix_laundry_date_received", table_name="laundry", if_exists=True)
+    op.drop_index("ix_laundry_status", table_name="laundry", if_exists=True)
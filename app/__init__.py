@@ -18,9 +18,9 @@ socketio = SocketIO(cors_allowed_origins="*")
 
 @login_manager.user_loader
 def load_user(id):
-    from .models import User
+    from .user_cache import load_cached_user
 
-    return User.query.get(int(id))
+    return load_cached_user(int(id))
 
 
 def create_app():
@@ -57,27 +57,12 @@ def create_app():
     # Allow overriding the database via DATABASE_URL or connect.json (easier for orchestration).
     # When running under pytest, skip setting a default so tests can provide
     # their own temporary DB URI after create_app().
-    database_url = os.environ.get("DATABASE_URL")
-    # If a connect.json exists, prefer its values (it is written by the admin UI on save)
-    try:
-        connect_path = os.path.join(os.path.abspath(os.getcwd()), "connect.json")
-        if os.path.exists(connect_path):
-            import json
+    # connect.json (written by the admin UI on save) takes precedence over
+    # .env and the environment; see app.runtime_config.
+    from .runtime_config import bind_app, reload as reload_runtime_config
 
-            with open(connect_path, "r", encoding="utf-8") as f:
-                try:
-                    data = json.load(f)
-                    # Only override if a value is present
-                    database_url = data.get("DATABASE_URL") or database_url
-                    # Also prefer SMS settings from connect.json
-                    if data.get("SEMAPHORE_API_KEY"):
-                        os.environ["SEMAPHORE_API_KEY"] = data.get("SEMAPHORE_API_KEY")
-                    if data.get("SEMAPHORE_SENDER_NAME"):
-                        os.environ["SEMAPHORE_SENDER_NAME"] = data.get("SEMAPHORE_SENDER_NAME")
-                except Exception:
-                    pass
-    except Exception:
-        pass
+    runtime_config = reload_runtime_config(force=True)
+    database_url = runtime_config.get("DATABASE_URL")
     if database_url:
         app.config["SQLALCHEMY_DATABASE_URI"] = database_url
     elif not running_under_pytest:
@@ -91,6 +76,14 @@ def create_app():
     if running_under_pytest and not database_url:
         app.config.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite:///:memory:")
 
+    # The PostgreSQL connect_args above are rejected by the sqlite3 driver, so
+    # drop them (and the pool sizing) when the app runs on SQLite.
+    if str(app.config.get("SQLALCHEMY_DATABASE_URI", "")).startswith("sqlite"):
+        engine_options = dict(app.config["SQLALCHEMY_ENGINE_OPTIONS"])
+        for key in ("connect_args", "pool_size", "max_overflow"):
+            engine_options.pop(key, None)
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
+
     # Ensure Flask knows it's in testing mode so runtime seeding/migrations
     # in create_database() are skipped during pytest runs.
     if running_under_pytest:
@@ -108,14 +101,14 @@ def create_app():
     app.config["MAIL_SERVER"] = "smtp.gmail.com"  # Configure for your email provider
     app.config["MAIL_PORT"] = 587
     app.config["MAIL_USE_TLS"] = True
-    app.config["MAIL_USERNAME"] = os.environ.get("MAIL_USERNAME", "")  # Add your email
-    app.config["MAIL_PASSWORD"] = os.environ.get(
+    app.config["MAIL_USERNAME"] = runtime_config.get("MAIL_USERNAME", "")  # Add your email
+    app.config["MAIL_PASSWORD"] = runtime_config.get(
         "MAIL_PASSWORD", ""
     )  # Add your password
 
-    # SMS Configuration (Environment variables or connect.json)
-    app.config["SEMAPHORE_API_KEY"] = os.environ.get("SEMAPHORE_API_KEY", "")
-    app.config["SEMAPHORE_SENDER_NAME"] = os.environ.get(
+    # SMS Configuration (Environment variables, .env or connect.json)
+    app.config["SEMAPHORE_API_KEY"] = runtime_config.get("SEMAPHORE_API_KEY", "")
+    app.config["SEMAPHORE_SENDER_NAME"] = runtime_config.get(
         "SEMAPHORE_SENDER_NAME", "ACCIO Laundry"
     )
 
@@ -123,6 +116,8 @@ def create_app():
     login_manager.init_app(app)
     login_manager.login_view = "auth.login"  # type: ignore
     mail.init_app(app)
+    # Later edits to .env/connect.json update the SMS and mail settings above
+    bind_app(app)
     socketio.init_app(app)
 
     # Optionally enable lightweight request/SQL monitoring (controlled by env)
@@ -170,24 +165,44 @@ def create_app():
     app.register_blueprint(user_management, url_prefix="/admin/users")
     app.register_blueprint(business_settings_bp)
 
-    # Import only the model needed at app startup to avoid unused-import noise
-    from .models import BusinessSettings
+    from .backfills import (
+        backfill_laundry_links_command,
+        backfill_phone_e164_command,
+        backfill_status_timestamps_command,
+    )
+    from .business_day import backfill_business_dates_command
+    from .daily_stats import rebuild_daily_stats_command
+    from .event_outbox import drain_outbox_events_command
+    from .index_advisor import suggest_indexes_command
+    from .retention import apply_retention_command
+    from .sms_outbox import drain_sms_outbox_command
+
+    app.cli.add_command(backfill_business_dates_command)
+    app.cli.add_command(backfill_laundry_links_command)
+    app.cli.add_command(backfill_phone_e164_command)
+    app.cli.add_command(backfill_status_timestamps_command)
+    app.cli.add_command(rebuild_daily_stats_command)
+    app.cli.add_command(suggest_indexes_command)
+    app.cli.add_command(drain_sms_outbox_command)
+    app.cli.add_command(drain_outbox_events_command)
+    app.cli.add_command(apply_retention_command)
+
+    # Both injectors are served from a process cache invalidated on commit
+    from .settings_cache import get_business_settings, is_first_run
 
     # Context processor to make business settings available globally
     @app.context_processor
     def inject_business_settings():
-        return dict(business_settings=BusinessSettings.get_settings())
+        return dict(business_settings=get_business_settings())
 
     # Provide a flag to templates indicating whether this is the first-run (no users yet)
     @app.context_processor
     def inject_first_run_flag():
         try:
-            from .models import User
-
-            is_first_run = User.query.count() == 0
+            first_run = is_first_run()
         except Exception:
-            is_first_run = False
-        return dict(is_first_run=is_first_run)
+            first_run = False
+        return dict(is_first_run=first_run)
 
 
     # Avoid running the runtime DB creation/seeding when pytest is running
@@ -239,6 +254,45 @@ def create_app():
     except Exception:
         pass
 
+    # Background workers that deliver queued SMS (controlled by ENABLE_SMS_WORKER)
+    if os.environ.get("ENABLE_SMS_WORKER", "1") != "0" and not running_under_pytest:
+        try:
+            from .sms_outbox import start_sms_dispatcher
+
+            from .bulk_sms import resume_bulk_jobs
+
+            start_sms_dispatcher(app)
+            resume_bulk_jobs(app)
+        except Exception as e:
+            print("Failed to start SMS outbox workers:", e)
+
+    # Worker sending queued email over a reused SMTP connection
+    if os.environ.get("ENABLE_MAIL_WORKER", "1") != "0" and not running_under_pytest:
+        try:
+            from .mail_queue import start_mail_queue
+
+            start_mail_queue(app)
+        except Exception as e:
+            print("Failed to start mail queue worker:", e)
+
+    # Workers running the side effects recorded by app.event_outbox
+    if os.environ.get("ENABLE_EVENT_WORKER", "1") != "0" and not running_under_pytest:
+        try:
+            from .event_outbox import start_event_dispatcher
+
+            start_event_dispatcher(app)
+        except Exception as e:
+            print("Failed to start event outbox workers:", e)
+
+    # Periodic retention run (app.retention; controlled by ENABLE_RETENTION_WORKER)
+    if os.environ.get("ENABLE_RETENTION_WORKER", "1") != "0" and not running_under_pytest:
+        try:
+            from .retention import start_retention_scheduler
+
+            start_retention_scheduler(app)
+        except Exception as e:
+            print("Failed to start retention scheduler:", e)
+
     return app
 
 
@@ -268,6 +322,14 @@ def create_database(app):
             # If migration fails, continue; the app can still run but tests may fail
             pass
 
+        # Add columns introduced on existing tables (and backfill them once)
+        try:
+            from .schema_upgrades import upgrade_schema
+
+            upgrade_schema(db)
+        except Exception as e:
+            print("Warning: schema upgrade failed:", e)
+
         # Ensure default SMS settings exist
         from .models import SMSSettings
 
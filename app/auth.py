@@ -4,6 +4,7 @@ from werkzeug.security import check_password_hash, generate_password_hash
 
 from . import db
 from .models import User
+from .settings_cache import is_first_run
 
 auth = Blueprint("auth", __name__)
 
@@ -13,11 +14,11 @@ def login():
     # If there are no users yet, guide the operator to create the first
     # account via the signup page which will be promoted to super_admin.
     try:
-        user_count = User.query.count()
+        first_run = is_first_run()
     except Exception:
-        user_count = 0
+        first_run = True
 
-    if user_count == 0:
+    if first_run:
         flash("No users found. Please create the first Super Admin account.", category="warning")
         return redirect(url_for("auth.signup"))
 
@@ -0,0 +1,197 @@
+"""Chunked data backfills for denormalized columns.
+
+Each backfill walks its table in primary-key order, ``chunk_size`` rows at a
+time, and commits per chunk, so it can run against a live database and be
+interrupted and rerun safely. They run once automatically when
+``app.schema_upgrades`` adds the column, and are exposed as CLI commands.
+"""
+from __future__ import annotations
+
+import logging
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, func, select, update
+
+from . import db
+from .models import Customer, Laundry, LaundryAuditLog, LaundryStatusHistory
+from .phones import normalize_phone
+
+logger = logging.getLogger("app.backfills")
+
+READY_STATUS = "Ready for Pickup"
+COMPLETED_STATUS = "Completed"
+
+
+def _backfill_laundry_pk(model, chunk_size: int) -> int:
+    """Set ``model.laundry_pk`` from the string ``laundry_id`` in id ranges."""
+    max_id = db.session.execute(select(func.max(model.id))).scalar() or 0
+    laundry_pk = (
+        select(Laundry.id)
+        .where(Laundry.laundry_id == model.laundry_id)
+        .scalar_subquery()
+    )
+    updated = 0
+    for low in range(0, max_id, chunk_size):
+        result = db.session.execute(
+            update(model)
+            .where(
+                model.id > low,
+                model.id <= low + chunk_size,
+                model.laundry_pk.is_(None),
+            )
+            .values(laundry_pk=laundry_pk)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        updated += result.rowcount or 0
+    return updated
+
+
+def backfill_laundry_links(chunk_size: int = 5000) -> dict:
+    """Fill the integer ``laundry_pk`` on status history and audit rows.
+
+    Rows whose laundry no longer exists keep a NULL link.
+    """
+    counts = {
+        "laundry_status_history": _backfill_laundry_pk(LaundryStatusHistory, chunk_size),
+        "laundry_audit_log": _backfill_laundry_pk(LaundryAuditLog, chunk_size),
+    }
+    logger.info("Backfilled laundry links: %s", counts)
+    return counts
+
+
+def backfill_status_timestamps(only_missing: bool = True, chunk_size: int = 1000) -> int:
+    """Fill ``Laundry.ready_at``/``completed_at`` from LaundryStatusHistory.
+
+    Uses the latest history row for each status. Completed orders with no
+    history (legacy rows) fall back to ``date_updated``. History is joined on
+    ``laundry_pk``, so run :func:`backfill_laundry_links` first. Returns rows
+    updated.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        stmt = select(Laundry.id).where(Laundry.id > last_id).order_by(Laundry.id).limit(chunk_size)
+        if only_missing:
+            stmt = stmt.where(Laundry.ready_at.is_(None), Laundry.completed_at.is_(None))
+        ids = db.session.execute(stmt).scalars().all()
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        milestones = db.session.execute(
+            select(
+                Laundry.id,
+                Laundry.status,
+                Laundry.date_updated,
+                func.max(
+                    case(
+                        (LaundryStatusHistory.new_status == READY_STATUS, LaundryStatusHistory.changed_at)
+                    )
+                ),
+                func.max(
+                    case(
+                        (LaundryStatusHistory.new_status == COMPLETED_STATUS, LaundryStatusHistory.changed_at)
+                    )
+                ),
+            )
+            .outerjoin(LaundryStatusHistory, LaundryStatusHistory.laundry_pk == Laundry.id)
+            .where(Laundry.id.in_(ids))
+            .group_by(Laundry.id, Laundry.status, Laundry.date_updated)
+        ).all()
+
+        params = []
+        for laundry_pk, status, date_updated, ready_at, completed_at in milestones:
+            if completed_at is None and status == COMPLETED_STATUS:
+                completed_at = date_updated
+            if ready_at is None and completed_at is None:
+                continue
+            params.append({"id": laundry_pk, "ready_at": ready_at, "completed_at": completed_at})
+        if params:
+            db.session.execute(update(Laundry), params)
+        db.session.commit()
+        updated += len(params)
+    logger.info("Backfilled status timestamps on %d laundries", updated)
+    return updated
+
+
+def backfill_phone_e164(only_missing: bool = True, chunk_size: int = 1000,
+                        start_after: int = 0) -> dict:
+    """Fill ``Customer.phone_e164`` from ``phone`` with app.phones.normalize_phone.
+
+    Walks customers with ``id > start_after``; each chunk is committed and
+    logged with its last id, which ``start_after`` resumes from. Returns
+    counts of rows scanned, updated and left NULL because the phone could
+    not be read, plus the last id seen.
+    """
+    counts = {"scanned": 0, "updated": 0, "unreadable": 0, "last_id": start_after}
+    while True:
+        stmt = (
+            select(Customer.id, Customer.phone, Customer.phone_e164)
+            .where(Customer.id > counts["last_id"], Customer.phone.isnot(None))
+            .order_by(Customer.id)
+            .limit(chunk_size)
+        )
+        if only_missing:
+            stmt = stmt.where(Customer.phone_e164.is_(None))
+        rows = db.session.execute(stmt).all()
+        if not rows:
+            break
+        params = []
+        for customer_id, phone, current in rows:
+            e164 = normalize_phone(phone)
+            if e164 is None:
+                counts["unreadable"] += 1
+            if e164 != current:
+                params.append({"id": customer_id, "phone_e164": e164})
+        if params:
+            db.session.execute(update(Customer), params)
+        db.session.commit()
+        counts["scanned"] += len(rows)
+        counts["updated"] += len(params)
+        counts["last_id"] = rows[-1][0]
+        logger.info("phone_e164 backfill: through customer id %d (%s)", counts["last_id"], counts)
+    logger.info("Backfilled phone_e164: %s", counts)
+    return counts
+
+
+@click.command("backfill-status-timestamps")
+@click.option("--all", "recompute_all", is_flag=True,
+              help="Recompute every laundry, not only rows missing both timestamps.")
+@click.option("--chunk-size", default=1000, show_default=True)
+@with_appcontext
+def backfill_status_timestamps_command(recompute_all, chunk_size):
+    """Fill Laundry.ready_at/completed_at from status history."""
+    count = backfill_status_timestamps(only_missing=not recompute_all, chunk_size=chunk_size)
+    click.echo(f"Updated {count} laundry row(s).")
+
+
+@click.command("backfill-laundry-links")
+@click.option("--chunk-size", default=5000, show_default=True)
+@with_appcontext
+def backfill_laundry_links_command(chunk_size):
+    """Fill LaundryStatusHistory/LaundryAuditLog.laundry_pk from laundry_id."""
+    counts = backfill_laundry_links(chunk_size=chunk_size)
+    click.echo(
+        f"Linked {counts['laundry_status_history']} status history and "
+        f"{counts['laundry_audit_log']} audit row(s)."
+    )
+
+
+@click.command("backfill-phone-e164")
+@click.option("--all", "recompute_all", is_flag=True,
+              help="Re-normalize every customer, not only rows missing phone_e164.")
+@click.option("--chunk-size", default=1000, show_default=True)
+@click.option("--start-after", default=0, show_default=True,
+              help="Resume after this customer id (logged per chunk).")
+@with_appcontext
+def backfill_phone_e164_command(recompute_all, chunk_size, start_after):
+    """Fill Customer.phone_e164 from the stored phone numbers."""
+    counts = backfill_phone_e164(
+        only_missing=not recompute_all, chunk_size=chunk_size, start_after=start_after
+    )
+    click.echo(
+        f"Scanned {counts['scanned']} customer(s) through id {counts['last_id']}: "
+        f"updated {counts['updated']}, {counts['unreadable']} unreadable."
+    )
@@ -0,0 +1,584 @@
+"""Bulk SMS campaigns sent as background jobs.
+
+``sms_settings.bulk_message`` used to render and send one message per
+customer inside the request. Campaigns are now planned in the request and
+delivered in the background:
+
+- **batched** (the message has no ``{customer_name}``): every recipient gets
+  the same text, so unique numbers are split into ``BulkMessageBatch`` rows
+  of up to ``SEMAPHORE_BULK_BATCH_SIZE`` numbers (default and maximum
+  ``BULK_MAX_NUMBERS``). A background job (:func:`start_bulk_job`) sends each
+  batch as one comma-separated provider call, retrying 429/5xx responses
+  with the outbox backoff, and records the status code and error per batch.
+- **personalized** (``{customer_name}`` present): texts differ per recipient,
+  so each message is queued in the SMS outbox and delivered by its worker
+  pool in parallel.
+
+Either way the ``BulkMessageHistory`` row carries the job ``status``
+(queued, running, paused, completed, failed, cancelled) and the running
+successful/failed counts. Batched jobs left queued or running by a restart
+are resumed by :func:`resume_bulk_jobs`. A job claims each batch
+(``pending`` to ``sending``, conditional ``UPDATE``) before calling the
+provider, so another job or process skips it; a batch still ``sending``
+``BULK_BATCH_SENDING_TIMEOUT`` seconds (300) after its last call or retry
+delay was caught mid-call and is marked failed for review, never resent.
+
+Progress goes out over Socket.IO: the bulk message page joins the
+``bulk:<id>`` room in the ``/bulk`` namespace and receives ``progress``
+events (sent, failed, remaining, ETA) after committed changes, at most one
+per ``BULK_PROGRESS_INTERVAL`` seconds (default 1) except for state changes.
+It sends ``control`` events to :func:`pause_campaign`,
+:func:`resume_campaign` and :func:`cancel_campaign`, which work through the
+database so a job running in another worker stops at its next batch.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from flask import current_app
+from flask_login import current_user
+from flask_socketio import emit, join_room
+from sqlalchemy import and_, case, event, select, update
+from sqlalchemy.orm import Session
+
+from . import db, socketio
+from .models import BulkMessageBatch, BulkMessageHistory, SMSOutbox
+from .sms_outbox import _env_number, _is_retryable, _wake, backoff_seconds, enqueue_sms
+from .sms_service import BULK_MAX_NUMBERS, sms_service
+
+logger = logging.getLogger("app.bulk_sms")
+
+PERSONALIZED_PLACEHOLDER = "{customer_name}"
+
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING, PAUSED)
+FINAL_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+BATCHED = "batched"
+PERSONALIZED = "personalized"
+
+NAMESPACE = "/bulk"
+DEFAULT_PROGRESS_INTERVAL = 1.0
+
+_SESSION_FLAG = "bulk_progress"
+
+_jobs_lock = threading.Lock()
+_jobs: dict = {}
+_emit_lock = threading.Lock()
+_last_emit: dict = {}
+
+
+def _batch_size() -> int:
+    return max(1, min(BULK_MAX_NUMBERS, _env_number("SEMAPHORE_BULK_BATCH_SIZE", BULK_MAX_NUMBERS)))
+
+
+def is_personalized(message_text: str) -> bool:
+    return PERSONALIZED_PLACEHOLDER in (message_text or "")
+
+
+def render_message(message_text: str, customer_name: Optional[str] = None) -> str:
+    """Fill the bulk message placeholders for one recipient."""
+    text = message_text.replace("{sender_name}", sms_service.sender_name or "")
+    return text.replace(PERSONALIZED_PLACEHOLDER, customer_name or "")
+
+
+def plan_campaign(history: BulkMessageHistory, customers: Iterable) -> int:
+    """Queue ``history``'s message for ``customers`` without committing.
+
+    ``customers`` yields objects with ``.full_name`` and ``.phone``, such as
+    the rows of app.bulk_recipients.iter_recipients.
+
+    Returns the number of recipients queued and sets ``total_recipients``,
+    ``send_mode`` and ``status`` on the history row (which must be flushed).
+    """
+    message_text = history.message_text
+    if is_personalized(message_text):
+        queued = 0
+        for customer in customers:
+            if enqueue_sms(
+                customer.phone,
+                render_message(message_text, customer.full_name),
+                category="bulk",
+                bulk_history_id=history.id,
+                commit=False,
+            ):
+                queued += 1
+        history.send_mode = PERSONALIZED
+        history.status = RUNNING if queued else COMPLETED
+    else:
+        numbers = []
+        seen = set()
+        for customer in customers:
+            number = sms_service.format_phone_number(customer.phone)
+            if number and number not in seen:
+                seen.add(number)
+                numbers.append(number)
+        message = render_message(message_text)
+        size = _batch_size()
+        for batch_number, start in enumerate(range(0, len(numbers), size), start=1):
+            chunk = numbers[start:start + size]
+            db.session.add(
+                BulkMessageBatch(
+                    bulk_history_id=history.id,
+                    batch_number=batch_number,
+                    message=message,
+                    numbers=",".join(chunk),
+                    recipient_count=len(chunk),
+                    status="pending",
+                    attempts=0,
+                )
+            )
+        queued = len(numbers)
+        history.send_mode = BATCHED
+        history.status = QUEUED if queued else COMPLETED
+    history.total_recipients = queued
+    history.successful_sends = 0
+    history.failed_sends = 0
+    if not queued:
+        history.completed_at = datetime.utcnow()
+    return queued
+
+
+def bump_campaign_counts(history_id: int, successful_sends: int = 0, failed_sends: int = 0) -> None:
+    """Add to a campaign's counters and close it once every recipient is counted.
+
+    Runs as UPDATE statements in the caller's transaction, so concurrent
+    outbox workers and batch jobs never lose each other's increments.
+    """
+    db.session.execute(
+        update(BulkMessageHistory)
+        .where(BulkMessageHistory.id == history_id)
+        .values(
+            successful_sends=BulkMessageHistory.successful_sends + successful_sends,
+            failed_sends=BulkMessageHistory.failed_sends + failed_sends,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    # Always announce the final state, whatever the throttle says
+    _mark_progress(history_id, force=_close_if_done(history_id))
+
+
+def _close_if_done(history_id: int, nothing_left: bool = False) -> bool:
+    """Close an active campaign once every recipient is counted.
+
+    ``nothing_left`` closes it regardless of the counters (no batch is left
+    to send). A campaign where every send failed ends as failed.
+    """
+    conditions = [
+        BulkMessageHistory.id == history_id,
+        BulkMessageHistory.status.in_((QUEUED, RUNNING)),
+    ]
+    if not nothing_left:
+        conditions.append(
+            BulkMessageHistory.successful_sends + BulkMessageHistory.failed_sends
+            >= BulkMessageHistory.total_recipients
+        )
+    result = db.session.execute(
+        update(BulkMessageHistory)
+        .where(*conditions)
+        .values(
+            status=case(
+                (
+                    and_(
+                        BulkMessageHistory.failed_sends > 0,
+                        BulkMessageHistory.successful_sends == 0,
+                    ),
+                    FAILED,
+                ),
+                else_=COMPLETED,
+            ),
+            completed_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return bool(result.rowcount)
+
+
+def _set_sending_batch(batch_id: int, **values) -> bool:
+    """Update a batch this job holds; False if it is no longer ``sending``. Commits."""
+    result = db.session.execute(
+        update(BulkMessageBatch)
+        .where(BulkMessageBatch.id == batch_id, BulkMessageBatch.status == "sending")
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return bool(result.rowcount)
+
+
+def _claim_batch(batch_id: int) -> bool:
+    """Move a pending batch to sending; False if another job got it first. Commits."""
+    result = db.session.execute(
+        update(BulkMessageBatch)
+        .where(BulkMessageBatch.id == batch_id, BulkMessageBatch.status == "pending")
+        .values(status="sending", claimed_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return bool(result.rowcount)
+
+
+def fail_stale_batches(history_id: Optional[int] = None) -> int:
+    """Mark batches abandoned mid-call as failed; returns how many. Commits.
+
+    The provider may or may not have delivered them, so they are left for
+    someone to check rather than sent again.
+    """
+    stale_before = datetime.utcnow() - timedelta(
+        seconds=_env_number("BULK_BATCH_SENDING_TIMEOUT", 300)
+    )
+    stale = (BulkMessageBatch.status == "sending") & (BulkMessageBatch.claimed_at < stale_before)
+    query = select(
+        BulkMessageBatch.id, BulkMessageBatch.bulk_history_id, BulkMessageBatch.recipient_count
+    ).where(stale)
+    if history_id is not None:
+        query = query.where(BulkMessageBatch.bulk_history_id == history_id)
+    failed = 0
+    for batch_id, batch_history_id, recipient_count in db.session.execute(query).all():
+        result = db.session.execute(
+            update(BulkMessageBatch)
+            .where(BulkMessageBatch.id == batch_id, stale)
+            .values(
+                status="failed",
+                error="Interrupted while sending; the provider may have delivered it. Not resent.",
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            failed += 1
+            bump_campaign_counts(batch_history_id, failed_sends=recipient_count)
+            logger.warning("Bulk batch %s was abandoned mid-call; marked failed for review", batch_id)
+    db.session.commit()
+    return failed
+
+
+def _send_batch(batch_id: int) -> str:
+    """Claim and deliver one pending batch, retrying transient failures; returns its status."""
+    if not _claim_batch(batch_id):
+        return "skipped"
+    batch = db.session.get(BulkMessageBatch, batch_id)
+    numbers, message = batch.numbers.split(","), batch.message
+    history_id, recipient_count = batch.bulk_history_id, batch.recipient_count
+    max_attempts = _env_number("SMS_MAX_ATTEMPTS", 6)
+    db.session.commit()
+
+    attempts = 0
+    while True:
+        attempts += 1
+        result = sms_service.deliver_many(numbers, message)
+        if result.ok or not _is_retryable(result) or attempts >= max_attempts:
+            break
+        delay = backoff_seconds(attempts, result.retry_after)
+        logger.info("Bulk batch %s retrying in %.0fs: %s", batch_id, delay, result.error)
+        # Keep the claim fresh across the delay so the batch is not taken for abandoned
+        if not _set_sending_batch(batch_id, claimed_at=datetime.utcnow() + timedelta(seconds=delay)):
+            logger.warning("Bulk batch %s was marked abandoned; not retrying", batch_id)
+            return "skipped"
+        time.sleep(delay)
+
+    if result.ok:
+        status = "sent"
+        values = {"sent_at": datetime.utcnow(), "error": None}
+    else:
+        status = "failed"
+        values = {"error": result.error}
+    if not _set_sending_batch(
+        batch_id, status=status, attempts=attempts, status_code=result.status_code, **values
+    ):
+        # Already counted as failed by fail_stale_batches
+        logger.warning("Bulk batch %s finished (%s) after it was marked abandoned", batch_id, status)
+        return "skipped"
+    if result.ok:
+        bump_campaign_counts(history_id, successful_sends=recipient_count)
+    else:
+        bump_campaign_counts(history_id, failed_sends=recipient_count)
+        logger.warning("Bulk batch %s failed after %d attempt(s): %s", batch_id, attempts, result.error)
+    db.session.commit()
+    return status
+
+
+def _claim_running(history_id: int) -> bool:
+    """Move a queued campaign to running; True while it should keep sending."""
+    db.session.execute(
+        update(BulkMessageHistory)
+        .where(BulkMessageHistory.id == history_id, BulkMessageHistory.status == QUEUED)
+        .values(status=RUNNING)
+        .execution_options(synchronize_session=False)
+    )
+    status = db.session.execute(
+        select(BulkMessageHistory.status).where(BulkMessageHistory.id == history_id)
+    ).scalar()
+    db.session.commit()
+    return status == RUNNING
+
+
+def run_bulk_job(history_id: int) -> None:
+    """Send every pending batch of a batched campaign, in order.
+
+    The campaign status is re-read before each batch, so pausing or
+    cancelling stops the job after the batch in flight. Batches another job
+    is sending are skipped.
+    """
+    fail_stale_batches(history_id)
+    batch_ids = db.session.execute(
+        select(BulkMessageBatch.id)
+        .where(BulkMessageBatch.bulk_history_id == history_id, BulkMessageBatch.status == "pending")
+        .order_by(BulkMessageBatch.batch_number)
+    ).scalars().all()
+    for batch_id in batch_ids:
+        if not _claim_running(history_id):
+            return
+        _send_batch(batch_id)
+
+    pending = BulkMessageBatch.query.filter(
+        BulkMessageBatch.bulk_history_id == history_id,
+        BulkMessageBatch.status.in_(("pending", "sending")),
+    ).count()
+    if not pending and _close_if_done(history_id, nothing_left=True):
+        _mark_progress(history_id, force=True)
+    db.session.commit()
+
+
+def _set_outbox_status(history_id: int, from_status: str, to_status: str) -> int:
+    result = db.session.execute(
+        update(SMSOutbox)
+        .where(SMSOutbox.bulk_history_id == history_id, SMSOutbox.status == from_status)
+        .values(status=to_status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount or 0
+
+
+def pause_campaign(history_id: int) -> Optional[str]:
+    """Stop sending after the batch/messages in flight; returns the new status."""
+    history = db.session.get(BulkMessageHistory, history_id)
+    if history is None or history.status not in (QUEUED, RUNNING):
+        return history.status if history else None
+    history.status = PAUSED
+    if history.send_mode == PERSONALIZED:
+        _set_outbox_status(history_id, SMSOutbox.PENDING, SMSOutbox.HELD)
+    _mark_progress(history_id, force=True)
+    db.session.commit()
+    return PAUSED
+
+
+def resume_campaign(history_id: int, app=None) -> Optional[str]:
+    """Continue a paused campaign; returns the new status."""
+    history = db.session.get(BulkMessageHistory, history_id)
+    if history is None or history.status != PAUSED:
+        return history.status if history else None
+    if history.send_mode == PERSONALIZED:
+        history.status = RUNNING
+        db.session.flush()
+        _set_outbox_status(history_id, SMSOutbox.HELD, SMSOutbox.PENDING)
+        _close_if_done(history_id)
+    else:
+        history.status = QUEUED
+    _mark_progress(history_id, force=True)
+    db.session.commit()
+    if history.send_mode == BATCHED:
+        start_bulk_job(app or current_app._get_current_object(), history_id)
+    else:
+        _wake.set()
+    db.session.refresh(history)
+    return history.status
+
+
+def cancel_campaign(history_id: int) -> Optional[str]:
+    """Drop everything not yet sent; returns the new status."""
+    history = db.session.get(BulkMessageHistory, history_id)
+    if history is None or history.status not in ACTIVE_STATUSES:
+        return history.status if history else None
+    history.status = CANCELLED
+    history.completed_at = datetime.utcnow()
+    db.session.execute(
+        update(BulkMessageBatch)
+        .where(BulkMessageBatch.bulk_history_id == history_id, BulkMessageBatch.status == "pending")
+        .values(status="cancelled")
+        .execution_options(synchronize_session=False)
+    )
+    for status in (SMSOutbox.PENDING, SMSOutbox.HELD):
+        _set_outbox_status(history_id, status, SMSOutbox.CANCELLED)
+    _mark_progress(history_id, force=True)
+    db.session.commit()
+    return CANCELLED
+
+
+def campaign_progress(history) -> dict:
+    """Progress payload for a BulkMessageHistory row (or a row-like mapping)."""
+    total = history.total_recipients or 0
+    sent = history.successful_sends or 0
+    failed = history.failed_sends or 0
+    remaining = max(0, total - sent - failed)
+    eta_seconds = None
+    if history.status in (QUEUED, RUNNING) and remaining and (sent + failed) and history.sent_at:
+        elapsed = (datetime.utcnow() - history.sent_at).total_seconds()
+        if elapsed > 0:
+            eta_seconds = round(remaining * elapsed / (sent + failed))
+    return {
+        "history_id": history.id,
+        "status": history.status,
+        "send_mode": history.send_mode,
+        "total": total,
+        "sent": sent,
+        "failed": failed,
+        "remaining": remaining,
+        "eta_seconds": eta_seconds,
+    }
+
+
+def room_name(history_id: int) -> str:
+    return f"bulk:{history_id}"
+
+
+def _mark_progress(history_id: int, force: bool = False) -> None:
+    pending = db.session.info.setdefault(_SESSION_FLAG, {})
+    pending[history_id] = pending.get(history_id, False) or force
+
+
+def publish_progress(history_id: int, force: bool = False) -> bool:
+    """Emit a progress event to the campaign's room unless one went out recently."""
+    now = time.monotonic()
+    interval = _env_number("BULK_PROGRESS_INTERVAL", DEFAULT_PROGRESS_INTERVAL)
+    with _emit_lock:
+        if not force and now - _last_emit.get(history_id, float("-inf")) < interval:
+            return False
+        _last_emit[history_id] = now
+    # Runs after a commit, when the session cannot issue SQL
+    with db.engine.connect() as connection:
+        row = connection.execute(
+            select(
+                BulkMessageHistory.id,
+                BulkMessageHistory.status,
+                BulkMessageHistory.send_mode,
+                BulkMessageHistory.total_recipients,
+                BulkMessageHistory.successful_sends,
+                BulkMessageHistory.failed_sends,
+                BulkMessageHistory.sent_at,
+            ).where(BulkMessageHistory.id == history_id)
+        ).first()
+    if row is None:
+        return False
+    socketio.emit("progress", campaign_progress(row), to=room_name(history_id), namespace=NAMESPACE)
+    return True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    pending = session.info.pop(_SESSION_FLAG, None)
+    for history_id, force in (pending or {}).items():
+        try:
+            publish_progress(history_id, force=force)
+        except Exception:
+            logger.exception("Could not publish progress for bulk campaign %s", history_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_FLAG, None)
+
+
+@socketio.on("connect", namespace=NAMESPACE)
+def _on_connect(auth=None):
+    if not current_user.is_authenticated:
+        return False
+
+
+@socketio.on("join", namespace=NAMESPACE)
+def _on_join(data):
+    """Subscribe to a campaign's progress and receive its current state."""
+    try:
+        history_id = int((data or {}).get("history_id"))
+    except (TypeError, ValueError):
+        return {"ok": False, "error": "history_id is required"}
+    history = db.session.get(BulkMessageHistory, history_id)
+    if history is None:
+        return {"ok": False, "error": "Campaign not found"}
+    join_room(room_name(history_id))
+    emit("progress", campaign_progress(history))
+    return {"ok": True}
+
+
+_CONTROLS = {
+    "pause": pause_campaign,
+    "resume": resume_campaign,
+    "cancel": cancel_campaign,
+}
+
+
+@socketio.on("control", namespace=NAMESPACE)
+def _on_control(data):
+    """Pause, resume or cancel a campaign: ``{"history_id": 1, "action": "pause"}``."""
+    data = data or {}
+    action = _CONTROLS.get(data.get("action"))
+    try:
+        history_id = int(data.get("history_id"))
+    except (TypeError, ValueError):
+        history_id = None
+    if action is None or history_id is None:
+        return {"ok": False, "error": "history_id and a pause/resume/cancel action are required"}
+    try:
+        status = action(history_id)
+    except Exception:
+        db.session.rollback()
+        logger.exception("Could not control bulk campaign %s", history_id)
+        return {"ok": False, "error": "Could not update the campaign"}
+    if status is None:
+        return {"ok": False, "error": "Campaign not found"}
+    return {"ok": True, "status": status}
+
+
+def _run_in_app(app, history_id: int) -> None:
+    try:
+        with app.app_context():
+            try:
+                run_bulk_job(history_id)
+            except Exception:
+                logger.exception("Bulk SMS job %s failed", history_id)
+                db.session.rollback()
+    finally:
+        with _jobs_lock:
+            _jobs.pop(history_id, None)
+
+
+def start_bulk_job(app, history_id: int):
+    """Run a batched campaign in the background (once per process)."""
+    with _jobs_lock:
+        job = _jobs.get(history_id)
+        if job is not None:
+            return job
+        job = _jobs[history_id] = socketio.start_background_task(_run_in_app, app, history_id)
+    return job
+
+
+def wait_for_job(history_id: int, timeout: Optional[float] = None) -> bool:
+    """Block until a running job finishes; returns False on timeout."""
+    with _jobs_lock:
+        job = _jobs.get(history_id)
+    if job is None:
+        return True
+    job.join(timeout)
+    return not job.is_alive()
+
+
+def resume_bulk_jobs(app) -> list:
+    """Restart batched campaigns interrupted while queued or running."""
+    with app.app_context():
+        history_ids = db.session.execute(
+            select(BulkMessageHistory.id).where(
+                BulkMessageHistory.send_mode == BATCHED,
+                BulkMessageHistory.status.in_((QUEUED, RUNNING)),
+            )
+        ).scalars().all()
+    for history_id in history_ids:
+        start_bulk_job(app, history_id)
+    return history_ids
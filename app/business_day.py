@@ -0,0 +1,180 @@
+"""Business-day bucketing in the shop's local timezone.
+
+Timestamps are stored as naive UTC (``datetime.utcnow``), but reports group
+by the day as the shop sees it (``BusinessSettings.timezone``, Asia/Manila
+by default). Grouping with ``func.date()`` on UTC values put the first hours
+after local midnight on the previous day and needed a different expression
+per dialect.
+
+This module converts each row once, on write: ``Laundry.business_date`` and
+``LaundryStatusHistory.business_date`` are stored, indexed columns filled by
+ORM ``before_insert``/``before_update`` listeners. Reports then filter and
+group on a plain DATE column. ``flask backfill-business-dates`` fills
+existing rows and re-derives them after a timezone change.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, select, update
+
+from . import db
+from .models import BusinessSettings, Laundry, LaundryStatusHistory
+
+logger = logging.getLogger("app.business_day")
+
+DEFAULT_TIMEZONE = "Asia/Manila"
+# Settings rarely change; re-read the timezone name at most this often
+_TZ_TTL_SECONDS = 60
+
+_tz_cache: dict = {"zone": None, "loaded_at": 0.0}
+
+
+def _load_timezone_name(connection=None) -> str:
+    stmt = select(BusinessSettings.timezone).limit(1)
+    try:
+        if connection is not None:
+            name = connection.execute(stmt).scalar()
+        else:
+            name = db.session.execute(stmt).scalar()
+    except Exception:
+        name = None
+    return name or DEFAULT_TIMEZONE
+
+
+def business_timezone(connection=None) -> ZoneInfo:
+    """Return the configured business timezone (cached for a short TTL).
+
+    Pass ``connection`` when called from inside a flush.
+    """
+    zone = _tz_cache["zone"]
+    if zone is not None and time.monotonic() - _tz_cache["loaded_at"] < _TZ_TTL_SECONDS:
+        return zone
+
+    name = _load_timezone_name(connection)
+    try:
+        zone = ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning("Unknown business timezone %r; falling back to UTC", name)
+        zone = ZoneInfo("UTC")
+    _tz_cache["zone"] = zone
+    _tz_cache["loaded_at"] = time.monotonic()
+    return zone
+
+
+def reset_business_timezone() -> None:
+    """Forget the cached timezone (call after BusinessSettings changes)."""
+    _tz_cache["zone"] = None
+
+
+def to_business_date(value: Optional[datetime], tz: Optional[ZoneInfo] = None) -> Optional[date]:
+    """Map a naive-UTC timestamp to the local business day."""
+    if value is None:
+        return None
+    tz = tz or business_timezone()
+    return value.replace(tzinfo=timezone.utc).astimezone(tz).date()
+
+
+def business_today() -> date:
+    return to_business_date(datetime.utcnow())
+
+
+def business_day_bounds(start_day: date, end_day: Optional[date] = None) -> tuple[datetime, datetime]:
+    """Return naive-UTC ``[start, end)`` covering local days start_day..end_day.
+
+    For range filters on timestamp columns that have no stored business date.
+    """
+    tz = business_timezone()
+    end_day = end_day or start_day
+
+    def local_midnight_utc(day: date) -> datetime:
+        local = datetime.combine(day, datetime.min.time(), tzinfo=tz)
+        return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return local_midnight_utc(start_day), local_midnight_utc(end_day + timedelta(days=1))
+
+
+# --- Write-time stamping ---------------------------------------------------
+
+
+@event.listens_for(Laundry, "before_insert")
+@event.listens_for(Laundry, "before_update")
+def _stamp_laundry(mapper, connection, target):
+    if target.date_received is None:
+        target.date_received = datetime.utcnow()
+    target.business_date = to_business_date(
+        target.date_received, business_timezone(connection)
+    )
+
+
+@event.listens_for(LaundryStatusHistory, "before_insert")
+def _stamp_status_history(mapper, connection, target):
+    if target.changed_at is None:
+        target.changed_at = datetime.utcnow()
+    target.business_date = to_business_date(
+        target.changed_at, business_timezone(connection)
+    )
+
+
+# --- Backfill --------------------------------------------------------------
+
+
+def _backfill_model(model, timestamp_col, only_missing: bool, chunk_size: int) -> int:
+    tz = business_timezone()
+    updated = 0
+    last_id = 0
+    while True:
+        stmt = (
+            select(model.id, timestamp_col)
+            .where(model.id > last_id, timestamp_col.isnot(None))
+            .order_by(model.id)
+            .limit(chunk_size)
+        )
+        if only_missing:
+            stmt = stmt.where(model.business_date.is_(None))
+        rows = db.session.execute(stmt).all()
+        if not rows:
+            break
+        db.session.execute(
+            update(model),
+            [{"id": row_id, "business_date": to_business_date(ts, tz)} for row_id, ts in rows],
+        )
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1][0]
+    return updated
+
+
+def backfill_business_dates(only_missing: bool = True, chunk_size: int = 1000) -> dict:
+    """Fill ``business_date`` on existing rows in id-ordered chunks.
+
+    With ``only_missing=False`` every row is re-derived (after a timezone
+    change). Commits after each chunk, so it is safe to interrupt and rerun.
+    """
+    reset_business_timezone()
+    return {
+        "laundry": _backfill_model(Laundry, Laundry.date_received, only_missing, chunk_size),
+        "laundry_status_history": _backfill_model(
+            LaundryStatusHistory, LaundryStatusHistory.changed_at, only_missing, chunk_size
+        ),
+    }
+
+
+@click.command("backfill-business-dates")
+@click.option("--all", "recompute_all", is_flag=True,
+              help="Re-derive every row (use after changing the business timezone).")
+@click.option("--chunk-size", default=1000, show_default=True)
+@with_appcontext
+def backfill_business_dates_command(recompute_all, chunk_size):
+    """Fill Laundry/LaundryStatusHistory.business_date from their timestamps."""
+    counts = backfill_business_dates(only_missing=not recompute_all, chunk_size=chunk_size)
+    click.echo(
+        f"Updated {counts['laundry']} laundry and "
+        f"{counts['laundry_status_history']} status history row(s)."
+    )
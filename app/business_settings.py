@@ -4,8 +4,10 @@ from flask import Blueprint, flash, jsonify, redirect, render_template, request,
 from flask_login import current_user, login_required
 
 from . import db
+from .business_day import reset_business_timezone
 from .models import BusinessSettings
-from dotenv import load_dotenv, set_key, find_dotenv
+from .runtime_config import reload as reload_runtime_config
+from dotenv import set_key, find_dotenv
 from sqlalchemy import create_engine
 import os
 import json
@@ -59,6 +61,7 @@ def business_settings():
 
             # Update system settings
             settings.currency_symbol = request.form.get("currency_symbol", "₱").strip()
+            previous_timezone = settings.timezone
             settings.timezone = request.form.get("timezone", "Asia/Manila").strip()
 
             # Advanced settings: Database URL and SMS (Semaphore)
@@ -163,8 +166,6 @@ def business_settings():
                 # If DB validated, persist and attempt a safe runtime rebind
                 if database_url:
                     set_key(dotenv_path, "DATABASE_URL", database_url)
-                    # reload into environment for current process (best-effort)
-                    load_dotenv(dotenv_path, override=True)
 
                     # Persist a machine-readable copy of connection info so
                     # orchestrators or runtime helpers can consume it easily.
@@ -190,6 +191,10 @@ def business_settings():
                     except Exception as e:
                         flash(f"Warning: could not write connect.json: {e}", "warning")
 
+                    # Publish the new values to this process (other workers
+                    # notice the changed files on their next check)
+                    reload_runtime_config(force=True)
+
                     # Try to reconfigure the Flask-SQLAlchemy engine at runtime so
                     # the app picks up the new DATABASE_URL without a full process
                     # restart. This is best-effort: if it fails, ask admin to restart.
@@ -261,7 +266,7 @@ def business_settings():
                         )
                 else:
                     # reload phone/sms env changes even if DB wasn't changed
-                    load_dotenv(dotenv_path, override=True)
+                    reload_runtime_config(force=True)
 
             except Exception as e:
                 # Non-fatal: save settings in DB and inform user
@@ -271,7 +276,14 @@ def business_settings():
             settings.updated_by = current_user.id
 
             db.session.commit()
+            reset_business_timezone()
             flash("Business settings updated successfully!", "success")
+            if settings.timezone != previous_timezone:
+                flash(
+                    "Timezone changed: run 'flask backfill-business-dates --all' and "
+                    "'flask rebuild-daily-stats' to re-bucket existing reports.",
+                    "warning",
+                )
 
         except Exception as e:
             db.session.rollback()
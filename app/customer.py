@@ -15,8 +15,10 @@ import io
 import re
 
 from . import db
+from .daily_stats import record_new_customer
 from .decorators import user_or_admin_required
 from .models import Customer, Laundry
+from .phones import is_ph_mobile, normalize_phone
 from .sms_service import send_welcome_sms
 
 
@@ -195,12 +197,29 @@ def view_customer(id):
 
 
 def validate_phone_number(phone):
-    """Validate Philippine phone number format"""
-    if not phone:
-        return False
-    # Allow +639XXXXXXXXX or 09XXXXXXXXX formats
-    phone_pattern = r"^(\+63|0)[0-9]{10}$"
-    return bool(re.match(phone_pattern, phone))
+    """Validate Philippine mobile number format"""
+    # Accepts +639XXXXXXXXX, 09XXXXXXXXX, 9XXXXXXXXX with spaces or dashes
+    return is_ph_mobile(normalize_phone(phone))
+
+
+def find_phone_owner(phone, exclude_id=None):
+    """Return the customer already using ``phone`` (compared in E.164), if any."""
+    e164 = normalize_phone(phone)
+    if not e164:
+        return None
+    query = Customer.query.filter(Customer.phone_e164 == e164)
+    if exclude_id is not None:
+        query = query.filter(Customer.id != exclude_id)
+    return query.first()
+
+
+def warn_shared_phone(owner):
+    """Flash a warning when the saved phone number also belongs to ``owner``."""
+    if owner is not None:
+        flash(
+            f"Another customer already uses this phone number ({owner.full_name}).",
+            category="warning",
+        )
 
 
 def validate_email(email):
@@ -304,6 +323,7 @@ def add_customer():
             full_name = full_name.strip()
             email = email.strip() if email else None
             phone = phone.strip()
+            owner = find_phone_owner(phone)
 
             # Create new customer with proper attribute assignment
             new_customer = Customer()
@@ -312,30 +332,28 @@ def add_customer():
             new_customer.phone = phone
 
             db.session.add(new_customer)
+            record_new_customer()
             db.session.commit()
-            # Broadcast notification to all users
-            from app.models import Notification, User
-
-            users = User.query.filter_by(is_active=True).all()
-            for user in users:
-                notif = Notification(
-                    user_id=user.id,
-                    title="New Customer Added",
-                    message=f"Customer '{full_name}' has been added to the system.",
-                    notification_type="info",
-                    related_model="customer",
-                    related_id=str(new_customer.id),
-                    action_url=f"/customer/view/{new_customer.id}",
-                    action_text="View Customer",
-                )
-                db.session.add(notif)
-            db.session.commit()
+            # Broadcast notification to all users (one row, read state per user)
+            from app.notifications import create_notification
+
+            create_notification(
+                user_id=None,
+                title="New Customer Added",
+                message=f"Customer '{full_name}' has been added to the system.",
+                notification_type="info",
+                related_model="customer",
+                related_id=str(new_customer.id),
+                action_url=f"/customer/view/{new_customer.id}",
+                action_text="View Customer",
+            )
 
             # Send welcome SMS if phone number is provided
             if phone:
                 send_welcome_sms(new_customer)
 
             flash("Customer added successfully!", category="success")
+            warn_shared_phone(owner)
             return redirect(url_for("customer.list_customers"))
 
     return render_template("customer_add.html", user=current_user)
@@ -371,6 +389,11 @@ def edit_customer(id):
             for error in errors:
                 flash(error, category="error")
         else:
+            # Only a changed number is checked, so existing shared numbers can still be edited
+            owner = None
+            if normalize_phone(phone) != customer_obj.phone_e164:
+                owner = find_phone_owner(phone, exclude_id=customer_obj.id)
+
             # Clean and update the data
             customer_obj.full_name = full_name.strip()
             customer_obj.email = email.strip() if email else None
@@ -384,6 +407,7 @@ def edit_customer(id):
 
             db.session.commit()
             flash("Customer updated successfully!", category="success")
+            warn_shared_phone(owner)
             return redirect(url_for("customer.list_customers"))
 
     return render_template("customer_edit.html", user=current_user, customer=customer_obj)
@@ -0,0 +1,254 @@
+"""Incremental DailyStats rollup and the report queries that read it.
+
+Report pages (charts, daily calendar, customer analytics, sales report) used
+to rescan Laundry and LaundryStatusHistory with ``func.date(...)`` on every
+request. Instead, the write paths bump one ``DailyStats`` row per
+(day, service) in the same transaction as the change, and the reports read
+those rows back with plain range filters on the indexed ``day`` column.
+
+Days are local business days (see ``app.business_day``). Definitions kept
+identical between the incremental path and the rebuild:
+
+- received_count: laundries received on the day (``Laundry.business_date``)
+- completed_count / revenue: laundries whose ``completed_at`` falls on the
+  day, at their price when completed (a re-completion moves the order to
+  the new day)
+- new_customers: customers created on the day (stored on service 0)
+
+``flask rebuild-daily-stats`` recomputes the table from the source rows.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Optional
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .backfills import backfill_status_timestamps
+from .business_day import backfill_business_dates, business_day_bounds, to_business_date
+from .models import Customer, DailyStats, Laundry
+
+logger = logging.getLogger("app.daily_stats")
+
+# Rollup bucket for laundries without a service and for new-customer counts
+NO_SERVICE = 0
+COMPLETED_STATUS = "Completed"
+
+_COUNTERS = ("received_count", "completed_count", "revenue", "new_customers")
+
+
+def _as_date(value) -> date:
+    """Normalize DATE results (date on most drivers, str on some)."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _bump(day: date, service_id: Optional[int], **deltas) -> None:
+    """Add ``deltas`` to the (day, service) row, creating it on first use.
+
+    Uses ``UPDATE ... SET col = col + delta`` so concurrent writers do not
+    lose increments; a unique-constraint race on first insert falls back to
+    the update.
+    """
+    service_id = service_id or NO_SERVICE
+    values = {getattr(DailyStats, k): getattr(DailyStats, k) + v for k, v in deltas.items()}
+    row_filter = DailyStats.query.filter_by(day=day, service_id=service_id)
+
+    if row_filter.update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(DailyStats(day=day, service_id=service_id, **deltas))
+    except IntegrityError:
+        # Another request created the row between our UPDATE and INSERT
+        row_filter.update(values, synchronize_session=False)
+
+
+def record_received(laundry: Laundry, when: Optional[datetime] = None) -> None:
+    day = laundry.business_date if when is None else None
+    day = day or to_business_date(when or laundry.date_received or datetime.utcnow())
+    _bump(day, laundry.service_id, received_count=1)
+
+
+def record_completed(laundry: Laundry, when: Optional[datetime] = None) -> None:
+    day = to_business_date(when or datetime.utcnow())
+    _bump(day, laundry.service_id, completed_count=1, revenue=float(laundry.price or 0))
+
+
+def record_new_customer(when: Optional[datetime] = None) -> None:
+    day = to_business_date(when or datetime.utcnow())
+    _bump(day, NO_SERVICE, new_customers=1)
+
+
+def _unrecord_completed(laundry: Laundry) -> None:
+    _bump(
+        to_business_date(laundry.completed_at),
+        laundry.service_id,
+        completed_count=-1,
+        revenue=-float(laundry.price or 0),
+    )
+
+
+def record_status_change(
+    laundry: Laundry, old_status, new_status, when: Optional[datetime] = None
+) -> None:
+    """Apply one status transition to the rollup (called by log_status_change).
+
+    Must run before ``laundry.completed_at`` is overwritten.
+    """
+    if old_status is None:
+        record_received(laundry)
+    if new_status == COMPLETED_STATUS:
+        if laundry.completed_at is not None:
+            _unrecord_completed(laundry)
+        record_completed(laundry, when)
+
+
+def forget_laundry(laundry: Laundry) -> None:
+    """Remove a laundry's contributions before it is deleted."""
+    received_day = laundry.business_date or to_business_date(laundry.date_received)
+    if received_day:
+        _bump(received_day, laundry.service_id, received_count=-1)
+    if laundry.completed_at is not None:
+        _unrecord_completed(laundry)
+
+
+def remember_laundry(laundry: Laundry) -> None:
+    """Re-add a laundry's contributions (undoes :func:`forget_laundry`).
+
+    An edit that changes the service or price forgets the order with its
+    old values, then remembers it with the new ones.
+    """
+    received_day = laundry.business_date or to_business_date(laundry.date_received)
+    if received_day:
+        _bump(received_day, laundry.service_id, received_count=1)
+    if laundry.completed_at is not None:
+        record_completed(laundry, laundry.completed_at)
+
+
+def rebuild_daily_stats(start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """Recompute DailyStats for [start, end] (whole history when omitted).
+
+    Returns the number of rollup rows written. Commits.
+    """
+    def in_range(column):
+        conds = []
+        if start is not None:
+            conds.append(column >= start)
+        if end is not None:
+            conds.append(column <= end)
+        return conds
+
+    # Rows written before these columns existed need them before they can be grouped
+    backfill_business_dates(only_missing=True)
+    backfill_status_timestamps(only_missing=True)
+
+    buckets: dict = defaultdict(lambda: dict.fromkeys(_COUNTERS, 0))
+
+    for day, service_id, count in (
+        db.session.query(Laundry.business_date, Laundry.service_id, func.count(Laundry.id))
+        .filter(Laundry.business_date.isnot(None), *in_range(Laundry.business_date))
+        .group_by(Laundry.business_date, Laundry.service_id)
+    ):
+        buckets[(_as_date(day), service_id or NO_SERVICE)]["received_count"] += count
+
+    # completed_at is a timestamp: range-filter on it, bucket per row in Python
+    completed_query = db.session.query(
+        Laundry.completed_at, Laundry.service_id, Laundry.price
+    ).filter(Laundry.completed_at.isnot(None))
+    if start is not None:
+        completed_query = completed_query.filter(
+            Laundry.completed_at >= business_day_bounds(start)[0]
+        )
+    if end is not None:
+        completed_query = completed_query.filter(
+            Laundry.completed_at < business_day_bounds(end)[1]
+        )
+    for completed_at, service_id, price in completed_query.yield_per(1000):
+        bucket = buckets[(to_business_date(completed_at), service_id or NO_SERVICE)]
+        bucket["completed_count"] += 1
+        bucket["revenue"] += float(price or 0)
+
+    # Customers carry no stored business date; bucket their timestamps here
+    customer_query = db.session.query(Customer.date_created).filter(
+        Customer.date_created.isnot(None)
+    )
+    if start is not None:
+        customer_query = customer_query.filter(
+            Customer.date_created >= business_day_bounds(start)[0]
+        )
+    if end is not None:
+        customer_query = customer_query.filter(
+            Customer.date_created < business_day_bounds(end)[1]
+        )
+    for (created_at,) in customer_query.yield_per(1000):
+        buckets[(to_business_date(created_at), NO_SERVICE)]["new_customers"] += 1
+
+    stale = DailyStats.query
+    if start:
+        stale = stale.filter(DailyStats.day >= start)
+    if end:
+        stale = stale.filter(DailyStats.day <= end)
+    stale.delete(synchronize_session=False)
+
+    db.session.add_all(
+        DailyStats(day=day, service_id=service_id, **counters)
+        for (day, service_id), counters in buckets.items()
+    )
+    db.session.commit()
+    logger.info("Rebuilt %d daily_stats rows (%s to %s)", len(buckets), start, end)
+    return len(buckets)
+
+
+def daily_totals(start: date, end: date) -> dict:
+    """Return ``{day: {counter: value}}`` for [start, end], summed over services."""
+    rows = (
+        db.session.query(
+            DailyStats.day,
+            func.sum(DailyStats.received_count),
+            func.sum(DailyStats.completed_count),
+            func.sum(DailyStats.revenue),
+            func.sum(DailyStats.new_customers),
+        )
+        .filter(DailyStats.day >= start, DailyStats.day <= end)
+        .group_by(DailyStats.day)
+        .all()
+    )
+    return {
+        _as_date(day): {
+            "received_count": int(received or 0),
+            "completed_count": int(completed or 0),
+            "revenue": float(revenue or 0),
+            "new_customers": int(new_customers or 0),
+        }
+        for day, received, completed, revenue, new_customers in rows
+    }
+
+
+def sum_between(totals: dict, start: date, end: date, counter: str):
+    """Sum one counter of a :func:`daily_totals` result over [start, end]."""
+    return sum(v[counter] for d, v in totals.items() if start <= d <= end)
+
+
+@click.command("rebuild-daily-stats")
+@click.option("--start", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+              help="First day to rebuild (YYYY-MM-DD). Defaults to all history.")
+@click.option("--end", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+              help="Last day to rebuild (YYYY-MM-DD). Defaults to all history.")
+@with_appcontext
+def rebuild_daily_stats_command(start, end):
+    """Backfill or rebuild the DailyStats rollup table."""
+    db.create_all()
+    count = rebuild_daily_stats(
+        start.date() if start else None, end.date() if end else None
+    )
+    click.echo(f"Rebuilt {count} daily_stats row(s).")
@@ -0,0 +1,269 @@
+"""Single-pass KPI aggregation for the main dashboard.
+
+The dashboard used to issue one ``COUNT(*)``/``SUM()`` round trip per card.
+This module folds those into a handful of conditional-aggregate queries
+(``SUM(CASE WHEN ... THEN 1 ELSE 0 END)``), one per table, and returns a
+single :class:`DashboardStats` object for the view and template.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, case, func, not_, or_
+
+from . import db
+from .business_day import business_day_bounds, business_today
+from .models import Customer, InventoryItem, Laundry, Service
+
+# Statuses that count as "done" (no longer active on the floor)
+DONE_STATUSES = ("Completed", "Picked Up")
+# Statuses whose price counts as realised revenue
+REVENUE_STATUSES = ("Completed", "Ready for Pickup")
+# Statuses included in "today's earned" card
+EARNED_STATUSES = ("Received", "Ready for Pickup", "Completed")
+
+
+def _count_if(condition):
+    """Return a ``SUM(CASE WHEN condition THEN 1 ELSE 0 END)`` expression."""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _sum_if(column, condition):
+    """Return a ``SUM(CASE WHEN condition THEN column ELSE 0 END)`` expression."""
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+
+@dataclass(frozen=True)
+class DashboardStats:
+    """All numeric KPIs rendered on the dashboard."""
+
+    # Laundry status counts
+    total_laundries: int = 0
+    active_laundries: int = 0
+    completed_laundries: int = 0
+    received_laundries_count: int = 0
+    ready_pickup_count: int = 0
+    pending_laundries: int = 0
+    in_progress_laundries: int = 0
+    picked_up_laundries: int = 0
+
+    # Today
+    received_today: int = 0
+    active_laundries_received_today: int = 0
+    today_earned_all_status: float = 0.0
+    completed_today: int = 0
+    today_earnings: float = 0.0
+
+    # Revenue
+    total_revenue: float = 0.0
+    estimated_revenue: float = 0.0
+
+    # Last 7 days
+    laundries_7d_total: int = 0
+    laundries_7d_completed: int = 0
+    new_customers_7d: int = 0
+    prev_customers_7d: int = 0
+
+    # Customers and services
+    total_customers: int = 0
+    total_services: int = 0
+    active_services: int = 0
+    standard_services: int = 0
+    express_services: int = 0
+    premium_services: int = 0
+
+    # Inventory
+    total_inventory_items: int = 0
+    low_stock_count: int = 0
+    out_of_stock_count: int = 0
+    total_inventory_value: float = 0.0
+
+    @property
+    def pending_since_beginning(self) -> int:
+        return self.pending_laundries
+
+    @property
+    def active_laundries_received_status(self) -> int:
+        return self.received_laundries_count
+
+    @property
+    def customer_growth_percent(self) -> int:
+        if self.prev_customers_7d > 0:
+            return round(
+                ((self.new_customers_7d - self.prev_customers_7d) / self.prev_customers_7d)
+                * 100
+            )
+        return 100 if self.new_customers_7d > 0 else 0
+
+    @property
+    def completion_rate_7d(self) -> int:
+        if self.laundries_7d_total > 0:
+            return round((self.laundries_7d_completed / self.laundries_7d_total) * 100)
+        return 0
+
+    @property
+    def capacity_percent(self) -> int:
+        # Assumes 50 concurrent loads as nominal shop capacity
+        return round(min(100, (self.active_laundries / 50) * 100))
+
+    @property
+    def service_utilization_percent(self) -> int:
+        if self.total_services > 0:
+            return round((self.active_services / self.total_services) * 100)
+        return 0
+
+    @property
+    def business_health_score(self) -> int:
+        """Weighted blend: completion rate (40%), customer growth (30%), utilization (30%)."""
+
+        def clamp(v, lo=0, hi=100):
+            return max(lo, min(hi, v))
+
+        return clamp(
+            round(
+                0.4 * clamp(self.completion_rate_7d)
+                + 0.3 * clamp(self.customer_growth_percent)
+                + 0.3 * clamp(self.service_utilization_percent)
+            )
+        )
+
+
+def _laundry_aggregates(today: date, seven_days_ago: datetime) -> dict:
+    day_start, day_end = business_day_bounds(today)
+    received_today = Laundry.business_date == today
+    updated_today = and_(
+        Laundry.date_updated >= day_start, Laundry.date_updated < day_end
+    )
+    not_done = not_(Laundry.status.in_(DONE_STATUSES))
+    in_last_7d = Laundry.date_received >= seven_days_ago
+
+    row = db.session.query(
+        func.count(Laundry.id).label("total_laundries"),
+        _count_if(not_done).label("active_laundries"),
+        _count_if(Laundry.status == "Completed").label("completed_laundries"),
+        _count_if(Laundry.status == "Received").label("received_laundries_count"),
+        _count_if(Laundry.status == "Ready for Pickup").label("ready_pickup_count"),
+        _count_if(Laundry.status == "Pending").label("pending_laundries"),
+        _count_if(Laundry.status == "In Progress").label("in_progress_laundries"),
+        _count_if(Laundry.status == "Picked Up").label("picked_up_laundries"),
+        _count_if(received_today).label("received_today"),
+        _count_if(and_(received_today, not_done)).label(
+            "active_laundries_received_today"
+        ),
+        _sum_if(
+            Laundry.price, and_(updated_today, Laundry.status.in_(EARNED_STATUSES))
+        ).label("today_earned_all_status"),
+        _sum_if(Laundry.price, Laundry.status.in_(REVENUE_STATUSES)).label(
+            "total_revenue"
+        ),
+        _sum_if(Laundry.price, not_(Laundry.status.in_(REVENUE_STATUSES))).label(
+            "estimated_revenue"
+        ),
+        _count_if(in_last_7d).label("laundries_7d_total"),
+        _count_if(and_(in_last_7d, Laundry.status == "Completed")).label(
+            "laundries_7d_completed"
+        ),
+    ).one()
+    return dict(row._mapping)
+
+
+def _completed_today_aggregates(today: date) -> dict:
+    """Orders moved to Completed/Ready for Pickup today and their value."""
+    day_start, day_end = business_day_bounds(today)
+    row = (
+        db.session.query(
+            func.count(Laundry.id).label("completed_today"),
+            func.coalesce(func.sum(Laundry.price), 0).label("today_earnings"),
+        )
+        .filter(
+            or_(
+                and_(Laundry.completed_at >= day_start, Laundry.completed_at < day_end),
+                and_(Laundry.ready_at >= day_start, Laundry.ready_at < day_end),
+            )
+        )
+        .one()
+    )
+    return dict(row._mapping)
+
+
+def _customer_aggregates(seven_days_ago: datetime, fourteen_days_ago: datetime) -> dict:
+    row = db.session.query(
+        func.count(Customer.id).label("total_customers"),
+        _count_if(Customer.date_created >= seven_days_ago).label("new_customers_7d"),
+        _count_if(
+            and_(
+                Customer.date_created >= fourteen_days_ago,
+                Customer.date_created < seven_days_ago,
+            )
+        ).label("prev_customers_7d"),
+    ).one()
+    return dict(row._mapping)
+
+
+def _service_aggregates() -> dict:
+    row = db.session.query(
+        func.count(Service.id).label("total_services"),
+        _count_if(Service.is_active.is_(True)).label("active_services"),
+        _count_if(Service.category == "Standard").label("standard_services"),
+        _count_if(Service.category == "Express").label("express_services"),
+        _count_if(Service.category == "Premium").label("premium_services"),
+    ).one()
+    return dict(row._mapping)
+
+
+def _inventory_aggregates() -> dict:
+    active = InventoryItem.is_active.is_(True)
+    row = db.session.query(
+        _count_if(active).label("total_inventory_items"),
+        _count_if(
+            and_(active, InventoryItem.current_stock <= InventoryItem.minimum_stock)
+        ).label("low_stock_count"),
+        _count_if(and_(active, InventoryItem.current_stock <= 0)).label(
+            "out_of_stock_count"
+        ),
+        _sum_if(InventoryItem.current_stock * InventoryItem.cost_per_unit, active).label(
+            "total_inventory_value"
+        ),
+    ).one()
+    return dict(row._mapping)
+
+
+def compute_dashboard_stats(
+    today: Optional[date] = None,
+    now: Optional[datetime] = None,
+    include_inventory: bool = True,
+) -> DashboardStats:
+    """Compute every dashboard KPI in five aggregate queries.
+
+    - today: local business date for the "today" cards (defaults to ``business_today()``).
+    - now: reference instant for the rolling 7-day windows (defaults to ``utcnow``).
+    - include_inventory: skip the inventory query for roles that never see it.
+    """
+    today = today or business_today()
+    now = now or datetime.utcnow()
+    seven_days_ago = now - timedelta(days=7)
+    fourteen_days_ago = now - timedelta(days=14)
+
+    values: dict = {}
+    values.update(_laundry_aggregates(today, seven_days_ago))
+    values.update(_completed_today_aggregates(today))
+    values.update(_customer_aggregates(seven_days_ago, fourteen_days_ago))
+    values.update(_service_aggregates())
+    if include_inventory:
+        values.update(_inventory_aggregates())
+
+    money_fields = {
+        "today_earned_all_status",
+        "today_earnings",
+        "total_revenue",
+        "estimated_revenue",
+        "total_inventory_value",
+    }
+    return DashboardStats(
+        **{
+            key: (float(val or 0) if key in money_fields else int(val or 0))
+            for key, val in values.items()
+        }
+    )
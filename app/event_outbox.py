@@ -0,0 +1,226 @@
+"""Transactional outbox for side effects of domain changes.
+
+``laundry.update_status`` used to commit the status and then, one after the
+other and each with its own commit and failure mode, create a staff
+notification, email the customer, queue the status SMS and award loyalty
+points. A crash in between lost the rest; a retried request repeated them.
+
+Now the request only records an ``outbox_event`` row (:func:`record_event`)
+in the same transaction as the change, so the work is committed together
+with its cause or not at all. Handlers registered with :func:`handles` run
+later in a worker:
+
+- each handler's database writes are committed together with an
+  ``outbox_event_receipt`` row for (event, handler), so a handler that has
+  completed is skipped when the event is retried; database effects such as
+  notifications, loyalty points and queued SMS happen exactly once
+- handlers must not commit themselves; effects outside the database (email)
+  are at-least-once, as a crash between sending and committing the receipt
+  repeats them
+- a failing handler leaves the event pending with exponential backoff
+  (``EVENT_MAX_ATTEMPTS``, default 8, then ``dead``); the other handlers
+  are not affected
+
+Events are claimed like SMS outbox rows (conditional ``UPDATE``), so several
+processes can drain the table. Workers start with the app unless
+``ENABLE_EVENT_WORKER=0`` (never under pytest); ``flask drain-outbox-events``
+processes due events in the foreground.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import OutboxEvent, OutboxEventReceipt
+from .sms_outbox import SMSDispatcher, _env_number, backoff_seconds
+
+logger = logging.getLogger("app.event_outbox")
+
+DEFAULT_MAX_ATTEMPTS = 8
+
+_SESSION_FLAG = "event_outbox_recorded"
+
+_wake = threading.Event()
+# event_type -> [(handler name, function)] in registration order
+_handlers: dict = {}
+
+
+def handles(event_type: str, name: str) -> Callable:
+    """Register ``fn(payload: dict)`` as handler ``name`` for ``event_type``.
+
+    Names are stored in receipts, so keep them stable once deployed.
+    """
+
+    def decorator(fn):
+        registered = _handlers.setdefault(event_type, [])
+        registered[:] = [(n, f) for n, f in registered if n != name]
+        registered.append((name, fn))
+        return fn
+
+    return decorator
+
+
+def record_event(event_type: str, payload: dict, dedupe_key: Optional[str] = None) -> OutboxEvent:
+    """Add an event to the current transaction (the caller commits)."""
+    row = OutboxEvent(
+        event_type=event_type,
+        payload=json.dumps(payload, default=str),
+        dedupe_key=dedupe_key,
+        status=OutboxEvent.PENDING,
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.session.add(row)
+    db.session.info[_SESSION_FLAG] = True
+    return row
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    if session.info.pop(_SESSION_FLAG, False):
+        _wake.set()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_FLAG, None)
+
+
+def _due_condition(now: datetime):
+    stale_before = now - timedelta(seconds=_env_number("EVENT_PROCESSING_TIMEOUT", 300))
+    return or_(
+        (OutboxEvent.status == OutboxEvent.PENDING) & (OutboxEvent.next_attempt_at <= now),
+        (OutboxEvent.status == OutboxEvent.PROCESSING) & (OutboxEvent.locked_at < stale_before),
+    )
+
+
+def claim_due(limit: int = 1) -> list:
+    """Mark up to ``limit`` due events as processing and return their ids. Commits."""
+    now = datetime.utcnow()
+    candidates = db.session.execute(
+        select(OutboxEvent.id)
+        .where(_due_condition(now))
+        .order_by(OutboxEvent.next_attempt_at, OutboxEvent.id)
+        .limit(limit * 2)
+    ).scalars().all()
+    claimed = []
+    for event_id in candidates:
+        result = db.session.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id == event_id, _due_condition(now))
+            .values(status=OutboxEvent.PROCESSING, locked_at=now, attempts=OutboxEvent.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            claimed.append(event_id)
+            if len(claimed) >= limit:
+                break
+    db.session.commit()
+    return claimed
+
+
+def process_claimed(event_id: int) -> str:
+    """Run the outstanding handlers of one claimed event; returns its new status."""
+    row = db.session.get(OutboxEvent, event_id)
+    if row is None or row.status != OutboxEvent.PROCESSING:
+        db.session.rollback()
+        return "skipped"
+    event_type, payload = row.event_type, json.loads(row.payload)
+    done = set(
+        db.session.execute(
+            select(OutboxEventReceipt.handler).where(OutboxEventReceipt.event_id == event_id)
+        ).scalars()
+    )
+    db.session.commit()
+
+    errors = []
+    for name, handler in _handlers.get(event_type, []):
+        if name in done:
+            continue
+        try:
+            handler(payload)
+            db.session.add(OutboxEventReceipt(event_id=event_id, handler=name))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            errors.append(f"{name}: {e}")
+            logger.warning("Handler %s failed for event %s: %s", name, event_id, e)
+
+    row = db.session.get(OutboxEvent, event_id)
+    now = datetime.utcnow()
+    row.locked_at = None
+    if not errors:
+        row.status = OutboxEvent.DONE
+        row.processed_at = now
+        row.last_error = None
+    elif row.attempts < _env_number("EVENT_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS):
+        row.status = OutboxEvent.PENDING
+        row.next_attempt_at = now + timedelta(seconds=backoff_seconds(row.attempts))
+        row.last_error = "; ".join(errors)[:2000]
+    else:
+        row.status = OutboxEvent.DEAD
+        row.last_error = "; ".join(errors)[:2000]
+        logger.error("Event %s dead after %d attempt(s): %s", event_id, row.attempts, row.last_error)
+    status = row.status
+    db.session.commit()
+    return status
+
+
+def drain_events(limit: Optional[int] = None) -> Counter:
+    """Process due events in this thread until none are due (or ``limit`` done)."""
+    outcomes: Counter = Counter()
+    while limit is None or sum(outcomes.values()) < limit:
+        ids = claim_due(1)
+        if not ids:
+            break
+        outcomes[process_claimed(ids[0])] += 1
+    return outcomes
+
+
+class EventDispatcher(SMSDispatcher):
+    """Worker threads draining ``outbox_event``."""
+
+    name = "event-outbox"
+    wake = _wake
+
+    def work_once(self) -> bool:
+        ids = claim_due(1)
+        if ids:
+            process_claimed(ids[0])
+        return bool(ids)
+
+
+def start_event_dispatcher(app) -> EventDispatcher:
+    """Start (once per app) the background event workers."""
+    dispatcher = app.extensions.get("event_dispatcher")
+    if dispatcher is None:
+        dispatcher = EventDispatcher(
+            app,
+            threads=_env_number("EVENT_WORKER_THREADS", 2),
+            poll_seconds=_env_number("EVENT_WORKER_POLL_SECONDS", 5.0),
+        )
+        dispatcher.start()
+        app.extensions["event_dispatcher"] = dispatcher
+    return dispatcher
+
+
+@click.command("drain-outbox-events")
+@click.option("--limit", type=int, default=None, help="Stop after this many events.")
+@with_appcontext
+def drain_outbox_events_command(limit):
+    """Process due side-effect events in the foreground."""
+    outcomes = drain_events(limit=limit)
+    click.echo(
+        ", ".join(f"{status}: {count}" for status, count in sorted(outcomes.items()))
+        or "No events due."
+    )
@@ -1,19 +1,20 @@
-from datetime import date, datetime, timedelta
+from datetime import datetime, timedelta
 
 from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 from sqlalchemy import and_, func, or_
 
+from .business_day import business_today
 from .models import (
-    Customer,
+    DailyStats,
     Expense,
     ExpenseCategory,
     InventoryItem,
     Laundry,
-    LaundryStatusHistory,
     Service,
     db,
 )
+from .reference_cache import cached_all
 
 expenses_bp = Blueprint("expenses", __name__, url_prefix="/expenses")
 
@@ -23,7 +24,7 @@ expenses_bp = Blueprint("expenses", __name__, url_prefix="/expenses")
 def dashboard():
     """Expense dashboard with overview"""
     # Current month expenses
-    today = date.today()
+    today = business_today()
     start_of_month = today.replace(day=1)
 
     # Get monthly expenses
@@ -41,7 +42,7 @@ def dashboard():
         db.session.query(func.sum(Laundry.price))
         .filter(
             and_(
-                Laundry.date_received >= start_of_month, Laundry.date_received <= today
+                Laundry.business_date >= start_of_month, Laundry.business_date <= today
             )
         )
         .scalar()
@@ -136,7 +137,7 @@ def list_expenses():
         page=page, per_page=20, error_out=False
     )
 
-    categories = ExpenseCategory.query.filter(ExpenseCategory.is_active).all()
+    categories = cached_all(ExpenseCategory, is_active=True)
 
     return render_template(
         "expenses/list.html", expenses=expenses, categories=categories
@@ -193,7 +194,7 @@ def add_expense():
             flash(f"Error adding expense: {str(e)}", "error")
             db.session.rollback()
 
-    categories = ExpenseCategory.query.filter(ExpenseCategory.is_active).all()
+    categories = cached_all(ExpenseCategory, is_active=True)
     return render_template("expenses/form.html", categories=categories)
 
 
@@ -243,7 +244,7 @@ def edit_expense(id):
             flash(f"Error updating expense: {str(e)}", "error")
             db.session.rollback()
 
-    categories = ExpenseCategory.query.filter(ExpenseCategory.is_active).all()
+    categories = cached_all(ExpenseCategory, is_active=True)
     return render_template("expenses/form.html", expense=expense, categories=categories)
 
 
@@ -302,7 +303,7 @@ def reports():
     date_from = request.args.get("date_from", "")
     date_to = request.args.get("date_to", "")
 
-    today = date.today()
+    today = business_today()
 
     # Set default date range based on report type
     if not date_from or not date_to:
@@ -337,46 +338,20 @@ def reports():
 
 def generate_sales_report(date_from, date_to, report_type):
     """Generate comprehensive sales and expense report"""
-    # Define datetime range for completion timestamps (inclusive of end date)
-    start_dt = datetime.combine(date_from, datetime.min.time())
-    end_dt_exclusive = datetime.combine(
-        date_to + timedelta(days=1), datetime.min.time()
-    )
-
-    # Completed laundries within range via status history
-    completed_subq = (
-        db.session.query(LaundryStatusHistory.laundry_id)
-        .filter(
-            and_(
-                LaundryStatusHistory.new_status == "Completed",
-                LaundryStatusHistory.changed_at >= start_dt,
-                LaundryStatusHistory.changed_at < end_dt_exclusive,
-            )
-        )
-        .subquery()
-    )
-
-    # Revenue from completed laundries in period
-    total_revenue = (
-        db.session.query(func.sum(Laundry.price))
-        .filter(Laundry.laundry_id.in_(completed_subq))
-        .scalar()
-        or 0
-    )
-
-    # Total laundries completed in period
-    laundry_count = (
-        db.session.query(func.count(func.distinct(LaundryStatusHistory.laundry_id)))
-        .filter(
-            and_(
-                LaundryStatusHistory.new_status == "Completed",
-                LaundryStatusHistory.changed_at >= start_dt,
-                LaundryStatusHistory.changed_at < end_dt_exclusive,
-            )
+    # Completions and revenue in the period come from the DailyStats rollup
+    in_period = and_(DailyStats.day >= date_from, DailyStats.day <= date_to)
+    period_totals = (
+        db.session.query(
+            func.coalesce(func.sum(DailyStats.revenue), 0),
+            func.coalesce(func.sum(DailyStats.completed_count), 0),
+            func.coalesce(func.sum(DailyStats.new_customers), 0),
         )
-        .scalar()
-        or 0
+        .filter(in_period)
+        .one()
     )
+    total_revenue = float(period_totals[0] or 0)
+    laundry_count = int(period_totals[1] or 0)
+    new_customers = int(period_totals[2] or 0)
 
     # Total expenses
     expense_query = db.session.query(func.sum(Expense.amount)).filter(
@@ -399,15 +374,16 @@ def generate_sales_report(date_from, date_to, report_type):
         .all()
     )
 
-    # Service performance for completed laundries in period
+    # Service performance for completed laundries in period (service 0 = none)
     service_performance = (
         db.session.query(
-            Laundry.service_id,
-            func.count(Laundry.id).label("count"),
-            func.sum(Laundry.price).label("revenue"),
+            func.nullif(DailyStats.service_id, 0).label("service_id"),
+            func.sum(DailyStats.completed_count).label("count"),
+            func.sum(DailyStats.revenue).label("revenue"),
         )
-        .filter(Laundry.laundry_id.in_(completed_subq))
-        .group_by(Laundry.service_id)
+        .filter(in_period)
+        .group_by(DailyStats.service_id)
+        .having(func.sum(DailyStats.completed_count) > 0)
         .all()
     )
 
@@ -419,22 +395,14 @@ def generate_sales_report(date_from, date_to, report_type):
         labels_hist.append(day.isoformat())
         day += timedelta(days=1)
 
-    # Query daily revenue grouped by date and service for completed laundries
+    # Daily revenue grouped by date and service for completed laundries
     daily_rows = (
         db.session.query(
-            func.date(LaundryStatusHistory.changed_at).label("day"),
-            Laundry.service_id,
-            func.sum(Laundry.price).label("revenue"),
-        )
-        .join(Laundry, Laundry.laundry_id == LaundryStatusHistory.laundry_id)
-        .filter(
-            and_(
-                LaundryStatusHistory.new_status == "Completed",
-                LaundryStatusHistory.changed_at >= start_dt,
-                LaundryStatusHistory.changed_at < end_dt_exclusive,
-            )
+            DailyStats.day,
+            DailyStats.service_id,
+            DailyStats.revenue,
         )
-        .group_by("day", Laundry.service_id)
+        .filter(in_period, DailyStats.completed_count > 0)
         .all()
     )
 
@@ -553,11 +521,6 @@ def generate_sales_report(date_from, date_to, report_type):
         }
     )
 
-    # Customer metrics
-    new_customers = Customer.query.filter(
-        and_(Customer.date_created >= date_from, Customer.date_created <= date_to)
-    ).count()
-
     # Current inventory value
     inventory_value = (
         db.session.query(
@@ -0,0 +1,156 @@
+"""Pooled HTTP session, circuit breaker and latency histogram for provider calls.
+
+``SMSService`` used module-level ``requests.post``/``requests.get``, so every
+send opened a new TLS connection and, while Semaphore was degraded, every
+order waited out the full 30s timeout. It now uses:
+
+- :func:`pooled_session`: a ``requests.Session`` whose adapter keeps up to
+  ``pool_size`` keep-alive connections per host (no adapter-level retries;
+  the outbox owns retrying)
+- :class:`CircuitBreaker`: after ``failure_threshold`` consecutive failures
+  calls fast-fail for ``cooldown_seconds``; then one trial call is let
+  through and closes the breaker on success or reopens it on failure
+- :class:`LatencyHistogram`: call latencies in fixed millisecond buckets,
+  shown on the SMS settings page with the breaker state
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Optional
+
+import requests  # type: ignore
+from requests.adapters import HTTPAdapter  # type: ignore
+
+logger = logging.getLogger("app.http_resilience")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def pooled_session(pool_size: int = 10) -> requests.Session:
+    """Return a Session keeping up to ``pool_size`` connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (thread-safe)."""
+
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 60.0, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.last_error: Optional[str] = None
+        self.times_opened = 0
+
+    def _refresh(self) -> None:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.cooldown_seconds:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until calls are allowed again (0 when not open)."""
+        with self._lock:
+            self._refresh()
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.cooldown_seconds - (self._clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        """True if a call may go out now; in half-open state only one at a time."""
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._failures += 1
+            self.last_error = error
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.times_opened += 1
+                    logger.warning(
+                        "Circuit opened after %d consecutive failure(s): %s", self._failures, error
+                    )
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._refresh()
+            retry_after = 0.0
+            if self._state == OPEN:
+                retry_after = max(0.0, self.cooldown_seconds - (self._clock() - self._opened_at))
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "cooldown_seconds": self.cooldown_seconds,
+                "retry_after": round(retry_after, 1),
+                "times_opened": self.times_opened,
+                "last_error": self.last_error,
+            }
+
+
+class LatencyHistogram:
+    """Counts of call latencies in fixed millisecond buckets (thread-safe)."""
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets_ms) + 1)
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000.0
+        with self._lock:
+            self._counts[bisect_left(self.buckets_ms, ms)] += 1
+            self._total_ms += ms
+            self._max_ms = max(self._max_ms, ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total_ms, max_ms = self._total_ms, self._max_ms
+        count = sum(counts)
+        labels = [f"≤{b} ms" for b in self.buckets_ms] + [f">{self.buckets_ms[-1]} ms"]
+        return {
+            "count": count,
+            "avg_ms": round(total_ms / count, 1) if count else None,
+            "max_ms": round(max_ms, 1) if count else None,
+            "buckets": [{"label": label, "count": n} for label, n in zip(labels, counts)],
+        }
@@ -0,0 +1,380 @@
+"""SQL fingerprinting and index suggestions from the monitoring stream.
+
+With ``SQL_INDEX_ADVISOR=1`` the monitoring hooks (``app.monitoring``) pass
+every executed statement to an :class:`IndexAdvisor`. It normalizes the SQL
+into a fingerprint (literals, bind markers and IN-lists collapsed), keeps
+call count and total/max time per fingerprint, and saves the aggregate to
+``SQL_INDEX_ADVISOR_FILE`` (default ``instance/sql_fingerprints.json``) when
+the process exits, merging with earlier runs.
+
+``flask suggest-indexes`` then reads that file, takes the hottest statements,
+pulls their WHERE and ORDER BY columns, and proposes composite indexes
+(equality columns first, then one range/sort column) that are not already
+covered by an existing index. ``--write`` renders them as an Alembic
+revision under ``alembic/versions`` for review.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import UniqueConstraint
+
+from . import db
+
+logger = logging.getLogger("app.index_advisor")
+
+DEFAULT_STATS_FILE = "sql_fingerprints.json"
+MAX_INDEX_COLUMNS = 3
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])\d+(?:\.\d+)?\b")
+_BIND_PARAM = re.compile(r"%\(\w+\)s|%s|(?<!:):\w+|\?")
+_POSTCOMPILE = re.compile(r"\(?__\[POSTCOMPILE_\w+\]\)?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+_TABLE_ALIAS = re.compile(
+    r"\b(?:FROM|JOIN|UPDATE)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE
+)
+_PREDICATE = re.compile(
+    r"\b(\w+)\.(\w+)\s*(=|!=|<>|<=|>=|<|>|\bIN\b|\bIS\b|\bLIKE\b|\bBETWEEN\b)",
+    re.IGNORECASE,
+)
+_QUALIFIED_COLUMN = re.compile(r"\b(\w+)\.(\w+)\b")
+_WHERE = re.compile(
+    r"\bWHERE\b(.*?)(?=\bGROUP BY\b|\bORDER BY\b|\bHAVING\b|\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+_ORDER_BY = re.compile(
+    r"\bORDER BY\b(.*?)(?=\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|\)|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+_SQL_KEYWORDS = {
+    "ON", "WHERE", "JOIN", "LEFT", "RIGHT", "INNER", "OUTER", "FULL", "CROSS",
+    "GROUP", "ORDER", "LIMIT", "OFFSET", "SET", "UNION", "HAVING", "USING",
+}
+_EQUALITY_OPS = {"=", "IN", "IS"}
+
+
+def fingerprint_sql(statement: str) -> str:
+    """Return ``statement`` with literals and parameters collapsed to ``?``."""
+    sql = _STRING_LITERAL.sub("?", statement or "")
+    sql = _POSTCOMPILE.sub("(?)", sql)
+    sql = _BIND_PARAM.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("IN (?)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def fingerprint_id(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def _aliases(sql: str) -> dict:
+    """Map every alias (and bare table name) in ``sql`` to its table."""
+    aliases = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def extract_columns(sql: str) -> dict:
+    """Return the filtered and sorted columns of a normalized SELECT/UPDATE/DELETE.
+
+    ``{"equality": [(table, col)], "range": [...], "order_by": [...]}``;
+    columns are resolved through table aliases and listed once each.
+    """
+    found: dict = {"equality": [], "range": [], "order_by": []}
+    if not sql or sql.split(" ", 1)[0].upper() not in {"SELECT", "UPDATE", "DELETE"}:
+        return found
+    aliases = _aliases(sql)
+
+    def add(kind, alias, column):
+        table = aliases.get(alias)
+        if table and (table, column) not in found[kind]:
+            found[kind].append((table, column))
+
+    for clause in _WHERE.findall(sql):
+        for alias, column, op in _PREDICATE.findall(clause):
+            add("equality" if op.upper() in _EQUALITY_OPS else "range", alias, column)
+    for clause in _ORDER_BY.findall(sql):
+        for alias, column in _QUALIFIED_COLUMN.findall(clause):
+            add("order_by", alias, column)
+    found["range"] = [c for c in found["range"] if c not in found["equality"]]
+    return found
+
+
+class IndexAdvisor:
+    """Thread-safe per-fingerprint aggregate of executed statements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats: dict = {}
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        normalized = fingerprint_sql(statement)
+        key = fingerprint_id(normalized)
+        with self._lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = {
+                    "sql": normalized[:4000],
+                    "calls": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                }
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+    def merge(self, stats: dict) -> None:
+        with self._lock:
+            for key, other in stats.items():
+                entry = self.stats.get(key)
+                if entry is None:
+                    self.stats[key] = dict(other)
+                    continue
+                entry["calls"] += other.get("calls", 0)
+                entry["total_ms"] += other.get("total_ms", 0.0)
+                entry["max_ms"] = max(entry["max_ms"], other.get("max_ms", 0.0))
+
+    def hottest(self, limit: int = 25) -> list:
+        """Return ``[(fingerprint, entry)]`` ordered by total time spent."""
+        with self._lock:
+            items = list(self.stats.items())
+        items.sort(key=lambda kv: kv[1]["total_ms"], reverse=True)
+        return items[:limit]
+
+    def save(self, path: str) -> None:
+        """Merge into the JSON file at ``path`` (keeps earlier runs).
+
+        What was written is taken out of the in-memory stats, so saving
+        again only adds the statements recorded since.
+        """
+        with self._lock:
+            pending, self.stats = self.stats, {}
+        try:
+            combined = IndexAdvisor()
+            combined.merge(load_stats(path))
+            combined.merge(pending)
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(combined.stats, f, indent=1)
+            os.replace(tmp_path, path)
+        except BaseException:
+            # Not persisted: keep the counts for the next save
+            self.merge(pending)
+            raise
+
+
+def load_stats(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.warning("Ignoring unreadable fingerprint file %s", path)
+        return {}
+
+
+def stats_file_path(app) -> str:
+    return (
+        app.config.get("SQL_INDEX_ADVISOR_FILE")
+        or os.environ.get("SQL_INDEX_ADVISOR_FILE")
+        or os.path.join(app.instance_path, DEFAULT_STATS_FILE)
+    )
+
+
+def _existing_index_prefixes(metadata) -> dict:
+    """Return ``{table: [column tuple, ...]}`` for the PK and every index."""
+    existing: dict = {}
+    for table in metadata.tables.values():
+        prefixes = existing.setdefault(table.name, [])
+        if table.primary_key.columns:
+            prefixes.append(tuple(c.name for c in table.primary_key.columns))
+        for index in table.indexes:
+            prefixes.append(tuple(c.name for c in index.columns))
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint):
+                prefixes.append(tuple(c.name for c in constraint.columns))
+    return existing
+
+
+def _is_covered(columns: tuple, prefixes: list) -> bool:
+    return any(p[: len(columns)] == columns for p in prefixes)
+
+
+def suggest_indexes(stats: dict, metadata, top: int = 25) -> list:
+    """Propose indexes for the ``top`` statements by total time.
+
+    Returns dicts with ``table``, ``columns``, ``name``, ``total_ms``,
+    ``calls`` and ``fingerprints``, heaviest first. Unknown tables/columns
+    and column lists already served by an index prefix are skipped.
+    """
+    advisor = IndexAdvisor()
+    advisor.merge(stats)
+    existing = _existing_index_prefixes(metadata)
+    suggestions: dict = {}
+
+    for key, entry in advisor.hottest(top):
+        found = extract_columns(entry["sql"])
+        per_table: dict = {}
+        for kind in ("equality", "range", "order_by"):
+            for table, column in found[kind]:
+                table_obj = metadata.tables.get(table)
+                if table_obj is None or column not in table_obj.c:
+                    continue
+                per_table.setdefault(table, {"equality": [], "range": [], "order_by": []})
+                per_table[table][kind].append(column)
+
+        for table, cols in per_table.items():
+            columns = sorted(cols["equality"])
+            # A single range or sort column can follow the equality prefix
+            tail = cols["range"][:1] or cols["order_by"][:1]
+            columns += [c for c in tail if c not in columns]
+            columns = tuple(columns[:MAX_INDEX_COLUMNS])
+            if not columns or _is_covered(columns, existing.get(table, [])):
+                continue
+            suggestion = suggestions.setdefault(
+                (table, columns),
+                {
+                    "table": table,
+                    "columns": columns,
+                    "name": f"ix_{table}_{'_'.join(columns)}",
+                    "total_ms": 0.0,
+                    "calls": 0,
+                    "fingerprints": [],
+                },
+            )
+            suggestion["total_ms"] += entry["total_ms"]
+            suggestion["calls"] += entry["calls"]
+            suggestion["fingerprints"].append(key)
+
+    ordered = sorted(suggestions.values(), key=lambda s: s["total_ms"], reverse=True)
+    # Drop suggestions that are a prefix of a heavier one on the same table
+    kept: list = []
+    for s in ordered:
+        if not any(
+            k["table"] == s["table"] and k["columns"][: len(s["columns"])] == s["columns"]
+            for k in kept
+        ):
+            kept.append(s)
+    return kept
+
+
+def _current_head(versions_dir: str) -> Optional[str]:
+    """Return the revision no other revision in ``versions_dir`` builds on."""
+    revisions, parents = set(), set()
+    if not os.path.isdir(versions_dir):
+        return None
+    for name in os.listdir(versions_dir):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(versions_dir, name), encoding="utf-8") as f:
+            source = f.read()
+        rev = re.search(r"^revision\s*=\s*['\"](\w+)['\"]", source, re.MULTILINE)
+        down = re.search(r"^down_revision\s*=\s*['\"](\w+)['\"]", source, re.MULTILINE)
+        if rev:
+            revisions.add(rev.group(1))
+        if down:
+            parents.add(down.group(1))
+    heads = sorted(revisions - parents)
+    return heads[0] if heads else None
+
+
+def render_revision(suggestions: list, revision: str, down_revision: Optional[str]) -> str:
+    """Render an Alembic revision that creates (and drops) ``suggestions``."""
+    lines = [
+        '"""Add indexes suggested by the SQL index advisor',
+        "",
+        f"Revision ID: {revision}",
+        f"Revises: {down_revision or ''}",
+        f"Create Date: {datetime.utcnow():%Y-%m-%d %H:%M:%S}",
+        "",
+        "Review before applying. Workload per index (total time, calls):",
+    ]
+    for s in suggestions:
+        lines.append(
+            f"  {s['name']}: {s['total_ms']:.1f}ms over {s['calls']} call(s), "
+            f"fingerprints {', '.join(s['fingerprints'][:5])}"
+        )
+    lines += [
+        '"""',
+        "from alembic import op",
+        "",
+        f"revision = {revision!r}",
+        f"down_revision = {down_revision!r}",
+        "branch_labels = None",
+        "depends_on = None",
+        "",
+        "",
+        "def upgrade():",
+    ]
+    for s in suggestions:
+        lines.append(
+            f"    op.create_index({s['name']!r}, {s['table']!r}, {list(s['columns'])!r}, "
+            "if_not_exists=True)"
+        )
+    if not suggestions:
+        lines.append("    pass")
+    lines += ["", "", "def downgrade():"]
+    for s in reversed(suggestions):
+        lines.append(
+            f"    op.drop_index({s['name']!r}, table_name={s['table']!r}, if_exists=True)"
+        )
+    if not suggestions:
+        lines.append("    pass")
+    return "\n".join(lines) + "\n"
+
+
+def write_revision(suggestions: list, versions_dir: str) -> str:
+    """Write a new revision file chained onto the current head; return its path."""
+    os.makedirs(versions_dir, exist_ok=True)
+    revision = uuid.uuid4().hex[:12]
+    source = render_revision(suggestions, revision, _current_head(versions_dir))
+    path = os.path.join(versions_dir, f"{revision}_advisor_indexes.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source)
+    return path
+
+
+@click.command("suggest-indexes")
+@click.option("--stats", "stats_path", default=None,
+              help="Fingerprint file (defaults to SQL_INDEX_ADVISOR_FILE or instance/sql_fingerprints.json).")
+@click.option("--top", default=25, show_default=True,
+              help="Number of hottest statements (by total time) to analyse.")
+@click.option("--write", "write_path", is_flag=False, flag_value="alembic/versions", default=None,
+              help="Write an Alembic revision to this versions directory (default alembic/versions).")
+@with_appcontext
+def suggest_indexes_command(stats_path, top, write_path):
+    """Suggest covering indexes for the hottest recorded SQL statements."""
+    stats = load_stats(stats_path or stats_file_path(current_app))
+    if not stats:
+        click.echo("No recorded statements. Run the app with SQL_INDEX_ADVISOR=1 first.")
+        return
+    suggestions = suggest_indexes(stats, db.metadata, top=top)
+    if not suggestions:
+        click.echo("Existing indexes already cover the hottest statements.")
+        return
+    for s in suggestions:
+        click.echo(
+            f"{s['name']} ON {s['table']} ({', '.join(s['columns'])}): "
+            f"{s['total_ms']:.1f}ms over {s['calls']} call(s)"
+        )
+    if write_path:
+        click.echo(f"Wrote {write_revision(suggestions, write_path)}")
@@ -10,7 +10,9 @@ import csv
 from werkzeug.utils import secure_filename
 
 from . import db
-from .models import InventoryCategory, InventoryItem, StockMovement
+from .inventory_alerts import record_stock_change
+from .models import InventoryAlert, InventoryCategory, InventoryItem, StockMovement
+from .reference_cache import cached_all
 
 inventory = Blueprint("inventory", __name__)
 
@@ -145,7 +147,7 @@ def list_items():
     )
 
     # Get categories for filter dropdown
-    categories = InventoryCategory.query.order_by(InventoryCategory.name).all()
+    categories = cached_all(InventoryCategory, order_by="name")
 
     return render_template("inventory/items.html", items=items, categories=categories)
 
@@ -243,7 +245,7 @@ def add_item():
             return redirect(url_for("inventory.add_item"))
 
     # GET request - show form
-    categories = InventoryCategory.query.order_by(InventoryCategory.name).all()
+    categories = cached_all(InventoryCategory, order_by="name")
     return render_template("inventory/item_form.html", categories=categories)
 
 
@@ -323,11 +325,14 @@ def edit_item(id):
                 movement.item_id = item.id
                 movement.movement_type = movement_type
                 movement.quantity = abs(stock_diff)
-                movement.reason = "Stock adjustment via edit"
-                movement.user_id = current_user.id
+                movement.stock_before = original_stock
+                movement.stock_after = new_stock
+                movement.notes = "Stock adjustment via edit"
+                movement.created_by = current_user.id
 
                 db.session.add(movement)
                 item.current_stock = new_stock
+                record_stock_change(item)
 
             db.session.commit()
             flash("Item updated successfully", "success")
@@ -338,7 +343,7 @@ def edit_item(id):
             flash(f"Error updating item: {str(e)}", "error")
 
     # GET request - show form
-    categories = InventoryCategory.query.order_by(InventoryCategory.name).all()
+    categories = cached_all(InventoryCategory, order_by="name")
     return render_template("inventory/item_form.html", item=item, categories=categories)
 
 
@@ -376,49 +381,19 @@ def update_stock(id):
         movement.item_id = item.id
         movement.movement_type = movement_type
         movement.quantity = quantity
-        movement.reason = reason
-        movement.user_id = current_user.id
+        movement.stock_before = item.current_stock
+        movement.stock_after = new_stock
+        movement.notes = reason
+        movement.created_by = current_user.id
 
         # Update item stock
         item.current_stock = new_stock
 
         db.session.add(movement)
+        # Low/out-of-stock alerts are raised after the commit (app.inventory_alerts)
+        record_stock_change(item)
         db.session.commit()
 
-        # Check if stock is now low and create notifications
-        try:
-            from .models import User
-            from .notifications import create_inventory_notification
-
-            # Check if item is now low stock or out of stock
-            if new_stock <= 0:
-                # Out of stock - notify all users
-                users = User.query.all()
-                for user in users:
-                    create_inventory_notification(user.id, item, "out_of_stock")
-            elif new_stock <= item.minimum_stock:
-                # Low stock - notify all users
-                users = User.query.all()
-                for user in users:
-                    # Check if notification already exists in the last 24 hours
-                    from datetime import datetime, timedelta
-
-                    from .models import Notification
-
-                    recent_notification = Notification.query.filter(
-                        Notification.user_id == user.id,
-                        Notification.related_model == "inventory",
-                        Notification.related_id == str(item.id),
-                        Notification.notification_type.in_(["warning", "error"]),
-                        Notification.created_at
-                        >= datetime.utcnow() - timedelta(hours=24),
-                    ).first()
-
-                    if not recent_notification:
-                        create_inventory_notification(user.id, item, "low_stock")
-        except Exception as e:
-            print(f"Failed to create inventory notification: {e}")
-
         flash("Stock updated successfully", "success")
 
     except Exception as e:
@@ -437,6 +412,7 @@ def delete_item(id):
     try:
         # Delete related stock movements
         StockMovement.query.filter_by(item_id=id).delete()
+        InventoryAlert.query.filter_by(item_id=id).delete()
 
         # Delete the item
         db.session.delete(item)
@@ -613,7 +589,7 @@ def reports():
             report_title = "Inventory Value Report"
 
     # Get categories for filters
-    categories = InventoryCategory.query.order_by(InventoryCategory.name).all()
+    categories = cached_all(InventoryCategory, order_by="name")
 
     return render_template(
         "inventory/reports.html",
@@ -728,7 +704,7 @@ def summary():
         page=page,
         per_page=per_page,
         category=category,
-        categories=InventoryCategory.query.order_by(InventoryCategory.name).all(),
+        categories=cached_all(InventoryCategory, order_by="name"),
         items_page=items_pagination,
     recent_movements=recent_movements,
     movements_count=movements_count,
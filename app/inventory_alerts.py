@@ -0,0 +1,151 @@
+"""Low- and out-of-stock alerts, evaluated set-based off the request path.
+
+``check_and_create_inventory_notifications`` loaded every low item and ran
+one "alerted in the last 24 hours?" query per item, and ``update_stock``
+repeated the check inline after its commit, so a busy stock room paid for
+it on every movement and two concurrent movements could both alert.
+
+:func:`evaluate_low_stock` does it in a fixed number of statements however
+many items there are:
+
+- one query selects the active items at or below ``minimum_stock`` that
+  have no alert yet for their level (low / out of stock) today
+- their ``inventory_alert`` rows are inserted in one statement that skips
+  rows whose ``dedupe_key`` (item, level, UTC day) already exists, so the
+  unique key, not a prior read, settles races between evaluators
+- the alerts that were new get one broadcast each
+  (:func:`app.notifications.create_broadcasts`)
+
+Stock movements record an ``inventory.stock_changed`` event
+(:func:`record_stock_change`) in their own transaction; the event outbox
+worker runs the evaluation for that item after the commit.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import and_, case, exists, insert, select, update
+
+from . import db
+from .event_outbox import handles, record_event
+from .models import InventoryAlert, InventoryItem
+
+logger = logging.getLogger("app.inventory_alerts")
+
+STOCK_CHANGED_EVENT = "inventory.stock_changed"
+
+
+def alert_level():
+    """SQL expression for the alert level of a low item."""
+    return case(
+        (InventoryItem.current_stock <= 0, InventoryAlert.OUT_OF_STOCK),
+        else_=InventoryAlert.LOW_STOCK,
+    )
+
+
+def dedupe_key(item_id: int, level: str, now: datetime) -> str:
+    return f"inventory:{item_id}:{level}:{now:%Y%m%d}"
+
+
+def _insert_ignore(table):
+    """``INSERT`` that skips rows conflicting on ``dedupe_key``."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+        return pg_insert(table).on_conflict_do_nothing(index_elements=["dedupe_key"])
+    if dialect == "sqlite":
+        return insert(table).prefix_with("OR IGNORE")
+    if dialect in ("mysql", "mariadb"):
+        return insert(table).prefix_with("IGNORE")
+    raise NotImplementedError(f"No insert-or-ignore for {dialect}")
+
+
+def evaluate_low_stock(item_ids: Optional[Iterable[int]] = None,
+                       now: Optional[datetime] = None, commit: bool = True) -> list:
+    """Alert on items (all by default) that are low and not yet alerted today.
+
+    Returns the ``NotificationBroadcast`` rows created. Pass
+    ``commit=False`` to leave the commit to the caller (outbox handlers).
+    """
+    from .notifications import create_broadcasts, inventory_notification_fields
+
+    now = now or datetime.utcnow()
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    level = alert_level()
+    stmt = select(InventoryItem, level.label("level")).where(
+        InventoryItem.is_active.is_(True),
+        InventoryItem.current_stock <= InventoryItem.minimum_stock,
+        ~exists().where(
+            and_(
+                InventoryAlert.item_id == InventoryItem.id,
+                InventoryAlert.level == level,
+                InventoryAlert.created_at >= day_start,
+            )
+        ),
+    )
+    if item_ids is not None:
+        stmt = stmt.where(InventoryItem.id.in_(list(item_ids)))
+    candidates = {
+        dedupe_key(item.id, level, now): (item, level)
+        for item, level in db.session.execute(stmt).all()
+    }
+    if not candidates:
+        if commit:
+            db.session.commit()
+        return []
+
+    existing = set(
+        db.session.execute(
+            select(InventoryAlert.dedupe_key).where(InventoryAlert.dedupe_key.in_(list(candidates)))
+        ).scalars()
+    )
+    fresh = [key for key in candidates if key not in existing]
+    new_alerts = []
+    if fresh:
+        db.session.execute(
+            _insert_ignore(InventoryAlert.__table__),
+            [
+                {"item_id": candidates[key][0].id, "level": candidates[key][1],
+                 "dedupe_key": key, "created_at": now}
+                for key in fresh
+            ],
+        )
+        # Ours are the rows still without a broadcast: an evaluator that won
+        # the race on a key commits its row together with its broadcast (and
+        # the insert above waits for it to do so)
+        new_alerts = db.session.execute(
+            select(InventoryAlert.id, InventoryAlert.dedupe_key).where(
+                InventoryAlert.dedupe_key.in_(fresh),
+                InventoryAlert.broadcast_id.is_(None),
+            )
+        ).all()
+    broadcasts = create_broadcasts(
+        [inventory_notification_fields(*candidates[key]) for _, key in new_alerts],
+        commit=False,
+    )
+    if broadcasts:
+        db.session.execute(
+            update(InventoryAlert),
+            [
+                {"id": alert_id, "broadcast_id": broadcast.id}
+                for (alert_id, _), broadcast in zip(new_alerts, broadcasts)
+            ],
+        )
+    if commit:
+        db.session.commit()
+    if broadcasts:
+        logger.info("Raised %d inventory alert(s)", len(broadcasts))
+    return broadcasts
+
+
+def record_stock_change(item: InventoryItem) -> None:
+    """Re-evaluate ``item``'s alert once the current transaction commits."""
+    record_event(STOCK_CHANGED_EVENT, {"item_id": item.id})
+
+
+@handles(STOCK_CHANGED_EVENT, "low_stock_alert")
+def _evaluate_changed_item(payload):
+    evaluate_low_stock([payload["item_id"]], commit=False)
@@ -5,18 +5,27 @@ from datetime import datetime
 from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 from flask_mail import Message
-from sqlalchemy import func, or_  # type: ignore
+from sqlalchemy import or_, select  # type: ignore
 
-from . import db, mail
+from . import db
+from .daily_stats import forget_laundry, remember_laundry
+from .event_outbox import handles, record_event
+from .mail_queue import send_email
 from .models import (
     Customer,
     Laundry,
     LaundryAuditLog,
     LaundryStatusHistory,
+    LoyaltyTransaction,
     Service,
     User,
 )
-from .sms_service import send_laundry_status_sms, send_sms_notification
+from .phones import normalize_phone
+from .reference_cache import cached_first, cached_get
+from .sms_service import (
+    send_laundry_batch_received_sms,
+    send_laundry_status_sms,
+)
 import base64
 import io
 
@@ -24,12 +33,16 @@ laundry = Blueprint("laundry", __name__)
 
 
 def log_laundry_change(
-    laundry_id, action, field_changed=None, old_value=None, new_value=None
+    laundry_id, action, field_changed=None, old_value=None, new_value=None, commit=True
 ):
-    """Log laundry changes for audit trail"""
+    """Log laundry changes for audit trail (``commit=False`` joins the caller's transaction)"""
     try:
         audit_log = LaundryAuditLog()
         audit_log.laundry_id = laundry_id
+        # Resolved inside the INSERT, so callers only need the public id
+        audit_log.laundry_pk = (
+            select(Laundry.id).where(Laundry.laundry_id == laundry_id).scalar_subquery()
+        )
         audit_log.action = action
         audit_log.field_changed = field_changed
         audit_log.old_value = str(old_value) if old_value is not None else None
@@ -38,7 +51,8 @@ def log_laundry_change(
         audit_log.ip_address = request.remote_addr
 
         db.session.add(audit_log)
-        db.session.commit()
+        if commit:
+            db.session.commit()
     except Exception as e:
         print(f"Error logging audit: {e}")
 
@@ -51,36 +65,20 @@ def generate_laundry_id():
             return laundry_id
 
 
-def send_notification_email(customer_email, subject, body):
-    """Send email notification to customer"""
+def send_notification_email(customer_email, subject, body, category=None):
+    """Send email notification to customer (queued for app.mail_queue)"""
     try:
         msg = Message(
             subject, sender="noreply@acciolaundry.com", recipients=[customer_email]
         )
         msg.body = body
-        mail.send(msg)
+        send_email(msg, category=category)
         return True
     except Exception as e:
         print(f"Error sending email: {e}")
         return False
 
 
-def send_notification(customer, subject, email_body, sms_message=None):
-    """Send both email and SMS notifications to customer"""
-    email_sent = False
-    sms_sent = False
-
-    # Send email if customer has email
-    if customer.email:
-        email_sent = send_notification_email(customer.email, subject, email_body)
-
-    # Send SMS if customer has phone and SMS message is provided
-    if customer.phone and sms_message:
-        sms_sent = send_sms_notification(customer.phone, sms_message)
-
-    return email_sent or sms_sent
-
-
 @laundry.route("/list")
 @login_required
 def list_laundries():
@@ -133,7 +131,7 @@ def list_laundries():
     if date_param:
         try:
             date_obj = datetime.strptime(date_param, "%Y-%m-%d").date()
-            base_query = base_query.filter(func.date(Laundry.date_received) == date_obj)
+            base_query = base_query.filter(Laundry.business_date == date_obj)
         except Exception:
             pass
     # Apply search filter across laundry id, customer name, and phone
@@ -202,15 +200,17 @@ def search_customers():
     if not q:
         return jsonify({"results": []})
 
-    # Split numeric vs text to improve phone searches
     like = f"%{q}%"
-
-    query = Customer.query
-    # Build filters safely (avoid injecting False into or_)
-    filters = [Customer.full_name.ilike(like), Customer.email.ilike(like)]
-    if hasattr(Customer, "phone"):
-        filters.append(Customer.phone.ilike(like))
-    query = query.filter(or_(*filters))
+    filters = [
+        Customer.full_name.ilike(like),
+        Customer.email.ilike(like),
+        Customer.phone.ilike(like),
+    ]
+    # A complete phone number also matches however the phone was typed in
+    e164 = normalize_phone(q)
+    if e164:
+        filters.append(Customer.phone_e164 == e164)
+    query = Customer.query.filter(or_(*filters))
 
     results = query.order_by(Customer.full_name.asc()).limit(limit).all()
     payload = []
@@ -269,7 +269,7 @@ def add_multiple_laundry():
                 service_pk = int(service_id) if service_id is not None else None
             except (ValueError, TypeError):
                 continue
-            service = Service.query.get(service_pk)
+            service = cached_get(Service, service_pk, attach=True)
             if not service:
                 continue
             
@@ -322,6 +322,7 @@ def add_multiple_laundry():
                 new_status="Received",
                 changed_by=current_user.id,
                 notes=f"Initial laundry created by {current_user.full_name} (Multi-load batch)",
+                laundry=new_laundry,
             )
             
             # Create notification for new laundry order
@@ -332,12 +333,12 @@ def add_multiple_laundry():
                 )
             except Exception as e:
                 print(f"Failed to create notification: {e}")
-            
-            # Send SMS for initial status (Received)
-            try:
-                send_laundry_status_sms(new_laundry.customer, new_laundry, "Received")
-            except Exception as e:
-                print(f"Failed to send 'Received' SMS: {e}")
+        
+        # One "Received" SMS listing every load; committed with the batch below
+        try:
+            send_laundry_batch_received_sms(customer, created_laundries, commit=False)
+        except Exception as e:
+            print(f"Failed to send 'Received' SMS: {e}")
         
         db.session.commit()
         
@@ -394,7 +395,7 @@ def add_laundry():
             service_pk = int(service_type) if service_type is not None else None
         except (ValueError, TypeError):
             service_pk = None
-        service = Service.query.get(service_pk)
+        service = cached_get(Service, service_pk, attach=True)
         if not service:
             flash("Service not found!", category="error")
             return redirect(url_for("laundry.add_laundry"))
@@ -441,6 +442,7 @@ def add_laundry():
             new_status="Received",
             changed_by=current_user.id,
             notes=f"Initial laundry created by {current_user.full_name}",
+            laundry=new_laundry,
         )
 
         # Create notification for new laundry order
@@ -528,7 +530,11 @@ def edit_laundry(laundry_id):
         new_customer_id = request.form.get("customerId")
 
         # Get service details
-        service = Service.query.get(new_service_type)
+        try:
+            new_service_pk = int(new_service_type) if new_service_type is not None else None
+        except (ValueError, TypeError):
+            new_service_pk = None
+        service = cached_get(Service, new_service_pk, attach=True)
         if not service:
             flash("Service not found!", category="error")
             return redirect(url_for("laundry.edit_laundry", laundry_id=laundry_id))
@@ -547,6 +553,10 @@ def edit_laundry(laundry_id):
         except (ValueError, TypeError):
             new_weight_value = 0.0
 
+        # Take the order out of the DailyStats rollup under its old service and
+        # price; it is put back with the edited values below
+        forget_laundry(laundry_item)
+
         if str(laundry_item.item_count) != new_item_count:
             log_laundry_change(
                 laundry_item.laundry_id,
@@ -554,6 +564,7 @@ def edit_laundry(laundry_id):
                 "item_count",
                 laundry_item.item_count,
                 new_item_count,
+                commit=False,
             )
             laundry_item.item_count = new_item_count
             changes_made = True
@@ -569,6 +580,7 @@ def edit_laundry(laundry_id):
                     else laundry_item.service_type
                 ),
                 service.name,
+                commit=False,
             )
             laundry_item.service_id = new_service_id
             # Keep relationship in sync for pricing
@@ -585,6 +597,7 @@ def edit_laundry(laundry_id):
                 "weight_kg",
                 laundry_item.weight_kg,
                 new_weight_kg,
+                commit=False,
             )
             laundry_item.weight_kg = new_weight_value
             changes_made = True
@@ -596,6 +609,7 @@ def edit_laundry(laundry_id):
                 "notes",
                 laundry_item.notes or "None",
                 new_notes or "None",
+                commit=False,
             )
             laundry_item.notes = new_notes
             changes_made = True
@@ -611,6 +625,7 @@ def edit_laundry(laundry_id):
                     "customer",
                     old_customer.full_name if old_customer else "Unknown",
                     customer.full_name,
+                    commit=False,
                 )
                 laundry_item.customer_id = new_customer_id
                 changes_made = True
@@ -625,6 +640,7 @@ def edit_laundry(laundry_id):
             # Recalculate price if item count, service type, or weight changed
             laundry_item.update_price()
 
+        remember_laundry(laundry_item)
         db.session.commit()
         flash("Laundry updated successfully!", category="success")
 
@@ -657,6 +673,29 @@ def edit_laundry(laundry_id):
     )
 
 
+STATUS_CHANGED_EVENT = "laundry.status_changed"
+
+STATUS_NOTIFICATION_TYPES = {
+    "Ready for Pickup": "ready_pickup",
+    "Completed": "completed",
+}
+
+STATUS_EMAILS = {
+    "Received": (
+        "Laundry Received",
+        "Your laundry (Laundry #{laundry_id}) is now being processed. We'll notify you when it's ready!",
+    ),
+    "Ready for Pickup": (
+        "Pickup ready!",
+        "Your laundry (Laundry #{laundry_id}) is ready for pickup at our location.",
+    ),
+    "Completed": (
+        "Laundry Completed!",
+        "Your laundry (Laundry #{laundry_id}) has been completed. Thank you for choosing ACCIO Laundry!",
+    ),
+}
+
+
 @laundry.route("/update-status/<laundry_id>", methods=["POST"])
 @login_required
 def update_status(laundry_id):
@@ -673,16 +712,22 @@ def update_status(laundry_id):
 
         # Log in audit log (legacy)
         log_laundry_change(
-            laundry_item.laundry_id, "STATUS_CHANGED", "status", old_status, new_status
+            laundry_item.laundry_id,
+            "STATUS_CHANGED",
+            "status",
+            old_status,
+            new_status,
+            commit=False,
         )
 
         # Log in status history (new detailed tracking)
-        LaundryStatusHistory.log_status_change(
+        history = LaundryStatusHistory.log_status_change(
             laundry_id=laundry_item.laundry_id,
             old_status=old_status,
             new_status=new_status,
             changed_by=current_user.id,
             notes=f"Status changed by {current_user.full_name}",
+            laundry=laundry_item,
         )
 
         # Update the laundry status
@@ -692,118 +737,126 @@ def update_status(laundry_id):
         laundry_item.edit_count = (laundry_item.edit_count or 0) + 1
         laundry_item.is_modified = True
 
+        # Notification, email, SMS and loyalty points are handled from the
+        # outbox after commit (see the handlers below)
+        db.session.flush()
+        record_event(
+            STATUS_CHANGED_EVENT,
+            {
+                "laundry_pk": laundry_item.id,
+                "laundry_id": laundry_item.laundry_id,
+                "old_status": old_status,
+                "new_status": new_status,
+                "changed_by": current_user.id,
+                "history_id": history.id if history else None,
+            },
+            dedupe_key=f"laundry-status:{history.id}" if history else None,
+        )
+
         db.session.commit()
 
-        # Create notification for status change
-        try:
-            from .notifications import create_laundry_notification
+    flash(f'Laundry status updated to "{new_status}"!', category="success")
 
-            if new_status == "Ready for Pickup":
-                create_laundry_notification(
-                    user_id=current_user.id,
-                    laundry=laundry_item,
-                    message_type="ready_pickup",
-                )
-            elif new_status == "Completed":
-                create_laundry_notification(
-                    user_id=current_user.id,
-                    laundry=laundry_item,
-                    message_type="completed",
-                )
-            else:
-                create_laundry_notification(
-                    user_id=current_user.id,
-                    laundry=laundry_item,
-                    message_type="status_update",
-                )
-        except Exception as e:
-            print(f"Failed to create notification: {e}")
+    return redirect(url_for("laundry.list_laundries"))
 
-        # Send email notification based on status (SMS handled via templates/toggles below)
-        if new_status == "Ready for Pickup":
-            send_notification(
-                laundry_item.customer,
-                "Pickup ready!",
-                f"Your laundry (Laundry #{laundry_item.laundry_id}) is ready for pickup at our location.",
-                sms_message=None,
-            )
-        elif new_status == "Completed":
-            send_notification(
-                laundry_item.customer,
-                "Laundry Completed!",
-                f"Your laundry (Laundry #{laundry_item.laundry_id}) has been completed. Thank you for choosing ACCIO Laundry!",
-                sms_message=None,
-            )
-    elif new_status == "Received":
-        send_notification(
-            laundry_item.customer,
-            "Laundry Received",
-            f"Your laundry (Laundry #{laundry_item.laundry_id}) is now being processed. We'll notify you when it's ready!",
-            sms_message=None,
-        )
 
-    # Send SMS using template-driven function (respects toggles and placeholders)
-    try:
-        send_laundry_status_sms(laundry_item.customer, laundry_item, new_status)
-    except Exception as e:
-        print(f"Failed to send status '{new_status}' SMS: {e}")
+def _event_laundry(payload):
+    # None when the order was deleted after the event was recorded
+    return db.session.get(Laundry, payload["laundry_pk"])
 
-    # Award loyalty points when order is completed
-    if new_status == "Completed":
-        # Award loyalty points when order is completed
-        from .models import CustomerLoyalty, LoyaltyProgram, LoyaltyTransaction
 
-        program = LoyaltyProgram.query.filter_by(is_active=True).first()
-        if program:
-            try:
-                # Calculate points based on total amount (use price field)
-                # Use rounding per-order to avoid cumulative truncation loss
-                points_earned = int(
-                    round((laundry_item.price or 0) * (program.points_per_peso or 1.0))
-                )
+@handles(STATUS_CHANGED_EVENT, "notification")
+def _notify_status_change(payload):
+    laundry_item = _event_laundry(payload)
+    if laundry_item is None:
+        return
+    from .notifications import create_laundry_notification
 
-                # Get or create customer loyalty record
-                loyalty = CustomerLoyalty.query.filter_by(
-                    customer_id=laundry_item.customer_id, program_id=program.id
-                ).first()
-                if not loyalty:
-                    loyalty = CustomerLoyalty()
-                    loyalty.customer_id = laundry_item.customer_id
-                    loyalty.program_id = program.id
-                    loyalty.points_balance = 0
-                    loyalty.total_points_earned = 0
-                    loyalty.total_points_redeemed = 0
-                    db.session.add(loyalty)
-
-                # Award points
-                loyalty.points_balance += points_earned
-                loyalty.total_points_earned += points_earned
-
-                # Create transaction record
-                transaction = LoyaltyTransaction()
-                transaction.customer_id = laundry_item.customer_id
-                transaction.program_id = program.id
-                transaction.laundry_id = laundry_item.laundry_id
-                transaction.transaction_type = "earned"
-                transaction.points = points_earned
-                transaction.description = (
-                    f"Points earned from laundry order #{laundry_item.laundry_id}"
-                )
+    create_laundry_notification(
+        user_id=payload["changed_by"],
+        laundry=laundry_item,
+        message_type=STATUS_NOTIFICATION_TYPES.get(payload["new_status"], "status_update"),
+        commit=False,
+    )
 
-                db.session.add(transaction)
 
-                db.session.commit()
-                flash(
-                    f"Customer earned {points_earned} loyalty points!", category="info"
-                )
+@handles(STATUS_CHANGED_EVENT, "email")
+def _email_status_change(payload):
+    laundry_item = _event_laundry(payload)
+    if laundry_item is None or payload["new_status"] not in STATUS_EMAILS:
+        return
+    customer = laundry_item.customer
+    if not customer.email:
+        return
+    subject, body = STATUS_EMAILS[payload["new_status"]]
+    # Raise so the outbox retries; the SMS goes out through its own handler
+    if not send_notification_email(
+        customer.email,
+        subject,
+        body.format(laundry_id=laundry_item.laundry_id),
+        category=f"status:{payload['new_status']}",
+    ):
+        raise RuntimeError(f"Email to {customer.email} was not sent")
+
+
+@handles(STATUS_CHANGED_EVENT, "sms")
+def _sms_status_change(payload):
+    laundry_item = _event_laundry(payload)
+    if laundry_item is None:
+        return
+    # Template-driven; respects the per-status toggles and placeholders
+    send_laundry_status_sms(
+        laundry_item.customer, laundry_item, payload["new_status"], commit=False
+    )
 
-            except Exception as e:
-                print(f"Error awarding loyalty points: {e}")
-                db.session.rollback()
 
-    flash(f'Laundry status updated to "{new_status}"!', category="success")
+@handles(STATUS_CHANGED_EVENT, "loyalty")
+def _award_completion_points(payload):
+    """Award loyalty points when an order is completed."""
+    if payload["new_status"] != "Completed":
+        return
+    laundry_item = _event_laundry(payload)
+    if laundry_item is None:
+        return
+    from .models import CustomerLoyalty, LoyaltyProgram
+
+    program = cached_first(LoyaltyProgram, is_active=True)
+    if not program:
+        return
+
+    # Calculate points based on total amount (use price field)
+    # Use rounding per-order to avoid cumulative truncation loss
+    points_earned = int(
+        round((laundry_item.price or 0) * (program.points_per_peso or 1.0))
+    )
 
-    return redirect(url_for("laundry.list_laundries"))
+    # Get or create customer loyalty record
+    loyalty = CustomerLoyalty.query.filter_by(
+        customer_id=laundry_item.customer_id
+    ).first()
+    if not loyalty:
+        loyalty = CustomerLoyalty()
+        loyalty.customer_id = laundry_item.customer_id
+        loyalty.current_points = 0
+        loyalty.total_points_earned = 0
+        loyalty.total_points_redeemed = 0
+        db.session.add(loyalty)
+
+    # Award points
+    loyalty.current_points = (loyalty.current_points or 0) + points_earned
+    loyalty.total_points_earned = (loyalty.total_points_earned or 0) + points_earned
+
+    # Create transaction record linked to the order by its integer id
+    transaction = LoyaltyTransaction()
+    transaction.customer_loyalty = loyalty
+    transaction.laundry_id = laundry_item.id
+    transaction.order_amount = laundry_item.price
+    transaction.transaction_type = "EARNED"
+    transaction.points = points_earned
+    transaction.description = (
+        f"Points earned from laundry order #{laundry_item.laundry_id}"
+    )
+    db.session.add(transaction)
 
 
 @laundry.route("/status-history/<laundry_id>")
@@ -811,7 +864,7 @@ def update_status(laundry_id):
 def view_status_history(laundry_id):
     laundry_item = Laundry.query.filter_by(laundry_id=laundry_id).first_or_404()
     status_history = (
-        LaundryStatusHistory.query.filter_by(laundry_id=laundry_id)
+        LaundryStatusHistory.query.filter_by(laundry_pk=laundry_item.id)
         .order_by(LaundryStatusHistory.changed_at.desc())
         .all()
     )
@@ -829,15 +882,23 @@ def view_status_history(laundry_id):
 def view_audit_log(laundry_id):
     laundry_item = Laundry.query.filter_by(laundry_id=laundry_id).first_or_404()
     audit_logs = (
-        LaundryAuditLog.query.filter_by(laundry_id=laundry_id)
+        LaundryAuditLog.query.filter_by(laundry_pk=laundry_item.id)
         .order_by(LaundryAuditLog.changed_at.desc())
         .all()
     )
 
+    # Load the editing users in one query instead of one per log entry
+    user_ids = {log.changed_by for log in audit_logs}
+    users = (
+        {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()}
+        if user_ids
+        else {}
+    )
+
     # Process audit logs to group by action and add user info
     processed_logs = []
     for log in audit_logs:
-        user = User.query.get(log.changed_by)
+        user = users.get(log.changed_by)
         processed_logs.append(
             {
                 "id": log.id,
@@ -900,8 +961,15 @@ def delete_laundry(laundry_id):
     except Exception as e:
         print(f"Failed to create deletion notification: {e}")
 
-    LaundryStatusHistory.query.filter_by(laundry_id=laundry_id).delete()
-    LaundryAuditLog.query.filter_by(laundry_id=laundry_id).delete()
+    # Take the laundry out of the report rollup while its history still exists
+    forget_laundry(laundry_item)
+
+    LaundryStatusHistory.query.filter_by(laundry_pk=laundry_item.id).delete()
+    LaundryAuditLog.query.filter_by(laundry_pk=laundry_item.id).delete()
+    # Keep loyalty history but drop its link to the deleted order
+    LoyaltyTransaction.query.filter_by(laundry_id=laundry_item.id).update(
+        {LoyaltyTransaction.laundry_id: None}, synchronize_session=False
+    )
 
     # Delete the Laundry
     db.session.delete(laundry_item)
@@ -2,6 +2,7 @@ from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import login_required
 
 from . import db
+from .reference_cache import cached_first
 
 loyalty_bp = Blueprint("loyalty_bp", __name__)
 
@@ -13,7 +14,7 @@ def dashboard():
     from .models import Customer, CustomerLoyalty, LoyaltyProgram, LoyaltyTransaction
 
     # Get program stats
-    program = LoyaltyProgram.query.filter_by(is_active=True).first()
+    program = cached_first(LoyaltyProgram, is_active=True)
 
     stats = {
         "total_members": CustomerLoyalty.query.count(),
@@ -112,7 +113,7 @@ def customer_detail(customer_id):
 def settings():
     from .models import LoyaltyProgram
 
-    program = LoyaltyProgram.query.filter_by(is_active=True).first()
+    program = cached_first(LoyaltyProgram, is_active=True)
     return render_template("loyalty/settings.html", program=program)
 
 
@@ -195,7 +196,7 @@ def award_points():
         return redirect(request.referrer or url_for("loyalty_bp.dashboard"))
 
     customer = Customer.query.get_or_404(customer_id)
-    program = LoyaltyProgram.query.filter_by(is_active=True).first()
+    program = cached_first(LoyaltyProgram, is_active=True)
 
     if not program:
         flash("No active loyalty program found!", category="error")
@@ -251,7 +252,7 @@ def redeem_points():
         return redirect(request.referrer or url_for("loyalty_bp.dashboard"))
 
     customer = Customer.query.get_or_404(customer_id)
-    program = LoyaltyProgram.query.filter_by(is_active=True).first()
+    program = cached_first(LoyaltyProgram, is_active=True)
 
     if not program:
         flash("No active loyalty program found!", category="error")
@@ -302,7 +303,7 @@ def bulk_award_points():
         points = 0
     reason = request.form.get("reason", "Bulk award")
 
-    program = LoyaltyProgram.query.filter_by(is_active=True).first()
+    program = cached_first(LoyaltyProgram, is_active=True)
     if not program:
         flash("No active loyalty program found!", category="error")
         return redirect(url_for("loyalty_bp.customers"))
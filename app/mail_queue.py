@@ -0,0 +1,293 @@
+"""Background email delivery over one reused SMTP connection.
+
+``send_notification_email`` used to call ``mail.send`` inside the request:
+a fresh SMTP + STARTTLS + login handshake with the mail provider for every
+message, with the request waiting on it. Messages now go into a bounded
+in-memory queue drained by one worker thread that:
+
+- keeps the SMTP connection open between messages and closes it after
+  ``EMAIL_IDLE_SECONDS`` (30) without mail, or when the mail settings are
+  reloaded (app.runtime_config)
+- takes up to ``EMAIL_BATCH_SIZE`` (20) queued messages at a time, sends
+  them over the connection and records every outcome as an
+  ``email_delivery`` row in one commit per batch
+- on a dropped connection or temporary (4xx) error reconnects and retries
+  the message, up to ``EMAIL_MAX_ATTEMPTS`` (3); permanent rejections
+  (5xx, refused recipients, malformed messages) fail at once
+
+The queue holds ``EMAIL_QUEUE_SIZE`` (500) messages. When it is full,
+:meth:`MailQueue.submit` waits ``EMAIL_ENQUEUE_TIMEOUT`` (2) seconds and
+then raises :class:`MailQueueFull`; the status-change outbox handler turns
+that into a retry later.
+
+The queue is in memory, so it is not what makes mail durable: the outbox
+event is. :func:`send_email` waits for the worker's SMTP outcome (up to
+``EMAIL_SEND_TIMEOUT``, 60 seconds) and raises :class:`MailDeliveryFailed`
+unless the server accepted the message, so the handler calling it, and its
+event, only succeed once the mail is sent. A crash with messages still
+queued leaves their events pending and they are retried.
+
+The worker starts with the app unless ``ENABLE_MAIL_WORKER=0`` (never under
+pytest); without it mail is sent synchronously as before.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import smtplib
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime
+from typing import Optional
+
+from flask import current_app
+from flask_mail import BadHeaderError
+
+from . import db
+from .models import EmailDelivery
+from .sms_outbox import _env_number
+
+logger = logging.getLogger("app.mail_queue")
+
+# Errors that retrying the same message cannot fix
+_PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, BadHeaderError, AssertionError)
+
+
+class MailQueueFull(Exception):
+    """The queue stayed full for the whole enqueue timeout."""
+
+
+class MailDeliveryFailed(Exception):
+    """The worker did not get the message accepted by the mail server."""
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, _PERMANENT_ERRORS):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class MailQueue:
+    """Bounded queue of ``flask_mail.Message`` objects and its worker thread."""
+
+    def __init__(self, app, maxsize: int = 500, batch_size: int = 20,
+                 idle_seconds: float = 30.0, enqueue_timeout: float = 2.0,
+                 max_attempts: int = 3, retry_seconds: float = 1.0):
+        self.app = app
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+        self.batch_size = max(1, batch_size)
+        self.idle_seconds = idle_seconds
+        self.enqueue_timeout = enqueue_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.retry_seconds = retry_seconds
+        self.stats: Counter = Counter()
+        self._connection = None
+        self._mail_state = None
+        # The worker and drain() never share the connection concurrently
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, message, category: Optional[str] = None,
+               timeout: Optional[float] = None) -> Future:
+        """Queue ``message``; raises :class:`MailQueueFull` when there is no room.
+
+        The returned future resolves to ``(status, error)`` once the worker
+        has tried to send it.
+        """
+        wait = self.enqueue_timeout if timeout is None else timeout
+        outcome: Future = Future()
+        try:
+            self.queue.put((message, category, datetime.utcnow(), outcome), timeout=wait)
+        except queue.Full:
+            self.stats["rejected"] += 1
+            raise MailQueueFull(f"Mail queue is full ({self.queue.maxsize} messages)")
+        self.stats["queued"] += 1
+        return outcome
+
+    def _take_batch(self, wait: float) -> list:
+        try:
+            batch = [self.queue.get(timeout=wait) if wait > 0 else self.queue.get_nowait()]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _connect(self):
+        state = current_app.extensions["mail"]
+        if self._connection is not None and state is not self._mail_state:
+            # Mail settings were reloaded: reconnect with the new ones
+            self.close()
+        if self._connection is None:
+            self._connection = state.connect().__enter__()
+            self._mail_state = state
+            self.stats["connections"] += 1
+        return self._connection
+
+    def close(self) -> None:
+        """Quit the SMTP session, if one is open."""
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+
+    def _send(self, message) -> tuple:
+        """Send one message; returns (status, attempts, error)."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._connect().send(message)
+                return EmailDelivery.SENT, attempt, None
+            except Exception as e:
+                if _is_permanent(e):
+                    return EmailDelivery.FAILED, attempt, str(e)[:2000]
+                logger.warning("SMTP send failed (attempt %d): %s", attempt, e)
+                self.close()
+                if attempt == self.max_attempts:
+                    return EmailDelivery.FAILED, attempt, str(e)[:2000]
+                self.stats["reconnects"] += 1
+                time.sleep(self.retry_seconds * attempt)
+
+    def process_batch(self, batch: list) -> Counter:
+        """Send ``batch`` over the shared connection and record the outcomes."""
+        outcomes: Counter = Counter()
+        results = []
+        with self._send_lock:
+            for message, category, queued_at, outcome in batch:
+                status, attempts, error = self._send(message)
+                results.append((outcome, status, error))
+                outcomes[status] += 1
+                self.stats[status] += 1
+                db.session.add(
+                    EmailDelivery(
+                        recipient=", ".join(sorted(message.send_to or []))[:255],
+                        subject=(message.subject or "")[:255],
+                        category=category,
+                        status=status,
+                        attempts=attempts,
+                        error=error,
+                        queued_at=queued_at,
+                    )
+                )
+                self.queue.task_done()
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Could not record %d email outcome(s)", len(batch))
+        for outcome, status, error in results:
+            outcome.set_result((status, error))
+        return outcomes
+
+    def drain(self) -> Counter:
+        """Send everything queued now in this thread (needs an app context)."""
+        outcomes: Counter = Counter()
+        while True:
+            batch = self._take_batch(0)
+            if not batch:
+                return outcomes
+            outcomes.update(self.process_batch(batch))
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "depth": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "connected": self._connection is not None,
+            **self.stats,
+        }
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mail-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the worker after it has sent what is already queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        last_sent = time.monotonic()
+        while not self._stop.is_set():
+            batch = self._take_batch(max(0.05, min(1.0, self.idle_seconds)))
+            if not batch:
+                if self._connection is not None and time.monotonic() - last_sent >= self.idle_seconds:
+                    with self._send_lock:
+                        self.close()
+                continue
+            try:
+                with self.app.app_context():
+                    self.process_batch(batch)
+            except Exception:
+                logger.exception("Mail queue worker error")
+            last_sent = time.monotonic()
+        try:
+            with self.app.app_context():
+                self.drain()
+        except Exception:
+            logger.exception("Mail queue worker error while stopping")
+        self.close()
+
+
+def get_mail_queue(app=None) -> MailQueue:
+    """Return the app's mail queue, creating it (not started) on first use."""
+    app = app or current_app._get_current_object()
+    mail_queue = app.extensions.get("mail_queue")
+    if mail_queue is None:
+        mail_queue = app.extensions["mail_queue"] = MailQueue(
+            app,
+            maxsize=_env_number("EMAIL_QUEUE_SIZE", 500),
+            batch_size=_env_number("EMAIL_BATCH_SIZE", 20),
+            idle_seconds=_env_number("EMAIL_IDLE_SECONDS", 30.0),
+            enqueue_timeout=_env_number("EMAIL_ENQUEUE_TIMEOUT", 2.0),
+            max_attempts=_env_number("EMAIL_MAX_ATTEMPTS", 3),
+            retry_seconds=_env_number("EMAIL_RETRY_SECONDS", 1.0),
+        )
+    return mail_queue
+
+
+def start_mail_queue(app) -> MailQueue:
+    """Start (once per app) the mail worker; it drains the queue at exit."""
+    mail_queue = get_mail_queue(app)
+    if not mail_queue.running:
+        mail_queue.start()
+        atexit.register(mail_queue.stop)
+    return mail_queue
+
+
+def send_email(message, category: Optional[str] = None, timeout: Optional[float] = None) -> None:
+    """Send ``message`` through the worker, or directly when none is running.
+
+    Returns once the mail server accepted the message. Raises
+    :class:`MailQueueFull` under backpressure, :class:`MailDeliveryFailed`
+    when the worker could not send it (or did not within ``timeout``) and
+    the SMTP error when sending synchronously.
+    """
+    mail_queue = get_mail_queue()
+    if not mail_queue.running:
+        current_app.extensions["mail"].send(message)
+        return
+    outcome = mail_queue.submit(message, category=category)
+    wait = _env_number("EMAIL_SEND_TIMEOUT", 60.0) if timeout is None else timeout
+    try:
+        status, error = outcome.result(timeout=wait)
+    except FutureTimeout:
+        # It may still go out; the caller's retry can then repeat it (at-least-once)
+        raise MailDeliveryFailed(f"Not sent within {wait:.0f}s")
+    if status != EmailDelivery.SENT:
+        raise MailDeliveryFailed(error or "Not sent")
@@ -1,8 +1,10 @@
 from datetime import datetime
 
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 
 from . import db
+from .phones import normalize_phone
 
 
 class User(db.Model, UserMixin):
@@ -84,10 +86,17 @@ class Customer(db.Model):
     full_name = db.Column(db.String(150))
     email = db.Column(db.String(150))
     phone = db.Column(db.String(20))
+    # ``phone`` in E.164 (app.phones), kept in sync on write; NULL if unreadable
+    phone_e164 = db.Column(db.String(16), index=True)
     is_active = db.Column(db.Boolean, default=True)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
     laundries = db.relationship("Laundry", backref="customer", lazy=True)
 
+    @validates("phone")
+    def _sync_phone_e164(self, key, value):
+        self.phone_e164 = normalize_phone(value)
+        return value
+
     def get_loyalty_info(self):
         """Get customer's loyalty information"""
         from . import db
@@ -141,7 +150,9 @@ class Service(db.Model):
 class Laundry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     laundry_id = db.Column(db.String(10), unique=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey("customer.id"), nullable=False)
+    customer_id = db.Column(
+        db.Integer, db.ForeignKey("customer.id"), nullable=False, index=True
+    )
     service_id = db.Column(
         db.Integer, db.ForeignKey("service.id"), nullable=True
     )  # New foreign key
@@ -149,12 +160,17 @@ class Laundry(db.Model):
     service_type = db.Column(db.String(50))  # Keep for backward compatibility
     weight_kg = db.Column(db.Float, default=0.0)  # Optional weight for advanced pricing
     price = db.Column(db.Float, default=0.0)  # Total price for the laundry
-    status = db.Column(db.String(20))  # Received, Ready for Pickup, Completed
+    status = db.Column(db.String(20), index=True)  # Received, Ready for Pickup, Completed
     notes = db.Column(db.Text)  # Description of clothes/items
-    date_received = db.Column(db.DateTime, default=datetime.utcnow)
+    date_received = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     date_updated = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
+    # Local business day of date_received (set on write, see app.business_day)
+    business_date = db.Column(db.Date, index=True)
+    # When the order last entered these statuses (set with the status change)
+    ready_at = db.Column(db.DateTime, index=True)
+    completed_at = db.Column(db.DateTime, index=True)
 
     # Relationships
     service = db.relationship("Service", backref="laundries", lazy=True)
@@ -183,7 +199,9 @@ class Laundry(db.Model):
         # If relationship not loaded yet but service_id exists (e.g., before session flush)
         if self.service_id:
             try:
-                service = Service.query.get(self.service_id)
+                from .reference_cache import cached_get
+
+                service = cached_get(Service, self.service_id)
                 if service:
                     return service.calculate_total_price(
                         self.item_count, self.weight_kg
@@ -200,6 +218,13 @@ class Laundry(db.Model):
         """Update the price field with calculated price"""
         self.price = self.calculate_price()
 
+    def stamp_status_time(self, status, when):
+        """Record when the order reached a milestone status"""
+        if status == "Ready for Pickup":
+            self.ready_at = when
+        elif status == "Completed":
+            self.completed_at = when
+
     def get_service_name(self):
         """Get service name from either new service model or legacy service_type"""
         if self.service:
@@ -216,6 +241,8 @@ class Laundry(db.Model):
 class LaundryAuditLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     laundry_id = db.Column(db.String(10), nullable=False)
+    # Integer link to laundry.id for indexed lookups (laundry_id is the public string)
+    laundry_pk = db.Column(db.Integer, db.ForeignKey("laundry.id"), index=True)
     action = db.Column(db.String(20))  # CREATED, EDITED, STATUS_CHANGED
     field_changed = db.Column(db.String(50))
     old_value = db.Column(db.Text)
@@ -228,27 +255,48 @@ class LaundryAuditLog(db.Model):
 class LaundryStatusHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     laundry_id = db.Column(db.String(10), nullable=False)
+    # Integer link to laundry.id for indexed lookups (laundry_id is the public string)
+    laundry_pk = db.Column(db.Integer, db.ForeignKey("laundry.id"), index=True)
     old_status = db.Column(db.String(20))
     new_status = db.Column(db.String(20), nullable=False)
     changed_by = db.Column(db.Integer, db.ForeignKey("userdb.id"), nullable=False)
     changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Local business day of changed_at (set on write, see app.business_day)
+    business_date = db.Column(db.Date, index=True)
     notes = db.Column(db.Text)
 
     # Relationship to User
     changed_by_user = db.relationship("User", backref="status_changes")
 
     @staticmethod
-    def log_status_change(laundry_id, old_status, new_status, changed_by, notes=None):
-        """Log a status change"""
+    def log_status_change(
+        laundry_id, old_status, new_status, changed_by, notes=None, laundry=None
+    ):
+        """Log a status change, stamp the laundry's milestone time and update DailyStats.
+
+        Pass ``laundry`` when the caller already has it loaded to avoid a lookup.
+        """
         if old_status != new_status:  # Only log if status actually changed
+            from .daily_stats import record_status_change
+
+            if laundry is None:
+                laundry = Laundry.query.filter_by(laundry_id=laundry_id).first()
+
             history = LaundryStatusHistory()
             history.laundry_id = laundry_id
+            history.laundry_pk = laundry.id if laundry is not None else None
             history.old_status = old_status
             history.new_status = new_status
             history.changed_by = changed_by
+            history.changed_at = datetime.utcnow()
             history.notes = notes
 
             db.session.add(history)
+
+            if laundry is not None:
+                # Rollup first: it needs the previous milestone timestamps
+                record_status_change(laundry, old_status, new_status, history.changed_at)
+                laundry.stamp_status_time(new_status, history.changed_at)
             return history
         return None
 
@@ -435,7 +483,7 @@ class StockMovement(db.Model):
 
     # Tracking
     created_by = db.Column(db.Integer, db.ForeignKey("userdb.id"), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # Relationships
     created_by_user = db.relationship("User", backref="stock_movements")
@@ -453,6 +501,7 @@ class StockMovement(db.Model):
     ):
         """Create a stock movement and update item stock"""
         from . import db
+        from .inventory_alerts import record_stock_change
 
         item = InventoryItem.query.get(item_id)
         if not item:
@@ -486,6 +535,7 @@ class StockMovement(db.Model):
         item.date_updated = datetime.utcnow()
 
         db.session.add(movement)
+        record_stock_change(item)
         return movement
 
     def __repr__(self):
@@ -618,6 +668,37 @@ class SalesReport(db.Model):
         return f"<SalesReport {self.report_date} - {self.report_type}>"
 
 
+class DailyStats(db.Model):
+    """Per-day, per-service rollup of order counts, revenue and new customers.
+
+    Maintained incrementally by ``app.daily_stats`` so report pages read a
+    handful of rows instead of rescanning Laundry and LaundryStatusHistory.
+    ``service_id`` 0 holds laundries without a service and the day's
+    new-customer count (customers are not tied to a service).
+    """
+
+    __tablename__ = "daily_stats"
+    __table_args__ = (
+        db.UniqueConstraint("day", "service_id", name="uq_daily_stats_day_service"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    service_id = db.Column(db.Integer, nullable=False, default=0)
+
+    received_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    new_customers = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    def __repr__(self):
+        return f"<DailyStats {self.day} service={self.service_id}>"
+
+
 class LoyaltyProgram(db.Model):
     """Loyalty program configuration"""
 
@@ -743,7 +824,7 @@ class LoyaltyTransaction(db.Model):
 
     # Related Records
     laundry_id = db.Column(
-        db.Integer, db.ForeignKey("laundry.id"), nullable=True
+        db.Integer, db.ForeignKey("laundry.id"), nullable=True, index=True
     )  # If earned from order
     order_amount = db.Column(
         db.Float, nullable=True
@@ -763,6 +844,9 @@ class LoyaltyTransaction(db.Model):
         return f"<LoyaltyTransaction {self.transaction_type}: {self.points} points>"
 
 
+DEFAULT_RECEIVED_BATCH_MESSAGE = "Hi {customer_name}! We received your {load_count} laundry loads: {load_list}. We'll text you when they're ready. - {sender_name}"
+
+
 class SMSSettings(db.Model):
     """SMS notification settings and custom messages"""
 
@@ -791,6 +875,11 @@ class SMSSettings(db.Model):
         db.Text,
         default="Welcome to {sender_name}, {customer_name}! We're excited to serve you. For inquiries, contact us at +639761111464.",
     )
+    # One "Received" SMS for a multi-load drop-off; {load_list} expands to
+    # "#<laundry_id> (<n> items)" per load
+    received_batch_message = db.Column(
+        db.Text, default=DEFAULT_RECEIVED_BATCH_MESSAGE
+    )
 
     # Metadata
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -816,9 +905,12 @@ class SMSSettings(db.Model):
         laundry_id: str,
         sender_name: str = "ACCIO Laundry",
         number_of_items: "int|str|None" = None,
+        load_list: str = "",
+        load_count: "int|str|None" = None,
     ) -> str:
         """Format message template with actual values, supporting both {number_of_items} and {Number of Items}.
         Note: {Number of Items} (with spaces) is replaced before .format() to avoid KeyError.
+        {load_list} and {load_count} describe a multi-load batch (empty otherwise).
         """
         # Normalize number_of_items to string
         noi = "" if number_of_items is None else str(number_of_items)
@@ -832,6 +924,8 @@ class SMSSettings(db.Model):
             laundry_id=laundry_id,
             sender_name=sender_name,
             number_of_items=noi,
+            load_list=load_list,
+            load_count="" if load_count is None else str(load_count),
         )
 
     def __repr__(self):
@@ -926,6 +1020,8 @@ class SMSSettingsProfile(db.Model):
         laundry_id: str,
         sender_name: str = "ACCIO Laundry",
         number_of_items: "int|str|None" = None,
+        load_list: str = "",
+        load_count: "int|str|None" = None,
     ) -> str:
         """Same formatter as SMSSettings for convenience when used directly"""
         noi = "" if number_of_items is None else str(number_of_items)
@@ -935,6 +1031,8 @@ class SMSSettingsProfile(db.Model):
             laundry_id=laundry_id,
             sender_name=sender_name,
             number_of_items=noi,
+            load_list=load_list,
+            load_count="" if load_count is None else str(load_count),
         )
 
     def __repr__(self):
@@ -955,6 +1053,11 @@ class BulkMessageHistory(db.Model):
     successful_sends = db.Column(db.Integer, default=0)
     failed_sends = db.Column(db.Integer, default=0)
 
+    # Background job state (app.bulk_sms); NULL on campaigns sent inline
+    status = db.Column(db.String(20))  # queued, running, paused, completed, failed, cancelled
+    send_mode = db.Column(db.String(20))  # batched, personalized
+    completed_at = db.Column(db.DateTime)
+
     # Relationships
     sent_by = db.relationship("User", backref="bulk_messages_sent")
 
@@ -987,9 +1090,154 @@ class BulkMessageHistory(db.Model):
         return f"<BulkMessage {self.message_type}: {self.total_recipients} recipients>"
 
 
+class BulkMessageBatch(db.Model):
+    """One provider call of a batched bulk campaign (identical text, many numbers)"""
+
+    __tablename__ = "bulk_message_batch"
+
+    id = db.Column(db.Integer, primary_key=True)
+    bulk_history_id = db.Column(
+        db.Integer, db.ForeignKey("bulk_message_history.id"), nullable=False, index=True
+    )
+    batch_number = db.Column(db.Integer, nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    numbers = db.Column(db.Text, nullable=False)  # comma-separated, provider format
+    recipient_count = db.Column(db.Integer, nullable=False, default=0)
+
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, sending, sent, failed, cancelled
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    status_code = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime)
+    # Set when a job claims the batch and refreshed before every provider call
+    claimed_at = db.Column(db.DateTime)
+
+    bulk_history = db.relationship(
+        "BulkMessageHistory",
+        backref=db.backref("batches", order_by="BulkMessageBatch.batch_number"),
+    )
+
+    def __repr__(self):
+        return f"<BulkMessageBatch {self.bulk_history_id}#{self.batch_number} {self.status}>"
+
+
+class SMSOutbox(db.Model):
+    """Durable queue of outbound SMS, drained by app.sms_outbox workers"""
+
+    __tablename__ = "sms_outbox"
+    __table_args__ = (
+        # Workers claim due rows by status and time
+        db.Index("ix_sms_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    DEAD = "dead"
+    HELD = "held"  # campaign paused
+    CANCELLED = "cancelled"
+
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(30), nullable=False, default="semaphore")
+    phone = db.Column(db.String(30), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    category = db.Column(db.String(50))  # status:<name>, welcome, bulk, manual
+    bulk_history_id = db.Column(
+        db.Integer, db.ForeignKey("bulk_message_history.id"), index=True
+    )
+
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=6)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_status_code = db.Column(db.Integer)
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<SMSOutbox {self.id} {self.status} to {self.phone}>"
+
+
+class EmailDelivery(db.Model):
+    """Outcome of one email sent by the app.mail_queue worker"""
+
+    __tablename__ = "email_delivery"
+
+    SENT = "sent"
+    FAILED = "failed"
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255))
+    category = db.Column(db.String(50))  # status:<name>, ...
+    status = db.Column(db.String(20), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=1)
+    error = db.Column(db.Text)
+
+    queued_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<EmailDelivery {self.id} {self.status} to {self.recipient}>"
+
+
+class OutboxEvent(db.Model):
+    """Side-effect event written in the same transaction as its cause (app.event_outbox)"""
+
+    __tablename__ = "outbox_event"
+    __table_args__ = (
+        db.Index("ix_outbox_event_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    DEAD = "dead"
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    # One event per cause: recording the same cause twice fails the transaction
+    dedupe_key = db.Column(db.String(120), unique=True)
+
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<OutboxEvent {self.id} {self.event_type} {self.status}>"
+
+
+class OutboxEventReceipt(db.Model):
+    """Marks one handler as done for one event, so retries skip it"""
+
+    __tablename__ = "outbox_event_receipt"
+    __table_args__ = (
+        db.UniqueConstraint("event_id", "handler", name="uq_outbox_event_receipt_event_handler"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey("outbox_event.id"), nullable=False)
+    handler = db.Column(db.String(50), nullable=False)
+    handled_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class Notification(db.Model):
     """User notifications for system events"""
 
+    __table_args__ = (
+        # Unread badge/list lookups filter on both columns
+        db.Index("ix_notification_user_id_is_read", "user_id", "is_read"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("userdb.id"), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -1069,6 +1317,102 @@ class Notification(db.Model):
         return f"<Notification {self.title}: {self.notification_type}>"
 
 
+class NotificationBroadcast(db.Model):
+    """A notification shown to every user, stored once.
+
+    Per-user state lives in ``NotificationReceipt`` rows, created only when a
+    user reads or deletes the broadcast; no receipt means unread. Users only
+    see broadcasts created after their account.
+    """
+
+    __tablename__ = "notification_broadcast"
+
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(50), nullable=False, default="info")
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    related_model = db.Column(db.String(50))
+    related_id = db.Column(db.String(50))
+
+    action_url = db.Column(db.String(500))
+    action_text = db.Column(db.String(100))
+
+    # Same "N hours ago" formatting as personal notifications
+    get_time_ago = Notification.get_time_ago
+
+    def __repr__(self):
+        return f"<NotificationBroadcast {self.title}: {self.notification_type}>"
+
+
+class NotificationReceipt(db.Model):
+    """One user's read/deleted state for a ``NotificationBroadcast``."""
+
+    __tablename__ = "notification_receipt"
+    __table_args__ = (
+        db.UniqueConstraint("broadcast_id", "user_id", name="uq_notification_receipt_user"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    broadcast_id = db.Column(
+        db.Integer, db.ForeignKey("notification_broadcast.id"), nullable=False
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey("userdb.id"), nullable=False, index=True)
+    read_at = db.Column(db.DateTime)
+    dismissed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<NotificationReceipt broadcast={self.broadcast_id} user={self.user_id}>"
+
+
+class InventoryAlert(db.Model):
+    """A low/out-of-stock alert raised for an inventory item.
+
+    ``dedupe_key`` (``inventory:<item id>:<level>:<YYYYMMDD>``) is unique, so
+    an item is alerted at most once per level and day however many
+    evaluations race.
+    """
+
+    __tablename__ = "inventory_alert"
+
+    LOW_STOCK = "low_stock"
+    OUT_OF_STOCK = "out_of_stock"
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey("inventory_item.id"), nullable=False, index=True)
+    level = db.Column(db.String(20), nullable=False)
+    dedupe_key = db.Column(db.String(120), nullable=False, unique=True)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey("notification_broadcast.id"))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<InventoryAlert {self.dedupe_key}>"
+
+
+class NotificationCounter(db.Model):
+    """Cached total/unread notification counts per user and type.
+
+    Covers personal notifications and the broadcasts the user can see, and
+    is updated in the same transaction as the change. A user without rows
+    has them rebuilt from the notifications on the next read.
+    """
+
+    __tablename__ = "notification_counter"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "notification_type", name="uq_notification_counter_type"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("userdb.id"), nullable=False)
+    notification_type = db.Column(db.String(50), nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<NotificationCounter user={self.user_id} {self.notification_type}: {self.unread}/{self.total}>"
+
+
 class ExportAudit(db.Model):
     """Simple audit log for customer exports"""
 
@@ -4,11 +4,15 @@ This module provides two quick helpers:
 - request timing: logs requests that exceed a configurable threshold
 - SQL timing: logs SQL statements that take longer than a threshold
 
+With ``SQL_INDEX_ADVISOR=1`` every statement is also fingerprinted and
+aggregated for ``flask suggest-indexes`` (see ``app.index_advisor``).
+
 The hooks are safe to register during app creation and are disabled when
 running under pytest unless explicitly enabled via env var.
 """
 from __future__ import annotations
 
+import atexit
 import logging
 import time
 import os
@@ -63,6 +67,14 @@ def init_monitoring(app, db, *, req_threshold_ms: int = 500, query_threshold_ms:
             logger.exception("Error measuring request time")
         return response
 
+    advisor = None
+    if os.environ.get("SQL_INDEX_ADVISOR") == "1" or app.config.get("SQL_INDEX_ADVISOR"):
+        from .index_advisor import IndexAdvisor, stats_file_path
+
+        advisor = IndexAdvisor()
+        app.extensions["index_advisor"] = advisor
+        atexit.register(advisor.save, stats_file_path(app))
+
     # SQL timing: attach to DB API cursor events. Use db.engine when app context is ready.
     try:
         engine = db.engine
@@ -78,6 +90,8 @@ def init_monitoring(app, db, *, req_threshold_ms: int = 500, query_threshold_ms:
                 if start is None:
                     return
                 elapsed_ms = (time.perf_counter() - start) * 1000
+                if advisor is not None:
+                    advisor.record(statement, elapsed_ms)
                 qthreshold = app.config.get("SQL_MONITORING_THRESHOLD_MS", query_threshold_ms)
                 if elapsed_ms >= qthreshold:
                     # Shorten long statements in logs
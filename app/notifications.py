@@ -1,11 +1,397 @@
-from flask import Blueprint, jsonify, render_template, request, url_for
+import logging
+from datetime import datetime
+
+from flask import Blueprint, abort, jsonify, render_template, request, url_for
 from flask_login import current_user, login_required
+from flask_socketio import emit, join_room
+from sqlalchemy import (
+    String, and_, case, cast, delete, event, exists, func, insert, literal, select, union_all,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from app import db, socketio
+from app.models import (
+    Notification, NotificationBroadcast, NotificationCounter, NotificationReceipt, User,
+)
 
-from app import db
-from app.models import Notification
+logger = logging.getLogger("app.notifications")
 
 notifications = Blueprint("notifications", __name__)
 
+# Broadcast notifications are addressed as "b<id>" next to personal "<id>"
+BROADCAST_KEY_PREFIX = "b"
+NOTIFICATION_TYPES = ("info", "success", "warning", "error")
+
+
+class FeedItem:
+    """A personal or broadcast notification as one user sees it."""
+
+    def __init__(self, key, source, is_read):
+        self.id = key
+        self.source = source
+        self.is_read = bool(is_read)
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+
+def _visible_broadcasts(user):
+    """Broadcasts ``user`` can see: those created since their account."""
+    if getattr(user, "date_created", None) is None:
+        return True
+    return NotificationBroadcast.created_at >= user.date_created
+
+
+def _feed(user, notification_type=None, unread_only=False):
+    """Personal and broadcast notifications of ``user`` as one subquery.
+
+    Columns: ``key``, ``notification_type``, ``created_at``, ``is_read``.
+    """
+    personal_read = func.coalesce(Notification.is_read, False)
+    personal = select(
+        cast(Notification.id, String).label("key"),
+        Notification.notification_type.label("notification_type"),
+        Notification.created_at.label("created_at"),
+        personal_read.label("is_read"),
+    ).where(Notification.user_id == user.id)
+    broadcast = (
+        select(
+            (literal(BROADCAST_KEY_PREFIX) + cast(NotificationBroadcast.id, String)).label("key"),
+            NotificationBroadcast.notification_type.label("notification_type"),
+            NotificationBroadcast.created_at.label("created_at"),
+            NotificationReceipt.read_at.isnot(None).label("is_read"),
+        )
+        .select_from(NotificationBroadcast)
+        .outerjoin(
+            NotificationReceipt,
+            and_(
+                NotificationReceipt.broadcast_id == NotificationBroadcast.id,
+                NotificationReceipt.user_id == user.id,
+            ),
+        )
+        .where(NotificationReceipt.dismissed_at.is_(None), _visible_broadcasts(user))
+    )
+    if notification_type:
+        personal = personal.where(Notification.notification_type == notification_type)
+        broadcast = broadcast.where(NotificationBroadcast.notification_type == notification_type)
+    if unread_only:
+        personal = personal.where(personal_read.is_(False))
+        broadcast = broadcast.where(NotificationReceipt.read_at.is_(None))
+    return union_all(personal, broadcast).subquery("feed")
+
+
+def _feed_keys(feed):
+    return select(feed.c.key).order_by(feed.c.created_at.desc(), feed.c.key.desc())
+
+
+def _load_feed_items(user, keys):
+    """Load the notifications behind ``keys`` (two queries), keeping order."""
+    personal_ids = [int(k) for k in keys if not k.startswith(BROADCAST_KEY_PREFIX)]
+    broadcast_ids = [int(k[1:]) for k in keys if k.startswith(BROADCAST_KEY_PREFIX)]
+    items = {}
+    if personal_ids:
+        for n in Notification.query.filter(Notification.id.in_(personal_ids)):
+            items[str(n.id)] = FeedItem(str(n.id), n, n.is_read)
+    if broadcast_ids:
+        rows = db.session.execute(
+            select(NotificationBroadcast, NotificationReceipt.read_at)
+            .outerjoin(
+                NotificationReceipt,
+                and_(
+                    NotificationReceipt.broadcast_id == NotificationBroadcast.id,
+                    NotificationReceipt.user_id == user.id,
+                ),
+            )
+            .where(NotificationBroadcast.id.in_(broadcast_ids))
+        )
+        for broadcast, read_at in rows:
+            key = f"{BROADCAST_KEY_PREFIX}{broadcast.id}"
+            items[key] = FeedItem(key, broadcast, read_at is not None)
+    return [items[k] for k in keys if k in items]
+
+
+def _grouped_counts_query(user):
+    feed = _feed(user)
+    return select(
+        feed.c.notification_type,
+        func.count(),
+        func.coalesce(func.sum(case((feed.c.is_read, 0), else_=1)), 0),
+    ).group_by(feed.c.notification_type)
+
+
+def _grouped_counts(user, connection=None):
+    """``(type, total, unread)`` rows computed from the notifications themselves."""
+    return (connection or db.session).execute(_grouped_counts_query(user)).all()
+
+
+def _cached_counts(user_id, connection=None):
+    return (connection or db.session).execute(
+        select(
+            NotificationCounter.notification_type,
+            NotificationCounter.total,
+            NotificationCounter.unread,
+        ).where(NotificationCounter.user_id == user_id)
+    ).all()
+
+
+def _build_counters(user):
+    """Store ``user``'s counters, counted by the inserting statement itself.
+
+    Reading the counts and inserting them separately would miss a
+    notification committed in between: its writer skips users without
+    counters (see :func:`adjust_counter`).
+    """
+    columns = ["user_id", "notification_type", "total", "unread"]
+    grouped = _grouped_counts_query(user).subquery()
+    counted = select(
+        literal(user.id, db.Integer), grouped.c[0], grouped.c[1], grouped.c[2]
+    )
+    # Zero rows for the remaining types, so the user has counters even with
+    # no notifications and is not counted again on every read
+    types = union_all(
+        *(select(literal(t, db.String).label("notification_type")) for t in NOTIFICATION_TYPES)
+    ).subquery()
+    zeros = select(
+        literal(user.id, db.Integer), types.c.notification_type,
+        literal(0, db.Integer), literal(0, db.Integer),
+    ).where(
+        ~exists().where(
+            NotificationCounter.user_id == user.id,
+            NotificationCounter.notification_type == types.c.notification_type,
+        )
+    )
+    try:
+        db.session.execute(insert(NotificationCounter).from_select(columns, counted))
+        db.session.execute(insert(NotificationCounter).from_select(columns, zeros))
+        db.session.commit()
+    except IntegrityError:
+        # Built concurrently by another request
+        db.session.rollback()
+
+
+def notification_counts(user):
+    """Total and unread counts, overall and per type, from the user's counters.
+
+    Missing counters are built with one grouped ``INSERT ... SELECT``.
+    """
+    rows = _cached_counts(user.id)
+    if not rows:
+        _build_counters(user)
+        rows = _cached_counts(user.id)
+    counts = {
+        "total": 0,
+        "unread": 0,
+        "types": dict.fromkeys(NOTIFICATION_TYPES, 0),
+        "type_totals": dict.fromkeys(NOTIFICATION_TYPES, 0),
+    }
+    for notification_type, total, unread in rows:
+        total, unread = max(total or 0, 0), max(unread or 0, 0)
+        counts["total"] += total
+        counts["unread"] += unread
+        counts["types"][notification_type] = unread
+        counts["type_totals"][notification_type] = total
+    return counts
+
+
+def unread_count(user, connection=None):
+    rows = _cached_counts(user.id, connection)
+    if rows:
+        return sum(max(unread or 0, 0) for _, _, unread in rows)
+    feed = _feed(user, unread_only=True)
+    return (connection or db.session).execute(select(func.count()).select_from(feed)).scalar() or 0
+
+
+def adjust_counter(user_id, notification_type, total=0, unread=0):
+    """Apply a change to the user's counters in the current transaction.
+
+    Users without counters are skipped; theirs are built on the next read.
+    """
+    has_counters = db.session.execute(
+        select(NotificationCounter.id).where(NotificationCounter.user_id == user_id).limit(1)
+    ).first()
+    if has_counters is None:
+        return
+    updated = db.session.execute(
+        update(NotificationCounter)
+        .where(
+            NotificationCounter.user_id == user_id,
+            NotificationCounter.notification_type == notification_type,
+        )
+        .values(
+            total=NotificationCounter.total + total,
+            unread=NotificationCounter.unread + unread,
+        )
+    ).rowcount
+    if not updated:
+        db.session.add(
+            NotificationCounter(
+                user_id=user_id,
+                notification_type=notification_type,
+                total=max(total, 0),
+                unread=max(unread, 0),
+            )
+        )
+
+
+def _count_new_broadcast(notification_type, count=1):
+    """A new broadcast is one more unread notification for every user."""
+    other = aliased(NotificationCounter)
+    missing_type = (
+        select(
+            NotificationCounter.user_id,
+            literal(notification_type, db.String),
+            literal(0, db.Integer),
+            literal(0, db.Integer),
+        )
+        .where(
+            ~exists().where(
+                other.user_id == NotificationCounter.user_id,
+                other.notification_type == notification_type,
+            )
+        )
+        .distinct()
+    )
+    db.session.execute(
+        insert(NotificationCounter).from_select(
+            ["user_id", "notification_type", "total", "unread"], missing_type
+        )
+    )
+    db.session.execute(
+        update(NotificationCounter)
+        .where(NotificationCounter.notification_type == notification_type)
+        .values(total=NotificationCounter.total + count, unread=NotificationCounter.unread + count)
+    )
+
+
+def reset_counters(user_ids=None):
+    """Drop cached counters (all users by default) so they are rebuilt on read."""
+    stmt = delete(NotificationCounter)
+    if user_ids is not None:
+        stmt = stmt.where(NotificationCounter.user_id.in_(list(user_ids)))
+    db.session.execute(stmt)
+
+
+# Live unread counts. Each signed-in tab joins its user's room on the
+# /notifications namespace and receives {"count": n} on connect and after
+# every commit that changes the count; a new broadcast sends {"delta": 1}
+# to everyone instead of one count query per user. The bell still polls,
+# but only as a slow reconciliation.
+NAMESPACE = "/notifications"
+ALL_USERS_ROOM = "users"
+_PUSH_FLAG = "notification_push"
+
+
+def user_room(user_id):
+    return f"user:{user_id}"
+
+
+def queue_unread_push(user_id=None):
+    """Push unread counts once the current transaction commits.
+
+    ``user_id=None`` is a new broadcast, which raises every user's count.
+    """
+    pending = db.session.info.setdefault(_PUSH_FLAG, {"users": set(), "broadcasts": 0})
+    if user_id is None:
+        pending["broadcasts"] += 1
+    else:
+        pending["users"].add(user_id)
+
+
+def publish_unread_counts(user_ids=(), broadcasts=0):
+    # Deltas go first so a user's exact count, which includes them, wins
+    if broadcasts:
+        socketio.emit("unread", {"delta": broadcasts}, to=ALL_USERS_ROOM, namespace=NAMESPACE)
+    if not user_ids:
+        return
+    # Runs after a commit, when the session cannot issue SQL
+    with db.engine.connect() as connection:
+        users = connection.execute(
+            select(User.id, User.date_created).where(User.id.in_(list(user_ids)))
+        ).all()
+        for user in users:
+            socketio.emit(
+                "unread",
+                {"count": unread_count(user, connection)},
+                to=user_room(user.id),
+                namespace=NAMESPACE,
+            )
+
+
+@event.listens_for(Session, "after_commit")
+def _push_after_commit(session):
+    pending = session.info.pop(_PUSH_FLAG, None)
+    if not pending:
+        return
+    try:
+        publish_unread_counts(pending["users"], pending["broadcasts"])
+    except Exception:
+        logger.exception("Could not push unread notification counts")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_push_after_rollback(session):
+    session.info.pop(_PUSH_FLAG, None)
+
+
+@socketio.on("connect", namespace=NAMESPACE)
+def _on_connect(auth=None):
+    if not current_user.is_authenticated:
+        return False
+    join_room(user_room(current_user.id))
+    join_room(ALL_USERS_ROOM)
+    emit("unread", {"count": notification_counts(current_user)["unread"]})
+
+
+def _parse_key(notification_key):
+    """``(is_broadcast, id)`` for a notification key, 404 when malformed."""
+    if notification_key.startswith(BROADCAST_KEY_PREFIX) and notification_key[1:].isdigit():
+        return True, int(notification_key[1:])
+    if notification_key.isdigit():
+        return False, int(notification_key)
+    abort(404)
+
+
+def _get_broadcast_or_404(user, broadcast_id):
+    broadcast = NotificationBroadcast.query.filter(
+        NotificationBroadcast.id == broadcast_id, _visible_broadcasts(user)
+    ).first()
+    if broadcast is None:
+        abort(404)
+    return broadcast
+
+
+def _set_receipt(broadcast, user_id, **values):
+    """Create or fill in the user's receipt; existing timestamps are kept."""
+    for attempt in range(2):
+        receipt = NotificationReceipt.query.filter_by(
+            broadcast_id=broadcast.id, user_id=user_id
+        ).first()
+        if receipt is None:
+            receipt = NotificationReceipt(broadcast_id=broadcast.id, user_id=user_id)
+            db.session.add(receipt)
+        was_read, was_dismissed = receipt.read_at is not None, receipt.dismissed_at is not None
+        for name, value in values.items():
+            if getattr(receipt, name) is None:
+                setattr(receipt, name, value)
+        if not was_dismissed:
+            adjust_counter(
+                user_id,
+                broadcast.notification_type,
+                total=-1 if receipt.dismissed_at is not None else 0,
+                unread=-1 if not was_read and receipt.read_at is not None else 0,
+            )
+        queue_unread_push(user_id)
+        try:
+            db.session.commit()
+            return receipt
+        except IntegrityError:
+            # Another request created the receipt first; update that one
+            db.session.rollback()
+            if attempt:
+                raise
+
 
 @notifications.route("/notifications")
 @login_required
@@ -15,63 +401,50 @@ def list_notifications():
     filter_type = request.args.get("type", "all")
     show_read = request.args.get("show_read", "false").lower() == "true"
 
-    # Build query
-    query = Notification.query.filter_by(user_id=current_user.id)
-
-    # Apply filters
-    if filter_type != "all":
-        query = query.filter_by(notification_type=filter_type)
+    # Badge counts (may build the counters, so before loading the page)
+    counts = notification_counts(current_user)
 
-    if not show_read:
-        query = query.filter_by(is_read=False)
-
-    # Order by most recent first
-    notifications_data = query.order_by(Notification.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
+    notification_type = None if filter_type == "all" else filter_type
+    feed = _feed(current_user, notification_type=notification_type, unread_only=not show_read)
+    # Most recent first; the page's notifications are loaded by key and the
+    # page count comes from the counters instead of another COUNT(*)
+    notifications_data = db.paginate(
+        _feed_keys(feed), page=page, per_page=20, error_out=False, count=False
     )
-
-    # Get counts for badges
-    unread_count = Notification.query.filter_by(
-        user_id=current_user.id, is_read=False
-    ).count()
-    total_count = Notification.query.filter_by(user_id=current_user.id).count()
-
-    # Type counts
-    type_counts = {
-        "info": Notification.query.filter_by(
-            user_id=current_user.id, notification_type="info", is_read=False
-        ).count(),
-        "success": Notification.query.filter_by(
-            user_id=current_user.id, notification_type="success", is_read=False
-        ).count(),
-        "warning": Notification.query.filter_by(
-            user_id=current_user.id, notification_type="warning", is_read=False
-        ).count(),
-        "error": Notification.query.filter_by(
-            user_id=current_user.id, notification_type="error", is_read=False
-        ).count(),
-    }
+    if notification_type:
+        totals = counts["type_totals"] if show_read else counts["types"]
+        notifications_data.total = totals.get(notification_type, 0)
+    else:
+        notifications_data.total = counts["total"] if show_read else counts["unread"]
+    notifications_data.items = _load_feed_items(current_user, notifications_data.items)
 
     return render_template(
         "notifications/list.html",
         notifications=notifications_data,
-        unread_count=unread_count,
-        total_count=total_count,
-        type_counts=type_counts,
+        unread_count=counts["unread"],
+        total_count=counts["total"],
+        type_counts=counts["types"],
         current_filter=filter_type,
         show_read=show_read,
     )
 
 
-@notifications.route("/notifications/<int:notification_id>/read", methods=["POST"])
+@notifications.route("/notifications/<notification_key>/read", methods=["POST"])
 @login_required
-def mark_read(notification_id):
+def mark_read(notification_key):
     """Mark a notification as read"""
-    notification = Notification.query.filter_by(
-        id=notification_id, user_id=current_user.id
-    ).first_or_404()
-
-    notification.mark_as_read()
+    is_broadcast, notification_id = _parse_key(notification_key)
+    if is_broadcast:
+        broadcast = _get_broadcast_or_404(current_user, notification_id)
+        _set_receipt(broadcast, current_user.id, read_at=datetime.utcnow())
+    else:
+        notification = Notification.query.filter_by(
+            id=notification_id, user_id=current_user.id
+        ).first_or_404()
+        if not notification.is_read:
+            adjust_counter(current_user.id, notification.notification_type, unread=-1)
+            queue_unread_push(current_user.id)
+        notification.mark_as_read()
 
     return jsonify({"success": True, "message": "Notification marked as read"})
 
@@ -80,31 +453,74 @@ def mark_read(notification_id):
 @login_required
 def mark_all_read():
     """Mark all notifications as read for the current user"""
-    notifications_to_update = Notification.query.filter_by(
-        user_id=current_user.id, is_read=False
-    ).all()
-
-    for notification in notifications_to_update:
-        notification.mark_as_read()
+    for attempt in range(2):
+        now = datetime.utcnow()
+        personal = db.session.execute(
+            update(Notification)
+            .where(Notification.user_id == current_user.id, Notification.is_read.isnot(True))
+            .values(is_read=True, read_at=now)
+        ).rowcount
+        unread_broadcasts = select(
+            NotificationBroadcast.id,
+            literal(current_user.id, db.Integer),
+            literal(now, db.DateTime),
+        ).where(
+            _visible_broadcasts(current_user),
+            ~exists().where(
+                NotificationReceipt.broadcast_id == NotificationBroadcast.id,
+                NotificationReceipt.user_id == current_user.id,
+            ),
+        )
+        db.session.execute(
+            update(NotificationCounter)
+            .where(NotificationCounter.user_id == current_user.id)
+            .values(unread=0)
+        )
+        queue_unread_push(current_user.id)
+        try:
+            broadcasts = db.session.execute(
+                insert(NotificationReceipt).from_select(
+                    ["broadcast_id", "user_id", "read_at"], unread_broadcasts
+                )
+            ).rowcount
+            db.session.commit()
+            break
+        except IntegrityError:
+            # A receipt was created concurrently; the retry skips it
+            db.session.rollback()
+            if attempt:
+                raise
 
     return jsonify(
         {
             "success": True,
-            "message": f"Marked {len(notifications_to_update)} notifications as read",
+            "message": f"Marked {personal + broadcasts} notifications as read",
         }
     )
 
 
-@notifications.route("/notifications/<int:notification_id>/delete", methods=["POST"])
+@notifications.route("/notifications/<notification_key>/delete", methods=["POST"])
 @login_required
-def delete_notification(notification_id):
-    """Delete a notification"""
-    notification = Notification.query.filter_by(
-        id=notification_id, user_id=current_user.id
-    ).first_or_404()
-
-    db.session.delete(notification)
-    db.session.commit()
+def delete_notification(notification_key):
+    """Delete a notification (broadcasts are only hidden for this user)"""
+    is_broadcast, notification_id = _parse_key(notification_key)
+    if is_broadcast:
+        broadcast = _get_broadcast_or_404(current_user, notification_id)
+        now = datetime.utcnow()
+        _set_receipt(broadcast, current_user.id, read_at=now, dismissed_at=now)
+    else:
+        notification = Notification.query.filter_by(
+            id=notification_id, user_id=current_user.id
+        ).first_or_404()
+        db.session.delete(notification)
+        adjust_counter(
+            current_user.id,
+            notification.notification_type,
+            total=-1,
+            unread=0 if notification.is_read else -1,
+        )
+        queue_unread_push(current_user.id)
+        db.session.commit()
 
     return jsonify({"success": True, "message": "Notification deleted"})
 
@@ -113,21 +529,17 @@ def delete_notification(notification_id):
 @login_required
 def get_unread_count():
     """API endpoint to get unread notification count"""
-    count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-
-    return jsonify({"count": count})
+    return jsonify({"count": notification_counts(current_user)["unread"]})
 
 
 @notifications.route("/notifications/api/recent")
 @login_required
 def get_recent_notifications():
     """API endpoint to get recent notifications for dropdown"""
-    recent = (
-        Notification.query.filter_by(user_id=current_user.id, is_read=False)
-        .order_by(Notification.created_at.desc())
-        .limit(5)
-        .all()
-    )
+    keys = db.session.execute(
+        _feed_keys(_feed(current_user, unread_only=True)).limit(5)
+    ).scalars().all()
+    recent = _load_feed_items(current_user, keys)
 
     notifications_data = []
     for notification in recent:
@@ -158,10 +570,18 @@ def create_notification(
     related_id=None,
     action_url=None,
     action_text=None,
+    commit=True,
 ):
-    """Helper function to create a new notification"""
-    notification = Notification(
-        user_id=user_id,
+    """Helper function to create a new notification
+
+    ``user_id=None`` creates one ``NotificationBroadcast`` shown to every
+    user instead of a row per user. Pass ``commit=False`` to leave the
+    commit to the caller (outbox handlers).
+    """
+    model = NotificationBroadcast if user_id is None else Notification
+    fields = {} if user_id is None else {"user_id": user_id}
+    notification = model(
+        **fields,
         title=title,
         message=message,
         notification_type=notification_type,
@@ -172,11 +592,38 @@ def create_notification(
     )
 
     db.session.add(notification)
-    db.session.commit()
+    if user_id is None:
+        _count_new_broadcast(notification_type)
+    else:
+        adjust_counter(user_id, notification_type, total=1, unread=1)
+    queue_unread_push(user_id)
+    if commit:
+        db.session.commit()
     return notification
 
 
-def create_laundry_notification(user_id, laundry, message_type="status_update"):
+def create_broadcasts(entries, commit=True):
+    """Broadcast several notifications at once (``NotificationBroadcast`` kwargs).
+
+    Counters are raised once per type rather than once per broadcast.
+    """
+    broadcasts = [NotificationBroadcast(**fields) for fields in entries]
+    if not broadcasts:
+        return []
+    db.session.add_all(broadcasts)
+    db.session.flush()
+    per_type = {}
+    for broadcast in broadcasts:
+        per_type[broadcast.notification_type] = per_type.get(broadcast.notification_type, 0) + 1
+        queue_unread_push(None)
+    for notification_type, count in per_type.items():
+        _count_new_broadcast(notification_type, count)
+    if commit:
+        db.session.commit()
+    return broadcasts
+
+
+def create_laundry_notification(user_id, laundry, message_type="status_update", commit=True):
     """Create laundry-related notifications"""
     messages = {
         "new_order": {
@@ -231,6 +678,7 @@ def create_laundry_notification(user_id, laundry, message_type="status_update"):
             related_id=str(laundry.laundry_id),
             action_url=action_url,
             action_text="View Order",
+            commit=commit,
         )
 
 
@@ -282,8 +730,8 @@ def create_system_notification(user_id, title, message, notification_type="info"
     )
 
 
-def create_inventory_notification(user_id, inventory_item, message_type="low_stock"):
-    """Create inventory-related notifications"""
+def inventory_notification_fields(inventory_item, message_type="low_stock"):
+    """Notification fields for an inventory message, or None if unknown"""
     messages = {
         "low_stock": {
             "title": "Inventory Low Warning",
@@ -302,71 +750,45 @@ def create_inventory_notification(user_id, inventory_item, message_type="low_sto
         },
     }
 
-    if message_type in messages:
-        msg_data = messages[message_type]
+    if message_type not in messages:
+        return None
+    msg_data = messages[message_type]
 
-        # Try to generate URL, fall back if not in request context
-        action_url = None
-        try:
-            action_url = url_for("inventory.list_items")
-        except RuntimeError:
-            # If we're not in a request context, create a basic URL
-            action_url = "/inventory/items"
+    # Try to generate URL, fall back if not in request context
+    action_url = None
+    try:
+        action_url = url_for("inventory.list_items")
+    except RuntimeError:
+        # If we're not in a request context, create a basic URL
+        action_url = "/inventory/items"
+
+    return {
+        "title": msg_data["title"],
+        "message": msg_data["message"],
+        "notification_type": msg_data["type"],
+        "related_model": "inventory",
+        "related_id": str(inventory_item.id),
+        "action_url": action_url,
+        "action_text": "Check Inventory",
+    }
 
-        return create_notification(
-            user_id=user_id,
-            title=msg_data["title"],
-            message=msg_data["message"],
-            notification_type=msg_data["type"],
-            related_model="inventory",
-            related_id=str(inventory_item.id),
-            action_url=action_url,
-            action_text="Check Inventory",
-        )
+
+def create_inventory_notification(user_id, inventory_item, message_type="low_stock"):
+    """Create inventory-related notifications"""
+    fields = inventory_notification_fields(inventory_item, message_type)
+    if fields:
+        return create_notification(user_id=user_id, **fields)
 
 
 def check_and_create_inventory_notifications():
-    """Check all inventory items and create notifications for low stock items"""
-    from app.models import InventoryItem, User
-
-    # Get all admin users (they should receive inventory notifications)
-    admin_users = User.query.all()  # You might want to filter for admin users only
+    """Broadcast a notification for each item that has newly run low.
 
-    # Get all low stock items
-    low_stock_items = InventoryItem.query.filter(
-        InventoryItem.current_stock <= InventoryItem.minimum_stock,  # type: ignore
-        InventoryItem.is_active,  # type: ignore
-    ).all()
+    See ``app.inventory_alerts``; stock movements run the same check for
+    their item through the event outbox.
+    """
+    from app.inventory_alerts import evaluate_low_stock
 
-    notifications_created = []
-
-    for item in low_stock_items:
-        for admin in admin_users:
-            # Check if we already have a recent notification for this item
-            from datetime import datetime, timedelta
-
-            recent_notification = Notification.query.filter(
-                Notification.user_id == admin.id,
-                Notification.related_model == "inventory",
-                Notification.related_id == str(item.id),
-                Notification.created_at >= datetime.utcnow() - timedelta(hours=24),
-            ).first()
-
-            # Only create notification if no recent one exists
-            if not recent_notification:
-                if item.current_stock <= 0:
-                    notification = create_inventory_notification(
-                        admin.id, item, "out_of_stock"
-                    )
-                else:
-                    notification = create_inventory_notification(
-                        admin.id, item, "low_stock"
-                    )
-
-                if notification:
-                    notifications_created.append(notification)
-
-    return notifications_created
+    return evaluate_low_stock()
 
 
 @notifications.route("/api/check-inventory", methods=["POST"])
@@ -0,0 +1,91 @@
+"""Canonical phone number normalization (E.164).
+
+Customer phones are stored as staff typed them ("0917 123 4567",
+"+63-917-1234567", "9171234567", ...). :func:`normalize_phone` is the one
+set of rules for turning them into E.164 (``+639171234567``); its result is
+stored in the indexed ``Customer.phone_e164`` column whenever ``phone`` is
+set, and is what SMS sending, shared-number warnings and phone search use.
+
+Rules, in order:
+
+- numbers with an extension (``x``, ``ext``) are rejected
+- ``+<digits>`` (or ``00<digits>``) is kept as an international number
+  of 8-15 digits
+- ``63`` + national number -> ``+63...``
+- ``0`` + national number (local format) -> ``+63...``
+- ``9`` + 9 digits (mobile without the leading 0) -> ``+639...``
+
+A Philippine national number is a 10-digit mobile number starting with 9
+or a 9-digit landline (area code + number); ``+63`` numbers of any other
+length are rejected.
+
+Anything else is ambiguous and normalizes to ``None``.
+"""
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+COUNTRY_CODE = "63"
+
+_EXTENSION_RE = re.compile(r"x|ext", re.IGNORECASE)
+_PH_MOBILE_RE = re.compile(r"\+639\d{9}")
+
+
+def normalize_phone(raw: Optional[str]) -> Optional[str]:
+    """Return ``raw`` in E.164 form, or None when it cannot be read reliably."""
+    if not raw:
+        return None
+    text = str(raw).strip()
+    if not text or _EXTENSION_RE.search(text):
+        return None
+    digits = re.sub(r"\D", "", text)
+    if not digits:
+        return None
+
+    if text.startswith("+") or text.startswith("00"):
+        if text.startswith("00"):
+            digits = digits[2:]
+        if digits.startswith(COUNTRY_CODE):
+            return _ph(_national(digits))
+        return "+" + digits if 8 <= len(digits) <= 15 else None
+    if digits.startswith(COUNTRY_CODE):
+        return _ph(_national(digits))
+    if digits.startswith("0"):
+        return _ph(digits[1:])
+    return _ph(digits)
+
+
+def _national(digits: str) -> str:
+    # "+63 0917..." repeats the local trunk 0 after the country code
+    national = digits[len(COUNTRY_CODE):]
+    return national[1:] if national.startswith("0") else national
+
+
+def _ph(national: str) -> Optional[str]:
+    """``+63<national>`` for a mobile (9 + 9 digits) or landline (9 digits) number."""
+    if national.startswith("9") and len(national) == 10:
+        return f"+{COUNTRY_CODE}{national}"
+    if len(national) == 9 and national[0] not in "09":
+        return f"+{COUNTRY_CODE}{national}"
+    return None
+
+
+def is_ph_mobile(e164: Optional[str]) -> bool:
+    return bool(e164 and _PH_MOBILE_RE.fullmatch(e164))
+
+
+def phone_issues(raw: Optional[str]) -> list:
+    """Reasons a stored phone needs manual review (empty when it is fine)."""
+    if not raw or not str(raw).strip():
+        return ["missing"]
+    if _EXTENSION_RE.search(str(raw)):
+        return ["has_extension"]
+    e164 = normalize_phone(raw)
+    if e164 is None:
+        return ["unrecognized_format"]
+    if not e164.startswith("+" + COUNTRY_CODE):
+        return ["non_ph_country_code"]
+    if not is_ph_mobile(e164):
+        return ["not_mobile"]
+    return []
@@ -6,6 +6,7 @@ from werkzeug.security import check_password_hash, generate_password_hash
 
 from . import db
 from .models import User
+from .user_cache import forget_user
 
 profile = Blueprint("profile", __name__)
 
@@ -68,6 +69,7 @@ def settings():
                     current_user.email = email
                     current_user.phone = phone
                     db.session.commit()
+                    forget_user(current_user.id)
                     flash("Profile updated successfully!", "success")
                 except Exception:
                     db.session.rollback()
@@ -108,6 +110,7 @@ def settings():
                         new_password, method="sha256"
                     )
                     db.session.commit()
+                    forget_user(current_user.id)
                     flash("Password changed successfully!", "success")
                 except Exception:
                     db.session.rollback()
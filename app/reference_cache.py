@@ -0,0 +1,188 @@
+"""Read-through cache for small, rarely changing reference tables.
+
+Hot paths kept re-reading the same handful of rows: ``Service`` on every
+price calculation, the active ``LoyaltyProgram`` on every completion,
+``SMSSettings`` on every SMS, and category lists on every form. Those reads
+now go through :func:`cached_get`, :func:`cached_first` and
+:func:`cached_all`, which cache the rows' column values per process, keyed by
+primary key or by the filter/order used.
+
+Each call returns fresh detached instances built from the cached values,
+so callers cannot change what other requests see, and changes made to them
+are never flushed. Pass ``attach=True`` to get an instance merged into the
+current session without a SELECT (needed before assigning it to a
+relationship). Lazy relationships are not available on detached instances.
+
+ORM insert/update/delete events on the cached models mark the session,
+and its ``after_commit`` drops that model's entries. ``REFERENCE_CACHE_TTL``
+(seconds, default 300) bounds staleness from other workers and bulk
+statements. :func:`cache_stats` reports hits and misses per model.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import db
+from .models import (
+    ExpenseCategory,
+    InventoryCategory,
+    LoyaltyProgram,
+    Service,
+    SMSSettings,
+)
+
+logger = logging.getLogger("app.reference_cache")
+
+DEFAULT_TTL_SECONDS = 300
+CACHED_MODELS = (Service, LoyaltyProgram, SMSSettings, ExpenseCategory, InventoryCategory)
+
+_SESSION_FLAG = "reference_cache_dirty"
+
+_lock = threading.Lock()
+_entries: dict = {}
+_hits: Counter = Counter()
+_misses: Counter = Counter()
+
+
+def _ttl() -> float:
+    try:
+        return float(os.environ.get("REFERENCE_CACHE_TTL", DEFAULT_TTL_SECONDS))
+    except ValueError:
+        return DEFAULT_TTL_SECONDS
+
+
+def _values(model, row) -> dict:
+    return {attr.key: getattr(row, attr.key) for attr in model.__mapper__.column_attrs}
+
+
+def _detached(model, values: dict):
+    """Build a detached instance of ``model`` holding ``values`` as loaded state."""
+    obj = model.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(obj, key, value)
+    make_transient_to_detached(obj)
+    return obj
+
+
+def _read_through(model, key: tuple, loader):
+    """Return cached column-value dicts for ``key``, loading them on a miss."""
+    slot = (model.__name__, key, str(db.engine.url))
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(slot)
+        if entry is not None and now - entry[1] < _ttl():
+            _hits[model.__name__] += 1
+            return entry[0]
+        _misses[model.__name__] += 1
+    rows = [_values(model, row) for row in loader()]
+    with _lock:
+        _entries[slot] = (rows, now)
+    return rows
+
+
+def _materialize(model, rows: list, attach: bool) -> list:
+    objects = [_detached(model, values) for values in rows]
+    if attach:
+        objects = [db.session.merge(obj, load=False) for obj in objects]
+    return objects
+
+
+def cached_get(model, pk, attach: bool = False):
+    """``db.session.get(model, pk)`` through the cache."""
+    if pk is None:
+        return None
+    rows = _read_through(model, ("pk", pk), lambda: [r for r in [db.session.get(model, pk)] if r])
+    objects = _materialize(model, rows, attach)
+    return objects[0] if objects else None
+
+
+def cached_first(model, attach: bool = False, **filters):
+    """``model.query.filter_by(**filters).first()`` through the cache."""
+    key = ("first",) + tuple(sorted(filters.items()))
+    rows = _read_through(
+        model, key, lambda: [r for r in [model.query.filter_by(**filters).first()] if r]
+    )
+    objects = _materialize(model, rows, attach)
+    return objects[0] if objects else None
+
+
+def cached_all(model, order_by: Optional[str] = None, **filters) -> list:
+    """``model.query.filter_by(**filters).order_by(order_by).all()`` through the cache."""
+    key = ("all", order_by) + tuple(sorted(filters.items()))
+
+    def load():
+        query = model.query.filter_by(**filters)
+        if order_by:
+            query = query.order_by(getattr(model, order_by))
+        return query.all()
+
+    return _materialize(model, _read_through(model, key, load), attach=False)
+
+
+def get_sms_settings():
+    """Read-only SMSSettings for send paths (creates the default row once)."""
+    settings = cached_first(SMSSettings)
+    if settings is None:
+        SMSSettings.get_settings()
+        settings = cached_first(SMSSettings)
+    return settings
+
+
+def invalidate(*models) -> None:
+    """Drop cached entries for ``models`` (everything when called without models)."""
+    names = {m.__name__ for m in models}
+    with _lock:
+        for slot in [s for s in _entries if not names or s[0] in names]:
+            del _entries[slot]
+
+
+def cache_stats() -> dict:
+    """Return ``{model name: {"hits": n, "misses": n}}``."""
+    with _lock:
+        return {
+            model.__name__: {"hits": _hits[model.__name__], "misses": _misses[model.__name__]}
+            for model in CACHED_MODELS
+        }
+
+
+def _mark_dirty(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_FLAG, set()).add(type(target))
+    else:
+        invalidate(type(target))
+
+
+def _mark_dirty_if_columns_changed(mapper, connection, target):
+    # Assigning a new Laundry to a cached Service flushes the Service for its
+    # collection alone; only column changes make cached values stale
+    session = object_session(target)
+    if session is None or session.is_modified(target, include_collections=False):
+        _mark_dirty(mapper, connection, target)
+
+
+for _model in CACHED_MODELS:
+    event.listen(_model, "after_insert", _mark_dirty)
+    event.listen(_model, "after_update", _mark_dirty_if_columns_changed)
+    event.listen(_model, "after_delete", _mark_dirty)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    models = session.info.pop(_SESSION_FLAG, None)
+    if models:
+        invalidate(*models)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_FLAG, None)
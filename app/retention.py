@@ -0,0 +1,303 @@
+"""Retention: delete (or archive, then delete) rows past their policy age.
+
+Notifications, audit logs, status history, export audits, email delivery
+records and processed outbox events were never deleted. Each
+:class:`RetentionPolicy` names a table, the timestamp column to age rows
+by, extra criteria and a default age in days, which the environment can
+override (``RETENTION_<NAME>_DAYS``; ``0`` disables a policy):
+
+- ``read_notifications``: read personal notifications, 30 days
+- ``broadcast_notifications``: broadcasts, their receipts and inventory
+  alerts, 90 days
+- ``email_deliveries``: email delivery records, 90 days
+- ``outbox_events``: processed outbox events and their receipts, 30 days
+- ``laundry_audit_logs``, ``laundry_status_history``, ``export_audits``:
+  2 years, archived first
+
+Rows go in id order, ``RETENTION_CHUNK_SIZE`` (500) per transaction, with a
+short pause (``RETENTION_CHUNK_PAUSE``, seconds) between chunks, so no
+statement holds locks for long. Archived rows are appended as JSON lines
+to ``<RETENTION_ARCHIVE_DIR>/<policy>-<YYYYMMDD>.jsonl.gz`` (default
+``instance/archive``) before the chunk is deleted; a chunk whose delete
+fails is archived again on the next run.
+
+:func:`run_retention` returns per-policy counts (rows deleted, archived and
+an estimate of the bytes reclaimed). It runs from ``flask apply-retention``
+and from an in-process scheduler started with the app unless
+``ENABLE_RETENTION_WORKER=0`` (never under pytest); every
+``RETENTION_INTERVAL_HOURS`` (24) one worker takes a lease in the shared
+cache and runs all policies.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select
+
+from . import db
+from .models import (
+    EmailDelivery,
+    ExportAudit,
+    InventoryAlert,
+    LaundryAuditLog,
+    LaundryStatusHistory,
+    Notification,
+    NotificationBroadcast,
+    NotificationReceipt,
+    OutboxEvent,
+    OutboxEventReceipt,
+)
+from .shared_cache import get_cache
+from .sms_outbox import _env_number
+
+logger = logging.getLogger("app.retention")
+
+DEFAULT_CHUNK_SIZE = 500
+LEASE_KEY = "retention:lease"
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    name: str
+    model: type
+    timestamp: str
+    days: int
+    criteria: Callable = lambda: ()
+    archive: bool = False
+    # (model, foreign key column) rows deleted with each chunk, first
+    children: tuple = ()
+    # Called with the chunk's rows in the deleting transaction
+    after_delete: Optional[Callable] = None
+
+    @property
+    def max_age_days(self) -> int:
+        return _env_number(f"RETENTION_{self.name.upper()}_DAYS", self.days)
+
+
+def _reset_counters_for(rows) -> None:
+    from .notifications import reset_counters
+
+    reset_counters({row["user_id"] for row in rows})
+
+
+def _reset_all_counters(rows) -> None:
+    from .notifications import reset_counters
+
+    reset_counters()
+
+
+POLICIES = (
+    RetentionPolicy(
+        "read_notifications", Notification, "created_at", 30,
+        criteria=lambda: (Notification.is_read.is_(True),),
+        after_delete=_reset_counters_for,
+    ),
+    RetentionPolicy(
+        "broadcast_notifications", NotificationBroadcast, "created_at", 90,
+        children=((NotificationReceipt, "broadcast_id"), (InventoryAlert, "broadcast_id")),
+        after_delete=_reset_all_counters,
+    ),
+    RetentionPolicy("email_deliveries", EmailDelivery, "created_at", 90),
+    RetentionPolicy(
+        "outbox_events", OutboxEvent, "created_at", 30,
+        criteria=lambda: (OutboxEvent.status.in_((OutboxEvent.DONE, OutboxEvent.DEAD)),),
+        children=((OutboxEventReceipt, "event_id"),),
+    ),
+    RetentionPolicy("laundry_audit_logs", LaundryAuditLog, "changed_at", 730, archive=True),
+    RetentionPolicy("laundry_status_history", LaundryStatusHistory, "changed_at", 730, archive=True),
+    RetentionPolicy("export_audits", ExportAudit, "created_at", 730, archive=True),
+)
+
+
+def get_policy(name: str) -> RetentionPolicy:
+    for policy in POLICIES:
+        if policy.name == name:
+            return policy
+    raise KeyError(name)
+
+
+def _expired(policy: RetentionPolicy, now: datetime):
+    table = policy.model.__table__
+    cutoff = now - timedelta(days=policy.max_age_days)
+    return table, (table.c[policy.timestamp] < cutoff, *policy.criteria())
+
+
+def archive_path(policy: RetentionPolicy, now: datetime) -> str:
+    directory = os.environ.get("RETENTION_ARCHIVE_DIR") or os.path.join(
+        current_app.instance_path, "archive"
+    )
+    return os.path.join(directory, f"{policy.name}-{now:%Y%m%d}.jsonl.gz")
+
+
+def _archive(path: str, lines: list) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Appending adds a gzip member; gzip readers see one stream
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in lines)
+
+
+def apply_policy(policy: RetentionPolicy, now: Optional[datetime] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, pause_seconds: float = 0.0,
+                 dry_run: bool = False) -> dict:
+    """Delete (archiving first if the policy says so) expired rows in chunks."""
+    now = now or datetime.utcnow()
+    counts = {"deleted": 0, "archived": 0, "bytes": 0, "chunks": 0}
+    if policy.max_age_days <= 0:
+        return counts
+    table, criteria = _expired(policy, now)
+    if dry_run:
+        counts["deleted"] = db.session.execute(
+            select(func.count()).select_from(table).where(*criteria)
+        ).scalar() or 0
+        return counts
+
+    while True:
+        rows = db.session.execute(
+            select(table).where(*criteria).order_by(table.c.id).limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            break
+        lines = [json.dumps(dict(row), default=str) for row in rows]
+        ids = [row["id"] for row in rows]
+        try:
+            if policy.archive:
+                _archive(archive_path(policy, now), lines)
+                counts["archived"] += len(rows)
+            for child, column in policy.children:
+                child_table = child.__table__
+                db.session.execute(delete(child_table).where(child_table.c[column].in_(ids)))
+            db.session.execute(delete(table).where(table.c.id.in_(ids)))
+            if policy.after_delete:
+                policy.after_delete(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        counts["deleted"] += len(rows)
+        counts["bytes"] += sum(len(line) for line in lines)
+        counts["chunks"] += 1
+        logger.info("Retention %s: chunk %d, through id %d", policy.name, counts["chunks"], ids[-1])
+        if len(rows) < chunk_size:
+            break
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    return counts
+
+
+def run_retention(names=None, now: Optional[datetime] = None, chunk_size: Optional[int] = None,
+                  pause_seconds: Optional[float] = None, dry_run: bool = False) -> dict:
+    """Apply the named policies (all by default); ``{name: counts}``.
+
+    A failing policy is logged and reported as ``{"error": ...}``; the
+    others still run.
+    """
+    if chunk_size is None:
+        chunk_size = _env_number("RETENTION_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+    if pause_seconds is None:
+        pause_seconds = _env_number("RETENTION_CHUNK_PAUSE", 0.1)
+    policies = POLICIES if not names else [get_policy(name) for name in names]
+    report = {}
+    for policy in policies:
+        try:
+            report[policy.name] = apply_policy(
+                policy, now=now, chunk_size=max(1, chunk_size),
+                pause_seconds=pause_seconds, dry_run=dry_run,
+            )
+        except Exception as e:
+            logger.exception("Retention policy %s failed", policy.name)
+            report[policy.name] = {"error": str(e)}
+    logger.info("Retention run%s: %s", " (dry run)" if dry_run else "", report)
+    return report
+
+
+class RetentionScheduler:
+    """Runs :func:`run_retention` periodically in a daemon thread.
+
+    With several workers, the first to take the shared-cache lease for an
+    interval does the run; the others skip it.
+    """
+
+    def __init__(self, app, interval_hours: float = 24.0, initial_delay: float = 300.0):
+        self.app = app
+        self.interval = max(60.0, interval_hours * 3600)
+        self.initial_delay = initial_delay
+        self.last_report: Optional[dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run_once(self) -> Optional[dict]:
+        """Run all policies if this worker gets the lease; None otherwise."""
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        # Expires a little before the next interval so a slow clock does not skip it
+        if not get_cache().add(LEASE_KEY, owner, ttl=self.interval * 0.9):
+            return None
+        with self.app.app_context():
+            self.last_report = run_retention()
+        return self.last_report
+
+    def _run(self) -> None:
+        delay = self.initial_delay
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Retention run failed")
+            delay = self.interval
+
+
+def start_retention_scheduler(app) -> RetentionScheduler:
+    """Start (once per app) the periodic retention run."""
+    scheduler = app.extensions.get("retention_scheduler")
+    if scheduler is None:
+        scheduler = RetentionScheduler(
+            app,
+            interval_hours=_env_number("RETENTION_INTERVAL_HOURS", 24.0),
+            initial_delay=_env_number("RETENTION_INITIAL_DELAY", 300.0),
+        )
+        scheduler.start()
+        app.extensions["retention_scheduler"] = scheduler
+    return scheduler
+
+
+@click.command("apply-retention")
+@click.option("--policy", "names", multiple=True,
+              type=click.Choice([p.name for p in POLICIES]),
+              help="Only apply this policy (repeatable).")
+@click.option("--dry-run", is_flag=True, help="Count expired rows without deleting them.")
+@click.option("--chunk-size", type=int, default=None, help="Rows per transaction.")
+@with_appcontext
+def apply_retention_command(names, dry_run, chunk_size):
+    """Delete or archive rows older than their retention policy."""
+    report = run_retention(names=names, chunk_size=chunk_size, dry_run=dry_run)
+    verb = "would delete" if dry_run else "deleted"
+    for name, counts in report.items():
+        if "error" in counts:
+            click.echo(f"{name}: failed ({counts['error']})")
+            continue
+        line = f"{name}: {verb} {counts['deleted']}"
+        if counts["archived"]:
+            line += f", archived {counts['archived']}"
+        if counts["bytes"]:
+            line += f", ~{counts['bytes'] / 1024:.1f} KiB reclaimed"
+        click.echo(line)
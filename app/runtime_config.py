@@ -0,0 +1,182 @@
+"""Versioned snapshots of the runtime configuration files.
+
+``SMSService._refresh_config`` used to run ``load_dotenv(override=True)`` on
+every ``is_configured()`` call, so each status SMS parsed ``.env`` from disk
+at least twice. Configuration now comes from an immutable
+:class:`ConfigSnapshot` built from, in increasing precedence, the process
+environment, ``.env`` and ``connect.json`` (written by the business settings
+page):
+
+- :func:`current` returns the published snapshot. At most once every
+  ``RUNTIME_CONFIG_CHECK_SECONDS`` (default 2) it stats both files and
+  re-parses them only when a file's mtime or size changed; otherwise no
+  disk I/O happens.
+- A reload whose values differ publishes a new snapshot with the next
+  ``version``, exports the file values into ``os.environ`` (as
+  ``load_dotenv(override=True)`` did) and pushes the SMS and mail settings
+  into every app registered with :func:`bind_app`.
+- Code that writes the files calls :func:`reload` afterwards so the change
+  applies immediately in this worker; other workers pick it up on their
+  next check.
+
+``RUNTIME_ENV_FILE`` and ``RUNTIME_CONNECT_FILE`` override the file
+locations (default: the nearest ``.env`` and ``connect.json`` in the
+working directory).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+from dotenv import dotenv_values, find_dotenv
+
+logger = logging.getLogger("app.runtime_config")
+
+DEFAULT_CHECK_SECONDS = 2.0
+
+# Keys copied into app.config of bound apps when they change
+APP_CONFIG_KEYS = (
+    "SEMAPHORE_API_KEY",
+    "SEMAPHORE_SENDER_NAME",
+    "MAIL_USERNAME",
+    "MAIL_PASSWORD",
+)
+APP_CONFIG_DEFAULTS = {"SEMAPHORE_SENDER_NAME": "ACCIO Laundry"}
+
+
+class ConfigSnapshot(NamedTuple):
+    """One published configuration; ``values`` is read-only."""
+
+    version: int
+    values: Mapping[str, str]
+    sources: tuple  # ((path, (mtime_ns, size) or None), ...)
+    loaded_at: float
+
+    def get(self, key: str, default=None):
+        value = self.values.get(key)
+        return default if value in (None, "") else value
+
+
+_lock = threading.Lock()
+_snapshot: Optional[ConfigSnapshot] = None
+_paths: Optional[tuple] = None
+_last_check = float("-inf")
+_apps: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _check_seconds() -> float:
+    try:
+        return float(os.environ.get("RUNTIME_CONFIG_CHECK_SECONDS", DEFAULT_CHECK_SECONDS))
+    except ValueError:
+        return DEFAULT_CHECK_SECONDS
+
+
+def _resolve_paths() -> tuple:
+    cwd = os.path.abspath(os.getcwd())
+    env_path = (
+        os.environ.get("RUNTIME_ENV_FILE")
+        or find_dotenv(usecwd=True)
+        or os.path.join(cwd, ".env")
+    )
+    connect_path = os.environ.get("RUNTIME_CONNECT_FILE") or os.path.join(cwd, "connect.json")
+    return env_path, connect_path
+
+
+def _stamp(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _read_connect(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning("Ignoring unreadable %s: %s", path, e)
+        return {}
+    return {str(k): str(v) for k, v in data.items() if v not in (None, "")} if isinstance(data, dict) else {}
+
+
+def _load(paths: tuple, stamps: tuple) -> dict:
+    env_path, connect_path = paths
+    file_values = {}
+    if stamps[0] is not None:
+        file_values.update({k: v for k, v in dotenv_values(env_path).items() if v is not None})
+    if stamps[1] is not None:
+        file_values.update(_read_connect(connect_path))
+    # Same effect as load_dotenv(override=True) for code reading os.environ
+    for key, value in file_values.items():
+        os.environ[key] = value
+    return dict(os.environ)
+
+
+def reload(force: bool = False) -> ConfigSnapshot:
+    """Re-read the files if they changed (always when ``force``); returns the snapshot."""
+    global _snapshot, _paths, _last_check
+    with _lock:
+        if force or _paths is None:
+            _paths = _resolve_paths()
+        _last_check = time.monotonic()
+        stamps = tuple(_stamp(p) for p in _paths)
+        sources = tuple(zip(_paths, stamps))
+        if not force and _snapshot is not None and _snapshot.sources == sources:
+            return _snapshot
+        values = _load(_paths, stamps)
+        previous = _snapshot
+        if previous is not None and dict(previous.values) == values:
+            _snapshot = previous._replace(sources=sources)
+            return _snapshot
+        _snapshot = ConfigSnapshot(
+            version=(previous.version + 1) if previous else 1,
+            values=MappingProxyType(values),
+            sources=sources,
+            loaded_at=time.time(),
+        )
+        snapshot = _snapshot
+        apps = list(_apps)
+    logger.info("Runtime configuration version %d loaded", snapshot.version)
+    for app in apps:
+        _apply_to_app(app, snapshot)
+    return snapshot
+
+
+def current() -> ConfigSnapshot:
+    """Return the published snapshot, reloading first if a file changed."""
+    snapshot = _snapshot
+    if snapshot is None or time.monotonic() - _last_check >= _check_seconds():
+        return reload()
+    return snapshot
+
+
+def _apply_to_app(app, snapshot: ConfigSnapshot) -> None:
+    changed = False
+    for key in APP_CONFIG_KEYS:
+        value = snapshot.get(key, APP_CONFIG_DEFAULTS.get(key, ""))
+        if app.config.get(key) != value:
+            app.config[key] = value
+            changed = changed or key.startswith("MAIL_")
+    app.config["RUNTIME_CONFIG_VERSION"] = snapshot.version
+    mail_ext = app.extensions.get("mail")
+    if changed and mail_ext is not None:
+        # Flask-Mail copies its settings at init_app time
+        from . import mail
+
+        mail.init_app(app)
+
+
+def bind_app(app) -> None:
+    """Keep ``app.config``'s SMS and mail settings in step with new snapshots."""
+    with _lock:
+        _apps.add(app)
+    _apply_to_app(app, current())
@@ -0,0 +1,173 @@
+"""Additive schema upgrades applied at startup.
+
+``db.create_all()`` creates missing tables but never alters existing ones, so
+columns and indexes added to existing models are listed here and created
+when absent. Column types (and foreign keys) are compiled from the model for
+the active dialect. Each column entry names a one-time backfill that runs
+after the column is added. Rollup tables listed in ``_rollup_upgrades`` are
+rebuilt when they are empty but their source tables are not (new table on
+a populated database).
+"""
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger("app.schema_upgrades")
+
+
+def _column_upgrades():
+    from .models import (
+        BulkMessageBatch,
+        BulkMessageHistory,
+        Customer,
+        Laundry,
+        LaundryAuditLog,
+        LaundryStatusHistory,
+        SMSSettings,
+    )
+
+    # (model, column name, backfill key or None); backfills run in list order
+    return [
+        (BulkMessageHistory, "status", None),
+        (BulkMessageHistory, "send_mode", None),
+        (BulkMessageHistory, "completed_at", None),
+        (BulkMessageBatch, "claimed_at", None),
+        (LaundryStatusHistory, "laundry_pk", "laundry_links"),
+        (LaundryAuditLog, "laundry_pk", "laundry_links"),
+        (Laundry, "business_date", "business_dates"),
+        (LaundryStatusHistory, "business_date", "business_dates"),
+        (Laundry, "ready_at", "status_timestamps"),
+        (Laundry, "completed_at", "status_timestamps"),
+        (SMSSettings, "received_batch_message", None),
+        (Customer, "phone_e164", "phone_e164"),
+    ]
+
+
+def _index_upgrades():
+    from .models import Laundry, LoyaltyTransaction, Notification, StockMovement
+
+    # Indexes added after their columns: (model, column names). Mirrors the
+    # reviewed Alembic revision for deployments not managed by Alembic.
+    return [
+        (LoyaltyTransaction, ("laundry_id",)),
+        (Laundry, ("status",)),
+        (Laundry, ("date_received",)),
+        (Laundry, ("customer_id",)),
+        (Notification, ("user_id", "is_read")),
+        (StockMovement, ("created_at",)),
+    ]
+
+
+def _rollup_upgrades():
+    from .models import Customer, DailyStats, Laundry
+
+    # (rollup model, source models, backfill key)
+    return [
+        (DailyStats, (Laundry, Customer), "daily_stats"),
+    ]
+
+
+def _run_backfill(key: str) -> None:
+    if key == "laundry_links":
+        from .backfills import backfill_laundry_links
+
+        backfill_laundry_links()
+    elif key == "business_dates":
+        from .business_day import backfill_business_dates
+
+        logger.info("Backfilled business_date: %s", backfill_business_dates(only_missing=True))
+    elif key == "status_timestamps":
+        from .backfills import backfill_status_timestamps
+
+        backfill_status_timestamps(only_missing=True)
+    elif key == "phone_e164":
+        from .backfills import backfill_phone_e164
+
+        backfill_phone_e164()
+    elif key == "daily_stats":
+        from .daily_stats import rebuild_daily_stats
+
+        logger.info("Rebuilt daily_stats: %d row(s)", rebuild_daily_stats())
+
+
+def _column_ddl(column, dialect) -> str:
+    ddl = f"{column.name} {column.type.compile(dialect=dialect)}"
+    for fk in column.foreign_keys:
+        target = fk.column
+        ddl += f" REFERENCES {target.table.name} ({target.name})"
+    return ddl
+
+
+def _create_index(db, table: str, *column_names: str) -> str:
+    name = f"ix_{table}_{'_'.join(column_names)}"
+    db.session.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(column_names)})"))
+    return name
+
+
+def upgrade_schema(db) -> set:
+    """Add any missing columns/indexes for existing tables; return what was added."""
+    inspector = db.inspect(db.engine)
+    dialect = db.engine.dialect
+    tables = set(inspector.get_table_names())
+    added = set()
+    backfills = []
+    for model, column_name, backfill in _column_upgrades():
+        table = model.__tablename__
+        if table not in tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        if column_name in existing:
+            continue
+        column = model.__table__.c[column_name]
+        try:
+            db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {_column_ddl(column, dialect)}"))
+            if column.index:
+                _create_index(db, table, column_name)
+            db.session.commit()
+            added.add((table, column_name))
+            if backfill and backfill not in backfills:
+                backfills.append(backfill)
+            print(f"Added missing column '{column_name}' to {table} table.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: could not add column {table}.{column_name}: {e}")
+
+    for model, column_names in _index_upgrades():
+        table = model.__tablename__
+        if table not in tables:
+            continue
+        indexed = {
+            tuple(ix["column_names"]) for ix in inspector.get_indexes(table)
+        }
+        if column_names in indexed:
+            continue
+        label = f"{table}({', '.join(column_names)})"
+        try:
+            name = _create_index(db, table, *column_names)
+            db.session.commit()
+            added.add((table, name))
+            print(f"Added missing index on {label}.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: could not index {label}: {e}")
+
+    for model, sources, backfill in _rollup_upgrades():
+        try:
+            if db.session.query(model.id).first() is None and any(
+                db.session.query(source.id).first() is not None for source in sources
+            ):
+                if backfill not in backfills:
+                    backfills.append(backfill)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: could not inspect {model.__tablename__}: {e}")
+
+    for key in backfills:
+        try:
+            _run_backfill(key)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: backfill '{key}' after schema upgrade failed: {e}")
+    return added
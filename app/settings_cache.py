@@ -0,0 +1,131 @@
+"""Process-level cache for values injected into every template render.
+
+``inject_business_settings`` and ``inject_first_run_flag`` used to run
+``BusinessSettings.get_settings()`` and ``User.query.count()`` on every
+render, partials and error pages included. Both values now come from this
+cache:
+
+- ORM ``after_insert``/``after_update``/``after_delete`` events on
+  BusinessSettings and User mark the owning session, and the session's
+  ``after_commit`` drops the affected entry, so a committed change is seen
+  by the next render in this process.
+- Other workers and bulk ``UPDATE``/``DELETE`` statements bypass those
+  events; ``SETTINGS_CACHE_TTL`` seconds (default 30) bounds how long they
+  can serve a stale value.
+
+Settings are cached as a read-only snapshot of the row's column values, not
+an ORM instance, so they never touch a request's session.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, object_session
+
+from . import db
+from .business_day import reset_business_timezone
+from .models import BusinessSettings, User
+
+logger = logging.getLogger("app.settings_cache")
+
+DEFAULT_TTL_SECONDS = 30
+
+_SESSION_FLAG = "settings_cache_dirty"
+
+_lock = threading.Lock()
+_entries: dict = {}
+
+
+class SettingsSnapshot(SimpleNamespace):
+    """Attribute access to a BusinessSettings row; assignments are refused."""
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SettingsSnapshot is read-only")
+
+
+def _ttl() -> float:
+    try:
+        return float(os.environ.get("SETTINGS_CACHE_TTL", DEFAULT_TTL_SECONDS))
+    except ValueError:
+        return DEFAULT_TTL_SECONDS
+
+
+def _cached(key: str, loader):
+    # Keyed per database so apps bound to different databases never mix
+    slot = (key, str(db.engine.url))
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(slot)
+        if entry is not None and now - entry[1] < _ttl():
+            return entry[0]
+    value = loader()
+    with _lock:
+        _entries[slot] = (value, now)
+    return value
+
+
+def invalidate(*keys: str) -> None:
+    """Drop the given entries (all of them when called without keys)."""
+    with _lock:
+        if keys:
+            for slot in [s for s in _entries if s[0] in keys]:
+                del _entries[slot]
+        else:
+            _entries.clear()
+
+
+def _load_business_settings() -> SettingsSnapshot:
+    settings = BusinessSettings.get_settings()
+    values = {c.key: getattr(settings, c.key) for c in BusinessSettings.__mapper__.column_attrs}
+    snapshot = SettingsSnapshot.__new__(SettingsSnapshot)
+    snapshot.__dict__.update(values)
+    return snapshot
+
+
+def get_business_settings() -> SettingsSnapshot:
+    """Return the cached BusinessSettings snapshot."""
+    return _cached("business_settings", _load_business_settings)
+
+
+def is_first_run() -> bool:
+    """Return True while no user accounts exist (cached)."""
+    return _cached(
+        "first_run",
+        lambda: (db.session.execute(select(func.count(User.id))).scalar() or 0) == 0,
+    )
+
+
+def _mark_dirty(key: str):
+    def listener(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(_SESSION_FLAG, set()).add(key)
+        else:
+            invalidate(key)
+
+    return listener
+
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(BusinessSettings, _event, _mark_dirty("business_settings"))
+for _event in ("after_insert", "after_delete"):
+    event.listen(User, _event, _mark_dirty("first_run"))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    keys = session.info.pop(_SESSION_FLAG, None)
+    if keys:
+        invalidate(*keys)
+        if "business_settings" in keys:
+            reset_business_timezone()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_FLAG, None)
@@ -0,0 +1,324 @@
+"""Small key/value cache shared by all workers, with pluggable backends.
+
+``SMSService`` kept the Semaphore account info in a per-process dict, so
+with several gunicorn workers each one polled ``/account`` on its own and
+kept running into 429s. Account info, the account rate-limit cooldown and
+the send cooldown now live in the backend selected by ``SHARED_CACHE_URL``:
+
+- ``memory://`` (default): in-process LRU, ``SHARED_CACHE_MAX_ENTRIES``
+  entries (1024); fine for a single worker
+- ``sqlite:///path/to/cache.db`` (or ``file:///...``): a SQLite file that
+  every worker on the host opens
+- ``redis://host:6379/0``: any server speaking the Redis protocol; the
+  client here only needs ``GET``, ``SET`` (``PX``/``NX``) and ``DEL``, so no
+  extra package is required
+
+Values must be JSON-serialisable. ``add`` is set-if-absent, used as a
+short lease so only one worker refreshes a value at a time. Backend
+errors are logged and treated as cache misses, never raised to callers.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Optional
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger("app.shared_cache")
+
+DEFAULT_URL = "memory://"
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class CacheBackend:
+    """Interface of the cache backends; ``ttl`` is in seconds."""
+
+    def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Store ``value`` only if ``key`` is absent; True if it was stored."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """Thread-safe LRU with per-entry expiry, local to this process."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max(1, max_entries)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _live(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= self._clock():
+            del self._entries[key]
+            return None
+        return entry
+
+    def _store(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        expires = self._clock() + ttl if ttl is not None else None
+        # Stored as JSON so callers never share mutable objects
+        self._entries[key] = (json.dumps(value), expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(entry[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteCache(CacheBackend):
+    """Cache table in a SQLite file shared by the workers on one host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS shared_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # A short-lived connection per call keeps this safe across threads
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def get(self, key: str) -> Any:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT value FROM shared_cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.time() + ttl if ttl is not None else None
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires),
+            )
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM shared_cache WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO shared_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires),
+            )
+            conn.execute("COMMIT")
+            return cursor.rowcount == 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def delete(self, key: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM shared_cache WHERE key = ?", (key,))
+
+
+class RedisCache(CacheBackend):
+    """Minimal Redis-protocol (RESP) client: one connection per thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, timeout: float = 2.0):
+        self.host, self.port, self.db = host, port, db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+            if self.password:
+                self._roundtrip("AUTH", self.password)
+            if self.db:
+                self._roundtrip("SELECT", str(self.db))
+        return conn
+
+    def _close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RuntimeError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            return [self._read_reply(reader) for _ in range(max(0, int(payload)))]
+        raise RuntimeError(f"Unexpected Redis reply {line!r}")
+
+    def _roundtrip(self, *args: str):
+        sock, reader = self._local.conn
+        encoded = [a.encode() for a in args]
+        request = b"*%d\r\n" % len(encoded) + b"".join(
+            b"$%d\r\n%s\r\n" % (len(a), a) for a in encoded
+        )
+        sock.sendall(request)
+        return self._read_reply(reader)
+
+    def _command(self, *args: str):
+        for attempt in (1, 2):
+            try:
+                self._connection()
+                return self._roundtrip(*args)
+            except (OSError, ConnectionError):
+                # Reconnect once on a dropped connection
+                self._close()
+                if attempt == 2:
+                    raise
+
+    def get(self, key: str) -> Any:
+        raw = self._command("GET", key)
+        return json.loads(raw) if raw is not None else None
+
+    def _set_args(self, key: str, value: Any, ttl: Optional[float]) -> list:
+        args = ["SET", key, json.dumps(value)]
+        if ttl is not None:
+            args += ["PX", str(max(1, int(ttl * 1000)))]
+        return args
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._command(*self._set_args(key, value, ttl))
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return self._command(*self._set_args(key, value, ttl), "NX") == "OK"
+
+    def delete(self, key: str) -> None:
+        self._command("DEL", key)
+
+
+class SafeCache(CacheBackend):
+    """Wraps a backend so its failures read as misses instead of raising."""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    def _call(self, method: str, default, *args):
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            logger.warning("Shared cache %s failed (%s): %s", method, type(self.backend).__name__, e)
+            return default
+
+    def get(self, key: str) -> Any:
+        return self._call("get", None, key)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._call("set", None, key, value, ttl)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return self._call("add", False, key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self._call("delete", None, key)
+
+
+def create_backend(url: str) -> CacheBackend:
+    """Build a backend from a ``memory://``, ``sqlite:///``/``file:///`` or ``redis://`` URL."""
+    parsed = urlparse(url or DEFAULT_URL)
+    if parsed.scheme in ("", "memory"):
+        try:
+            max_entries = int(os.environ.get("SHARED_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        except ValueError:
+            max_entries = DEFAULT_MAX_ENTRIES
+        return MemoryCache(max_entries)
+    if parsed.scheme in ("sqlite", "file"):
+        return SQLiteCache(unquote(parsed.path))
+    if parsed.scheme == "redis":
+        db = parsed.path.strip("/")
+        return RedisCache(
+            host=parsed.hostname or "127.0.0.1",
+            port=parsed.port or 6379,
+            db=int(db) if db.isdigit() else 0,
+            password=unquote(parsed.password) if parsed.password else None,
+        )
+    raise ValueError(f"Unsupported SHARED_CACHE_URL scheme: {parsed.scheme!r}")
+
+
+_lock = threading.Lock()
+_caches: dict = {}
+
+
+def get_cache() -> CacheBackend:
+    """Return the (per-URL singleton) cache selected by ``SHARED_CACHE_URL``."""
+    url = os.environ.get("SHARED_CACHE_URL", DEFAULT_URL)
+    cache = _caches.get(url)
+    if cache is None:
+        with _lock:
+            cache = _caches.get(url)
+            if cache is None:
+                try:
+                    backend = create_backend(url)
+                except Exception as e:
+                    logger.error("Could not open %s shared cache (%s); using memory", urlparse(url).scheme, e)
+                    backend = MemoryCache()
+                cache = _caches[url] = SafeCache(backend)
+    return cache
@@ -0,0 +1,343 @@
+"""Durable outbound SMS queue and the background workers that drain it.
+
+Request handlers used to call the provider inline (``requests.post`` with a
+30s timeout), so one slow Semaphore response stalled the single eventlet
+worker. Handlers now call :func:`enqueue_sms`, which only inserts an
+``sms_outbox`` row, and return immediately. A pool of worker threads
+(:class:`SMSDispatcher`, green threads under eventlet) claims due rows and
+delivers them:
+
+- claiming is a conditional ``UPDATE ... WHERE status = 'pending'`` per row,
+  so several processes can drain the same table without double sends;
+  rows left in ``sending`` by a crashed worker are reclaimed after
+  ``SMS_SENDING_TIMEOUT`` seconds
+- at most ``SMS_PROVIDER_CONCURRENCY`` calls per provider run at once in a
+  process (``"semaphore=2"`` style, default 2)
+- 429, 5xx and network errors are retried with exponential backoff and
+  jitter (``SMS_RETRY_BASE_SECONDS``, ``SMS_RETRY_MAX_SECONDS``), honouring
+  ``Retry-After``; other failures, or running out of ``SMS_MAX_ATTEMPTS``,
+  move the row to the ``dead`` state for inspection and requeue
+
+Workers start with the app unless ``ENABLE_SMS_WORKER=0`` (and never under
+pytest). ``flask drain-sms-outbox`` delivers due rows in the foreground.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import SMSOutbox
+
+logger = logging.getLogger("app.sms_outbox")
+
+DEFAULT_PROVIDER = "semaphore"
+DEFAULT_MAX_ATTEMPTS = 6
+DEFAULT_PROVIDER_CONCURRENCY = 2
+
+_SESSION_FLAG = "sms_outbox_enqueued"
+
+# Set when new rows are committed so idle workers wake before their poll interval
+_wake = threading.Event()
+_slots_lock = threading.Lock()
+_provider_slots: dict = {}
+
+
+def _env_number(name: str, default):
+    try:
+        return type(default)(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _providers() -> dict:
+    from .sms_service import sms_service
+
+    return {DEFAULT_PROVIDER: sms_service}
+
+
+def _provider_concurrency(provider: str) -> int:
+    limits = {}
+    for part in os.environ.get("SMS_PROVIDER_CONCURRENCY", "").split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip().isdigit():
+            limits[name.strip()] = max(1, int(value))
+    return limits.get(provider, DEFAULT_PROVIDER_CONCURRENCY)
+
+
+def _provider_slot(provider: str) -> threading.BoundedSemaphore:
+    with _slots_lock:
+        slot = _provider_slots.get(provider)
+        if slot is None:
+            slot = _provider_slots[provider] = threading.BoundedSemaphore(
+                _provider_concurrency(provider)
+            )
+        return slot
+
+
+def enqueue_sms(
+    phone: str,
+    message: str,
+    provider: str = DEFAULT_PROVIDER,
+    category: Optional[str] = None,
+    bulk_history_id: Optional[int] = None,
+    commit: bool = True,
+) -> Optional[SMSOutbox]:
+    """Queue one SMS; returns the outbox row (None for a blank phone/message).
+
+    With ``commit=False`` the row is only added to the session and goes out
+    with the caller's transaction.
+    """
+    if not phone or not phone.strip() or not message:
+        return None
+    row = SMSOutbox(
+        provider=provider,
+        phone=phone.strip(),
+        message=message,
+        category=category,
+        bulk_history_id=bulk_history_id,
+        status=SMSOutbox.PENDING,
+        attempts=0,
+        max_attempts=_env_number("SMS_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS),
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.session.add(row)
+    db.session.info[_SESSION_FLAG] = True
+    if commit:
+        db.session.commit()
+    return row
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    if session.info.pop(_SESSION_FLAG, False):
+        _wake.set()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_FLAG, None)
+
+
+def backoff_seconds(attempts: int, retry_after: Optional[int] = None) -> float:
+    """Delay before retry number ``attempts`` (1-based), with +/-20% jitter."""
+    base = _env_number("SMS_RETRY_BASE_SECONDS", 30.0)
+    cap = _env_number("SMS_RETRY_MAX_SECONDS", 3600.0)
+    delay = min(cap, base * (2 ** max(0, attempts - 1)))
+    delay *= random.uniform(0.8, 1.2)
+    if retry_after:
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+def _is_retryable(result) -> bool:
+    # No status code means a network error or missing configuration
+    return result.status_code is None or result.status_code == 429 or result.status_code >= 500
+
+
+def _due_condition(now: datetime):
+    stale_before = now - timedelta(seconds=_env_number("SMS_SENDING_TIMEOUT", 300))
+    return or_(
+        (SMSOutbox.status == SMSOutbox.PENDING) & (SMSOutbox.next_attempt_at <= now),
+        (SMSOutbox.status == SMSOutbox.SENDING) & (SMSOutbox.locked_at < stale_before),
+    )
+
+
+def claim_due(limit: int = 1) -> list:
+    """Mark up to ``limit`` due rows as sending and return their ids. Commits."""
+    now = datetime.utcnow()
+    candidates = db.session.execute(
+        select(SMSOutbox.id)
+        .where(_due_condition(now))
+        .order_by(SMSOutbox.next_attempt_at, SMSOutbox.id)
+        .limit(limit * 2)
+    ).scalars().all()
+    claimed = []
+    for outbox_id in candidates:
+        result = db.session.execute(
+            update(SMSOutbox)
+            .where(SMSOutbox.id == outbox_id, _due_condition(now))
+            .values(status=SMSOutbox.SENDING, locked_at=now, attempts=SMSOutbox.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            claimed.append(outbox_id)
+            if len(claimed) >= limit:
+                break
+    db.session.commit()
+    return claimed
+
+
+def _bump_bulk_history(bulk_history_id: Optional[int], column: str) -> None:
+    if bulk_history_id is None:
+        return
+    from .bulk_sms import bump_campaign_counts
+
+    bump_campaign_counts(bulk_history_id, **{column: 1})
+
+
+def deliver_claimed(outbox_id: int) -> str:
+    """Send one claimed row and record the outcome; returns the new status."""
+    row = db.session.get(SMSOutbox, outbox_id)
+    if row is None or row.status != SMSOutbox.SENDING:
+        db.session.rollback()
+        return "skipped"
+    provider_name, phone, message = row.provider, row.phone, row.message
+    # Do not hold a transaction open across the provider call
+    db.session.commit()
+
+    provider = _providers().get(provider_name)
+    if provider is None:
+        from .sms_service import SendResult
+
+        result = SendResult(False, status_code=0, error=f"Unknown SMS provider {provider_name!r}")
+    else:
+        with _provider_slot(provider_name):
+            result = provider.deliver(phone, message)
+
+    row = db.session.get(SMSOutbox, outbox_id)
+    now = datetime.utcnow()
+    row.last_status_code = result.status_code
+    row.locked_at = None
+    if result.ok:
+        row.status = SMSOutbox.SENT
+        row.sent_at = now
+        row.last_error = None
+        _bump_bulk_history(row.bulk_history_id, "successful_sends")
+    elif _is_retryable(result) and row.attempts < row.max_attempts:
+        row.status = SMSOutbox.PENDING
+        row.next_attempt_at = now + timedelta(
+            seconds=backoff_seconds(row.attempts, result.retry_after)
+        )
+        row.last_error = result.error
+    else:
+        row.status = SMSOutbox.DEAD
+        row.last_error = result.error
+        _bump_bulk_history(row.bulk_history_id, "failed_sends")
+        logger.warning("SMS %s dead after %d attempt(s): %s", outbox_id, row.attempts, result.error)
+    status = row.status
+    db.session.commit()
+    return status
+
+
+def drain_outbox(limit: Optional[int] = None) -> Counter:
+    """Deliver due rows in this thread until none are due (or ``limit`` sent)."""
+    outcomes: Counter = Counter()
+    while limit is None or sum(outcomes.values()) < limit:
+        ids = claim_due(1)
+        if not ids:
+            break
+        outcomes[deliver_claimed(ids[0])] += 1
+    return outcomes
+
+
+def requeue_dead(ids: Optional[list] = None) -> int:
+    """Move dead rows (all, or ``ids``) back to pending with a fresh attempt budget."""
+    stmt = update(SMSOutbox).where(SMSOutbox.status == SMSOutbox.DEAD)
+    if ids:
+        stmt = stmt.where(SMSOutbox.id.in_(ids))
+    result = db.session.execute(
+        stmt.values(
+            status=SMSOutbox.PENDING, attempts=0, next_attempt_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.info[_SESSION_FLAG] = True
+    db.session.commit()
+    return result.rowcount or 0
+
+
+class SMSDispatcher:
+    """Pool of worker threads draining the outbox for one app.
+
+    Subclasses reuse the loop for other outbox tables by overriding
+    ``name``, ``wake`` and :meth:`work_once`.
+    """
+
+    name = "sms-outbox"
+    wake = _wake
+
+    def __init__(self, app, threads: int = 4, poll_seconds: float = 5.0):
+        self.app = app
+        self.threads = max(1, threads)
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._workers: list = []
+
+    def start(self) -> None:
+        for n in range(self.threads):
+            worker = threading.Thread(target=self._run, name=f"{self.name}-{n}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self.wake.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def work_once(self) -> bool:
+        """Handle one due row; False when nothing was due."""
+        ids = claim_due(1)
+        if ids:
+            deliver_claimed(ids[0])
+        return bool(ids)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            worked = False
+            # Cleared before claiming, so a wake-up set while we look for
+            # work (or after we found none) is not lost
+            self.wake.clear()
+            try:
+                with self.app.app_context():
+                    worked = self.work_once()
+            except Exception:
+                logger.exception("%s worker error", self.name)
+                try:
+                    with self.app.app_context():
+                        db.session.rollback()
+                except Exception:
+                    pass
+            if not worked:
+                self.wake.wait(self.poll_seconds)
+
+
+def start_sms_dispatcher(app) -> SMSDispatcher:
+    """Start (once per app) the background outbox workers."""
+    dispatcher = app.extensions.get("sms_dispatcher")
+    if dispatcher is None:
+        dispatcher = SMSDispatcher(
+            app,
+            threads=_env_number("SMS_WORKER_THREADS", 4),
+            poll_seconds=_env_number("SMS_WORKER_POLL_SECONDS", 5.0),
+        )
+        dispatcher.start()
+        app.extensions["sms_dispatcher"] = dispatcher
+    return dispatcher
+
+
+@click.command("drain-sms-outbox")
+@click.option("--limit", type=int, default=None, help="Stop after this many deliveries.")
+@click.option("--requeue-dead", "requeue_dead_rows", is_flag=True,
+              help="Move dead messages back to pending first.")
+@with_appcontext
+def drain_sms_outbox_command(limit, requeue_dead_rows):
+    """Deliver due SMS from the outbox in the foreground."""
+    if requeue_dead_rows:
+        click.echo(f"Requeued {requeue_dead()} dead message(s).")
+    outcomes = drain_outbox(limit=limit)
+    click.echo(
+        ", ".join(f"{status}: {count}" for status, count in sorted(outcomes.items()))
+        or "No messages due."
+    )
@@ -1,28 +1,50 @@
+import hashlib
+import math
 import os
+import threading
 import time
 import urllib.parse
-from typing import Optional
+from typing import NamedTuple, Optional
 
 import requests  # type: ignore
-from flask import current_app
 
-try:
-    # Optional: reload env vars when refreshing config
-    from dotenv import load_dotenv  # type: ignore
-except Exception:  # pragma: no cover
-    load_dotenv = None  # type: ignore
+from . import runtime_config
+from .http_resilience import CircuitBreaker, LatencyHistogram, pooled_session
+from .phones import normalize_phone
+from .shared_cache import get_cache
+
+
+DEFAULT_API_BASE = "https://semaphore.co/api/v4"
+# Most numbers Semaphore accepts in one messages call
+BULK_MAX_NUMBERS = 1000
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class SendResult(NamedTuple):
+    """Outcome of one provider call (used by the outbox to decide retries)"""
+
+    ok: bool
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    retry_after: Optional[int] = None  # seconds, from a 429 Retry-After header
 
 
 class SMSService:
     """SMS service using Semaphore API"""
 
     def __init__(self):
-        # Initialize with current environment values; will be refreshed per call
+        # Initialize with current environment values; replaced from the
+        # runtime configuration snapshot whenever its version changes
+        self._config_version = None
         self.api_key = os.environ.get("SEMAPHORE_API_KEY", "")
         self.sender_name = os.environ.get("SEMAPHORE_SENDER_NAME", "ACCIO Laundry")
-        self.base_url = "https://semaphore.co/api/v4/messages"
-        # Simple in-memory cache for account info to avoid rate limits
-        self._account_cache = None  # type: ignore[assignment]
+        self.api_base = os.environ.get("SEMAPHORE_API_BASE", DEFAULT_API_BASE).rstrip("/")
         # Minimum seconds between live account refreshes
         try:
             self.min_refresh_seconds = int(
@@ -31,32 +53,73 @@ class SMSService:
         except Exception:
             self.min_refresh_seconds = 60
 
-    def _refresh_config(self) -> None:
-        """Refresh API credentials from Flask config or .env at runtime.
-        This lets admins update .env without restarting the server.
+        # Keep-alive connection pool shared by all threads (built on first use)
+        self._http = None
+        self._http_lock = threading.Lock()
+        self.pool_size = int(_env_float("SMS_HTTP_POOL_SIZE", 10))
+        # Fail fast while the provider keeps failing instead of waiting out timeouts
+        self.connect_timeout = _env_float("SMS_CONNECT_TIMEOUT", 3.05)
+        self.read_timeout = _env_float("SMS_READ_TIMEOUT", 15)
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(_env_float("SMS_BREAKER_FAILURES", 5)),
+            cooldown_seconds=_env_float("SMS_BREAKER_COOLDOWN", 60),
+        )
+        self.latency = {"messages": LatencyHistogram(), "account": LatencyHistogram()}
+
+    @property
+    def http(self):
+        if self._http is None:
+            with self._http_lock:
+                if self._http is None:
+                    self._http = pooled_session(self.pool_size)
+        return self._http
+
+    def _request(self, endpoint: str, method: str, url: str, read_timeout: float, **kwargs):
+        """Make one provider call, recording latency and the breaker outcome.
+
+        5xx responses and transport errors count as failures; any other
+        response means the provider is up.
         """
-        # Reload .env into process env if possible
+        started = time.monotonic()
         try:
-            if load_dotenv:
-                load_dotenv(override=True)  # pick up latest edits
-        except Exception:
-            pass
+            response = self.http.request(
+                method, url, timeout=(self.connect_timeout, read_timeout), **kwargs
+            )
+        except Exception as e:
+            self.latency[endpoint].observe(time.monotonic() - started)
+            self.breaker.record_failure(str(e))
+            raise
+        self.latency[endpoint].observe(time.monotonic() - started)
+        if response.status_code >= 500:
+            self.breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            self.breaker.record_success()
+        return response
 
-        # Prefer Flask app config if available, else fall back to OS env
-        api_key = None
-        sender = None
-        try:
-            if current_app:  # type: ignore[truthy-bool]
-                api_key = (current_app.config.get("SEMAPHORE_API_KEY") or "").strip()  # type: ignore[attr-defined]
-                sender = (current_app.config.get("SEMAPHORE_SENDER_NAME") or "").strip()  # type: ignore[attr-defined]
-        except Exception:
-            # current_app might not be available outside app context
-            pass
+    def health(self) -> dict:
+        """Breaker state and latency histograms for the settings page"""
+        return {
+            "breaker": self.breaker.snapshot(),
+            "latency": {name: h.snapshot() for name, h in self.latency.items()},
+        }
 
-        self.api_key = api_key or os.environ.get("SEMAPHORE_API_KEY", "")
-        self.sender_name = sender or os.environ.get(
-            "SEMAPHORE_SENDER_NAME", "ACCIO Laundry"
-        )
+    def _refresh_config(self) -> None:
+        """Apply the current runtime configuration snapshot.
+
+        Cheap to call per send: the files behind the snapshot are only
+        re-read when they change (see app.runtime_config).
+        """
+        snapshot = runtime_config.current()
+        if snapshot.version == self._config_version:
+            return
+        self.api_key = snapshot.get("SEMAPHORE_API_KEY", "")
+        self.sender_name = snapshot.get("SEMAPHORE_SENDER_NAME", "ACCIO Laundry")
+        self.api_base = snapshot.get("SEMAPHORE_API_BASE", DEFAULT_API_BASE).rstrip("/")
+        self._config_version = snapshot.version
+
+    @property
+    def base_url(self) -> str:
+        return self.api_base + "/messages"
 
     def is_configured(self) -> bool:
         """Check if SMS service is properly configured"""
@@ -64,42 +127,63 @@ class SMSService:
         return bool(self.api_key and self.sender_name)
 
     def format_phone_number(self, phone: Optional[str]) -> Optional[str]:
-        """Format phone number for Semaphore API"""
-        if not phone:
-            return None
-
-        # Remove all non-digits
-        phone = "".join(filter(str.isdigit, phone))
-
-        # Handle Philippine phone numbers
-        if phone.startswith("63"):
-            # Already in international format
-            return phone
-        elif phone.startswith("0"):
-            # Convert 09XXXXXXXXX to 639XXXXXXXXX
-            return "63" + phone[1:]
-        elif len(phone) == 10 and phone.startswith("9"):
-            # Add country code to 9XXXXXXXXX
-            return "63" + phone
-        else:
-            # Return as is if format is unclear
-            return phone
+        """Format phone number for Semaphore API (E.164 digits, no "+")"""
+        e164 = normalize_phone(phone)
+        return e164[1:] if e164 else None
 
     def send_sms(self, phone_number: str, message: str) -> bool:
-        """Send SMS using Semaphore API"""
+        """Send SMS using Semaphore API (blocking; prefer app.sms_outbox.enqueue_sms)"""
+        return self.deliver(phone_number, message).ok
+
+    def deliver(self, phone_number: str, message: str) -> SendResult:
+        """Make one provider call and report the outcome"""
         if not self.is_configured():
             print(
                 "SMS service not configured. Please set SEMAPHORE_API_KEY and SEMAPHORE_SENDER_NAME"
             )
-            return False
+            return SendResult(False, error="SMS service not configured")
 
         formatted_phone = self.format_phone_number(phone_number)
         if not formatted_phone:
             print(f"Invalid phone number: {phone_number}")
-            return False
+            return SendResult(False, error=f"Invalid phone number: {phone_number}")
+        return self._post_message(formatted_phone, message)
+
+    def deliver_many(self, phone_numbers: list, message: str) -> SendResult:
+        """Send one identical message to several numbers in a single call.
 
+        Semaphore accepts up to ``BULK_MAX_NUMBERS`` comma-separated numbers.
+        """
+        if not self.is_configured():
+            return SendResult(False, error="SMS service not configured")
+        numbers = [n for n in (self.format_phone_number(p) for p in phone_numbers) if n]
+        if not numbers:
+            return SendResult(False, status_code=0, error="No valid phone numbers")
+        return self._post_message(",".join(numbers), message)
+
+    def _post_message(self, formatted_phone: str, message: str) -> SendResult:
+        cooldown = self._send_cooldown()
+        if cooldown:
+            print(f"SMS provider rate limit in effect; not sending (retry in ~{cooldown}s)")
+            return SendResult(
+                False,
+                status_code=429,
+                error="Rate limited by SMS API (shared cooldown)",
+                retry_after=cooldown,
+            )
+        if not self.breaker.allow():
+            retry_after = math.ceil(self.breaker.retry_after()) or 1
+            print(f"SMS provider circuit open; not sending (retry in ~{retry_after}s)")
+            return SendResult(
+                False,
+                error="SMS provider unavailable (circuit open)",
+                retry_after=retry_after,
+            )
         try:
-            print(f"Sending SMS to {formatted_phone}...")
+            if "," in formatted_phone:
+                print(f"Sending SMS to {formatted_phone.count(',') + 1} numbers...")
+            else:
+                print(f"Sending SMS to {formatted_phone}...")
 
             params = {
                 "apikey": self.api_key,
@@ -111,25 +195,70 @@ class SMSService:
             # Build URL with parameters
             url = self.base_url + "?" + urllib.parse.urlencode(params)
 
-            response = requests.post(url, timeout=30)
+            response = self._request("messages", "POST", url, self.read_timeout)
 
             if response.status_code == 200:
                 print("SMS sent successfully!")
-                return True
-            else:
-                print(f"Failed to send SMS. Status code: {response.status_code}")
-                print(f"Response: {response.text}")
-                return False
+                return SendResult(True, status_code=200)
+
+            print(f"Failed to send SMS. Status code: {response.status_code}")
+            print(f"Response: {response.text}")
+            retry_after = None
+            if response.status_code == 429:
+                try:
+                    retry_after = int(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    retry_after = None
+                if retry_after:
+                    # Every worker holds off until the provider's window passes
+                    self._start_send_cooldown(retry_after)
+            return SendResult(
+                False,
+                status_code=response.status_code,
+                error=f"API Error: {response.status_code} - {response.text[:500]}",
+                retry_after=retry_after,
+            )
 
         except requests.exceptions.RequestException as e:
             print(f"Error sending SMS: {e}")
-            return False
+            return SendResult(False, error=f"Error sending SMS: {e}")
         except Exception as e:
             print(f"Unexpected error sending SMS: {e}")
-            return False
+            return SendResult(False, error=f"Unexpected error sending SMS: {e}")
+
+    def _shared_key(self, name: str) -> str:
+        # Scoped to the account so rotating the API key never serves stale data
+        account = hashlib.sha1(f"{self.api_base}|{self.api_key}".encode()).hexdigest()[:12]
+        return f"sms:{account}:{name}"
+
+    def _send_cooldown(self) -> Optional[int]:
+        """Seconds left on a provider 429 cooldown seen by any worker"""
+        until = get_cache().get(self._shared_key("send_cooldown"))
+        if until is None:
+            return None
+        remaining = math.ceil(until - time.time())
+        return remaining if remaining > 0 else None
+
+    def _start_send_cooldown(self, retry_after: int) -> None:
+        get_cache().set(self._shared_key("send_cooldown"), time.time() + retry_after, ttl=retry_after)
+
+    def _last_known_account(self, error: str, next_refresh_in: int, **extra) -> Optional[dict]:
+        last = get_cache().get(self._shared_key("account_last"))
+        if not last:
+            return None
+        last.update(extra)
+        last["error"] = error
+        last["next_refresh_in"] = next_refresh_in
+        last["cached"] = True
+        return last
 
     def get_account_status(self) -> dict:
-        """Get account status and credit balance from Semaphore API"""
+        """Get account status and credit balance from Semaphore API
+
+        Results, the 429 cooldown and a short refresh lease live in the
+        shared cache (app.shared_cache), so all workers make at most one
+        ``/account`` call per refresh window between them.
+        """
         # Ensure credentials are up to date before checking
         if not self.is_configured():
             return {
@@ -138,105 +267,119 @@ class SMSService:
                 "error": "SMS service not configured",
             }
 
-        # Serve from cache if still fresh
+        cache = get_cache()
         now = time.time()
-        if isinstance(self._account_cache, dict):
-            expires_at = self._account_cache.get("expires_at", 0)
-            if now < expires_at and self._account_cache.get("data"):
-                data = dict(self._account_cache["data"])
-                data["cached"] = True
-                # seconds remaining until next live refresh attempt
-                data["next_refresh_in"] = max(0, int(expires_at - now))
-                return data
 
+        # Serve from cache if still fresh
+        fresh = cache.get(self._shared_key("account"))
+        if fresh:
+            data = dict(fresh["data"])
+            data["cached"] = True
+            # seconds remaining until next live refresh attempt
+            data["next_refresh_in"] = max(0, int(fresh["expires_at"] - now))
+            return data
+
+        # Honour a rate-limit cooldown started by any worker
+        cooldown_until = cache.get(self._shared_key("account_cooldown"))
+        if cooldown_until and cooldown_until > now:
+            retry_after = math.ceil(cooldown_until - now)
+            return self._last_known_account(
+                "Rate limited by SMS API; showing last known values.",
+                retry_after,
+                rate_limited_for=retry_after,
+            ) or {
+                "status": "Error",
+                "credit_balance": 0,
+                "error": f"API Error: 429 - Too Many Attempts. Try again in ~{retry_after}s",
+                "rate_limited_for": retry_after,
+                "next_refresh_in": retry_after,
+                "cached": False,
+            }
+
+        # Only one worker refreshes at a time; the others show the last values
+        lease_key = self._shared_key("account_lease")
+        own_lease = cache.add(lease_key, now, ttl=15)
+        if not own_lease:
+            last = self._last_known_account(None, 15)
+            if last:
+                return last
+
+        # Checked after the lease: in half-open state allow() takes the single
+        # trial call, which only a request (recording its outcome) gives back
+        if not self.breaker.allow():
+            if own_lease:
+                cache.delete(lease_key)
+            retry_after = math.ceil(self.breaker.retry_after())
+            return self._last_known_account(
+                "SMS provider unavailable; showing last known values.", retry_after
+            ) or {
+                "status": "Unavailable",
+                "credit_balance": 0,
+                "error": f"SMS provider unavailable after repeated failures. Retrying in ~{retry_after}s",
+                "next_refresh_in": retry_after,
+                "cached": False,
+            }
+
+        refresh_seconds = max(10, self.min_refresh_seconds)
         try:
             # Semaphore account balance endpoint
-            balance_url = "https://semaphore.co/api/v4/account"
-
-            # Try with light backoff to be gentle
-            attempts = 0
-            last_error = None
-            while attempts < 3:
-                attempts += 1
-                response = requests.get(
-                    balance_url, params={"apikey": self.api_key}, timeout=10
-                )
+            balance_url = self.api_base + "/account"
+            response = self._request(
+                "account",
+                "GET",
+                balance_url,
+                min(self.read_timeout, 10),
+                params={"apikey": self.api_key},
+            )
 
-                if response.status_code == 200:
-                    data = response.json()
-                    result = {
-                        "status": data.get("account_status", "Active"),
-                        "credit_balance": float(data.get("credit_balance", 0)),
-                        "account_name": data.get("account_name", self.sender_name),
-                        "error": None,
-                        "cached": False,
-                        "next_refresh_in": max(
-                            0, int(max(10, self.min_refresh_seconds))
-                        ),
-                    }
-                    # Cache for a short window to avoid 429s
-                    self._account_cache = {
-                        "data": result,
-                        "expires_at": now + max(10, self.min_refresh_seconds),
-                    }
-                    return result
-
-                # Handle rate limiting
-                if response.status_code == 429:
-                    retry_after_header = response.headers.get("Retry-After")
-                    try:
-                        retry_after = (
-                            int(retry_after_header) if retry_after_header else 30
-                        )
-                    except Exception:
-                        retry_after = 30
-
-                    # If we have previous cache, serve it and indicate cooldown
-                    if isinstance(
-                        self._account_cache, dict
-                    ) and self._account_cache.get("data"):
-                        cached_data = dict(self._account_cache["data"])
-                        cached_data["error"] = (
-                            "Rate limited by SMS API; showing last known values."
-                        )
-                        cached_data["rate_limited_for"] = retry_after
-                        cached_data["next_refresh_in"] = retry_after
-                        cached_data["cached"] = True
-                        # extend cache a bit to avoid hammering
-                        self._account_cache["expires_at"] = now + retry_after
-                        return cached_data
-
-                    # No cache to fall back to; return a helpful error
-                    return {
-                        "status": "Error",
-                        "credit_balance": 0,
-                        "error": f"API Error: 429 - Too Many Attempts. Try again in ~{retry_after}s",
-                        "rate_limited_for": retry_after,
-                        "next_refresh_in": retry_after,
-                        "cached": False,
-                    }
-
-                # Non-200 other than 429; collect error and break
-                last_error = f"API Error: {response.status_code} - {response.text}"
-                break
-
-            # If here, attempts exhausted or non-retryable
-            # Return last cache if available; else return error
-            if isinstance(self._account_cache, dict) and self._account_cache.get(
-                "data"
-            ):
-                cached_data = dict(self._account_cache["data"])
-                cached_data["error"] = last_error or "Unknown API error"
-                # keep existing next_refresh_in on cache if present; else compute from expires_at
-                if "next_refresh_in" not in cached_data:
-                    expires_at = self._account_cache.get("expires_at", now)
-                    cached_data["next_refresh_in"] = max(0, int(expires_at - now))
-                cached_data["cached"] = True
-                return cached_data
-            return {
+            if response.status_code == 200:
+                data = response.json()
+                result = {
+                    "status": data.get("account_status", "Active"),
+                    "credit_balance": float(data.get("credit_balance", 0)),
+                    "account_name": data.get("account_name", self.sender_name),
+                    "error": None,
+                    "cached": False,
+                    "next_refresh_in": refresh_seconds,
+                }
+                # Cache for a short window to avoid 429s
+                cache.set(
+                    self._shared_key("account"),
+                    {"data": result, "expires_at": now + refresh_seconds},
+                    ttl=refresh_seconds,
+                )
+                cache.set(self._shared_key("account_last"), result, ttl=86400)
+                return result
+
+            # Handle rate limiting
+            if response.status_code == 429:
+                retry_after_header = response.headers.get("Retry-After")
+                try:
+                    retry_after = int(retry_after_header) if retry_after_header else 30
+                except Exception:
+                    retry_after = 30
+                cache.set(self._shared_key("account_cooldown"), now + retry_after, ttl=retry_after)
+
+                # If we have previous values, serve them and indicate cooldown
+                return self._last_known_account(
+                    "Rate limited by SMS API; showing last known values.",
+                    retry_after,
+                    rate_limited_for=retry_after,
+                ) or {
+                    "status": "Error",
+                    "credit_balance": 0,
+                    "error": f"API Error: 429 - Too Many Attempts. Try again in ~{retry_after}s",
+                    "rate_limited_for": retry_after,
+                    "next_refresh_in": retry_after,
+                    "cached": False,
+                }
+
+            # Non-200 other than 429: last known values if any, else the error
+            last_error = f"API Error: {response.status_code} - {response.text}"
+            return self._last_known_account(last_error, refresh_seconds) or {
                 "status": "Error",
                 "credit_balance": 0,
-                "error": last_error or "Unknown API error",
+                "error": last_error,
                 "cached": False,
             }
 
@@ -252,33 +395,39 @@ class SMSService:
                 "credit_balance": 0,
                 "error": f"Unexpected error: {str(e)}",
             }
+        finally:
+            if own_lease:
+                cache.delete(lease_key)
 
 
 # Global SMS service instance
 sms_service = SMSService()
 
 
-def send_sms_notification(phone_number: str, message: str) -> bool:
-    """Convenience function to send SMS notification"""
-    return sms_service.send_sms(phone_number, message)
+def send_sms_notification(
+    phone_number: str, message: str, category: str = "manual", commit: bool = True
+) -> bool:
+    """Queue an SMS notification for background delivery.
+
+    Returns True once the message is queued (not when it is delivered); pass
+    ``commit=False`` when the caller commits the surrounding transaction.
+    """
+    from .sms_outbox import enqueue_sms
 
+    return enqueue_sms(phone_number, message, category=category, commit=commit) is not None
 
-def send_laundry_status_sms(customer, laundry, status: str) -> bool:
+
+def send_laundry_status_sms(customer, laundry, status: str, commit: bool = True) -> bool:
     """Send laundry status update via SMS"""
-    # Refresh configuration to pick up any runtime changes
-    try:
-        sms_service._refresh_config()
-    except Exception:
-        pass
     if not customer.phone:
         print(f"No phone number for customer {customer.full_name}")
         return False
 
     # Import here to avoid circular imports
-    from .models import SMSSettings
+    from .reference_cache import get_sms_settings
 
-    # Get SMS settings
-    settings = SMSSettings.get_settings()
+    # Get SMS settings (read-only, cached)
+    settings = get_sms_settings()
 
     # Check if SMS is enabled for this status
     status_enabled_map = {
@@ -316,7 +465,54 @@ def send_laundry_status_sms(customer, laundry, status: str) -> bool:
         # Fallback message if no template found
         message = f"Hi {customer.full_name}! Your laundry (#{laundry.laundry_id}) status has been updated to: {status}. - {sms_service.sender_name}"
 
-    return send_sms_notification(customer.phone, message)
+    return send_sms_notification(
+        customer.phone_e164 or customer.phone, message, category=f"status:{status}", commit=commit
+    )
+
+
+def format_load_list(laundries) -> str:
+    """Describe a batch of loads as "#<laundry_id> (<n> items), ..." """
+    parts = []
+    for laundry in laundries:
+        count = laundry.item_count or 0
+        parts.append(f"#{laundry.laundry_id} ({count} item{'' if count == 1 else 's'})")
+    return ", ".join(parts)
+
+
+def send_laundry_batch_received_sms(customer, laundries, commit: bool = True) -> bool:
+    """Send one "Received" SMS for all loads dropped off together"""
+    if len(laundries) == 1:
+        return send_laundry_status_sms(customer, laundries[0], "Received", commit=commit)
+    if not customer.phone:
+        print(f"No phone number for customer {customer.full_name}")
+        return False
+
+    from .models import DEFAULT_RECEIVED_BATCH_MESSAGE
+    from .reference_cache import get_sms_settings
+
+    settings = get_sms_settings()
+    if not settings.received_enabled:
+        print("SMS notifications disabled for status: Received")
+        return False
+
+    load_list = format_load_list(laundries)
+    try:
+        message = settings.format_message(
+            settings.received_batch_message or DEFAULT_RECEIVED_BATCH_MESSAGE,
+            customer.full_name,
+            ", ".join(str(load.laundry_id) for load in laundries),
+            sms_service.sender_name,
+            number_of_items=sum(load.item_count or 0 for load in laundries),
+            load_list=load_list,
+            load_count=len(laundries),
+        )
+    except Exception as e:
+        print(f"Error formatting batch SMS template: {e}")
+        message = f"Hi {customer.full_name}! We received your {len(laundries)} laundry loads: {load_list}. - {sms_service.sender_name}"
+
+    return send_sms_notification(
+        customer.phone_e164 or customer.phone, message, category="status:Received", commit=commit
+    )
 
 
 def send_welcome_sms(customer) -> bool:
@@ -325,10 +521,10 @@ def send_welcome_sms(customer) -> bool:
         return False
 
     # Import here to avoid circular imports
-    from .models import SMSSettings
+    from .reference_cache import get_sms_settings
 
-    # Get SMS settings
-    settings = SMSSettings.get_settings()
+    # Get SMS settings (read-only, cached)
+    settings = get_sms_settings()
 
     # Check if welcome SMS is enabled
     if not settings.welcome_enabled:
@@ -343,4 +539,6 @@ def send_welcome_sms(customer) -> bool:
         sms_service.sender_name,
     )
 
-    return send_sms_notification(customer.phone, message)
+    return send_sms_notification(
+        customer.phone_e164 or customer.phone, message, category="welcome"
+    )
@@ -1,13 +1,22 @@
-from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
-from datetime import datetime, timedelta
 
 from . import db
-from .models import SMSSettings, SMSSettingsProfile
-from .sms_service import send_sms_notification, sms_service
+from .bulk_recipients import (
+    count_recipients,
+    iter_recipients,
+    recipients_query,
+    recipients_query_from_form,
+)
+from .bulk_sms import ACTIVE_STATUSES, BATCHED, plan_campaign, start_bulk_job
+from .models import DEFAULT_RECEIVED_BATCH_MESSAGE, SMSSettings, SMSSettingsProfile
+from .sms_service import sms_service
 
 sms_settings_bp = Blueprint("sms_settings", __name__)
 
+# Sample {load_list} for previews and test messages
+SAMPLE_LOAD_LIST = "#TEST001 (3 items), #TEST002 (2 items)"
+
 
 @sms_settings_bp.route("/sms-settings", methods=["GET", "POST"])
 @login_required
@@ -32,6 +41,7 @@ def sms_settings():
                 "ready_pickup_message",
                 "completed_message",
                 "welcome_message",
+                "received_batch_message",
             }
 
             # Only update toggles if any toggle field is present in the POST (e.g., from the toggle form)
@@ -61,6 +71,10 @@ def sms_settings():
                     settings.welcome_message = (
                         request.form.get("welcome_message") or ""
                     ).strip()
+                if "received_batch_message" in form_keys:
+                    settings.received_batch_message = (
+                        request.form.get("received_batch_message") or ""
+                    ).strip()
                 updated = True
 
             # Commit only if something changed
@@ -137,6 +151,7 @@ def sms_settings():
         sender_name=sms_service.sender_name,
         sms_profiles=profiles,
         active_profile=active_profile,
+        provider_health=sms_service.health(),
     )
 
 
@@ -382,6 +397,16 @@ def test_sms():
                 sms_service.sender_name,
                 number_of_items=5,
             )
+        elif message_type == "received_batch":
+            message = settings.format_message(
+                settings.received_batch_message or DEFAULT_RECEIVED_BATCH_MESSAGE,
+                "John Doe",
+                "TEST001, TEST002",
+                sms_service.sender_name,
+                number_of_items=5,
+                load_list=SAMPLE_LOAD_LIST,
+                load_count=2,
+            )
         elif message_type == "welcome":
             message = settings.format_message(
                 settings.welcome_message, "John Doe", "", sms_service.sender_name
@@ -398,6 +423,7 @@ def test_sms():
         # Add an informational note if the selected type is disabled (tests still proceed)
         disabled_map = {
             "received": not settings.received_enabled,
+            "received_batch": not settings.received_enabled,
             "ready_pickup": not settings.ready_pickup_enabled,
             "completed": not settings.completed_enabled,
             "welcome": not settings.welcome_enabled,
@@ -405,8 +431,8 @@ def test_sms():
         if disabled_map.get(message_type):
             note = "Note: This notification type is disabled in settings. Test SMS sent anyway."
 
-        # Send test SMS
-        success = send_sms_notification(phone, message)
+        # Send test SMS synchronously so the result reflects the provider response
+        success = sms_service.send_sms(phone, message)
 
         if success:
             resp = {"success": True, "message": "Test SMS sent successfully!"}
@@ -435,6 +461,7 @@ def reset_messages():
         settings.ready_pickup_message = "Hi {customer_name}! Great news! Your laundry (#{laundry_id}) is ready for pickup. Please visit us during business hours. - {sender_name}"
         settings.completed_message = "Hi {customer_name}! Your laundry (#{laundry_id}) has been completed. Thank you for choosing {sender_name}!"
         settings.welcome_message = "Welcome to {sender_name}, {customer_name}! We're excited to serve you. For inquiries, contact us at +639761111464."
+        settings.received_batch_message = DEFAULT_RECEIVED_BATCH_MESSAGE
 
         # Update metadata
         settings.updated_by = current_user.id
@@ -464,6 +491,8 @@ def preview_message():
             "L001234",
             sms_service.sender_name,
             number_of_items=5,
+            load_list=SAMPLE_LOAD_LIST,
+            load_count=2,
         )
 
         return jsonify({"success": True, "preview": formatted_message})
@@ -478,13 +507,11 @@ def preview_message():
 @login_required
 def bulk_message():
     """Send bulk promotional/event messages to all customers"""
-    from .models import BulkMessageHistory, Customer, CustomerLoyalty, Laundry
+    from .models import BulkMessageHistory, Customer
 
     if request.method == "POST":
         message_text = request.form.get("message_text", "").strip()
         message_type = request.form.get("message_type", "promo")
-        recipient_mode = request.form.get("recipient_mode", "all")
-        customer_ids_raw = request.form.get("customer_ids", "")
 
         if not message_text:
             flash("Message text is required", "error")
@@ -497,76 +524,9 @@ def bulk_message():
             )
             return redirect(url_for("sms_settings.bulk_message"))
 
-        # Build recipient list based on recipient_mode
-        customers_with_phones = []
-        if recipient_mode == "all":
-            customers = (
-                Customer.query.filter(Customer.phone.isnot(None), Customer.is_active).all()
-            )
-            customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
-
-        elif recipient_mode == "selected":
-            # Expect comma-separated ids
-            ids = [int(x) for x in customer_ids_raw.split(",") if x.strip().isdigit()]
-            if ids:
-                customers = (
-                    Customer.query.filter(Customer.id.in_(ids), Customer.phone.isnot(None), Customer.is_active).all()
-                )
-                customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
-
-        elif recipient_mode == "tier":
-            tier = request.form.get("tier") or ""
-            if tier:
-                try:
-                    customers = (
-                        Customer.query.join("loyalty").filter(
-                            Customer.phone.isnot(None), Customer.is_active,
-                            db.func.lower(db.text("customer_loyalty.current_tier")) == tier.lower(),
-                        ).all()
-                    )
-                except Exception:
-                    customers = []
-
-                if not customers:
-                    loyalty_customers = CustomerLoyalty.query.filter(
-                        db.func.lower(CustomerLoyalty.current_tier) == tier.lower()
-                    ).all()
-                    ids = [l.customer_id for l in loyalty_customers]
-                    if ids:
-                        customers = (
-                            Customer.query.filter(Customer.id.in_(ids), Customer.phone.isnot(None), Customer.is_active).all()
-                        )
-
-                customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
-
-        elif recipient_mode == "recent":
-            try:
-                days = int(request.form.get("recent_days", "7"))
-            except Exception:
-                days = 7
-            cutoff = datetime.utcnow() - timedelta(days=days)
-
-            recent_customer_rows = (
-                db.session.query(Laundry.customer_id)
-                .filter(Laundry.date_received >= cutoff)
-                .distinct()
-                .all()
-            )
-            ids = [r[0] for r in recent_customer_rows]
-            if ids:
-                customers = (
-                    Customer.query.filter(Customer.id.in_(ids), Customer.phone.isnot(None), Customer.is_active).all()
-                )
-                customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
-
-        else:
-            # Unknown mode, treat as all
-            customers = (
-                Customer.query.filter(Customer.phone.isnot(None), Customer.is_active).all()
-            )
-            customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
-
-        if not customers_with_phones:
+        recipients = recipients_query_from_form(request.form)
+        recipient_count = count_recipients(recipients)
+        if not recipient_count:
             flash("No customers found with phone numbers", "warning")
             return redirect(url_for("sms_settings.bulk_message"))
 
@@ -575,48 +535,27 @@ def bulk_message():
         bulk_history.message_text = message_text
         bulk_history.message_type = message_type
         bulk_history.sent_by_user_id = current_user.id
-        bulk_history.total_recipients = len(customers_with_phones)
+        bulk_history.total_recipients = recipient_count
         db.session.add(bulk_history)
+        db.session.flush()
 
-        success_count = 0
-        failed_count = 0
-
-        for customer in customers_with_phones:
-            try:
-                # Format message with customer name and sender name
-                formatted_message = message_text.replace("{customer_name}", customer.full_name or "")
-                formatted_message = formatted_message.replace(
-                    "{sender_name}", sms_service.sender_name
-                )
-
-                if sms_service.send_sms(customer.phone, formatted_message):
-                    success_count += 1
-                else:
-                    failed_count += 1
-
-            except Exception as e:
-                failed_count += 1
-
-        # Update bulk message history with results
-        bulk_history.successful_sends = success_count
-        bulk_history.failed_sends = failed_count
+        # Identical texts go out in provider-sized batches from a background
+        # job; personalized texts are queued per recipient in the SMS outbox
+        queued_count = plan_campaign(bulk_history, iter_recipients(recipients))
         db.session.commit()
+        if bulk_history.send_mode == BATCHED and queued_count:
+            start_bulk_job(current_app._get_current_object(), bulk_history.id)
 
-        if success_count > 0:
-            flash(
-                f"Bulk message sent successfully to {success_count} customers!",
-                "success",
-            )
-        if failed_count > 0:
-            flash(f"Failed to send message to {failed_count} customers", "warning")
+        flash(
+            f"Bulk message queued for {queued_count} customers. Progress is shown below while it sends.",
+            "success",
+        )
 
         return redirect(url_for("sms_settings.bulk_message"))
 
     # GET request - show the form
     total_customers = Customer.query.filter(Customer.is_active).count()
-    customers_with_phones = Customer.query.filter(
-        Customer.phone.isnot(None), Customer.is_active
-    ).count()
+    customers_with_phones = count_recipients(recipients_query("all"))
 
     # Check if SMS service is configured
     sms_configured = sms_service.is_configured()
@@ -628,11 +567,19 @@ def bulk_message():
         .all()
     )
 
+    # Campaigns still sending; the page follows them over Socket.IO
+    active_campaigns = (
+        BulkMessageHistory.query.filter(BulkMessageHistory.status.in_(ACTIVE_STATUSES))
+        .order_by(BulkMessageHistory.sent_at.desc())
+        .all()
+    )
+
     return render_template(
         "bulk_message.html",
         total_customers=total_customers,
         customers_with_phones=customers_with_phones,
         recent_campaigns=recent_campaigns,
+        active_campaigns=active_campaigns,
         sms_configured=sms_configured,
     )
 
@@ -690,90 +637,20 @@ def preview_bulk_message():
 @login_required
 def compute_recipients():
     """Compute recipient list for a bulk send (dry-run) and return customers without sending SMS."""
-    from .models import Customer, CustomerLoyalty, Laundry
-
-    recipient_mode = request.form.get("recipient_mode", "all")
-    customer_ids_raw = request.form.get("customer_ids", "")
-
     try:
-        customers_with_phones = []
-
-        if recipient_mode == "all":
-            customers = (
-                Customer.query.filter(Customer.phone.isnot(None), Customer.is_active).all()
-            )
-            customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
-
-        elif recipient_mode == "selected":
-            ids = [int(x) for x in customer_ids_raw.split(",") if x.strip().isdigit()]
-            if ids:
-                customers = (
-                    Customer.query.filter(Customer.id.in_(ids), Customer.phone.isnot(None), Customer.is_active).all()
-                )
-                customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
-
-        elif recipient_mode == "tier":
-            tier = request.form.get("tier") or ""
-            if tier:
-                try:
-                    customers = (
-                        Customer.query.join("loyalty").filter(
-                            Customer.phone.isnot(None), Customer.is_active,
-                            db.func.lower(db.text("customer_loyalty.current_tier")) == tier.lower(),
-                        ).all()
-                    )
-                except Exception:
-                    customers = []
-
-                if not customers:
-                    loyalty_customers = CustomerLoyalty.query.filter(
-                        db.func.lower(CustomerLoyalty.current_tier) == tier.lower()
-                    ).all()
-                    ids = [l.customer_id for l in loyalty_customers]
-                    if ids:
-                        customers = (
-                            Customer.query.filter(Customer.id.in_(ids), Customer.phone.isnot(None), Customer.is_active).all()
-                        )
-
-                customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
-
-        elif recipient_mode == "recent":
-            try:
-                days = int(request.form.get("recent_days", "7"))
-            except Exception:
-                days = 7
-            cutoff = datetime.utcnow() - timedelta(days=days)
-
-            recent_customer_rows = (
-                db.session.query(Laundry.customer_id)
-                .filter(Laundry.date_received >= cutoff)
-                .distinct()
-                .all()
-            )
-            ids = [r[0] for r in recent_customer_rows]
-            if ids:
-                customers = (
-                    Customer.query.filter(Customer.id.in_(ids), Customer.phone.isnot(None), Customer.is_active).all()
-                )
-                customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
-
-        else:
-            customers = (
-                Customer.query.filter(Customer.phone.isnot(None), Customer.is_active).all()
-            )
-            customers_with_phones = [c for c in customers if c.phone and c.phone.strip()]
+        recipients = recipients_query_from_form(request.form)
 
         # Build response data (limit list size to avoid massive payloads)
         max_list = 500
         customers_list = [
-            {"id": c.id, "name": c.full_name, "phone": c.phone}
-            for c in customers_with_phones[:max_list]
+            {"id": r.id, "name": r.full_name, "phone": r.phone}
+            for r in iter_recipients(recipients, limit=max_list)
         ]
 
         return jsonify(
             {
                 "success": True,
-                "total": len(customers_with_phones),
+                "total": count_recipients(recipients),
                 "shown": len(customers_list),
                 "customers": customers_list,
             }
@@ -0,0 +1,111 @@
+"""LRU + TTL cache behind the Flask-Login user loader.
+
+Every authenticated request (including each unread-count poll) used to run
+``User.query.get`` in ``load_user``. The loader now keeps a detached copy of
+each user's column values; a hit is attached to the request's session with
+``session.merge(..., load=False)``, which issues no SQL and still returns a
+normal session-bound ``User`` (so views can modify and commit it).
+
+Entries are dropped when a User update or delete is committed in this
+process, and the user-management/profile views also forget the user
+explicitly after committing. ``USER_CACHE_TTL`` (seconds, default 30) bounds
+how long other workers can serve a stale role or ``is_active`` flag;
+``USER_CACHE_SIZE`` (default 256) caps the number of users kept.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from . import db
+from .models import User
+
+logger = logging.getLogger("app.user_cache")
+
+DEFAULT_TTL_SECONDS = 30
+DEFAULT_MAX_SIZE = 256
+
+_SESSION_FLAG = "user_cache_dirty"
+
+_lock = threading.Lock()
+_entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+
+def _env_number(name: str, default):
+    try:
+        return type(default)(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _snapshot(user: User) -> User:
+    """Return a detached copy of ``user``'s loaded column values."""
+    copy = User(**{attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def load_cached_user(user_id: int) -> Optional[User]:
+    """Return the session-bound User for ``user_id``, using the cache when fresh."""
+    slot = (user_id, str(db.engine.url))
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(slot)
+        if entry is not None and now - entry[1] < _env_number("USER_CACHE_TTL", DEFAULT_TTL_SECONDS):
+            _entries.move_to_end(slot)
+            snapshot = entry[0]
+        else:
+            snapshot = None
+    if snapshot is not None:
+        return db.session.merge(snapshot, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    with _lock:
+        _entries[slot] = (_snapshot(user), now)
+        _entries.move_to_end(slot)
+        while len(_entries) > _env_number("USER_CACHE_SIZE", DEFAULT_MAX_SIZE):
+            _entries.popitem(last=False)
+    return user
+
+
+def forget_user(*user_ids: int) -> None:
+    """Drop cached entries for ``user_ids`` (every user when called without ids)."""
+    with _lock:
+        if user_ids:
+            for slot in [s for s in _entries if s[0] in user_ids]:
+                del _entries[slot]
+        else:
+            _entries.clear()
+
+
+def _mark_dirty(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_FLAG, set()).add(target.id)
+    else:
+        forget_user(target.id)
+
+
+event.listen(User, "after_update", _mark_dirty)
+event.listen(User, "after_delete", _mark_dirty)
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_after_commit(session):
+    user_ids = session.info.pop(_SESSION_FLAG, None)
+    if user_ids:
+        forget_user(*user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_FLAG, None)
@@ -7,6 +7,7 @@ from werkzeug.security import generate_password_hash
 from . import db
 from .decorators import super_admin_required
 from .models import User
+from .user_cache import forget_user
 
 user_management = Blueprint("user_management", __name__)
 
@@ -131,6 +132,7 @@ def edit_user(user_id):
                 user.is_active = is_active
 
                 db.session.commit()
+                forget_user(user.id)
                 flash(f"User {full_name} has been updated successfully!", "success")
                 return redirect(url_for("user_management.list_users"))
             except Exception:
@@ -164,6 +166,7 @@ def delete_user(user_id):
     try:
         db.session.delete(user)
         db.session.commit()
+        forget_user(user_id)
         flash(f"User {user.full_name} has been deleted successfully!", "success")
     except Exception:
         db.session.rollback()
@@ -188,6 +191,7 @@ def reset_password(user_id):
             # Use a supported scheme; 'sha256' can raise in newer Werkzeug versions
             user.password = generate_password_hash(new_password, method="pbkdf2:sha256")
             db.session.commit()
+            forget_user(user.id)
             flash(f"Password reset successfully for {user.full_name}!", "success")
         except Exception as e:
             db.session.rollback()
@@ -2,20 +2,25 @@ from flask import Blueprint, jsonify, render_template, request, session
 from flask_login import current_user, login_required
 
 from . import db, socketio
+from .business_day import business_today
+from .daily_stats import daily_totals, sum_between
+from .dashboard_stats import compute_dashboard_stats
 from .decorators import user_or_admin_required
 from .models import (
     Customer,
+    DailyStats,
     DashboardWidget,
     Expense,
     InventoryItem,
     Laundry,
-    LaundryStatusHistory,
     Service,
 )
-from .sms_service import sms_service
+from .sms_service import send_sms_notification
+from dataclasses import replace
 from datetime import datetime, timedelta
 
-from sqlalchemy import desc, func, text
+from sqlalchemy import desc, extract, func, text
+from sqlalchemy.orm import joinedload
 
 views = Blueprint("views", __name__)
 
@@ -191,8 +196,8 @@ def customer_analytics():
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 10, type=int)
 
-    # Default date range: last 90 days
-    today = datetime.utcnow().date()
+    # Default date range: last 90 business days
+    today = business_today()
     default_start = today - timedelta(days=89)
     try:
         start_date = datetime.strptime(start_str, "%Y-%m-%d").date() if start_str else default_start
@@ -209,16 +214,14 @@ def customer_analytics():
     active_customers = (
         db.session.query(Customer.id)
         .join(Laundry, Laundry.customer_id == Customer.id)
-        .filter(func.date(Laundry.date_received) >= (today - timedelta(days=29)))
+        .filter(Laundry.business_date >= today - timedelta(days=29))
         .distinct()
         .count()
     )
 
-    total_revenue = (
-        db.session.query(func.coalesce(func.sum(Laundry.price), 0))
-        .filter(Laundry.status == "Completed")
-        .scalar()
-        or 0
+    # Lifetime completed revenue from the DailyStats rollup
+    total_revenue = float(
+        db.session.query(func.coalesce(func.sum(DailyStats.revenue), 0)).scalar() or 0
     )
 
     avg_spend = round(float(total_revenue) / total_customers, 2) if total_customers else 0.0
@@ -244,84 +247,51 @@ def customer_analytics():
 
     top_customers = top_paged.items
 
-    # Prepare timeseries for customer growth (new customers by day)
-    # Query counts grouped by date_created
-    growth_rows = (
-        db.session.query(func.date(Customer.date_created).label("day"), func.count(Customer.id))
-        .filter(func.date(Customer.date_created) >= start_date, func.date(Customer.date_created) <= end_date)
-        .group_by(func.date(Customer.date_created))
-        .order_by(func.date(Customer.date_created))
-        .all()
-    )
+    # Prepare timeseries for customer growth (new customers by day, from the rollup)
+    growth_totals = daily_totals(start_date, end_date)
     # Build full list of dates
     delta = end_date - start_date
     dates = [(start_date + timedelta(days=i)).isoformat() for i in range(delta.days + 1)]
-    growth_map = {str(d): c for d, c in growth_rows}
+    growth_map = {d.isoformat(): row["new_customers"] for d, row in growth_totals.items()}
     growth_series = [int(growth_map.get(d, 0)) for d in dates]
 
-    # Basic monthly cohorts (by first laundry date) -> retention over subsequent months
-    # We'll compute cohorts by month of first laundry and retention for next 3 months
+    # Basic monthly cohorts (by first laundry business day) -> retention over subsequent months
+    # We'll compute cohorts by month of first laundry and retention for next 3 months.
+    # business_date is a stored DATE, so extract() works the same on every dialect.
     cohort_sql = (
-        db.session.query(Customer.id, func.min(func.date(Laundry.date_received)).label("first_date"))
-        .join(Laundry)
-        .group_by(Customer.id)
+        db.session.query(
+            Laundry.customer_id.label("id"),
+            func.min(Laundry.business_date).label("first_date"),
+        )
+        .filter(Laundry.business_date.isnot(None))
+        .group_by(Laundry.customer_id)
         .subquery()
     )
 
-    # Cohort query: use DB-specific date formatting functions (
-    # SQLite: strftime, MySQL/MariaDB: date_format). If the dialect
-    # doesn't support either, skip cohort computation gracefully.
     cohort_rows = []
     try:
-        dialect_name = getattr(db.session.get_bind(), "dialect").name
-    except Exception:
-        try:
-            dialect_name = db.engine.dialect.name
-        except Exception:
-            dialect_name = None
-
-    try:
-        if dialect_name == "sqlite":
-            cohort_rows = (
-                db.session.query(
-                    func.strftime("%Y-%m", cohort_sql.c.first_date).label("cohort_month"),
-                    func.strftime("%Y-%m", Laundry.date_received).label("activity_month"),
-                    func.count(func.distinct(Laundry.customer_id)).label("count"),
-                )
-                .select_from(cohort_sql)
-                .join(Laundry, Laundry.customer_id == cohort_sql.c.id)
-                .group_by("cohort_month", "activity_month")
-                .all()
+        month_rows = (
+            db.session.query(
+                extract("year", cohort_sql.c.first_date),
+                extract("month", cohort_sql.c.first_date),
+                extract("year", Laundry.business_date),
+                extract("month", Laundry.business_date),
+                func.count(func.distinct(Laundry.customer_id)),
             )
-        elif dialect_name in ("mysql", "mariadb"):
-            cohort_rows = (
-                db.session.query(
-                    func.date_format(cohort_sql.c.first_date, "%%Y-%%m").label("cohort_month"),
-                    func.date_format(Laundry.date_received, "%%Y-%%m").label("activity_month"),
-                    func.count(func.distinct(Laundry.customer_id)).label("count"),
-                )
-                .select_from(cohort_sql)
-                .join(Laundry, Laundry.customer_id == cohort_sql.c.id)
-                .group_by("cohort_month", "activity_month")
-                .all()
+            .select_from(cohort_sql)
+            .join(Laundry, Laundry.customer_id == cohort_sql.c.id)
+            .group_by(
+                extract("year", cohort_sql.c.first_date),
+                extract("month", cohort_sql.c.first_date),
+                extract("year", Laundry.business_date),
+                extract("month", Laundry.business_date),
             )
-        else:
-            # Unknown dialect: attempt generic SQL by casting to text and truncating
-            # May not be supported on all DBs; wrap in try/except to avoid crashing.
-            try:
-                cohort_rows = (
-                    db.session.query(
-                        func.substr(func.cast(cohort_sql.c.first_date, db.String), 1, 7).label("cohort_month"),
-                        func.substr(func.cast(Laundry.date_received, db.String), 1, 7).label("activity_month"),
-                        func.count(func.distinct(Laundry.customer_id)).label("count"),
-                    )
-                    .select_from(cohort_sql)
-                    .join(Laundry, Laundry.customer_id == cohort_sql.c.id)
-                    .group_by("cohort_month", "activity_month")
-                    .all()
-                )
-            except Exception:
-                cohort_rows = []
+            .all()
+        )
+        cohort_rows = [
+            (f"{int(cy):04d}-{int(cm):02d}", f"{int(ay):04d}-{int(am):02d}", count)
+            for cy, cm, ay, am, count in month_rows
+        ]
     except Exception:
         # Any unexpected error: skip cohorts to keep the route working
         cohort_rows = []
@@ -399,7 +369,7 @@ def push_notification():
 @login_required
 def daily_calendar():
     # Get current month and year
-    today = datetime.today()
+    today = business_today()
     year = request.args.get("year", today.year, type=int)
     month = request.args.get("month", today.month, type=int)
 
@@ -409,42 +379,16 @@ def daily_calendar():
         next_month_dt = datetime(year + 1, 1, 1)
     else:
         next_month_dt = datetime(year, month + 1, 1)
-    _last_day = next_month_dt - timedelta(days=1)
-
-    # Query daily laundry totals
-    daily_totals = (
-        db.session.query(
-            func.date(Laundry.date_received).label("day"),
-            func.count(Laundry.laundry_id).label("total"),
-        )
-        .filter(
-            Laundry.date_received >= first_day, Laundry.date_received < next_month_dt
-        )
-        .group_by(func.date(Laundry.date_received))
-        .all()
-    )
-
-    # Build a dict for easy lookup
-    totals_by_day = {str(day): total for day, total in daily_totals}
-
-    # Query daily earnings (sum of prices) for the month.
-    # Assumption: earnings are counted for laundries received on the date and
-    # with statuses that indicate they contributed revenue (Completed, Ready for Pickup, Picked Up).
-    daily_earnings = (
-        db.session.query(
-            func.date(Laundry.date_received).label("day"),
-            func.coalesce(func.sum(Laundry.price), 0).label("earn"),
-        )
-        .filter(
-            Laundry.date_received >= first_day,
-            Laundry.date_received < next_month_dt,
-            Laundry.status.in_(["Completed", "Ready for Pickup", "Picked Up"]),
-        )
-        .group_by(func.date(Laundry.date_received))
-        .all()
-    )
+    last_day = next_month_dt - timedelta(days=1)
 
-    earnings_by_day = {str(day): float(earn or 0) for day, earn in daily_earnings}
+    # Received counts and completed revenue per day come from the rollup
+    month_totals = daily_totals(first_day.date(), last_day.date())
+    totals_by_day = {
+        day.isoformat(): row["received_count"] for day, row in month_totals.items()
+    }
+    earnings_by_day = {
+        day.isoformat(): row["revenue"] for day, row in month_totals.items()
+    }
 
     # Prepare calendar grid
     import calendar
@@ -586,38 +530,15 @@ def get_user_dashboard_config(user_id):
 @views.route("/")
 @login_required
 def dashboard():
-    today = datetime.now().date()
-    # Calculate today's earned amount for statuses Received, Ready to Pickup, Completed
-    today_earned_all_status = (
-        db.session.query(func.sum(Laundry.price))
-        .filter(
-            func.date(Laundry.date_updated) == today,
-            Laundry.status.in_(["Received", "Ready for Pickup", "Completed"]),
-        )
-        .scalar()
-        or 0
+    today = business_today()
+    # All numeric KPIs come from a handful of conditional-aggregate queries
+    stats = compute_dashboard_stats(
+        today=today, include_inventory=current_user.is_admin()
     )
-    # Count laundries with status 'Ready for Pickup' (all, no date filter)
-    ready_pickup_count = Laundry.query.filter_by(status="Ready for Pickup").count()
-    # Count laundries with status 'Received' for new dashboard card
-    received_laundries_count = Laundry.query.filter_by(status="Received").count()
-    # Count laundries with status 'Pending' and 'Received' for dashboard cards
-    pending_since_beginning = Laundry.query.filter_by(status="Pending").count()
-    active_laundries_received_status = Laundry.query.filter_by(
-        status="Received"
-    ).count()
-    # Total laundries with status 'Received' (since beginning)
-    _received_since_beginning = Laundry.query.filter_by(status="Received").count()
-    # Calculate today's earnings (visible to all users)
-    # Definition: sum of prices for orders whose status transitioned to 'Completed' or 'Picked Up' today
-    today = datetime.now().date()
-    # Active laundries received today (not completed or picked up)
-    active_laundries_received_today = Laundry.query.filter(
-        func.date(Laundry.date_received) == today,
-        ~Laundry.status.in_(["Completed", "Picked Up"]),
-    ).count()
-    # Active laundries pending since the beginning (never updated from 'Pending')
-    pending_since_beginning = Laundry.query.filter_by(status="Pending").count()
+    if not current_user.is_manager():
+        # Basic users do not see financial figures
+        stats = replace(stats, total_revenue=0.0, estimated_revenue=0.0)
+
     # Get user's customized dashboard widgets based on role
     user_widgets = get_user_dashboard_config(current_user.id)
 
@@ -654,180 +575,25 @@ def dashboard():
         dashboard_data["weather_today"] = "Weather unavailable"
         dashboard_data["weather_icon"] = ""
 
-    # Common data for all users
-    # Treat 'Picked Up' as completed/not active as well
-    active_laundries = Laundry.query.filter(
-        ~Laundry.status.in_(["Completed", "Picked Up"])
-    ).count()
-    completed_laundries = Laundry.query.filter_by(status="Completed").count()
-    # Services: track both total and active for utilization
-    total_services = Service.query.count()
-    active_services = Service.query.filter_by(is_active=True).count()
-
-    # Recent laundries (limit view to 6) - available to all users
+    # Recent laundries (limit view to 6) - available to all users.
+    # Eager-load the customer/service shown on each row to avoid N+1 lookups.
     RECENT_LIMIT = 6
     recent_laundries = (
-        Laundry.query.order_by(Laundry.date_received.desc()).limit(RECENT_LIMIT).all()
-    )
-    total_laundries_count = Laundry.query.count()
-    recent_laundries_more = max(0, total_laundries_count - RECENT_LIMIT)
-
-    # Calculate today's earnings (visible to all users)
-    # Definition: sum of prices for orders whose status transitioned to 'Completed' or 'Picked Up' today
-    today = datetime.now().date()
-    completed_today_subq = (
-        db.session.query(LaundryStatusHistory.laundry_id)
-        .filter(
-            LaundryStatusHistory.new_status.in_(["Completed", "Ready for Pickup"]),
-            func.date(LaundryStatusHistory.changed_at) == today,
-        )
-        .subquery()
-    )
-    today_earnings = (
-        db.session.query(func.sum(Laundry.price))
-        .filter(Laundry.laundry_id.in_(completed_today_subq))
-        .scalar()
-        or 0
-    )
-
-    # Count of orders completed today (via status history), includes 'Picked Up'
-    completed_today = (
-        db.session.query(func.count(func.distinct(LaundryStatusHistory.laundry_id)))
-        .filter(
-            LaundryStatusHistory.new_status.in_(["Completed", "Ready for Pickup"]),
-            func.date(LaundryStatusHistory.changed_at) == today,
-        )
-        .scalar()
-        or 0
-    )
-
-    # Calculate laundries received today
-    received_today = Laundry.query.filter(
-        func.date(Laundry.date_received) == today
-    ).count()
-
-    # Add common data to dashboard_data
-    dashboard_data.update(
-        {
-            "pending_since_beginning": pending_since_beginning,
-            "active_laundries": active_laundries,
-            "active_laundries_received_status": active_laundries_received_status,
-            "active_laundries_received_today": active_laundries_received_today,
-            "received_laundries_count": received_laundries_count,
-            "ready_pickup_count": ready_pickup_count,
-            "today_earned_all_status": today_earned_all_status,
-            "completed_laundries": completed_laundries,
-            "total_services": total_services,
-            "active_services": active_services,
-            "recent_laundries": recent_laundries,
-            "recent_laundries_more": recent_laundries_more,
-            "today_earnings": today_earnings,
-            "completed_today": completed_today,
-            "received_today": received_today,
-        }
-    )
-    # Quick performance metrics (last 7 days)
-    now = datetime.utcnow()
-    seven_days_ago = now - timedelta(days=7)
-    fourteen_days_ago = now - timedelta(days=14)
-
-    # New customers last 7 days and previous 7 days for growth
-    new_customers_7d = Customer.query.filter(
-        Customer.date_created >= seven_days_ago
-    ).count()
-    prev_customers_7d = Customer.query.filter(
-        Customer.date_created >= fourteen_days_ago,
-        Customer.date_created < seven_days_ago,
-    ).count()
-    if prev_customers_7d > 0:
-        customer_growth_percent = round(
-            ((new_customers_7d - prev_customers_7d) / prev_customers_7d) * 100
-        )
-    else:
-        customer_growth_percent = 100 if new_customers_7d > 0 else 0
-
-    laundries_7d_total = Laundry.query.filter(
-        Laundry.date_received >= seven_days_ago
-    ).count()
-    laundries_7d_completed = Laundry.query.filter(
-        Laundry.date_received >= seven_days_ago, Laundry.status == "Completed"
-    ).count()
-    completion_rate_7d = (
-        round((laundries_7d_completed / laundries_7d_total) * 100)
-        if laundries_7d_total > 0
-        else 0
-    )
-
-    # Capacity percent for visualization (assumes 50 as nominal capacity)
-    capacity_percent = (
-        round(min(100, (active_laundries / 50) * 100))
-        if active_laundries is not None
-        else 0
-    )
-
-    # Service utilization (active vs total defined services)
-    service_utilization_percent = (
-        round((active_services / total_services) * 100) if total_services > 0 else 0
-    )
-
-    # Business health score based on recent performance and utilization
-    # Weighted blend: completion rate (40%), customer growth (30%), service utilization (30%)
-    def clamp(v, lo=0, hi=100):
-        return max(lo, min(hi, v))
-
-    business_health_score = clamp(
-        round(
-            0.4 * clamp(completion_rate_7d)
-            + 0.3 * clamp(customer_growth_percent)
-            + 0.3 * clamp(service_utilization_percent)
-        )
-    )
-
-    # Get laundries completed or ready for pickup today by status change date
-    completed_today_laundry_rows = (
-        db.session.query(LaundryStatusHistory.laundry_id)
-        .filter(
-            LaundryStatusHistory.new_status.in_(["Completed", "Ready for Pickup"]),
-            func.date(LaundryStatusHistory.changed_at) == today,
-        )
-        .distinct()
+        Laundry.query.options(joinedload(Laundry.customer), joinedload(Laundry.service))
+        .order_by(Laundry.date_received.desc())
+        .limit(RECENT_LIMIT)
         .all()
     )
-    completed_today_laundry_ids = [
-        row.laundry_id for row in completed_today_laundry_rows
-    ]
-    _completed_today_laundries = Laundry.query.filter(
-        Laundry.laundry_id.in_(completed_today_laundry_ids)
-    ).all()
     dashboard_data.update(
         {
-            "new_customers_7d": new_customers_7d,
-            "customer_growth_percent": customer_growth_percent,
-            "completion_rate_7d": completion_rate_7d,
-            "capacity_percent": capacity_percent,
-            "service_utilization_percent": service_utilization_percent,
-            "business_health_score": business_health_score,
+            "recent_laundries": recent_laundries,
+            "recent_laundries_more": max(0, stats.total_laundries - RECENT_LIMIT),
         }
     )
 
     # Role-based data access
-    if current_user.is_admin():
-        # Full admin access - all data including financial and system info
-        total_customers = Customer.query.count()
-        total_revenue = (
-            db.session.query(func.sum(Laundry.price))
-            .filter(Laundry.status.in_(["Completed", "Ready for Pickup"]))
-            .scalar()
-            or 0
-        )
-        estimated_revenue = (
-            db.session.query(func.sum(Laundry.price))
-            .filter(~Laundry.status.in_(["Completed", "Ready for Pickup"]))
-            .scalar()
-            or 0
-        )
-
-        # Popular services (admin only)
+    if current_user.is_manager():
+        # Popular services (managers and admins)
         popular_services = (
             db.session.query(Service.name, func.count(Laundry.id).label("count"))
             .join(Service.laundries)
@@ -836,81 +602,28 @@ def dashboard():
             .limit(5)
             .all()
         )
+        dashboard_data["popular_services"] = popular_services
+    else:
+        dashboard_data["popular_services"] = []
 
+    if current_user.is_admin():
         # Recent expenses (admin only) limited to 6 for professional compact view
         recent_expenses = (
-            Expense.query.order_by(Expense.expense_date.desc())
+            Expense.query.options(joinedload(Expense.category))
+            .order_by(Expense.expense_date.desc())
             .limit(RECENT_LIMIT)
             .all()
         )
         total_expenses_count = Expense.query.count()
-        recent_expenses_more = max(0, total_expenses_count - RECENT_LIMIT)
-
-        # Add admin-specific data
-        dashboard_data.update(
-            {
-                "total_customers": total_customers,
-                "total_revenue": total_revenue,
-                "estimated_revenue": estimated_revenue,
-                "popular_services": popular_services,
-                "recent_expenses": recent_expenses,
-                "recent_expenses_more": recent_expenses_more,
-            }
-        )
-    elif current_user.is_manager():
-        # Manager access - operational data and reports but limited financial access
-        total_customers = Customer.query.count()
-        total_revenue = (
-            db.session.query(func.sum(Laundry.price))
-            .filter(Laundry.status.in_(["Completed", "Ready for Pickup"]))
-            .scalar()
-            or 0
-        )
-        estimated_revenue = (
-            db.session.query(func.sum(Laundry.price))
-            .filter(~Laundry.status.in_(["Completed", "Ready for Pickup"]))
-            .scalar()
-            or 0
-        )
-
-        # Popular services (manager access)
-        popular_services = (
-            db.session.query(Service.name, func.count(Laundry.id).label("count"))
-            .join(Service.laundries)
-            .group_by(Service.id)
-            .order_by(desc("count"))
-            .limit(5)
-            .all()
-        )
-
-        # Recent expenses limited for managers (no sensitive financial data)
-        recent_expenses = []
-        recent_expenses_more = 0
-
-        # Add manager-specific data
         dashboard_data.update(
             {
-                "total_customers": total_customers,
-                "total_revenue": total_revenue,
-                "estimated_revenue": estimated_revenue,
-                "popular_services": popular_services,
                 "recent_expenses": recent_expenses,
-                "recent_expenses_more": recent_expenses_more,
+                "recent_expenses_more": max(0, total_expenses_count - RECENT_LIMIT),
             }
         )
     else:
-        # User access - show total customers, hide financials
-        total_customers = Customer.query.count()
-        dashboard_data.update(
-            {
-                "total_customers": total_customers,
-                "total_revenue": 0,
-                "estimated_revenue": 0,
-                "popular_services": [],
-                "recent_expenses": [],
-                "recent_expenses_more": 0,
-            }
-        )
+        # Managers and users do not see expense data
+        dashboard_data.update({"recent_expenses": [], "recent_expenses_more": 0})
 
     # Get all active services for pricing display (available to all users)
     all_services = (
@@ -922,49 +635,18 @@ def dashboard():
 
     # Admin-only statistics and charts
     if current_user.is_admin():
-        # Get inventory statistics (admin only)
-        total_inventory_items = InventoryItem.query.filter_by(is_active=True).count()
+        # Low-stock list for the alert panel; out-of-stock items are the
+        # subset with nothing left on the shelf.
         low_stock_items = InventoryItem.query.filter(
             InventoryItem.current_stock <= InventoryItem.minimum_stock,  # type: ignore
             InventoryItem.is_active,  # type: ignore
         ).all()
-        out_of_stock_items = InventoryItem.query.filter(
-            InventoryItem.current_stock <= 0,  # type: ignore
-            InventoryItem.is_active,  # type: ignore
-        ).all()
+        out_of_stock_items = [i for i in low_stock_items if i.current_stock <= 0]
 
-        # Calculate total inventory value
-        total_inventory_value = (
-            db.session.query(
-                func.sum(InventoryItem.current_stock * InventoryItem.cost_per_unit)
-            )
-            .filter(InventoryItem.is_active)
-            .scalar()
-            or 0
-        )  # type: ignore
-
-        # Additional stats for charts
-        pending_laundries = Laundry.query.filter_by(status="Pending").count()
-        in_progress_laundries = Laundry.query.filter_by(status="In Progress").count()
-        picked_up_laundries = Laundry.query.filter_by(status="Picked Up").count()
-
-        # Service type counts
-        wash_only_services = Service.query.filter(
-            Service.category == "Standard"
-        ).count()
-        dry_only_services = Service.query.filter(Service.category == "Express").count()
-        wash_dry_services = Service.query.filter(Service.category == "Premium").count()
-
-        # Add admin-specific data to dashboard_data
         dashboard_data.update(
             {
-                "total_inventory_items": total_inventory_items,
                 "low_stock_items": low_stock_items,
                 "out_of_stock_items": out_of_stock_items,
-                "total_inventory_value": total_inventory_value,
-                "pending_laundries": pending_laundries,
-                "in_progress_laundries": in_progress_laundries,
-                "picked_up_laundries": picked_up_laundries,
             }
         )
 
@@ -973,47 +655,51 @@ def dashboard():
             "revenue": {
                 "labels": ["Jan", "Feb", "Mar", "Apr", "May", "Jun"],
                 "data": [
-                    round(dashboard_data["total_revenue"] * 0.6, 2),
-                    round(dashboard_data["total_revenue"] * 0.7, 2),
-                    round(dashboard_data["total_revenue"] * 0.8, 2),
-                    round(dashboard_data["total_revenue"] * 0.9, 2),
-                    round(dashboard_data["total_revenue"] * 0.95, 2),
-                    round(dashboard_data["total_revenue"], 2),
+                    round(stats.total_revenue * 0.6, 2),
+                    round(stats.total_revenue * 0.7, 2),
+                    round(stats.total_revenue * 0.8, 2),
+                    round(stats.total_revenue * 0.9, 2),
+                    round(stats.total_revenue * 0.95, 2),
+                    round(stats.total_revenue, 2),
                 ],
             },
             "services": {
                 "labels": ["Standard", "Express", "Premium", "Other"],
                 "data": [
-                    wash_only_services,
-                    dry_only_services,
-                    wash_dry_services,
+                    stats.standard_services,
+                    stats.express_services,
+                    stats.premium_services,
                     max(
                         0,
-                        dashboard_data["total_services"]
-                        - (wash_only_services + dry_only_services + wash_dry_services),
+                        stats.total_services
+                        - (
+                            stats.standard_services
+                            + stats.express_services
+                            + stats.premium_services
+                        ),
                     ),
                 ],
             },
             "status": {
                 "labels": ["Pending", "In Progress", "Completed", "Picked Up"],
                 "data": [
-                    pending_laundries,
-                    in_progress_laundries,
-                    dashboard_data["completed_laundries"],
-                    picked_up_laundries,
+                    stats.pending_laundries,
+                    stats.in_progress_laundries,
+                    stats.completed_laundries,
+                    stats.picked_up_laundries,
                 ],
             },
             "inventory": {
                 "labels": ["Total Items", "Low Stock", "Out of Stock", "Healthy Stock"],
                 "data": [
-                    total_inventory_items,
-                    len(low_stock_items),
-                    len(out_of_stock_items),
+                    stats.total_inventory_items,
+                    stats.low_stock_count,
+                    stats.out_of_stock_count,
                     max(
                         0,
-                        total_inventory_items
-                        - len(low_stock_items)
-                        - len(out_of_stock_items),
+                        stats.total_inventory_items
+                        - stats.low_stock_count
+                        - stats.out_of_stock_count,
                     ),
                 ],
             },
@@ -1023,10 +709,8 @@ def dashboard():
         # Regular users get simplified chart data
         dashboard_data.update(
             {
-                "total_inventory_items": 0,
                 "low_stock_items": [],
                 "out_of_stock_items": [],
-                "total_inventory_value": 0,
                 "chart_data": {},
             }
         )
@@ -1037,6 +721,7 @@ def dashboard():
         "user_widgets": user_widgets,
         "datetime": datetime,  # Add datetime for template use
         "today": today,
+        "stats": stats,
         **dashboard_data,  # Unpack all dashboard data
     }
 
@@ -1055,12 +740,9 @@ def charts():
     ).count()
     completed_laundries = Laundry.query.filter_by(status="Completed").count()
 
-    # Calculate real revenue from completed laundries
+    # Lifetime completed revenue from the DailyStats rollup
     total_revenue = (
-        db.session.query(func.sum(Laundry.price))
-        .filter(Laundry.status == "Completed")
-        .scalar()
-        or 0
+        db.session.query(func.coalesce(func.sum(DailyStats.revenue), 0)).scalar() or 0
     )
 
     # Get popular services data
@@ -1098,23 +780,34 @@ def charts():
         or 0
     )
 
-    # Replace heavy graph construction with compact trend metrics.
-    # Trends summarize recent activity (7d, 30d) and compare to the previous window.
+    # Trends and the daily/weekly/monthly series read the DailyStats rollup:
+    # one range query covering the longest window (12 months), summed in Python.
+    today = business_today()
+    months_back = 12
+
+    # Helper to move months without external deps
+    def add_months(y: int, m: int, delta: int) -> tuple[int, int]:
+        total = y * 12 + (m - 1) + delta
+        ny = total // 12
+        nm = total % 12 + 1
+        return ny, nm
+
+    sy, sm = add_months(today.year, today.month, -(months_back - 1))
+    start_month_date = datetime(sy, sm, 1).date()
     try:
-        today = datetime.utcnow().date()
+        rollup = daily_totals(min(start_month_date, today - timedelta(days=59)), today)
+    except Exception:
+        rollup = {}
 
+    # Compact trend metrics: recent activity (7d, 30d) compared to the previous window.
+    try:
         # 7-day window (last 7 days) and previous 7-day window
         last_7_start = today - timedelta(days=6)
         prev_7_start = last_7_start - timedelta(days=7)
         prev_7_end = last_7_start - timedelta(days=1)
 
-        last_7_count = Laundry.query.filter(
-            func.date(Laundry.date_received) >= last_7_start
-        ).count()
-        prev_7_count = Laundry.query.filter(
-            func.date(Laundry.date_received) >= prev_7_start,
-            func.date(Laundry.date_received) <= prev_7_end,
-        ).count()
+        last_7_count = sum_between(rollup, last_7_start, today, "received_count")
+        prev_7_count = sum_between(rollup, prev_7_start, prev_7_end, "received_count")
         if prev_7_count > 0:
             pct_change_7 = round(
                 ((last_7_count - prev_7_count) / prev_7_count) * 100, 1
@@ -1127,21 +820,8 @@ def charts():
         prev_30_start = last_30_start - timedelta(days=30)
         prev_30_end = last_30_start - timedelta(days=1)
 
-        revenue_last_30 = (
-            db.session.query(func.coalesce(func.sum(Laundry.price), 0))
-            .filter(func.date(Laundry.date_received) >= last_30_start)
-            .scalar()
-            or 0
-        )
-        revenue_prev_30 = (
-            db.session.query(func.coalesce(func.sum(Laundry.price), 0))
-            .filter(
-                func.date(Laundry.date_received) >= prev_30_start,
-                func.date(Laundry.date_received) <= prev_30_end,
-            )
-            .scalar()
-            or 0
-        )
+        revenue_last_30 = sum_between(rollup, last_30_start, today, "revenue")
+        revenue_prev_30 = sum_between(rollup, prev_30_start, prev_30_end, "revenue")
         if revenue_prev_30 > 0:
             pct_change_revenue_30 = round(
                 ((revenue_last_30 - revenue_prev_30) / revenue_prev_30) * 100, 1
@@ -1149,34 +829,16 @@ def charts():
         else:
             pct_change_revenue_30 = 100.0 if revenue_last_30 > 0 else 0.0
 
-        # 30-day completion rate (Completed / total received)
-        completed_last_30 = Laundry.query.filter(
-            func.date(Laundry.date_received) >= last_30_start,
-            Laundry.status == "Completed",
-        ).count()
-        total_last_30 = Laundry.query.filter(
-            func.date(Laundry.date_received) >= last_30_start
-        ).count()
-        completion_rate_30 = (
-            round((completed_last_30 / total_last_30) * 100, 1)
-            if total_last_30 > 0
-            else 0.0
-        )
+        # 30-day completion rate (completed / received in the window, capped at 100%)
+        def completion_rate(start, end):
+            received = sum_between(rollup, start, end, "received_count")
+            completed = sum_between(rollup, start, end, "completed_count")
+            if received <= 0:
+                return 0.0
+            return round(min(100.0, (completed / received) * 100), 1)
 
-        completed_prev_30 = Laundry.query.filter(
-            func.date(Laundry.date_received) >= prev_30_start,
-            func.date(Laundry.date_received) <= prev_30_end,
-            Laundry.status == "Completed",
-        ).count()
-        total_prev_30 = Laundry.query.filter(
-            func.date(Laundry.date_received) >= prev_30_start,
-            func.date(Laundry.date_received) <= prev_30_end,
-        ).count()
-        completion_prev_rate_30 = (
-            round((completed_prev_30 / total_prev_30) * 100, 1)
-            if total_prev_30 > 0
-            else 0.0
-        )
+        completion_rate_30 = completion_rate(last_30_start, today)
+        completion_prev_rate_30 = completion_rate(prev_30_start, prev_30_end)
         if completion_prev_rate_30 > 0:
             pct_change_completion_30 = round(
                 (
@@ -1215,199 +877,45 @@ def charts():
             "trends": {"laundries_7d": {}, "revenue_30d": {}, "completion_rate_30d": {}}
         }
 
-    # Real transactions and earnings analytics
+    # Transactions (orders received) and earnings (completed revenue) series
     try:
         from collections import defaultdict
-        from datetime import date as _date
-
-        today = _date.today()
-
-        # Helper: build a price map for a set of laundry_ids
-        def build_price_map(laundry_ids: set[str]) -> dict[str, float]:
-            if not laundry_ids:
-                return {}
-            rows = Laundry.query.filter(Laundry.laundry_id.in_(list(laundry_ids))).all()
-            return {row.laundry_id: float((row.price or 0.0)) for row in rows}
 
-        # Daily (last 7 days) using Python aggregation for portability
+        # Daily (last 7 days)
         days_back = 7
         start_daily = today - timedelta(days=days_back - 1)
-        daily_hist = (
-            db.session.query(
-                func.date(LaundryStatusHistory.changed_at).label("day"),
-                LaundryStatusHistory.laundry_id,
-            )
-            .filter(
-        LaundryStatusHistory.new_status.in_(["Completed", "Picked Up", "Received"]),
-                func.date(LaundryStatusHistory.changed_at) >= start_daily,
-                func.date(LaundryStatusHistory.changed_at) <= today,
-            )
-            .all()
-        )
-
-        # Aggregate by day with distinct laundries per day
-        daily_ids_by_day: dict[str, set[str]] = defaultdict(set)
-        daily_hist_ids_window: set[str] = set()
-        for day_val, lid in daily_hist:
-            key = str(day_val)
-            daily_ids_by_day[key].add(lid)
-            daily_hist_ids_window.add(lid)
-
-        # Fallback: include laundries with status Completed/Picked Up by date_updated if missing in history
-        daily_fallback_rows = (
-            Laundry.query.with_entities(
-                func.date(Laundry.date_updated).label("day"), Laundry.laundry_id
-            )
-            .filter(
-                Laundry.status.in_(["Completed", "Picked Up", "Received"]),
-                func.date(Laundry.date_updated) >= start_daily,
-                func.date(Laundry.date_updated) <= today,
-            )
-            .all()
-        )
-        for fday, flid in daily_fallback_rows:
-            if flid not in daily_hist_ids_window:
-                key = str(fday)
-                daily_ids_by_day[key].add(flid)
-
-        # Build price map for all laundries appearing in window
-        all_daily_ids: set[str] = set()
-        for s in daily_ids_by_day.values():
-            all_daily_ids.update(s)
-        price_map_daily = build_price_map(all_daily_ids)
-
         daily_labels: list[str] = []
         daily_counts: list[int] = []
         daily_earnings: list[float] = []
         for i in range(days_back):
             d = start_daily + timedelta(days=i)
-            key = d.isoformat()
+            row = rollup.get(d, {})
             daily_labels.append(d.strftime("%b %d"))
-            lids = daily_ids_by_day.get(key, set())
-            daily_counts.append(len(lids))
-            revenue = sum(price_map_daily.get(lx, 0.0) for lx in lids)
-            daily_earnings.append(round(revenue, 2))
+            daily_counts.append(row.get("received_count", 0))
+            daily_earnings.append(round(row.get("revenue", 0.0), 2))
 
-        # Weekly (last 6 weeks) - aggregate in Python for cross-DB compatibility
+        # Weekly (last 6 ISO weeks, starting Monday)
         weeks_back = 6
-        start_weekly = today - timedelta(
-            weeks=weeks_back - 1, days=today.weekday()
-        )  # start of week (Mon)
-        weekly_histories = (
-            db.session.query(
-                LaundryStatusHistory.laundry_id, LaundryStatusHistory.changed_at
-            )
-            .filter(
-        LaundryStatusHistory.new_status.in_(["Completed", "Picked Up", "Received"]),
-                func.date(LaundryStatusHistory.changed_at) >= start_weekly,
-                func.date(LaundryStatusHistory.changed_at) <= today,
-            )
-            .all()
-        )
-
-        weekly_counts_map: dict[str, int] = defaultdict(int)
-        weekly_ids_map: dict[str, set[str]] = defaultdict(set)
-        weekly_hist_ids_window: set[str] = set()
-        for lid, changed_at in weekly_histories:
-            week_year, week_num, _ = changed_at.isocalendar()
-            key = f"{week_year}-W{week_num:02d}"
-            if lid not in weekly_ids_map[key]:
-                weekly_ids_map[key].add(lid)
-                weekly_counts_map[key] += 1
-                weekly_hist_ids_window.add(lid)
-
-        # Fallback: add laundries using date_updated week if not present in history
-        weekly_fallback_rows = (
-            Laundry.query.with_entities(Laundry.laundry_id, Laundry.date_updated)
-            .filter(
-                Laundry.status.in_(["Completed", "Picked Up", "Received"]),
-                func.date(Laundry.date_updated) >= start_weekly,
-                func.date(Laundry.date_updated) <= today,
-            )
-            .all()
-        )
-        for lid, upd in weekly_fallback_rows:
-            if lid in weekly_hist_ids_window:
-                continue
-            wy, wn, _ = upd.isocalendar()
-            key = f"{wy}-W{wn:02d}"
-            if lid not in weekly_ids_map[key]:
-                weekly_ids_map[key].add(lid)
-                weekly_counts_map[key] += 1
-
-        # Build price map for all weekly ids
-        all_weekly_ids: set[str] = set()
-        for s in weekly_ids_map.values():
-            all_weekly_ids.update(s)
-        price_map_weekly = build_price_map(all_weekly_ids)
-
+        start_weekly = today - timedelta(weeks=weeks_back - 1, days=today.weekday())
         weekly_labels: list[str] = []
         weekly_counts: list[int] = []
         weekly_earnings: list[float] = []
         cur = start_weekly
         for _ in range(weeks_back):
             wy, wn, _ = cur.isocalendar()
-            label = f"{wy}-W{wn:02d}"
-            weekly_labels.append(label)
-            lids = weekly_ids_map.get(label, set())
-            weekly_counts.append(len(lids))
-            revenue = sum(price_map_weekly.get(lx, 0.0) for lx in lids)
-            weekly_earnings.append(round(revenue, 2))
+            week_end = cur + timedelta(days=6)
+            weekly_labels.append(f"{wy}-W{wn:02d}")
+            weekly_counts.append(sum_between(rollup, cur, week_end, "received_count"))
+            weekly_earnings.append(round(sum_between(rollup, cur, week_end, "revenue"), 2))
             cur = cur + timedelta(weeks=1)
 
-        # Monthly (last 12 months) - aggregate in Python
-        months_back = 12
-
-        # Helper to move months without external deps
-        def add_months(y: int, m: int, delta: int) -> tuple[int, int]:
-            total = y * 12 + (m - 1) + delta
-            ny = total // 12
-            nm = total % 12 + 1
-            return ny, nm
-
-        sy, sm = add_months(today.year, today.month, -(months_back - 1))
-        start_month_date = datetime(sy, sm, 1).date()
-
-        monthly_histories = (
-            db.session.query(
-                LaundryStatusHistory.laundry_id, LaundryStatusHistory.changed_at
-            )
-            .filter(
-                LaundryStatusHistory.new_status.in_(["Completed", "Picked Up", "Received"]),
-                func.date(LaundryStatusHistory.changed_at) >= start_month_date,
-                func.date(LaundryStatusHistory.changed_at) <= today,
-            )
-            .all()
-        )
-
-        monthly_ids_map: dict[str, set[str]] = defaultdict(set)
-        monthly_hist_ids_window: set[str] = set()
-        for lid, changed_at in monthly_histories:
-            key = changed_at.strftime("%Y-%m")
-            monthly_ids_map[key].add(lid)
-            monthly_hist_ids_window.add(lid)
-
-        # Fallback: use Laundry.date_updated month if not present in history
-        monthly_fallback_rows = (
-            Laundry.query.with_entities(Laundry.laundry_id, Laundry.date_updated)
-            .filter(
-                Laundry.status.in_(["Completed", "Picked Up", "Received"]),
-                func.date(Laundry.date_updated) >= start_month_date,
-                func.date(Laundry.date_updated) <= today,
-            )
-            .all()
-        )
-        for lid, upd in monthly_fallback_rows:
-            if lid in monthly_hist_ids_window:
-                continue
-            key = upd.strftime("%Y-%m")
-            monthly_ids_map[key].add(lid)
-
-        # Build price map for all monthly ids
-        all_monthly_ids: set[str] = set()
-        for s in monthly_ids_map.values():
-            all_monthly_ids.update(s)
-        price_map_monthly = build_price_map(all_monthly_ids)
+        # Monthly (last 12 months)
+        monthly_count_map: dict[str, int] = defaultdict(int)
+        monthly_earning_map: dict[str, float] = defaultdict(float)
+        for d, row in rollup.items():
+            key = d.strftime("%Y-%m")
+            monthly_count_map[key] += row["received_count"]
+            monthly_earning_map[key] += row["revenue"]
 
         monthly_labels: list[str] = []
         monthly_counts: list[int] = []
@@ -1416,10 +924,8 @@ def charts():
         for _ in range(months_back):
             key = f"{cy:04d}-{cm:02d}"
             monthly_labels.append(datetime(cy, cm, 1).strftime("%b %Y"))
-            lids = monthly_ids_map.get(key, set())
-            monthly_counts.append(len(lids))
-            revenue = sum(price_map_monthly.get(lx, 0.0) for lx in lids)
-            monthly_earnings.append(round(revenue, 2))
+            monthly_counts.append(monthly_count_map.get(key, 0))
+            monthly_earnings.append(round(monthly_earning_map.get(key, 0.0), 2))
             cy, cm = add_months(cy, cm, 1)
 
         chart_data.update(
@@ -1556,13 +1062,13 @@ def send_sms_route():
                 {"success": False, "message": "Phone number and message are required"}
             )
 
-        # Use the SMS service to send the message
-        result = sms_service.send_sms(phone_number, message)
+        # Queue the message; the outbox workers deliver it in the background
+        result = send_sms_notification(phone_number, message)
 
         if result:
-            return jsonify({"success": True, "message": "SMS sent successfully"})
+            return jsonify({"success": True, "message": "SMS queued for sending"})
         else:
-            return jsonify({"success": False, "message": "Failed to send SMS"})
+            return jsonify({"success": False, "message": "Failed to queue SMS"})
 
     except Exception as e:
         return jsonify({"success": False, "message": f"Error sending SMS: {str(e)}"})
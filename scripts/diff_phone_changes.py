@@ -1,13 +1,19 @@
 """Generate CSV of phone changes between current DB and a backup.
 
-Output: instance/phone_changes.csv with columns: id, full_name, old_phone, new_phone
+Output: instance/phone_changes.csv with columns: id, full_name, old_phone, new_phone,
+same_number (whether both values normalize to the same E.164 number)
 """
 import sqlite3
 import csv
 import os
-from datetime import datetime
+import sys
+
+WORKDIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if WORKDIR not in sys.path:
+    sys.path.insert(0, WORKDIR)
+
+from app.phones import normalize_phone
 
-WORKDIR = os.path.dirname(os.path.dirname(__file__))
 INSTANCE_DIR = os.path.join(WORKDIR, 'instance')
 CURRENT_DB = os.path.join(INSTANCE_DIR, 'laundry.db')
 # pick latest .bak by modification time
@@ -34,12 +40,14 @@ for cid, (name_old, phone_old) in old.items():
     if cid in new:
         name_new, phone_new = new[cid]
         if (phone_old or '').strip() != (phone_new or '').strip():
-            changed.append((cid, name_new or name_old, phone_old or '', phone_new or ''))
+            old_norm = normalize_phone(phone_old)
+            same = bool(old_norm) and old_norm == normalize_phone(phone_new)
+            changed.append((cid, name_new or name_old, phone_old or '', phone_new or '', 'yes' if same else 'no'))
 
 out_csv = os.path.join(INSTANCE_DIR, 'phone_changes.csv')
 with open(out_csv, 'w', newline='', encoding='utf-8') as f:
     w = csv.writer(f)
-    w.writerow(['id', 'full_name', 'old_phone', 'new_phone'])
+    w.writerow(['id', 'full_name', 'old_phone', 'new_phone', 'same_number'])
     for row in changed:
         w.writerow(row)
 
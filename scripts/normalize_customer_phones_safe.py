@@ -7,12 +7,11 @@ Rules:
 - numbers already starting with +63 or 63 are normalized to +63XXXXXXXXXX
 
 Do not touch numbers with other country codes (+1, +44, etc.) or numbers with extensions.
+The rules are app.phones.normalize_phone restricted to mobile numbers.
 This script will print changes and commit them.
 """
 import os
-import re
 import sys
-from datetime import datetime
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
@@ -20,33 +19,12 @@ if ROOT not in sys.path:
 
 from app import create_app, db
 from app.models import Customer
+from app.phones import is_ph_mobile, normalize_phone
 
 
 def normalize_safe(raw: str) -> str | None:
-    if not raw:
-        return None
-    s = raw.strip()
-    # skip if contains extension characters
-    if re.search(r"[xX]|ext|extension", s):
-        return None
-    # remove separators
-    digits = re.sub(r"[^0-9]", "", s)
-    if not digits:
-        return None
-
-    # already international PH
-    if digits.startswith("63") and len(digits) >= 11:
-        return "+" + digits
-
-    # local mobile with leading 0 (09XXXXXXXXX -> +639XXXXXXXXX)
-    if digits.startswith("09") and len(digits) == 11:
-        return "+63" + digits[1:]
-
-    # 10-digit mobile starting with 9 -> +63XXXXXXXXXX
-    if len(digits) == 10 and digits.startswith("9"):
-        return "+63" + digits
-
-    return None
+    norm = normalize_phone(raw)
+    return norm if is_ph_mobile(norm) else None
 
 
 def main():
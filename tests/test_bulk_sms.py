@@ -0,0 +1,281 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db, socketio
+from app.bulk_sms import _send_batch, plan_campaign, publish_progress, run_bulk_job, wait_for_job
+from app.models import BulkMessageBatch, BulkMessageHistory, Customer, SMSOutbox, User
+from app.sms_outbox import drain_outbox
+from test_sms_outbox import StubSemaphore
+
+
+@pytest.fixture
+def stub():
+    server = StubSemaphore()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, monkeypatch, stub):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_bulk_sms.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    monkeypatch.setenv('SEMAPHORE_API_BASE', stub.base)
+    monkeypatch.setenv('SEMAPHORE_API_KEY', 'test-key')
+    monkeypatch.setenv('SEMAPHORE_SENDER_NAME', 'ACCIO')
+    monkeypatch.setenv('SEMAPHORE_BULK_BATCH_SIZE', '2')
+    monkeypatch.setenv('SMS_RETRY_BASE_SECONDS', '0.01')
+    monkeypatch.setenv('SMS_MAX_ATTEMPTS', '2')
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='admin@example.com', password='x', full_name='Admin', role='admin'))
+        for i, name in enumerate(['Alice', 'Bob', 'Carol', 'Dan', 'Eve']):
+            db.session.add(Customer(full_name=name, phone=f'0917123450{i}'))
+        # Same number as Alice in another format; batched sends dedupe it
+        db.session.add(Customer(full_name='Alice Again', phone='+63 917 123 4500'))
+        db.session.commit()
+    yield app
+
+
+@pytest.fixture
+def client(app_instance):
+    return app_instance.test_client()
+
+
+def login_client_as_admin(client, app_instance):
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            admin = User.query.filter_by(email='admin@example.com').first()
+        sess['_user_id'] = str(admin.id)
+        sess['_fresh'] = True
+
+
+def test_identical_text_is_sent_in_batches_by_background_job(client, app_instance, stub):
+    login_client_as_admin(client, app_instance)
+    stub.responses = [(200, {}), (503, {}), (200, {}), (400, {})]
+    resp = client.post('/sms-settings/sms-settings/bulk-message', data={
+        'message_text': 'Sale today at {sender_name}!', 'message_type': 'promo', 'recipient_mode': 'all',
+    })
+    assert resp.status_code == 302
+
+    with app_instance.app_context():
+        history = BulkMessageHistory.query.one()
+        history_id = history.id
+        assert history.send_mode == 'batched'
+    assert wait_for_job(history_id, timeout=10)
+
+    # Five unique numbers in batches of two: three provider calls, one retried
+    assert len(stub.requests) == 4
+    assert all(q['message'] == ['Sale today at ACCIO!'] for _, q in stub.requests)
+    assert stub.requests[0][1]['number'] == ['639171234500,639171234501']
+
+    with app_instance.app_context():
+        batches = BulkMessageBatch.query.filter_by(bulk_history_id=history_id).order_by(
+            BulkMessageBatch.batch_number
+        ).all()
+        assert [(b.status, b.attempts, b.status_code, b.recipient_count) for b in batches] == [
+            ('sent', 1, 200, 2), ('sent', 2, 200, 2), ('failed', 1, 400, 1),
+        ]
+        assert batches[2].error.startswith('API Error: 400')
+        history = db.session.get(BulkMessageHistory, history_id)
+        assert (history.total_recipients, history.successful_sends, history.failed_sends) == (5, 4, 1)
+        assert history.status == 'completed' and history.completed_at is not None
+        assert SMSOutbox.query.count() == 0
+
+        # Re-running a finished job sends nothing
+        run_bulk_job(history_id)
+    assert len(stub.requests) == 4
+
+
+def test_campaign_where_every_batch_is_rejected_fails(client, app_instance, stub):
+    login_client_as_admin(client, app_instance)
+    stub.responses = [(400, {})] * 3
+    client.post('/sms-settings/sms-settings/bulk-message', data={
+        'message_text': 'Sale today!', 'message_type': 'promo', 'recipient_mode': 'all',
+    })
+    with app_instance.app_context():
+        history_id = BulkMessageHistory.query.one().id
+    assert wait_for_job(history_id, timeout=10)
+
+    assert len(stub.requests) == 3
+    with app_instance.app_context():
+        history = db.session.get(BulkMessageHistory, history_id)
+        assert (history.successful_sends, history.failed_sends) == (0, 5)
+        assert history.status == 'failed' and history.completed_at is not None
+
+
+def test_personalized_text_falls_back_to_outbox(client, app_instance, stub):
+    login_client_as_admin(client, app_instance)
+    client.post('/sms-settings/sms-settings/bulk-message', data={
+        'message_text': 'Hi {customer_name}!', 'message_type': 'promo', 'recipient_mode': 'all',
+    })
+
+    with app_instance.app_context():
+        history = BulkMessageHistory.query.one()
+        assert (history.send_mode, history.status, history.total_recipients) == ('personalized', 'running', 6)
+        assert BulkMessageBatch.query.count() == 0
+        assert drain_outbox() == {'sent': 6}
+        history = db.session.get(BulkMessageHistory, history.id)
+        assert (history.successful_sends, history.status) == (6, 'completed')
+
+    assert sorted(q['message'][0] for _, q in stub.requests)[0] == 'Hi Alice Again!'
+
+
+def plan(app_instance, text):
+    with app_instance.app_context():
+        history = BulkMessageHistory(
+            message_text=text, message_type='promo', sent_by_user_id=User.query.first().id,
+        )
+        db.session.add(history)
+        db.session.flush()
+        plan_campaign(history, Customer.query.all())
+        db.session.commit()
+        return history.id
+
+
+def progress_events(socket_client):
+    return [e['args'][0] for e in socket_client.get_received('/bulk') if e['name'] == 'progress']
+
+
+def test_socket_progress_pause_and_resume(client, app_instance, stub, monkeypatch):
+    monkeypatch.setenv('BULK_PROGRESS_INTERVAL', '60')
+    history_id = plan(app_instance, 'Sale today!')
+
+    anonymous = socketio.test_client(app_instance, namespace='/bulk')
+    assert not anonymous.is_connected('/bulk')
+
+    login_client_as_admin(client, app_instance)
+    sock = socketio.test_client(app_instance, namespace='/bulk', flask_test_client=client)
+    assert sock.emit('join', {'history_id': history_id}, namespace='/bulk', callback=True) == {'ok': True}
+    assert progress_events(sock) == [{
+        'history_id': history_id, 'status': 'queued', 'send_mode': 'batched',
+        'total': 5, 'sent': 0, 'failed': 0, 'remaining': 5, 'eta_seconds': None,
+    }]
+
+    reply = sock.emit('control', {'history_id': history_id, 'action': 'pause'}, namespace='/bulk', callback=True)
+    assert reply == {'ok': True, 'status': 'paused'}
+    assert progress_events(sock)[-1]['status'] == 'paused'
+    with app_instance.app_context():
+        run_bulk_job(history_id)
+    assert stub.requests == []
+
+    reply = sock.emit('control', {'history_id': history_id, 'action': 'resume'}, namespace='/bulk', callback=True)
+    assert reply['ok']
+    assert wait_for_job(history_id, timeout=10)
+    assert len(stub.requests) == 3
+
+    # Per-batch updates are throttled; the final state change always goes out
+    events = progress_events(sock)
+    assert events[-1]['status'] == 'completed'
+    assert (events[-1]['sent'], events[-1]['remaining']) == (5, 0)
+    assert len(events) < 5
+    with app_instance.app_context():
+        assert not publish_progress(history_id)
+    sock.disconnect(namespace='/bulk')
+
+
+def test_pause_and_cancel_personalized_campaign(client, app_instance, stub):
+    history_id = plan(app_instance, 'Hi {customer_name}!')
+    login_client_as_admin(client, app_instance)
+    sock = socketio.test_client(app_instance, namespace='/bulk', flask_test_client=client)
+
+    sock.emit('control', {'history_id': history_id, 'action': 'pause'}, namespace='/bulk', callback=True)
+    with app_instance.app_context():
+        assert SMSOutbox.query.filter_by(status='held').count() == 6
+        assert drain_outbox() == {}
+
+    reply = sock.emit('control', {'history_id': history_id, 'action': 'cancel'}, namespace='/bulk', callback=True)
+    assert reply == {'ok': True, 'status': 'cancelled'}
+    with app_instance.app_context():
+        assert SMSOutbox.query.filter_by(status='cancelled').count() == 6
+        history = db.session.get(BulkMessageHistory, history_id)
+        assert history.status == 'cancelled' and history.completed_at is not None
+    assert stub.requests == []
+
+    reply = sock.emit('control', {'history_id': history_id, 'action': 'explode'}, namespace='/bulk', callback=True)
+    assert not reply['ok']
+    sock.disconnect(namespace='/bulk')
+
+
+def test_recipient_audiences_are_single_sql_queries(client, app_instance):
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import event
+
+    from app.bulk_recipients import count_recipients, iter_recipients, recipients_query
+    from app.models import CustomerLoyalty, Laundry
+
+    with app_instance.app_context():
+        customers = {c.full_name: c for c in Customer.query.all()}
+        customers['Bob'].phone = '   '
+        customers['Eve'].is_active = False
+        db.session.add(CustomerLoyalty(customer_id=customers['Carol'].id, current_tier='Gold'))
+        db.session.add(CustomerLoyalty(customer_id=customers['Dan'].id, current_tier='Silver'))
+        db.session.add(Laundry(laundry_id='0000000001', customer_id=customers['Dan'].id,
+                               date_received=datetime.utcnow()))
+        db.session.add(Laundry(laundry_id='0000000002', customer_id=customers['Carol'].id,
+                               date_received=datetime.utcnow() - timedelta(days=30)))
+        db.session.commit()
+        bob_id, dan_id = customers['Bob'].id, customers['Dan'].id
+
+        def names(query):
+            return [r.full_name for r in iter_recipients(query, chunk_size=2)]
+
+        statements = []
+        record = lambda *args: statements.append(args[2])  # noqa: E731
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert names(recipients_query('all')) == ['Alice', 'Carol', 'Dan', 'Alice Again']
+            assert names(recipients_query('tier', tier='gold')) == ['Carol']
+            assert names(recipients_query('recent', recent_days=7)) == ['Dan']
+            selected = recipients_query('selected', customer_ids=f"{bob_id},{dan_id},x")
+            assert names(selected) == ['Dan']
+            assert names(recipients_query('selected', customer_ids='')) == []
+            assert count_recipients(recipients_query('all')) == 4
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert len(statements) == 6
+        assert 'count(*)' in statements[-1].lower()
+
+    login_client_as_admin(client, app_instance)
+    data = client.post('/sms-settings/sms-settings/compute-recipients', data={
+        'recipient_mode': 'tier', 'tier': 'Silver',
+    }).get_json()
+    assert data['total'] == 1
+    assert data['customers'] == [{'id': dan_id, 'name': 'Dan', 'phone': '+639171234503'}]
+
+
+def test_batches_are_claimed_and_never_resent(app_instance, stub):
+    with app_instance.app_context():
+        history = BulkMessageHistory(message_text='Promo', message_type='promo',
+                                     sent_by_user_id=User.query.first().id)
+        db.session.add(history)
+        db.session.flush()
+        plan_campaign(history, Customer.query.order_by(Customer.id).all())
+        history.status = 'running'
+        first, second, third = history.batches
+        # Another worker is sending the first batch; the second was caught mid-call by a crash
+        first.status, first.claimed_at = 'sending', datetime.utcnow()
+        second.status, second.claimed_at = 'sending', datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        history_id, first_id = history.id, first.id
+
+        run_bulk_job(history_id)
+        assert [q['number'] for _, q in stub.requests] == [['639171234504']]
+        statuses = [b.status for b in BulkMessageBatch.query.order_by(BulkMessageBatch.batch_number)]
+        assert statuses == ['sending', 'failed', 'sent']
+        assert db.session.get(BulkMessageBatch, second.id).error.startswith('Interrupted while sending')
+        history = db.session.get(BulkMessageHistory, history_id)
+        assert (history.successful_sends, history.failed_sends, history.status) == (1, 2, 'running')
+
+        # A second run has nothing left to claim
+        run_bulk_job(history_id)
+        assert len(stub.requests) == 1
+        assert _send_batch(first_id) == 'skipped'
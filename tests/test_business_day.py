@@ -0,0 +1,77 @@
+import os
+import sys
+import pytest
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.business_day import (
+    backfill_business_dates,
+    business_day_bounds,
+    reset_business_timezone,
+    to_business_date,
+)
+from app.models import BusinessSettings, Customer, Laundry
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_business_day.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        db.session.add(BusinessSettings(timezone='Asia/Manila'))
+        db.session.add(Customer(full_name='Alice'))
+        db.session.commit()
+        reset_business_timezone()
+    yield app
+    reset_business_timezone()
+
+
+def test_late_utc_evening_lands_on_next_manila_day(app_instance):
+    with app_instance.app_context():
+        # 17:30 UTC is 01:30 the next day in Manila (UTC+8)
+        assert to_business_date(datetime(2025, 3, 1, 17, 30)) == date(2025, 3, 2)
+        assert to_business_date(datetime(2025, 3, 1, 15, 59)) == date(2025, 3, 1)
+        assert business_day_bounds(date(2025, 3, 2)) == (
+            datetime(2025, 3, 1, 16, 0),
+            datetime(2025, 3, 2, 16, 0),
+        )
+
+
+def test_business_date_is_stamped_on_write(app_instance):
+    with app_instance.app_context():
+        laundry = Laundry(
+            laundry_id='0000000001',
+            customer_id=Customer.query.first().id,
+            date_received=datetime(2025, 3, 1, 17, 30),
+        )
+        db.session.add(laundry)
+        db.session.commit()
+        assert laundry.business_date == date(2025, 3, 2)
+
+        laundry.date_received = datetime(2025, 3, 1, 1, 0)
+        db.session.commit()
+        assert laundry.business_date == date(2025, 3, 1)
+
+
+def test_backfill_fills_missing_business_dates(app_instance):
+    with app_instance.app_context():
+        laundry = Laundry(
+            laundry_id='0000000002',
+            customer_id=Customer.query.first().id,
+            date_received=datetime(2025, 3, 1, 20, 0),
+        )
+        db.session.add(laundry)
+        db.session.commit()
+        # Simulate a row written before the column existed
+        db.session.execute(db.text("UPDATE laundry SET business_date = NULL"))
+        db.session.commit()
+
+        counts = backfill_business_dates(chunk_size=1)
+        assert counts['laundry'] == 1
+        db.session.expire_all()
+        assert Laundry.query.first().business_date == date(2025, 3, 2)
@@ -0,0 +1,234 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.business_day import business_today
+from app.models import Customer, DailyStats, Laundry, Service, User
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_daily_stats.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        admin = User(email='admin@example.com', password='x', full_name='Admin', role='admin')
+        db.session.add(admin)
+        db.session.add(Service(name='Wash', base_price=150.0, category='Standard'))
+        db.session.add(Customer(full_name='Alice'))
+        db.session.commit()
+    yield app
+
+
+@pytest.fixture
+def client(app_instance):
+    return app_instance.test_client()
+
+
+def login_client_as_admin(client, app_instance):
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            admin = User.query.filter_by(email='admin@example.com').first()
+        sess['_user_id'] = str(admin.id)
+        sess['_fresh'] = True
+
+
+def snapshot():
+    return sorted(
+        (r.day, r.service_id, r.received_count, r.completed_count, r.revenue, r.new_customers)
+        for r in DailyStats.query.all()
+    )
+
+
+def add_and_complete_laundry(client, app_instance):
+    with app_instance.app_context():
+        customer_id = Customer.query.first().id
+        service_id = Service.query.first().id
+    client.post(
+        '/laundry/add',
+        data={'customerId': customer_id, 'serviceType': service_id, 'itemCount': '3'},
+    )
+    with app_instance.app_context():
+        laundry_id = Laundry.query.first().laundry_id
+    client.post(f'/laundry/update-status/{laundry_id}', data={'status': 'Completed'})
+    return laundry_id, service_id
+
+
+def test_status_changes_maintain_rollup(client, app_instance):
+    login_client_as_admin(client, app_instance)
+    _, service_id = add_and_complete_laundry(client, app_instance)
+
+    with app_instance.app_context():
+        row = DailyStats.query.filter_by(
+            day=business_today(), service_id=service_id
+        ).one()
+        assert row.received_count == 1
+        assert row.completed_count == 1
+        assert row.revenue == pytest.approx(150.0)
+
+
+def test_rebuild_command_matches_incremental_rollup(client, app_instance):
+    login_client_as_admin(client, app_instance)
+    add_and_complete_laundry(client, app_instance)
+
+    with app_instance.app_context():
+        incremental = [r for r in snapshot() if r[5] == 0]
+        # Drift the table, then rebuild from source rows
+        DailyStats.query.delete()
+        db.session.commit()
+
+    result = app_instance.test_cli_runner().invoke(args=['rebuild-daily-stats'])
+    assert result.exit_code == 0, result.output
+
+    with app_instance.app_context():
+        rebuilt = snapshot()
+    # The rebuild also counts the fixture customer, which bypassed add_customer
+    assert [r for r in rebuilt if r[5] == 0] == incremental
+    assert sum(r[5] for r in rebuilt) == 1
+
+
+def test_delete_laundry_removes_contributions(client, app_instance):
+    login_client_as_admin(client, app_instance)
+    laundry_id, _ = add_and_complete_laundry(client, app_instance)
+
+    client.post(f'/laundry/delete/{laundry_id}')
+
+    with app_instance.app_context():
+        assert Laundry.query.count() == 0
+        assert all(r[2] == 0 and r[3] == 0 and r[4] == 0 for r in snapshot())
+
+
+def test_edit_moves_contributions_to_new_service_and_price(client, app_instance):
+    login_client_as_admin(client, app_instance)
+    laundry_id, old_service_id = add_and_complete_laundry(client, app_instance)
+    with app_instance.app_context():
+        dry = Service(name='Dry Clean', base_price=400.0, category='Premium')
+        db.session.add(dry)
+        db.session.commit()
+        new_service_id = dry.id
+        customer_id = Customer.query.first().id
+
+    resp = client.post(f'/laundry/edit/{laundry_id}', data={
+        'customerId': customer_id, 'serviceType': new_service_id, 'itemCount': '3', 'notes': 'x',
+    })
+    assert resp.status_code == 302
+
+    with app_instance.app_context():
+        laundry_item = Laundry.query.one()
+        assert laundry_item.price == pytest.approx(400.0)
+        old = DailyStats.query.filter_by(service_id=old_service_id).one()
+        assert (old.received_count, old.completed_count, old.revenue) == (0, 0, 0)
+        new = DailyStats.query.filter_by(service_id=new_service_id).one()
+        assert (new.received_count, new.completed_count, new.revenue) == (1, 1, pytest.approx(400.0))
+        incremental = snapshot()
+
+    # Deleting afterwards empties the buckets it was moved to
+    client.post(f'/laundry/delete/{laundry_id}')
+    with app_instance.app_context():
+        assert all(r[2] == 0 and r[3] == 0 and r[4] == 0 for r in snapshot())
+        assert [r for r in incremental if r[2]] == [
+            (business_today(), new_service_id, 1, 1, pytest.approx(400.0), 0)
+        ]
+
+
+def test_schema_upgrade_fills_an_empty_rollup(client, app_instance):
+    from app.schema_upgrades import upgrade_schema
+
+    login_client_as_admin(client, app_instance)
+    add_and_complete_laundry(client, app_instance)
+    with app_instance.app_context():
+        # A database populated before daily_stats existed
+        DailyStats.query.delete()
+        db.session.commit()
+        upgrade_schema(db)
+        rebuilt = snapshot()
+        assert sum(r[2] for r in rebuilt) == 1 and sum(r[5] for r in rebuilt) == 1
+
+        # A populated rollup is left alone
+        upgrade_schema(db)
+        assert snapshot() == rebuilt
+
+
+def test_report_pages_render_from_rollup(client, app_instance):
+    login_client_as_admin(client, app_instance)
+    add_and_complete_laundry(client, app_instance)
+
+    for url in ('/daily-calendar', '/charts', '/customer-analytics', '/expenses/reports'):
+        resp = client.get(url)
+        assert resp.status_code == 200, url
+
+
+def test_status_change_stamps_milestone_times(client, app_instance):
+    login_client_as_admin(client, app_instance)
+    laundry_id, _ = add_and_complete_laundry(client, app_instance)
+    client.post(f'/laundry/update-status/{laundry_id}', data={'status': 'Ready for Pickup'})
+
+    with app_instance.app_context():
+        laundry = Laundry.query.filter_by(laundry_id=laundry_id).one()
+        assert laundry.completed_at is not None
+        assert laundry.ready_at is not None
+        assert laundry.ready_at >= laundry.completed_at
+
+    # Completing again moves the order rather than counting it twice
+    client.post(f'/laundry/update-status/{laundry_id}', data={'status': 'Completed'})
+    with app_instance.app_context():
+        assert sum(r[3] for r in snapshot()) == 1
+
+
+def test_backfill_status_timestamps_from_history(client, app_instance):
+    from app.backfills import backfill_status_timestamps
+
+    login_client_as_admin(client, app_instance)
+    laundry_id, _ = add_and_complete_laundry(client, app_instance)
+
+    with app_instance.app_context():
+        expected = Laundry.query.filter_by(laundry_id=laundry_id).one().completed_at
+        # Simulate a row written before the columns existed
+        db.session.execute(db.text("UPDATE laundry SET completed_at = NULL, ready_at = NULL"))
+        db.session.commit()
+
+        assert backfill_status_timestamps(chunk_size=1) == 1
+        db.session.expire_all()
+        assert Laundry.query.filter_by(laundry_id=laundry_id).one().completed_at == expected
+
+
+def test_history_and_audit_link_by_laundry_pk(client, app_instance):
+    from app.backfills import backfill_laundry_links
+    from app.event_outbox import drain_events
+    from app.models import (
+        LaundryAuditLog, LaundryStatusHistory, LoyaltyProgram, LoyaltyTransaction,
+    )
+
+    with app_instance.app_context():
+        db.session.add(LoyaltyProgram(name='Points', points_per_peso=1.0, is_active=True))
+        db.session.commit()
+
+    login_client_as_admin(client, app_instance)
+    laundry_id, _ = add_and_complete_laundry(client, app_instance)
+
+    with app_instance.app_context():
+        laundry = Laundry.query.filter_by(laundry_id=laundry_id).one()
+        history = LaundryStatusHistory.query.all()
+        assert history and all(h.laundry_pk == laundry.id for h in history)
+        assert all(a.laundry_pk == laundry.id for a in LaundryAuditLog.query.all())
+        # Points are awarded by the status-change outbox handler
+        drain_events()
+        assert LoyaltyTransaction.query.filter_by(laundry_id=laundry.id).count() == 1
+
+        # Rows written before the column existed are linked by the backfill
+        db.session.execute(db.text("UPDATE laundry_status_history SET laundry_pk = NULL"))
+        db.session.commit()
+        counts = backfill_laundry_links(chunk_size=1)
+        assert counts['laundry_status_history'] == len(history)
+
+    assert client.get(f'/laundry/status-history/{laundry_id}').status_code == 200
+    assert client.get(f'/laundry/audit/{laundry_id}').status_code == 200
+    client.post(f'/laundry/delete/{laundry_id}')
+    with app_instance.app_context():
+        assert LaundryStatusHistory.query.count() == 0
@@ -0,0 +1,126 @@
+import os
+import sys
+import pytest
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import (
+    BusinessSettings,
+    Customer,
+    InventoryCategory,
+    InventoryItem,
+    Laundry,
+    Service,
+    User,
+)
+
+# Upper bound on SQL statements for one dashboard render (login, context
+# processors and all KPI cards included). The pre-aggregation dashboard
+# issued well over fifty.
+DASHBOARD_STATEMENT_BUDGET = 20
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, monkeypatch):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_dashboard.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        admin = User(email='admin@example.com', password='x', full_name='Admin', role='admin')
+        db.session.add(admin)
+        db.session.add(BusinessSettings())
+        wash = Service(name='Wash', base_price=100.0, category='Standard')
+        db.session.add(wash)
+        category = InventoryCategory(name='Detergent')
+        db.session.add(category)
+        db.session.flush()
+        db.session.add(InventoryItem(name='Soap', category_id=category.id, current_stock=2, minimum_stock=10))
+        customers = [Customer(full_name=f'Customer {i}') for i in range(5)]
+        db.session.add_all(customers)
+        db.session.flush()
+        statuses = ['Received', 'Ready for Pickup', 'Completed', 'Picked Up']
+        for i in range(12):
+            db.session.add(
+                Laundry(
+                    laundry_id=f'{i:010d}',
+                    customer_id=customers[i % 5].id,
+                    service_id=wash.id,
+                    price=100.0 + i,
+                    status=statuses[i % 4],
+                    date_received=datetime.utcnow(),
+                )
+            )
+        db.session.commit()
+
+    # Keep the weather widget off the network
+    import requests
+
+    def _no_weather(*args, **kwargs):
+        raise requests.exceptions.ConnectionError('offline')
+
+    monkeypatch.setattr(requests, 'get', _no_weather)
+    yield app
+
+
+@pytest.fixture
+def client(app_instance):
+    return app_instance.test_client()
+
+
+def login_client_as_admin(client, app_instance):
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            admin = User.query.filter_by(email='admin@example.com').first()
+        sess['_user_id'] = str(admin.id)
+        sess['_fresh'] = True
+
+
+def count_statements(app_instance, fn):
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app_instance.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _record)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', _record)
+    return result, statements
+
+
+def test_dashboard_stays_within_statement_budget(client, app_instance):
+    login_client_as_admin(client, app_instance)
+    resp, statements = count_statements(app_instance, lambda: client.get('/'))
+    assert resp.status_code == 200
+    assert len(statements) <= DASHBOARD_STATEMENT_BUDGET, "\n".join(statements)
+
+
+def test_dashboard_stats_values(app_instance):
+    from app.dashboard_stats import compute_dashboard_stats
+
+    with app_instance.app_context():
+        stats = compute_dashboard_stats()
+    assert stats.total_laundries == 12
+    assert stats.received_laundries_count == 3
+    assert stats.ready_pickup_count == 3
+    assert stats.completed_laundries == 3
+    assert stats.picked_up_laundries == 3
+    # Completed and Picked Up are not active
+    assert stats.active_laundries == 6
+    assert stats.received_today == 12
+    assert stats.total_customers == 5
+    assert stats.new_customers_7d == 5
+    assert stats.total_services == 1
+    assert stats.low_stock_count == 1
+    expected_revenue = sum(100.0 + i for i in range(12) if i % 4 in (1, 2))
+    assert stats.total_revenue == pytest.approx(expected_revenue)
@@ -0,0 +1,132 @@
+import importlib
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.event_outbox import drain_events
+from app.models import (
+    Customer,
+    Laundry,
+    LoyaltyProgram,
+    LoyaltyTransaction,
+    Notification,
+    OutboxEvent,
+    OutboxEventReceipt,
+    Service,
+    SMSOutbox,
+    User,
+)
+
+laundry_module = importlib.import_module('app.laundry')
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, monkeypatch):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_event_outbox.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    monkeypatch.setenv('SEMAPHORE_API_KEY', 'test-key')
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='admin@example.com', password='x', full_name='Admin', role='admin'))
+        db.session.add(Service(name='Wash', base_price=150.0, category='Standard'))
+        db.session.add(Customer(full_name='Alice', phone='09171234567'))
+        db.session.add(LoyaltyProgram(is_active=True, points_per_peso=1.0))
+        db.session.commit()
+    yield app
+
+
+@pytest.fixture
+def client(app_instance):
+    client = app_instance.test_client()
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            sess['_user_id'] = str(User.query.filter_by(email='admin@example.com').first().id)
+        sess['_fresh'] = True
+    return client
+
+
+def add_laundry(client, app_instance):
+    with app_instance.app_context():
+        customer_id = Customer.query.first().id
+        service_id = Service.query.first().id
+    client.post('/laundry/add', data={'customerId': customer_id, 'serviceType': service_id, 'itemCount': '2'})
+    with app_instance.app_context():
+        return Laundry.query.first().laundry_id
+
+
+def status_sms_count(status):
+    return SMSOutbox.query.filter_by(category=f'status:{status}').count()
+
+
+def test_status_change_commits_once_and_side_effects_run_from_outbox(client, app_instance):
+    laundry_id = add_laundry(client, app_instance)
+
+    commits = []
+    counter = lambda session: commits.append(session)  # noqa: E731
+    event.listen(Session, 'after_commit', counter)
+    try:
+        client.post(f'/laundry/update-status/{laundry_id}', data={'status': 'Completed'})
+    finally:
+        event.remove(Session, 'after_commit', counter)
+    assert len(commits) == 1
+
+    with app_instance.app_context():
+        row = OutboxEvent.query.one()
+        assert (row.event_type, row.status) == ('laundry.status_changed', 'pending')
+        # Nothing has happened yet besides the status change itself
+        assert Laundry.query.one().status == 'Completed'
+        assert LoyaltyTransaction.query.count() == 0
+        assert status_sms_count('Completed') == 0
+
+        assert drain_events() == {'done': 1}
+        assert Notification.query.filter(Notification.title.contains('Completed')).count() == 1
+        assert status_sms_count('Completed') == 1
+        assert LoyaltyTransaction.query.one().points == 150
+        assert OutboxEventReceipt.query.count() == 4
+
+        # Draining again finds nothing due
+        assert drain_events() == {}
+
+
+def test_failed_handler_retries_without_repeating_the_others(client, app_instance, monkeypatch):
+    laundry_id = add_laundry(client, app_instance)
+    client.post(f'/laundry/update-status/{laundry_id}', data={'status': 'Completed'})
+
+    def failing_sms(*args, **kwargs):
+        raise RuntimeError('provider down')
+
+    original = laundry_module.send_laundry_status_sms
+    monkeypatch.setattr(laundry_module, 'send_laundry_status_sms', failing_sms)
+    with app_instance.app_context():
+        assert drain_events() == {'pending': 1}
+        row = OutboxEvent.query.one()
+        assert row.attempts == 1 and 'sms: provider down' in row.last_error
+        assert row.next_attempt_at > datetime.utcnow()
+        assert {r.handler for r in OutboxEventReceipt.query} == {'notification', 'email', 'loyalty'}
+        assert status_sms_count('Completed') == 0
+
+    monkeypatch.setattr(laundry_module, 'send_laundry_status_sms', original)
+    with app_instance.app_context():
+        db.session.query(OutboxEvent).update({'next_attempt_at': datetime.utcnow()})
+        db.session.commit()
+        assert drain_events() == {'done': 1}
+        assert status_sms_count('Completed') == 1
+        assert LoyaltyTransaction.query.count() == 1
+        assert Notification.query.filter(Notification.title.contains('Completed')).count() == 1
+
+
+def test_unchanged_status_records_no_event(client, app_instance):
+    laundry_id = add_laundry(client, app_instance)
+    client.post(f'/laundry/update-status/{laundry_id}', data={'status': 'Received'})
+    with app_instance.app_context():
+        assert OutboxEvent.query.count() == 0
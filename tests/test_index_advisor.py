@@ -0,0 +1,92 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.index_advisor import (
+    IndexAdvisor, extract_columns, fingerprint_sql, load_stats, render_revision,
+    suggest_indexes,
+)
+from app.models import Laundry
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, monkeypatch):
+    data_dir = tmp_path_factory.mktemp('data')
+    os.environ['DATABASE_URL'] = f"sqlite:///{data_dir / 'test_index_advisor.db'}"
+    monkeypatch.setenv('ENABLE_REQUEST_MONITORING', '1')
+    monkeypatch.setenv('SQL_INDEX_ADVISOR', '1')
+    monkeypatch.setenv('SQL_INDEX_ADVISOR_FILE', str(data_dir / 'fingerprints.json'))
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+    yield app
+
+
+def test_fingerprint_collapses_literals_and_in_lists():
+    a = fingerprint_sql("SELECT * FROM laundry WHERE laundry.status = 'Received' AND laundry.id IN (1, 2, 3)")
+    b = fingerprint_sql("SELECT *  FROM laundry\nWHERE laundry.status = ? AND laundry.id IN (?, ?)")
+    assert a == b == "SELECT * FROM laundry WHERE laundry.status = ? AND laundry.id IN (?)"
+
+
+def test_extract_columns_resolves_aliases():
+    found = extract_columns(
+        "SELECT n.id FROM notification AS n JOIN userdb ON userdb.id = n.user_id "
+        "WHERE n.user_id = ? AND n.is_read = ? AND n.created_at >= ? ORDER BY n.created_at DESC LIMIT ?"
+    )
+    assert found['equality'] == [('notification', 'user_id'), ('notification', 'is_read')]
+    assert found['range'] == [('notification', 'created_at')]
+    assert found['order_by'] == [('notification', 'created_at')]
+
+
+def test_suggestions_skip_covered_columns_and_render_revision():
+    from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table
+
+    metadata = MetaData()
+    Table(
+        'orders', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('state', String(20)),
+        Column('created', DateTime),
+        Column('owner_id', Integer),
+        Index('ix_orders_owner_id', 'owner_id'),
+    )
+    advisor = IndexAdvisor()
+    for _ in range(3):
+        advisor.record("SELECT orders.id FROM orders WHERE orders.state = 'x' ORDER BY orders.created", 5.0)
+    advisor.record("SELECT orders.id FROM orders WHERE orders.owner_id = 7", 50.0)
+
+    suggestions = suggest_indexes(advisor.stats, metadata)
+    assert [(s['name'], s['columns'], s['calls']) for s in suggestions] == [
+        ('ix_orders_state_created', ('state', 'created'), 3),
+    ]
+
+    source = render_revision(suggestions, 'abc123', None)
+    compile(source, 'revision.py', 'exec')
+    assert "op.create_index('ix_orders_state_created', 'orders', ['state', 'created']" in source
+
+
+def test_monitoring_records_statements_for_cli(app_instance, tmp_path):
+    with app_instance.app_context():
+        Laundry.query.filter_by(status='Received').order_by(Laundry.date_received).all()
+    advisor = app_instance.extensions['index_advisor']
+    assert any('laundry.status = ?' in e['sql'] for e in advisor.stats.values())
+
+    recorded = {key: entry['calls'] for key, entry in advisor.stats.items()}
+    stats_path = str(tmp_path / 'stats.json')
+    advisor.save(stats_path)
+    advisor.save(stats_path)
+    saved = load_stats(stats_path)
+    assert {key: saved[key]['calls'] for key in recorded} == recorded
+
+    versions = tmp_path / 'versions'
+    result = app_instance.test_cli_runner().invoke(
+        args=['suggest-indexes', '--stats', stats_path, '--write', str(versions)]
+    )
+    assert result.exit_code == 0, result.output
+    # status and date_received are indexed, so the recorded query is already covered
+    assert 'already cover' in result.output
+    assert not versions.exists()
@@ -0,0 +1,191 @@
+import os
+import socketserver
+import sys
+import threading
+import time
+
+import pytest
+from flask_mail import Message
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db, mail
+from app.mail_queue import (
+    MailDeliveryFailed, MailQueue, MailQueueFull, get_mail_queue, send_email, start_mail_queue,
+)
+from app.models import EmailDelivery
+
+
+class StubSMTP:
+    """Local SMTP server recording messages, with scripted failures."""
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []  # (connection number, recipients)
+        self.drop_after = None  # close each connection after this many messages
+        self.refuse = set()  # recipients answered with 550
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b'\r\n')
+
+            def handle(self):
+                stub.connections += 1
+                number, sent, recipients = stub.connections, 0, []
+                self.reply('220 stub ESMTP')
+                while True:
+                    line = self.rfile.readline().decode().strip()
+                    if not line:
+                        return
+                    verb = line.split(' ', 1)[0].upper()
+                    if verb in ('EHLO', 'HELO'):
+                        self.reply('250 stub')
+                    elif verb == 'MAIL':
+                        recipients = []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        address = line.split(':', 1)[1].strip().strip('<>')
+                        if address in stub.refuse:
+                            self.reply('550 No such user')
+                        else:
+                            recipients.append(address)
+                            self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        while self.rfile.readline() not in (b'.\r\n', b''):
+                            pass
+                        stub.messages.append((number, recipients))
+                        self.reply('250 Queued')
+                        sent += 1
+                        if stub.drop_after and sent >= stub.drop_after:
+                            return
+                    elif verb == 'RSET':
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Not implemented')
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def smtp():
+    server = StubSMTP()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, smtp, monkeypatch):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_mail_queue.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    monkeypatch.setenv('EMAIL_RETRY_SECONDS', '0')
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config.update(
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=smtp.port, MAIL_USE_TLS=False,
+        MAIL_USERNAME='', MAIL_PASSWORD='', MAIL_SUPPRESS_SEND=False,
+    )
+    mail.init_app(app)
+    with app.app_context():
+        db.create_all()
+    yield app
+    queue = app.extensions.get('mail_queue')
+    if queue:
+        queue.stop()
+
+
+def message(to):
+    msg = Message('Pickup ready!', sender='noreply@acciolaundry.com', recipients=[to])
+    msg.body = 'Your laundry is ready.'
+    return msg
+
+
+def test_batch_shares_one_connection_and_records_outcomes(app_instance, smtp):
+    with app_instance.app_context():
+        queue = get_mail_queue()
+        for n in range(5):
+            queue.submit(message(f'c{n}@example.com'), category='status:Ready for Pickup')
+        assert queue.drain() == {'sent': 5}
+        assert smtp.connections == 1 and len(smtp.messages) == 5
+
+        rows = EmailDelivery.query.order_by(EmailDelivery.id).all()
+        assert [r.recipient for r in rows] == [f'c{n}@example.com' for n in range(5)]
+        assert all(r.status == 'sent' and r.attempts == 1 for r in rows)
+
+        # The connection stays open for the next batch
+        queue.submit(message('later@example.com'))
+        queue.drain()
+        assert smtp.connections == 1
+
+
+def test_reconnects_after_drop_and_fails_refused_recipients(app_instance, smtp):
+    smtp.drop_after = 2
+    smtp.refuse = {'gone@example.com'}
+    with app_instance.app_context():
+        queue = get_mail_queue()
+        for to in ('a@example.com', 'b@example.com', 'c@example.com', 'gone@example.com', 'd@example.com'):
+            queue.submit(message(to))
+        assert queue.drain() == {'sent': 4, 'failed': 1}
+        assert queue.stats['reconnects'] >= 1
+        assert smtp.connections >= 2
+        assert sorted(r[0] for _, r in smtp.messages) == ['a@example.com', 'b@example.com', 'c@example.com', 'd@example.com']
+
+        failed = EmailDelivery.query.filter_by(status='failed').one()
+        assert failed.recipient == 'gone@example.com' and failed.attempts == 1
+        assert 'No such user' in failed.error
+
+
+def test_full_queue_pushes_back(app_instance):
+    queue = MailQueue(app_instance, maxsize=2, enqueue_timeout=0.01)
+    queue.submit(message('a@example.com'))
+    queue.submit(message('b@example.com'))
+    with pytest.raises(MailQueueFull):
+        queue.submit(message('c@example.com'))
+    assert queue.stats['rejected'] == 1
+
+
+def test_worker_sends_notification_email_off_the_request(app_instance, smtp):
+    from app.laundry import send_notification_email
+
+    queue = start_mail_queue(app_instance)
+    with app_instance.app_context():
+        assert send_notification_email('alice@example.com', 'Laundry Received', 'Processing.')
+
+    deadline = time.time() + 5
+    while len(smtp.messages) < 1 and time.time() < deadline:
+        time.sleep(0.02)
+    queue.stop()
+    assert smtp.messages == [(1, ['alice@example.com'])]
+    with app_instance.app_context():
+        assert EmailDelivery.query.one().status == 'sent'
+
+
+def test_send_email_reports_the_smtp_outcome(app_instance, smtp):
+    smtp.refuse = {'gone@example.com'}
+    queue = start_mail_queue(app_instance)
+    try:
+        with app_instance.app_context():
+            # Returns only once the server has the message
+            send_email(message('alice@example.com'), category='status:Completed')
+            assert smtp.messages == [(1, ['alice@example.com'])]
+            # A rejected message fails its caller (the outbox handler retries)
+            with pytest.raises(MailDeliveryFailed, match='No such user'):
+                send_email(message('gone@example.com'))
+    finally:
+        queue.stop()
+    with app_instance.app_context():
+        assert sorted(r.status for r in EmailDelivery.query) == ['failed', 'sent']
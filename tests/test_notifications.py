@@ -0,0 +1,313 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db, socketio
+from app.event_outbox import drain_events
+from app.inventory_alerts import dedupe_key, evaluate_low_stock
+from app.models import (
+    InventoryAlert, InventoryCategory, InventoryItem, Notification, NotificationBroadcast,
+    NotificationCounter, NotificationReceipt, OutboxEvent, User,
+)
+from app.notifications import (
+    _cached_counts, _grouped_counts, check_and_create_inventory_notifications, create_notification,
+    notification_counts,
+)
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_notifications.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        created = datetime.utcnow() - timedelta(days=1)
+        for i in range(40):
+            db.session.add(User(email=f'staff{i}@example.com', password='x', full_name=f'Staff {i}',
+                                role='admin' if i == 0 else 'user', date_created=created))
+        db.session.commit()
+    yield app
+
+
+@pytest.fixture
+def client(app_instance):
+    return app_instance.test_client()
+
+
+def login_as(client, app_instance, email):
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            user = User.query.filter_by(email=email).first()
+        sess['_user_id'] = str(user.id)
+        sess['_fresh'] = True
+
+
+def test_new_customer_writes_one_broadcast_row(client, app_instance):
+    login_as(client, app_instance, 'staff0@example.com')
+    resp = client.post('/customer/add', data={'fullName': 'Alice', 'phone': '09171234567'})
+    assert resp.status_code == 302
+    with app_instance.app_context():
+        assert NotificationBroadcast.query.count() == 1
+        assert Notification.query.count() == 0
+        assert NotificationReceipt.query.count() == 0
+
+
+def test_read_state_is_per_user_and_set_based(client, app_instance):
+    with app_instance.app_context():
+        staff1 = User.query.filter_by(email='staff1@example.com').one()
+        create_notification(staff1.id, 'Personal', 'Only for staff 1', 'success')
+        for n in range(3):
+            create_notification(None, f'Broadcast {n}', 'For everyone', 'warning')
+        # Broadcasts from before an account existed are not shown to it
+        old = create_notification(None, 'Ancient', 'Before everyone', 'info')
+        old.created_at = datetime.utcnow() - timedelta(days=30)
+        db.session.commit()
+
+    login_as(client, app_instance, 'staff1@example.com')
+    assert client.get('/notifications/api/unread-count').get_json() == {'count': 4}
+    recent = client.get('/notifications/api/recent').get_json()
+    broadcast_key = next(n['id'] for n in recent if n['title'] == 'Broadcast 0')
+    assert broadcast_key.startswith('b')
+
+    assert client.post(f'/notifications/{broadcast_key}/read').status_code == 200
+    assert client.post(f'/notifications/{broadcast_key}/read').status_code == 200
+    assert client.get('/notifications/api/unread-count').get_json() == {'count': 3}
+
+    page = client.get('/notifications?show_read=true')
+    assert page.status_code == 200
+    assert b'Broadcast 2' in page.data and b'Personal' in page.data and b'Ancient' not in page.data
+
+    with app_instance.app_context():
+        statements = []
+        engine = db.engine
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            resp = client.post('/notifications/mark-all-read')
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+    assert resp.get_json()['message'] == 'Marked 3 notifications as read'
+    # Personal rows, counters, broadcast receipts
+    assert sum(s.lstrip().upper().startswith(('UPDATE', 'INSERT')) for s in statements) == 3
+    assert client.get('/notifications/api/unread-count').get_json() == {'count': 0}
+
+    # Other users still see every broadcast as unread
+    login_as(client, app_instance, 'staff2@example.com')
+    assert client.get('/notifications/api/unread-count').get_json() == {'count': 3}
+    assert client.post(f'/notifications/{broadcast_key}/delete').status_code == 200
+    assert client.get('/notifications/api/unread-count').get_json() == {'count': 2}
+    page = client.get('/notifications?show_read=true')
+    assert b'Broadcast 0' not in page.data
+    assert client.post('/notifications/999/read').status_code == 404
+
+    with app_instance.app_context():
+        assert NotificationBroadcast.query.count() == 4
+        assert NotificationReceipt.query.count() == 4
+
+
+def add_items(*stocks):
+    category = InventoryCategory(name='Supplies')
+    db.session.add(category)
+    db.session.flush()
+    items = [InventoryItem(name=f'Item {i}', category_id=category.id, current_stock=stock,
+                           minimum_stock=5, unit_of_measure='kg', created_by=1)
+             for i, stock in enumerate(stocks)]
+    db.session.add_all(items)
+    db.session.commit()
+    return [item.id for item in items]
+
+
+def test_low_stock_check_broadcasts_once_per_item(app_instance):
+    with app_instance.app_context():
+        add_items(1, 0, 10, *([2] * 20))
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            created = check_and_create_inventory_notifications()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert sorted(n.notification_type for n in created) == ['error'] + ['warning'] * 21
+        # Independent of the number of items
+        # Low items, existing keys, inserted alerts: a fixed number of statements
+        lowered = [s.lstrip().lower() for s in statements]
+        assert sum(s.startswith('select') for s in lowered) == 3
+        assert sum(s.startswith('insert or ignore into inventory_alert') for s in lowered) == 1
+        assert not any('from notification_broadcast' in s for s in lowered)
+        assert check_and_create_inventory_notifications() == []
+        assert NotificationBroadcast.query.count() == 22
+        assert InventoryAlert.query.filter(InventoryAlert.broadcast_id.is_(None)).count() == 0
+        assert Notification.query.count() == 0
+
+
+def test_alert_dedupe_is_enforced_by_the_unique_key(app_instance, monkeypatch):
+    from app import inventory_alerts
+
+    with app_instance.app_context():
+        winner_id, loser_id = add_items(1, 2)
+        now = datetime.utcnow().replace(microsecond=123456)
+        insert_ignore = inventory_alerts._insert_ignore
+
+        def racing_insert(table):
+            # Another evaluator commits the first item's alert, with its
+            # broadcast, between our read of existing keys and our insert
+            other = create_notification(None, 'Inventory Low Warning', 'x', 'warning', commit=False)
+            db.session.flush()
+            db.session.add(InventoryAlert(item_id=winner_id, level='low_stock', broadcast_id=other.id,
+                                          dedupe_key=dedupe_key(winner_id, 'low_stock', now)))
+            db.session.flush()
+            return insert_ignore(table)
+
+        def truncate_seconds(conn, cursor, statement, parameters, context, executemany):
+            # Stored without fractional seconds, as MySQL DATETIME does
+            if statement.startswith('INSERT OR IGNORE INTO inventory_alert'):
+                parameters = [(*row[:-1], row[-1][:19]) for row in parameters]
+            return statement, parameters
+
+        monkeypatch.setattr(inventory_alerts, '_insert_ignore', racing_insert)
+        event.listen(db.engine, 'before_cursor_execute', truncate_seconds, retval=True)
+        try:
+            created = evaluate_low_stock(now=now)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', truncate_seconds)
+        assert [b.related_id for b in created] == [str(loser_id)]
+        assert InventoryAlert.query.count() == 2
+        assert NotificationBroadcast.query.count() == 2
+        assert InventoryAlert.query.filter(InventoryAlert.broadcast_id.is_(None)).count() == 0
+
+
+def test_stock_movement_alerts_after_commit(client, app_instance):
+    with app_instance.app_context():
+        item_id, = add_items(10)
+    login_as(client, app_instance, 'staff0@example.com')
+    resp = client.post(f'/inventory/items/{item_id}/update_stock',
+                       data={'movement_type': 'OUT', 'quantity': '6'})
+    assert resp.status_code == 302
+    with app_instance.app_context():
+        # The request only recorded the event
+        assert NotificationBroadcast.query.count() == 0
+        assert OutboxEvent.query.filter_by(event_type='inventory.stock_changed').count() == 1
+        assert drain_events()['done'] == 1
+        assert [b.notification_type for b in NotificationBroadcast.query] == ['warning']
+
+    client.post(f'/inventory/items/{item_id}/update_stock', data={'movement_type': 'OUT', 'quantity': '1'})
+    client.post(f'/inventory/items/{item_id}/update_stock', data={'movement_type': 'OUT', 'quantity': '9'})
+    with app_instance.app_context():
+        assert drain_events()['done'] == 2
+        assert sorted(a.level for a in InventoryAlert.query) == ['low_stock', 'out_of_stock']
+        assert NotificationBroadcast.query.count() == 2
+
+
+def unread_events(sock):
+    return [e['args'][0] for e in sock.get_received('/notifications') if e['name'] == 'unread']
+
+
+def test_unread_counts_are_pushed_to_the_users_room(client, app_instance):
+    anonymous = socketio.test_client(app_instance, namespace='/notifications')
+    assert not anonymous.is_connected('/notifications')
+
+    login_as(client, app_instance, 'staff1@example.com')
+    sock = socketio.test_client(app_instance, namespace='/notifications', flask_test_client=client)
+    assert unread_events(sock) == [{'count': 0}]
+
+    other = app_instance.test_client()
+    login_as(other, app_instance, 'staff2@example.com')
+    other_sock = socketio.test_client(app_instance, namespace='/notifications', flask_test_client=other)
+    assert unread_events(other_sock) == [{'count': 0}]
+
+    with app_instance.app_context():
+        staff1 = User.query.filter_by(email='staff1@example.com').one()
+        create_notification(staff1.id, 'Personal', 'Only for staff 1')
+        create_notification(None, 'Broadcast', 'For everyone')
+        # Not committed yet: nothing is pushed
+        create_notification(staff1.id, 'Draft', 'Rolled back', commit=False)
+        db.session.rollback()
+    assert unread_events(sock) == [{'count': 1}, {'delta': 1}]
+    assert unread_events(other_sock) == [{'delta': 1}]
+
+    assert client.post('/notifications/mark-all-read').status_code == 200
+    assert unread_events(sock) == [{'count': 0}]
+    assert unread_events(other_sock) == []
+
+
+def test_counters_follow_every_change(client, app_instance):
+    with app_instance.app_context():
+        staff1 = User.query.filter_by(email='staff1@example.com').one()
+        # Counters are built on first read from the notifications themselves
+        create_notification(staff1.id, 'Before counters', 'x', 'error')
+        assert NotificationCounter.query.count() == 0
+
+    login_as(client, app_instance, 'staff1@example.com')
+    assert client.get('/notifications/api/unread-count').get_json() == {'count': 1}
+
+    with app_instance.app_context():
+        staff1 = User.query.filter_by(email='staff1@example.com').one()
+        personal = create_notification(staff1.id, 'Personal', 'x', 'success')
+        create_notification(staff1.id, 'Other', 'x', 'info')
+        create_notification(None, 'Broadcast', 'x', 'warning')
+        custom = create_notification(None, 'Custom type', 'x', 'maintenance')
+        personal_key, custom_key = str(personal.id), f'b{custom.id}'
+
+    assert client.post(f'/notifications/{personal_key}/read').status_code == 200
+    assert client.post(f'/notifications/{custom_key}/delete').status_code == 200
+    assert client.post(f'/notifications/{personal_key}/delete').status_code == 200
+
+    with app_instance.app_context():
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert client.get('/notifications/api/unread-count').get_json() == {'count': 3}
+            page = client.get('/notifications?type=warning')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert b'Broadcast' in page.data
+        assert not any('count(*)' in s.lower() for s in statements)
+
+        staff1 = User.query.filter_by(email='staff1@example.com').one()
+        cached = sorted((t, total, unread) for t, total, unread in _cached_counts(staff1.id) if total)
+        assert cached == sorted(tuple(row) for row in _grouped_counts(staff1)) == [
+            ('error', 1, 1), ('info', 1, 1), ('warning', 1, 1),
+        ]
+
+
+def test_counters_are_built_by_the_inserting_statement(app_instance):
+    with app_instance.app_context():
+        staff1 = User.query.filter_by(email='staff1@example.com').one()
+        create_notification(staff1.id, 'Personal', 'x', 'error')
+        create_notification(None, 'Broadcast', 'x', 'warning')
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(' '.join(statement.split()).lower())
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            counts = notification_counts(staff1)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert (counts['total'], counts['unread']) == (2, 2)
+        # Counted inside the INSERT, so nothing committed meanwhile is missed
+        inserts = [s for s in statements if s.startswith('insert into notification_counter')]
+        assert len(inserts) == 2 and all(' select ' in s for s in inserts)
+        assert not any(s.startswith('select') and 'group by' in s for s in statements)
+        assert sorted(tuple(r) for r in _cached_counts(staff1.id)) == [
+            ('error', 1, 1), ('info', 0, 0), ('success', 0, 0), ('warning', 1, 1),
+        ]
@@ -0,0 +1,132 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import update
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.backfills import backfill_phone_e164
+from app.models import Customer, User
+from app.phones import normalize_phone, phone_issues
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_phones.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='admin@example.com', password='x', full_name='Admin', role='admin'))
+        db.session.commit()
+    yield app
+
+
+@pytest.fixture
+def client(app_instance):
+    return app_instance.test_client()
+
+
+def login_client_as_admin(client, app_instance):
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            admin = User.query.filter_by(email='admin@example.com').first()
+        sess['_user_id'] = str(admin.id)
+        sess['_fresh'] = True
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('09171234567', '+639171234567'),
+    ('0917 123 4567', '+639171234567'),
+    ('+63-917-123-4567', '+639171234567'),
+    ('639171234567', '+639171234567'),
+    ('9171234567', '+639171234567'),
+    ('+63 0917 123 4567', '+639171234567'),
+    ('0063 917 123 4567', '+639171234567'),
+    ('(02) 8123 4567', '+63281234567'),
+    ('028123456', None),
+    ('+1 415 555 2671', '+14155552671'),
+    ('0917 123 4567 ext 2', None),
+    ('12345', None),
+    ('', None),
+    (None, None),
+])
+def test_normalize_phone(raw, expected):
+    assert normalize_phone(raw) == expected
+
+
+def test_phone_issues():
+    assert phone_issues('09171234567') == []
+    assert phone_issues('') == ['missing']
+    assert phone_issues('0917 123 4567 x2') == ['has_extension']
+    assert phone_issues('12345') == ['unrecognized_format']
+    assert phone_issues('+1 415 555 2671') == ['non_ph_country_code']
+    assert phone_issues('(02) 8123 4567') == ['not_mobile']
+
+
+def test_phone_e164_follows_phone_and_backfill_resumes(app_instance):
+    with app_instance.app_context():
+        customer = Customer(full_name='Alice', phone='0917 123 4567')
+        assert customer.phone_e164 == '+639171234567'
+        customer.phone = 'not a number'
+        assert customer.phone_e164 is None
+
+        for i in range(5):
+            db.session.add(Customer(full_name=f'C{i}', phone=f'0917 000 000{i}'))
+        db.session.add(Customer(full_name='Bad', phone='12345'))
+        db.session.commit()
+        # Rows written before the column existed
+        db.session.execute(update(Customer).values(phone_e164=None))
+        db.session.commit()
+
+        first = backfill_phone_e164(chunk_size=2)
+        assert first == {'scanned': 6, 'updated': 5, 'unreadable': 1, 'last_id': 6}
+
+        db.session.execute(update(Customer).where(Customer.id > 3).values(phone_e164=None))
+        db.session.commit()
+        resumed = backfill_phone_e164(chunk_size=2, start_after=3)
+        assert resumed == {'scanned': 3, 'updated': 2, 'unreadable': 1, 'last_id': 6}
+        assert [c.phone_e164 for c in Customer.query.order_by(Customer.id)] == [
+            '+639170000000', '+639170000001', '+639170000002',
+            '+639170000003', '+639170000004', None,
+        ]
+
+
+def pop_flashes(client):
+    with client.session_transaction() as sess:
+        return sess.pop('_flashes', [])
+
+
+def test_search_and_shared_phone_warning_use_e164(client, app_instance):
+    login_client_as_admin(client, app_instance)
+    with app_instance.app_context():
+        db.session.add(Customer(full_name='Alice', phone='09171234567'))
+        db.session.add(Customer(full_name='Bob', phone='09179999999'))
+        db.session.commit()
+
+    resp = client.get('/laundry/search-customers?q=%2B63 917 123 4567')
+    assert [r['name'] for r in resp.get_json()['results']] == ['Alice']
+    # Digits from the middle of a number still find it, even when they
+    # happen to read as a complete (landline) number
+    resp = client.get('/laundry/search-customers?q=171234567')
+    assert [r['name'] for r in resp.get_json()['results']] == ['Alice']
+
+    # A shared number is saved, with a warning
+    resp = client.post('/customer/add', data={'fullName': 'Alice Again', 'phone': '+63 917 123 4567'})
+    assert resp.status_code == 302
+    assert ('warning', 'Another customer already uses this phone number (Alice).') in pop_flashes(client)
+
+    with app_instance.app_context():
+        assert Customer.query.count() == 3
+        bob = Customer.query.filter_by(full_name='Bob').one()
+    resp = client.post(f'/customer/edit/{bob.id}', data={'fullName': 'Bob', 'phone': '917-123-4567'})
+    assert resp.status_code == 302
+    assert 'warning' in [category for category, _ in pop_flashes(client)]
+    # Edits that keep the number do not warn again
+    resp = client.post(f'/customer/edit/{bob.id}', data={'fullName': 'Bobby', 'phone': '0917 123 4567', 'is_active': 'on'})
+    assert resp.status_code == 302
+    assert 'warning' not in [category for category, _ in pop_flashes(client)]
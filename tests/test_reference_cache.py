@@ -0,0 +1,99 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import inspect
+
+from app import create_app, db
+from app.models import Customer, ExpenseCategory, Laundry, LoyaltyProgram, Service, User
+from app.reference_cache import cache_stats, cached_all, cached_first, cached_get
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_reference_cache.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='admin@example.com', password='x', full_name='Admin', role='admin'))
+        db.session.add(Service(name='Wash', base_price=150.0, category='Standard'))
+        db.session.add(Customer(full_name='Alice'))
+        db.session.add(LoyaltyProgram(name='Points', points_per_peso=1.0, is_active=True))
+        db.session.add(ExpenseCategory(name='Utilities', is_active=True))
+        db.session.add(ExpenseCategory(name='Retired', is_active=False))
+        db.session.commit()
+    yield app
+
+
+@pytest.fixture
+def client(app_instance):
+    return app_instance.test_client()
+
+
+def login_client_as_admin(client, app_instance):
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            admin = User.query.filter_by(email='admin@example.com').first()
+        sess['_user_id'] = str(admin.id)
+        sess['_fresh'] = True
+
+
+def test_reads_are_cached_detached_and_counted(app_instance):
+    with app_instance.app_context():
+        service_id = Service.query.first().id
+        db.session.expunge_all()
+        before = cache_stats()['Service']
+
+        first = cached_get(Service, service_id)
+        second = cached_get(Service, service_id)
+        after = cache_stats()['Service']
+        assert after['misses'] == before['misses'] + 1
+        assert after['hits'] == before['hits'] + 1
+
+        assert inspect(first).detached and first is not second
+        # Changes to a returned copy are neither flushed nor shared
+        first.base_price = 1.0
+        db.session.commit()
+        assert cached_get(Service, service_id).base_price == 150.0
+        assert db.session.get(Service, service_id).base_price == 150.0
+
+        assert [c.name for c in cached_all(ExpenseCategory, is_active=True)] == ['Utilities']
+
+
+def test_commit_invalidates_model_entries(app_instance):
+    with app_instance.app_context():
+        assert cached_first(LoyaltyProgram, is_active=True).points_per_peso == 1.0
+
+        program = LoyaltyProgram.query.first()
+        program.points_per_peso = 2.0
+        db.session.flush()
+        assert cached_first(LoyaltyProgram, is_active=True).points_per_peso == 1.0
+        db.session.commit()
+
+        assert cached_first(LoyaltyProgram, is_active=True).points_per_peso == 2.0
+
+
+def test_add_laundry_uses_cached_service(client, app_instance):
+    login_client_as_admin(client, app_instance)
+    with app_instance.app_context():
+        customer_id = Customer.query.first().id
+        service_id = Service.query.first().id
+        cached_get(Service, service_id)
+        hits = cache_stats()['Service']['hits']
+
+    for _ in range(2):
+        client.post(
+            '/laundry/add',
+            data={'customerId': customer_id, 'serviceType': service_id, 'itemCount': '2'},
+        )
+
+    with app_instance.app_context():
+        assert cache_stats()['Service']['hits'] >= hits + 2
+        laundries = Laundry.query.all()
+        assert len(laundries) == 2
+        assert all(l.service_id == service_id and l.service.name == 'Wash' for l in laundries)
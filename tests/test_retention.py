@@ -0,0 +1,121 @@
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import (
+    ExportAudit, LaundryAuditLog, Notification, NotificationBroadcast, NotificationCounter,
+    NotificationReceipt, OutboxEvent, OutboxEventReceipt, User,
+)
+from app.notifications import notification_counts
+from app.retention import LEASE_KEY, RetentionScheduler, apply_retention_command, get_policy, run_retention
+from app.shared_cache import get_cache
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, monkeypatch):
+    tmp = tmp_path_factory.mktemp('data')
+    os.environ['DATABASE_URL'] = f"sqlite:///{tmp / 'test_retention.db'}"
+    monkeypatch.setenv('RETENTION_ARCHIVE_DIR', str(tmp / 'archive'))
+    monkeypatch.setenv('RETENTION_CHUNK_PAUSE', '0')
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='admin@example.com', password='x', full_name='Admin', role='admin',
+                            date_created=datetime.utcnow() - timedelta(days=400)))
+        db.session.commit()
+    yield app
+
+
+def days_ago(n):
+    return datetime.utcnow() - timedelta(days=n)
+
+
+def test_policies_delete_and_archive_in_chunks(app_instance):
+    with app_instance.app_context():
+        user = User.query.one()
+        for age, is_read in [(40, True), (40, True), (40, False), (5, True)]:
+            db.session.add(Notification(user_id=user.id, title='t', message='m', notification_type='info',
+                                        is_read=is_read, created_at=days_ago(age)))
+        old_broadcast = NotificationBroadcast(title='b', message='m', notification_type='info',
+                                              created_at=days_ago(100))
+        db.session.add(old_broadcast)
+        db.session.flush()
+        db.session.add(NotificationReceipt(broadcast_id=old_broadcast.id, user_id=user.id, read_at=days_ago(99)))
+        for age in (800, 800, 800, 10):
+            db.session.add(LaundryAuditLog(laundry_id='L1', action='EDITED', changed_by=user.id,
+                                           changed_at=days_ago(age), new_value='x' * 20))
+        db.session.add(ExportAudit(user_id=user.id, search_query='q', created_at=days_ago(10)))
+        done = OutboxEvent(event_type='laundry.status_changed', payload='{}', status=OutboxEvent.DONE,
+                           created_at=days_ago(40))
+        pending = OutboxEvent(event_type='laundry.status_changed', payload='{}', status=OutboxEvent.PENDING,
+                              created_at=days_ago(40))
+        db.session.add_all([done, pending])
+        db.session.flush()
+        db.session.add(OutboxEventReceipt(event_id=done.id, handler='sms'))
+        db.session.commit()
+        assert notification_counts(user)['total'] == 5
+        assert NotificationCounter.query.count()
+
+        assert run_retention(dry_run=True)['read_notifications']['deleted'] == 2
+        assert Notification.query.count() == 4
+
+        report = run_retention(chunk_size=2)
+        assert report['read_notifications'] == {'deleted': 2, 'archived': 0, 'bytes': report['read_notifications']['bytes'], 'chunks': 1}
+        assert report['broadcast_notifications']['deleted'] == 1
+        assert report['outbox_events']['deleted'] == 1
+        assert report['laundry_audit_logs']['deleted'] == 3
+        assert report['laundry_audit_logs']['archived'] == 3
+        assert report['laundry_audit_logs']['chunks'] == 2
+        assert report['export_audits']['deleted'] == 0
+
+        assert sorted((n.is_read, n.created_at > days_ago(10)) for n in Notification.query) == [(False, False), (True, True)]
+        assert NotificationReceipt.query.count() == 0
+        assert [e.status for e in OutboxEvent.query] == ['pending']
+        assert OutboxEventReceipt.query.count() == 0
+        assert LaundryAuditLog.query.count() == 1
+        # Counters are rebuilt from what is left
+        assert NotificationCounter.query.count() == 0
+        assert notification_counts(user)['total'] == 2
+
+        path = os.path.join(os.environ['RETENTION_ARCHIVE_DIR'],
+                            f"laundry_audit_logs-{datetime.utcnow():%Y%m%d}.jsonl.gz")
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            archived = [json.loads(line) for line in f]
+        assert len(archived) == 3 and archived[0]['new_value'] == 'x' * 20
+
+
+def test_policy_age_comes_from_environment(app_instance, monkeypatch):
+    monkeypatch.setenv('RETENTION_READ_NOTIFICATIONS_DAYS', '0')
+    assert get_policy('read_notifications').max_age_days == 0
+    with app_instance.app_context():
+        user = User.query.one()
+        db.session.add(Notification(user_id=user.id, title='t', message='m', notification_type='info',
+                                    is_read=True, created_at=days_ago(400)))
+        db.session.commit()
+        assert run_retention(names=['read_notifications'])['read_notifications']['deleted'] == 0
+
+
+def test_cli_and_scheduler_lease(app_instance):
+    with app_instance.app_context():
+        user = User.query.one()
+        db.session.add(Notification(user_id=user.id, title='t', message='m', notification_type='info',
+                                    is_read=True, created_at=days_ago(40)))
+        db.session.commit()
+
+    result = app_instance.test_cli_runner().invoke(apply_retention_command, ['--policy', 'read_notifications'])
+    assert result.exit_code == 0, result.output
+    assert 'read_notifications: deleted 1' in result.output
+
+    get_cache().delete(LEASE_KEY)
+    scheduler = RetentionScheduler(app_instance, interval_hours=1)
+    other_worker = RetentionScheduler(app_instance, interval_hours=1)
+    assert scheduler.run_once() is not None
+    assert other_worker.run_once() is None
@@ -0,0 +1,84 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, runtime_config
+from app.sms_service import sms_service
+
+
+@pytest.fixture
+def config_files(tmp_path, monkeypatch):
+    env_file = tmp_path / '.env'
+    connect_file = tmp_path / 'connect.json'
+    env_file.write_text('SEMAPHORE_API_KEY=from-env-file\nSEMAPHORE_SENDER_NAME=ENVSHOP\n')
+    monkeypatch.setenv('RUNTIME_ENV_FILE', str(env_file))
+    monkeypatch.setenv('RUNTIME_CONNECT_FILE', str(connect_file))
+    # Check the files on every access so the test needs no sleeps
+    monkeypatch.setenv('RUNTIME_CONFIG_CHECK_SECONDS', '0')
+    for key in ('SEMAPHORE_API_KEY', 'SEMAPHORE_SENDER_NAME', 'MAIL_USERNAME'):
+        monkeypatch.delenv(key, raising=False)
+    yield env_file, connect_file
+    # Exported file values must not leak into later tests
+    for key in ('SEMAPHORE_API_KEY', 'SEMAPHORE_SENDER_NAME', 'MAIL_USERNAME'):
+        os.environ.pop(key, None)
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, config_files):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_runtime_config.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    app = create_app()
+    app.config['TESTING'] = True
+    yield app
+
+
+def bump_mtime(path):
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_unchanged_files_are_not_reparsed(app_instance, config_files, monkeypatch):
+    calls = []
+    real_dotenv_values = runtime_config.dotenv_values
+    monkeypatch.setattr(runtime_config, 'dotenv_values', lambda p: calls.append(p) or real_dotenv_values(p))
+
+    with app_instance.app_context():
+        for _ in range(5):
+            assert sms_service.is_configured()
+    assert sms_service.api_key == 'from-env-file'
+    assert calls == []
+
+    version = runtime_config.current().version
+    env_file, _ = config_files
+    env_file.write_text('SEMAPHORE_API_KEY=rotated-key\nSEMAPHORE_SENDER_NAME=ENVSHOP\n')
+    bump_mtime(env_file)
+    with app_instance.app_context():
+        assert sms_service.is_configured()
+    assert sms_service.api_key == 'rotated-key'
+    assert len(calls) == 1
+    assert runtime_config.current().version == version + 1
+    assert app_instance.config['SEMAPHORE_API_KEY'] == 'rotated-key'
+
+
+def test_connect_json_wins_and_updates_mail_settings(app_instance, config_files):
+    _, connect_file = config_files
+    assert app_instance.config['SEMAPHORE_SENDER_NAME'] == 'ENVSHOP'
+
+    connect_file.write_text(json.dumps({'SEMAPHORE_SENDER_NAME': 'JSONSHOP', 'MAIL_USERNAME': 'ops@example.com'}))
+    snapshot = runtime_config.reload()
+    assert snapshot.get('SEMAPHORE_SENDER_NAME') == 'JSONSHOP'
+    assert app_instance.config['MAIL_USERNAME'] == 'ops@example.com'
+    assert app_instance.extensions['mail'].username == 'ops@example.com'
+
+    # Snapshots are immutable
+    with pytest.raises(TypeError):
+        snapshot.values['SEMAPHORE_SENDER_NAME'] = 'X'
+
+    # Rewriting identical values does not publish a new version
+    connect_file.write_text(json.dumps({'MAIL_USERNAME': 'ops@example.com', 'SEMAPHORE_SENDER_NAME': 'JSONSHOP'}))
+    bump_mtime(connect_file)
+    assert runtime_config.current().version == snapshot.version
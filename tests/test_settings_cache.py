@@ -0,0 +1,74 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import BusinessSettings, User
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_settings_cache.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(BusinessSettings(business_name='Before'))
+        db.session.commit()
+    yield app
+
+
+def count_statements(app_instance, fn, needle):
+    seen = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if needle in statement:
+            seen.append(statement)
+
+    with app_instance.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before)
+    try:
+        fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before)
+    return len(seen)
+
+
+def test_context_processors_hit_the_database_once(app_instance):
+    client = app_instance.test_client()
+    client.get('/auth/signup')
+
+    def render_twice():
+        client.get('/auth/signup')
+        client.get('/auth/login')
+
+    assert count_statements(app_instance, render_twice, 'business_settings') == 0
+    assert count_statements(app_instance, render_twice, 'FROM userdb') == 0
+
+
+def test_commit_invalidates_settings_and_first_run(app_instance):
+    from app.settings_cache import get_business_settings, is_first_run
+
+    with app_instance.app_context():
+        assert get_business_settings().business_name == 'Before'
+        assert is_first_run() is True
+
+        settings = BusinessSettings.query.first()
+        settings.business_name = 'After'
+        db.session.add(User(email='admin@example.com', password='x', full_name='Admin', role='admin'))
+        db.session.flush()
+        # Uncommitted changes are not published
+        assert get_business_settings().business_name == 'Before'
+        db.session.commit()
+
+        assert get_business_settings().business_name == 'After'
+        assert is_first_run() is False
+        with pytest.raises(AttributeError):
+            get_business_settings().business_name = 'Nope'
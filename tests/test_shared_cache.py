@@ -0,0 +1,207 @@
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.shared_cache import MemoryCache, RedisCache, SQLiteCache, create_backend, get_cache
+from app.sms_service import SMSService
+
+
+class StubRedis:
+    """Local stand-in speaking enough of the Redis protocol for the cache."""
+
+    def __init__(self):
+        self.data = {}  # key -> (value, expires_at or None)
+        self.commands = []
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def read_command(self):
+                header = self.rfile.readline()
+                if not header:
+                    return None
+                args = []
+                for _ in range(int(header[1:-2])):
+                    length = int(self.rfile.readline()[1:-2])
+                    args.append(self.rfile.read(length + 2)[:-2].decode())
+                return args
+
+            def handle(self):
+                while True:
+                    args = self.read_command()
+                    if args is None:
+                        return
+                    stub.commands.append(args)
+                    self.wfile.write(stub.execute(args))
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, args):
+        name = args[0].upper()
+        if name == 'GET':
+            entry = self._live(args[1])
+            if entry is None:
+                return b'$-1\r\n'
+            value = entry[0].encode()
+            return b'$%d\r\n%s\r\n' % (len(value), value)
+        if name == 'SET':
+            key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+            if 'NX' in options and self._live(key) is not None:
+                return b'$-1\r\n'
+            expires = None
+            if 'PX' in options:
+                expires = time.time() + int(args[3 + options.index('PX') + 1]) / 1000
+            self.data[key] = (value, expires)
+            return b'+OK\r\n'
+        if name == 'DEL':
+            return b':%d\r\n' % int(self.data.pop(args[1], None) is not None)
+        return b'-ERR unknown command\r\n'
+
+    @property
+    def url(self):
+        return f"redis://127.0.0.1:{self.server.server_address[1]}/0"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubAccountAPI:
+    """Semaphore /account endpoint with scripted responses."""
+
+    def __init__(self):
+        self.calls = 0
+        self.responses = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.calls += 1
+                status, headers = stub.responses.pop(0) if stub.responses else (200, {})
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(json.dumps({'credit_balance': 42, 'account_name': 'ACCIO'}).encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/v4"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def redis_stub():
+    server = StubRedis()
+    yield server
+    server.close()
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def backend(request, tmp_path, redis_stub):
+    if request.param == 'memory':
+        return MemoryCache(max_entries=3)
+    if request.param == 'sqlite':
+        return SQLiteCache(str(tmp_path / 'cache.db'))
+    return RedisCache(port=redis_stub.server.server_address[1])
+
+
+def test_backend_contract(backend):
+    assert backend.get('missing') is None
+    backend.set('k', {'a': [1, 2]})
+    assert backend.get('k') == {'a': [1, 2]}
+    assert backend.add('k', 'other') is False
+    backend.delete('k')
+    assert backend.add('k', 'other', ttl=0.05) is True
+    assert backend.get('k') == 'other'
+    time.sleep(0.1)
+    assert backend.get('k') is None
+    assert backend.add('k', 'again', ttl=5) is True
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+
+def test_backend_selection_and_errors_read_as_misses(tmp_path, redis_stub, monkeypatch):
+    assert isinstance(create_backend('memory://'), MemoryCache)
+    assert isinstance(create_backend(f"sqlite:///{tmp_path}/c.db"), SQLiteCache)
+    assert isinstance(create_backend(redis_stub.url), RedisCache)
+
+    # Nothing listens on this port: the cache degrades to misses
+    monkeypatch.setenv('SHARED_CACHE_URL', 'redis://127.0.0.1:1/0')
+    cache = get_cache()
+    cache.set('k', 1)
+    assert cache.get('k') is None and cache.add('k', 1) is False
+
+
+@pytest.fixture
+def account_api():
+    server = StubAccountAPI()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, monkeypatch, account_api, redis_stub):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_shared_cache.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    monkeypatch.setenv('SEMAPHORE_API_BASE', account_api.base)
+    monkeypatch.setenv('SEMAPHORE_API_KEY', 'test-key')
+    monkeypatch.setenv('SEMAPHORE_SENDER_NAME', 'ACCIO')
+    monkeypatch.setenv('SHARED_CACHE_URL', redis_stub.url)
+    app = create_app()
+    app.config['TESTING'] = True
+    yield app
+
+
+def test_workers_share_account_info_and_cooldown(app_instance, account_api):
+    # Two service instances stand in for two gunicorn workers
+    worker_a, worker_b = SMSService(), SMSService()
+    with app_instance.app_context():
+        first = worker_a.get_account_status()
+        assert (first['credit_balance'], first['cached']) == (42.0, False)
+        second = worker_b.get_account_status()
+        assert (second['credit_balance'], second['cached']) == (42.0, True)
+        assert account_api.calls == 1
+
+        # A 429 seen by one worker puts every worker into the same cooldown
+        get_cache().delete(worker_a._shared_key('account'))
+        account_api.responses = [(429, {'Retry-After': '90'})]
+        limited = worker_a.get_account_status()
+        assert limited['rate_limited_for'] == 90 and limited['credit_balance'] == 42.0
+        again = worker_b.get_account_status()
+        assert again['rate_limited_for'] >= 89 and again['cached']
+        assert account_api.calls == 2
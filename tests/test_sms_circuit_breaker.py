@@ -0,0 +1,144 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.http_resilience import CircuitBreaker, LatencyHistogram
+from app.models import User
+from app.sms_service import sms_service
+from test_sms_outbox import StubSemaphore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def stub():
+    server = StubSemaphore()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, monkeypatch, stub, clock):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_sms_circuit_breaker.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    monkeypatch.setenv('SEMAPHORE_API_BASE', stub.base)
+    monkeypatch.setenv('SEMAPHORE_API_KEY', 'test-key')
+    monkeypatch.setenv('SEMAPHORE_SENDER_NAME', 'ACCIO')
+    # The service is a process-wide singleton; give each test fresh health state
+    monkeypatch.setattr(sms_service, 'breaker', CircuitBreaker(failure_threshold=2, cooldown_seconds=30, clock=clock))
+    monkeypatch.setattr(sms_service, 'latency', {'messages': LatencyHistogram(), 'account': LatencyHistogram()})
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='admin@example.com', password='x', full_name='Admin', role='admin'))
+        db.session.commit()
+    yield app
+
+
+def test_breaker_opens_fast_fails_and_recovers(app_instance, stub, clock):
+    stub.responses = [(503, {}), (502, {})]
+    with app_instance.app_context():
+        assert sms_service.deliver('09171234567', 'one').status_code == 503
+        assert sms_service.breaker.state == 'closed'
+        assert sms_service.deliver('09171234567', 'two').status_code == 502
+        assert sms_service.breaker.state == 'open'
+
+        # Open: no provider call, and the outbox is told when to retry
+        result = sms_service.deliver('09171234567', 'three')
+        assert not result.ok and result.status_code is None and result.retry_after == 30
+        assert len(stub.requests) == 2
+        assert sms_service.get_account_status()['status'] == 'Unavailable'
+
+        # After the cooldown one trial call goes out and closes the breaker
+        clock.now += 31
+        assert sms_service.breaker.state == 'half_open'
+        assert sms_service.deliver('09171234567', 'four').ok
+        assert sms_service.breaker.state == 'closed'
+    assert len(stub.requests) == 3
+
+    latency = sms_service.health()['latency']['messages']
+    assert latency['count'] == 3
+    assert sum(b['count'] for b in latency['buckets']) == 3
+
+
+def test_failed_trial_reopens_and_connection_errors_count(app_instance, stub, clock):
+    stub.responses = [(500, {}), (500, {}), (500, {})]
+    with app_instance.app_context():
+        sms_service.deliver('09171234567', 'a')
+        sms_service.deliver('09171234567', 'b')
+        clock.now += 31
+        assert sms_service.breaker.allow()
+        # Only one trial call at a time while half-open
+        assert not sms_service.breaker.allow()
+        sms_service.breaker.record_failure('HTTP 500')
+        assert sms_service.breaker.snapshot()['times_opened'] == 2
+
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=5, clock=clock)
+    breaker.record_failure('Connection refused')
+    assert breaker.snapshot()['state'] == 'open' and breaker.retry_after() == 5
+
+
+def test_requests_reuse_pooled_session(app_instance, stub):
+    with app_instance.app_context():
+        session = sms_service.http
+        assert sms_service.deliver('09171234567', 'x').ok
+        assert sms_service.http is session
+        adapter = session.get_adapter(stub.base)
+        assert adapter._pool_maxsize == sms_service.pool_size
+
+
+def test_settings_page_shows_breaker_and_latency(app_instance, stub):
+    client = app_instance.test_client()
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            sess['_user_id'] = str(User.query.first().id)
+        sess['_fresh'] = True
+    with app_instance.app_context():
+        sms_service.deliver('09171234567', 'x')
+    html = client.get('/sms-settings/sms-settings').get_data(as_text=True)
+    assert 'Provider Circuit' in html and 'Healthy' in html
+    assert 'latency-histogram' in html
+
+
+def test_account_refresh_without_a_call_leaves_the_trial_free(app_instance, stub, clock):
+    from app.shared_cache import get_cache
+
+    stub.responses = [(500, {}), (500, {})]
+    with app_instance.app_context():
+        sms_service.deliver('09171234567', 'a')
+        sms_service.deliver('09171234567', 'b')
+        clock.now += 31
+        assert sms_service.breaker.state == 'half_open'
+        cache = get_cache()
+        cache.delete(sms_service._shared_key('account'))
+        cache.set(sms_service._shared_key('account_last'),
+                  {'status': 'Active', 'credit_balance': 10.0, 'error': None}, ttl=60)
+
+        # Another worker is refreshing: last known values, no provider call
+        cache.set(sms_service._shared_key('account_lease'), 'other', ttl=15)
+        try:
+            assert sms_service.get_account_status()['credit_balance'] == 10.0
+        finally:
+            cache.delete(sms_service._shared_key('account_lease'))
+        assert len(stub.requests) == 2
+
+        # The trial call is still available to the next send
+        assert sms_service.deliver('09171234567', 'c').ok
+        assert sms_service.breaker.state == 'closed'
@@ -0,0 +1,237 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import BulkMessageHistory, Customer, Laundry, Service, SMSOutbox, User
+from app.shared_cache import get_cache
+from app.sms_outbox import SMSDispatcher, drain_outbox, enqueue_sms, start_sms_dispatcher
+from app.sms_service import sms_service
+
+
+class StubSemaphore:
+    """Local HTTP server standing in for the Semaphore messages endpoint."""
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []  # scripted (status, headers) tuples; default 200
+        self.delay = 0.0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                time.sleep(stub.delay)
+                url = urlparse(self.path)
+                stub.requests.append((url.path, parse_qs(url.query)))
+                status, headers = stub.responses.pop(0) if stub.responses else (200, {})
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(b'[{"message_id": 1}]')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/v4"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubSemaphore()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory, monkeypatch, stub):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_sms_outbox.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    monkeypatch.setenv('SEMAPHORE_API_BASE', stub.base)
+    monkeypatch.setenv('SEMAPHORE_API_KEY', 'test-key')
+    monkeypatch.setenv('SEMAPHORE_SENDER_NAME', 'ACCIO')
+    monkeypatch.setenv('SMS_RETRY_BASE_SECONDS', '60')
+    monkeypatch.setenv('SMS_MAX_ATTEMPTS', '3')
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='admin@example.com', password='x', full_name='Admin', role='admin'))
+        db.session.add(Service(name='Wash', base_price=150.0, category='Standard'))
+        db.session.add(Customer(full_name='Alice', phone='09171234567'))
+        db.session.commit()
+    yield app
+    dispatcher = app.extensions.get('sms_dispatcher')
+    if dispatcher:
+        dispatcher.stop()
+
+
+@pytest.fixture
+def client(app_instance):
+    return app_instance.test_client()
+
+
+def login_client_as_admin(client, app_instance):
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            admin = User.query.filter_by(email='admin@example.com').first()
+        sess['_user_id'] = str(admin.id)
+        sess['_fresh'] = True
+
+
+def make_due(outbox_id):
+    db.session.query(SMSOutbox).filter_by(id=outbox_id).update({'next_attempt_at': datetime.utcnow()})
+    db.session.commit()
+
+
+def test_status_sms_is_queued_then_delivered(client, app_instance, stub):
+    login_client_as_admin(client, app_instance)
+    with app_instance.app_context():
+        customer_id = Customer.query.first().id
+        service_id = Service.query.first().id
+    client.post('/laundry/add', data={'customerId': customer_id, 'serviceType': service_id, 'itemCount': '2'})
+
+    # The request returned without calling the provider
+    assert stub.requests == []
+    with app_instance.app_context():
+        row = SMSOutbox.query.one()
+        assert (row.status, row.category) == ('pending', 'status:Received')
+
+        assert drain_outbox() == {'sent': 1}
+        row = db.session.get(SMSOutbox, row.id)
+        assert row.status == 'sent' and row.attempts == 1 and row.sent_at is not None
+
+    path, query = stub.requests[0]
+    assert path == '/api/v4/messages'
+    assert query['number'] == ['639171234567']
+    assert query['apikey'] == ['test-key']
+    with app_instance.app_context():
+        laundry_id = Laundry.query.first().laundry_id
+        assert laundry_id in query['message'][0]
+
+
+def test_multi_load_drop_off_sends_one_consolidated_sms(client, app_instance, stub):
+    login_client_as_admin(client, app_instance)
+    with app_instance.app_context():
+        customer_id = Customer.query.first().id
+        service_id = Service.query.first().id
+    client.post('/laundry/add-multiple', data={
+        'customerId': customer_id,
+        'serviceType_1': service_id, 'itemCount_1': '3',
+        'serviceType_2': service_id, 'itemCount_2': '1',
+        'serviceType_3': service_id, 'itemCount_3': '2',
+    })
+
+    with app_instance.app_context():
+        loads = Laundry.query.order_by(Laundry.id).all()
+        assert len(loads) == 3
+        row = SMSOutbox.query.one()
+        assert row.category == 'status:Received'
+        assert 'your 3 laundry loads' in row.message
+        assert f'#{loads[0].laundry_id} (3 items), #{loads[1].laundry_id} (1 item)' in row.message
+        assert drain_outbox() == {'sent': 1}
+    assert len(stub.requests) == 1
+
+
+def test_rate_limit_backs_off_and_server_errors_dead_letter(app_instance, stub):
+    with app_instance.app_context():
+        row = enqueue_sms('09171234567', 'hello')
+        stub.responses = [(429, {'Retry-After': '120'})]
+        assert drain_outbox() == {'pending': 1}
+        row = db.session.get(SMSOutbox, row.id)
+        assert row.attempts == 1 and row.last_status_code == 429
+        assert (row.next_attempt_at - datetime.utcnow()).total_seconds() > 100
+        # Not due yet, so a second drain does nothing
+        assert drain_outbox() == {}
+        # Let the provider's Retry-After window (shared by all workers) pass
+        get_cache().delete(sms_service._shared_key('send_cooldown'))
+
+        stub.responses = [(503, {}), (502, {})]
+        make_due(row.id)
+        assert drain_outbox() == {'pending': 1}
+        make_due(row.id)
+        assert drain_outbox() == {'dead': 1}
+        row = db.session.get(SMSOutbox, row.id)
+        assert (row.status, row.attempts, row.last_status_code) == ('dead', 3, 502)
+
+
+def test_client_errors_are_not_retried(app_instance, stub):
+    with app_instance.app_context():
+        row = enqueue_sms('09171234567', 'hello')
+        stub.responses = [(400, {})]
+        assert drain_outbox() == {'dead': 1}
+        assert db.session.get(SMSOutbox, row.id).attempts == 1
+
+
+def test_worker_pool_drains_bulk_campaign(app_instance, stub, monkeypatch):
+    monkeypatch.setenv('SMS_PROVIDER_CONCURRENCY', 'semaphore=2')
+    stub.delay = 0.05
+    with app_instance.app_context():
+        history = BulkMessageHistory(
+            message_text='Promo', message_type='promo',
+            sent_by_user_id=User.query.first().id, total_recipients=6,
+        )
+        db.session.add(history)
+        db.session.flush()
+        for i in range(6):
+            enqueue_sms(f'0917123450{i}', 'Promo', category='bulk', bulk_history_id=history.id, commit=False)
+        db.session.commit()
+        history_id = history.id
+
+    start_sms_dispatcher(app_instance)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        with app_instance.app_context():
+            if SMSOutbox.query.filter_by(status='sent').count() == 6:
+                break
+        time.sleep(0.05)
+
+    with app_instance.app_context():
+        assert SMSOutbox.query.filter_by(status='sent').count() == 6
+        assert db.session.get(BulkMessageHistory, history_id).successful_sends == 6
+    assert sorted(q['number'][0] for _, q in stub.requests) == [f'63917123450{i}' for i in range(6)]
+
+
+def test_wake_during_an_empty_claim_is_not_lost(app_instance):
+    wake = threading.Event()
+    calls = []
+
+    class Dispatcher(SMSDispatcher):
+        name = 'test-dispatcher'
+
+        def work_once(self):
+            calls.append(time.time())
+            if len(calls) == 1:
+                # Work enqueued after this claim found nothing
+                self.wake.set()
+            return False
+
+    Dispatcher.wake = wake
+    dispatcher = Dispatcher(app_instance, threads=1, poll_seconds=30)
+    dispatcher.start()
+    try:
+        deadline = time.time() + 5
+        while len(calls) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        dispatcher.stop()
+    assert len(calls) >= 2 and calls[1] - calls[0] < 5
@@ -0,0 +1,94 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User
+
+
+@pytest.fixture
+def app_instance(tmp_path_factory):
+    db_fd = tmp_path_factory.mktemp('data') / 'test_user_cache.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_fd}"
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='root@example.com', password='x', full_name='Root', role='super_admin'))
+        db.session.add(User(email='staff@example.com', password='x', full_name='Staff', role='user'))
+        db.session.commit()
+    yield app
+
+
+def login_client_as(client, app_instance, email):
+    with client.session_transaction() as sess:
+        with app_instance.app_context():
+            user = User.query.filter_by(email=email).first()
+        sess['_user_id'] = str(user.id)
+        sess['_fresh'] = True
+    return user.id
+
+
+def count_user_selects(app_instance, fn):
+    seen = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM userdb' in statement:
+            seen.append(statement)
+
+    with app_instance.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before)
+    try:
+        fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before)
+    return len(seen)
+
+
+def test_repeat_requests_reuse_cached_user(app_instance):
+    client = app_instance.test_client()
+    login_client_as(client, app_instance, 'staff@example.com')
+    assert client.get('/notifications/api/unread-count').status_code == 200
+
+    def poll():
+        for _ in range(3):
+            assert client.get('/notifications/api/unread-count').status_code == 200
+
+    assert count_user_selects(app_instance, poll) == 0
+
+
+def test_deactivation_takes_effect_on_next_request(app_instance):
+    staff = app_instance.test_client()
+    staff_id = login_client_as(staff, app_instance, 'staff@example.com')
+    assert staff.get('/customer/list').status_code == 200
+
+    root = app_instance.test_client()
+    login_client_as(root, app_instance, 'root@example.com')
+    resp = root.post(
+        f'/admin/users/users/{staff_id}/edit',
+        data={'full_name': 'Staff', 'email': 'staff@example.com', 'role': 'user'},
+    )
+    assert resp.status_code == 302
+
+    resp = staff.get('/customer/list')
+    assert resp.status_code == 302
+    assert '/auth/login' in resp.headers['Location']
+
+
+def test_profile_update_is_persisted_from_cached_user(app_instance):
+    client = app_instance.test_client()
+    user_id = login_client_as(client, app_instance, 'staff@example.com')
+    client.get('/notifications/api/unread-count')
+
+    client.post(
+        '/profile/settings',
+        data={'action': 'update_profile', 'full_name': 'Renamed', 'email': 'staff@example.com', 'phone': ''},
+    )
+    with app_instance.app_context():
+        assert db.session.get(User, user_id).full_name == 'Renamed'